@@ -6,7 +6,10 @@ import paramiko
 from datetime import datetime
 from netmiko import ConnectHandler
 import ftplib
-import re
+from backup_cleanup import delete_old_backups
+from export_diff import diff_export, format_summary
+from export_index import index_exports
+from compliance import evaluate_fleet, format_digest
 
 # Завантажуємо конфігурацію
 CONFIG_FILE = './config.json'
@@ -118,81 +121,6 @@ def upload_backup_to_ftp(local_file, backup_name, ftp_config, file_type='backup'
         send_telegram_message(error_message)
         return False
 
-def delete_old_backups(mikrotik, keep_count=2):
-    try:
-        device = {
-            "device_type": "mikrotik_routeros",
-            "host": mikrotik['host'],
-            "username": mikrotik['user'],
-            "password": mikrotik['password'],
-        }
-
-        with ConnectHandler(**device) as ssh_conn:
-            backups = ssh_conn.send_command('/file print')
-
-            # Логуємо вхідний список файлів
-            print(f"📜 Отриманий список файлів:\n{backups}")
-
-            backup_files = []
-            for line in backups.splitlines():
-                match = re.search(r'(\S+\.backup|\S+\.rsc)', line)  # Знаходимо файли з розширеннями
-                if match:
-                    backup_files.append(match.group(1))
-
-            print(f"📂 Вибрані файли для аналізу: {backup_files}")
-
-            if not backup_files:
-                print(f"⚠ На {mikrotik['name']} немає файлів для видалення.")
-                return False
-
-            # Функція для витягування дати
-            def extract_datetime(file_name):
-                match = re.search(r'(\d{8}-\d{4})', file_name)  # YYYYMMDD-HHMM
-                if match:
-                    try:
-                        dt = datetime.strptime(match.group(1), "%Y%m%d-%H%M")
-                        return dt
-                    except ValueError:
-                        print(f"⚠ Помилка парсингу дати у файлі: {file_name}")
-                        return None
-                print(f"⚠ Дата не знайдена у файлі: {file_name}")
-                return None
-
-            # Формуємо список кортежів (ім'я файлу, дата)
-            backup_files_with_dates = [(file, extract_datetime(file)) for file in backup_files]
-
-            # Видаляємо файли, у яких не вдалося отримати дату
-            backup_files_with_dates = [item for item in backup_files_with_dates if item[1] is not None]
-
-            if not backup_files_with_dates:
-                print(f"⚠ Жоден файл не має правильної дати! Перевір регулярний вираз.")
-                return False
-
-            # Сортуємо за датою
-            backup_files_with_dates.sort(key=lambda x: x[1])
-
-            # Логуємо відсортований список
-            sorted_files = "\n".join(f"{file} ({date})" for file, date in backup_files_with_dates)
-            print(f"📂 Відсортований список файлів на {mikrotik['name']}:\n{sorted_files}")
-
-            # Визначаємо файли для видалення (залишаємо keep_count найновіших)
-            files_to_delete = backup_files_with_dates[:-keep_count]
-
-            if not files_to_delete:
-                print(f"✅ На {mikrotik['name']} немає файлів для видалення.")
-                return False
-
-            for file, date in files_to_delete:
-                print(f"❌ Видаляємо файл: {file} ({date})")
-                ssh_conn.send_command(f'/file remove "{file}"')
-
-            return True
-    except Exception as e:
-        error_message = f"Помилка видалення бекапів на {mikrotik['name']} ({mikrotik['host']}): {e}"
-        print(error_message)
-        return False
-
-
 def attempt_connection(mikrotik, max_retries=3):
     for attempt in range(1, max_retries + 1):
         try:
@@ -228,6 +156,17 @@ if __name__ == "__main__":
                     upload_backup_to_ftp(local_backup, backup_name, config['ftp'], 'backup')
                     upload_backup_to_ftp(local_rsc, backup_name, config['ftp'], 'rsc')
                     delete_old_backups(mikrotik)
+                    try:
+                        summary = format_summary(diff_export(mikrotik['name'], local_rsc, BACKUP_DIR))
+                        if summary:
+                            send_telegram_message(summary)
+                    except Exception as e:
+                        # Помилка розбору експорту чи БД не зупиняє бекап решти пристроїв
+                        print(f"Помилка порівняння експорту для #{mikrotik['name']}: {str(e)[:200]}")
+                    try:
+                        index_exports([local_rsc], BACKUP_DIR, workers=0)
+                    except Exception as e:
+                        print(f"Помилка індексації експорту для #{mikrotik['name']}: {str(e)[:200]}")
 
 
                 send_telegram_message(f"🔹 #{idx} *#{mikrotik['name']}* ({mikrotik['host']}):\n"
@@ -247,4 +186,11 @@ if __name__ == "__main__":
             else:
                 send_telegram_message(f"❌ Не вдалося підключитись до {mikrotik['host']} після повторної спроби.")
 
+    try:
+        digest = format_digest(evaluate_fleet(BACKUP_DIR, devices=[mikrotik['name'] for mikrotik in config['mikrotiks']]))
+        if digest:
+            send_telegram_message(digest)
+    except Exception as e:
+        print(f"Помилка перевірки відповідності: {str(e)[:200]}")
+
     send_telegram_message(f"✅ Завдання виконано! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
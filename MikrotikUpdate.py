@@ -3,6 +3,7 @@ import time
 import json
 from datetime import datetime
 from netmiko import ConnectHandler
+from routeros_parsers import needs_update, parse_update_check
 
 
 # Завантажуємо конфігурацію
@@ -69,12 +70,9 @@ def check_and_update_mikrotik(mikrotik):
 
             with ConnectHandler(**device) as ssh_conn:
                 output = ssh_conn.send_command('/system package update check-for-updates')
-                installed_version = next(
-                    (line.split(':')[1].strip() for line in output.splitlines() if "installed-version" in line), None)
-                latest_version = next(
-                    (line.split(':')[1].strip() for line in output.splitlines() if "latest-version" in line), None)
+                installed_version, latest_version = parse_update_check(output)
                 if installed_version and latest_version:
-                    if tuple(map(int, installed_version.split('.'))) < tuple(map(int, latest_version.split('.'))):
+                    if needs_update(installed_version, latest_version):
                         ssh_conn.send_command('/system package update install')
                         return f"Оновлення для MikroTik *#{mikrotik['name']}* завершено."
                     else:
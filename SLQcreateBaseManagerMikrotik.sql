@@ -6,6 +6,91 @@ GO
 USE ManagerMikrotik;
 GO
 
+-- Обчислювані стовпці з функцією вимагають цих параметрів під час створення (sqlcmd за замовчуванням QUOTED_IDENTIFIER OFF)
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
+-- Функція ключа версії RouterOS для обчислюваних стовпців [MikroTikDevices]
+CREATE FUNCTION [dbo].[RouterOSVersionKey] (@version NVARCHAR(50))
+RETURNS BIGINT
+WITH SCHEMABINDING
+AS
+BEGIN
+    -- Ключ версії одним числом, як routeros_parsers.version_number:
+    -- major.minor.patch по три цифри, канал (alpha 0, beta 1, rc 2, реліз 3), номер передрелізу.
+    -- 7.15.3 -> 7015003003000, 7.15rc2 -> 7015000002002. Нерозпізнана версія - NULL.
+    DECLARE @start INT = PATINDEX(N'%[0-9]%', @version);
+    IF @version IS NULL OR @start = 0
+        RETURN NULL;
+    DECLARE @text NVARCHAR(50) = LOWER(SUBSTRING(@version, @start, 50));
+    DECLARE @i INT = 1, @length INT = LEN(@text), @part INT = 0, @value INT = 0, @char NCHAR(1);
+    DECLARE @major INT = 0, @minor INT = 0, @patch INT = 0, @rank INT = 3, @pre INT = 0;
+    WHILE @i <= @length
+    BEGIN
+        SET @char = SUBSTRING(@text, @i, 1);
+        IF @char LIKE N'[0-9]'
+            SET @value = CASE WHEN @value >= 100 THEN 999 ELSE @value * 10 + UNICODE(@char) - 48 END;
+        ELSE IF @char = N'.' AND SUBSTRING(@text, @i + 1, 1) LIKE N'[0-9]'
+        BEGIN
+            IF @part = 0 SET @major = @value;
+            ELSE IF @part = 1 SET @minor = @value;
+            ELSE IF @part = 2 SET @patch = @value;
+            SET @part = @part + 1;
+            SET @value = 0;
+        END
+        ELSE
+            BREAK;
+        SET @i = @i + 1;
+    END
+    IF @part = 0 SET @major = @value;
+    ELSE IF @part = 1 SET @minor = @value;
+    ELSE IF @part = 2 SET @patch = @value;
+
+    -- Канал випуску одразу після номера: 7.15rc2, 7.16 beta4
+    SET @text = LTRIM(SUBSTRING(@text, @i, 50));
+    SET @rank = CASE WHEN @text LIKE N'alpha%' THEN 0 WHEN @text LIKE N'beta%' THEN 1
+                     WHEN @text LIKE N'rc%' THEN 2 ELSE 3 END;
+    IF @rank < 3
+    BEGIN
+        SET @text = LTRIM(SUBSTRING(@text, CASE @rank WHEN 0 THEN 6 WHEN 1 THEN 5 ELSE 3 END, 50));
+        SET @i = 1;
+        WHILE @i <= LEN(@text) AND SUBSTRING(@text, @i, 1) LIKE N'[0-9]'
+        BEGIN
+            SET @pre = CASE WHEN @pre >= 100 THEN 999 ELSE @pre * 10 + UNICODE(SUBSTRING(@text, @i, 1)) - 48 END;
+            SET @i = @i + 1;
+        END
+    END
+    RETURN CAST(@major AS BIGINT) * 1000000000000 + CAST(@minor AS BIGINT) * 1000000000
+         + CAST(@patch AS BIGINT) * 1000000 + @rank * 1000 + @pre;
+END
+GO
+
+-- Створення таблиці [Sites] (ієрархія сайтів: область -> місто -> майданчик)
+CREATE TABLE [dbo].[Sites] (
+    [id] INT IDENTITY(1,1) PRIMARY KEY,
+    [name] NVARCHAR(100) NOT NULL UNIQUE,
+    [parent_id] INT NULL REFERENCES [dbo].[Sites] ([id]), -- Батьківський сайт
+    [max_concurrency] INT NULL, -- Максимум одночасно оброблюваних пристроїв сайту разом з дочірніми
+    [bandwidth_kbps] INT NULL, -- Ліміт швидкості передачі бекапів сайту разом з дочірніми, кбіт/с (throttle.py)
+    [row_version] ROWVERSION -- Змінюється при кожній зміні рядка (відбиток налаштувань, settings_store.py)
+);
+GO
+
+-- Сайт разом з усіма дочірніми - для фільтра за сайтом (inventory.py)
+CREATE FUNCTION [dbo].[SiteSubtree] (@name NVARCHAR(100))
+RETURNS TABLE
+AS
+RETURN (
+    WITH tree AS (
+        SELECT [id] FROM [dbo].[Sites] WHERE [name] = @name
+        UNION ALL
+        SELECT s.[id] FROM [dbo].[Sites] s JOIN tree t ON s.[parent_id] = t.[id]
+    )
+    SELECT [id] FROM tree
+);
+GO
+
 -- Створення таблиці [MikroTikDevices]
 CREATE TABLE [dbo].[MikroTikDevices] (
     [id] INT IDENTITY(1,1) PRIMARY KEY, -- Автоматично генерований ідентифікатор
@@ -17,13 +102,52 @@ CREATE TABLE [dbo].[MikroTikDevices] (
     [latest_version] NVARCHAR(50), -- Остання доступна версія
     [backup_status] NVARCHAR(200), -- Статус останнього бекапу
     [backup_status_final] NVARCHAR(200), -- Останній фінальний статус бекапу
-    [routerboard_firmware] NVARCHAR(50) -- Версія прошивки RouterBoard
+    [routerboard_firmware] NVARCHAR(50), -- Версія прошивки RouterBoard
+    [site_id] INT NULL REFERENCES [dbo].[Sites] ([id]), -- Сайт пристрою
+    [serial_number] NVARCHAR(50) NULL, -- Серійний номер RouterBoard (discovery.py, пошук дублікатів)
+    -- Обчислювані стовпці для сортування і фільтрації на сервері (inventory.py)
+    [installed_version_key] AS [dbo].[RouterOSVersionKey]([installed_version]) PERSISTED,
+    [latest_version_key] AS [dbo].[RouterOSVersionKey]([latest_version]) PERSISTED,
+    -- 1 - встановлена версія старша за доступну або версії ще невідомі (потрібна перевірка)
+    [needs_update] AS CAST(CASE WHEN [dbo].[RouterOSVersionKey]([installed_version])
+                                     >= [dbo].[RouterOSVersionKey]([latest_version]) THEN 0 ELSE 1 END AS BIT) PERSISTED,
+    [row_version] ROWVERSION -- Змінюється при кожній зміні рядка (відбиток налаштувань, settings_store.py)
+);
+GO
+
+-- Створення таблиць [DeviceGroups] і [DeviceGroupMembers] (довільні групи і теги пристроїв)
+CREATE TABLE [dbo].[DeviceGroups] (
+    [id] INT IDENTITY(1,1) PRIMARY KEY,
+    [kind] NVARCHAR(10) NOT NULL DEFAULT 'group' CHECK ([kind] IN ('group', 'tag')),
+    [name] NVARCHAR(100) NOT NULL,
+    [row_version] ROWVERSION,
+    CONSTRAINT UQ_DeviceGroups_KindName UNIQUE ([kind], [name])
+);
+GO
+
+CREATE TABLE [dbo].[DeviceGroupMembers] (
+    [group_id] INT NOT NULL REFERENCES [dbo].[DeviceGroups] ([id]) ON DELETE CASCADE,
+    [device_id] INT NOT NULL REFERENCES [dbo].[MikroTikDevices] ([id]) ON DELETE CASCADE,
+    [row_version] ROWVERSION,
+    PRIMARY KEY ([group_id], [device_id])
+);
+GO
+
+-- Створення таблиці [SavedQueries] (збережені фільтри інвентарю як цілі задач, JSON InventoryQuery)
+CREATE TABLE [dbo].[SavedQueries] (
+    [id] INT IDENTITY(1,1) PRIMARY KEY,
+    [name] NVARCHAR(100) NOT NULL UNIQUE,
+    [definition] NVARCHAR(MAX) NOT NULL,
+    [created_at] DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    [updated_at] DATETIME2,
+    [row_version] ROWVERSION
 );
 GO
 
 -- Створення таблиці [TelegramSettings]
 CREATE TABLE [dbo].[TelegramSettings] (
-    [token] NVARCHAR(100) PRIMARY KEY -- Токен API Telegram (унікальний)
+    [token] NVARCHAR(100) PRIMARY KEY, -- Токен API Telegram (унікальний)
+    [row_version] ROWVERSION
 );
 GO
 
@@ -33,19 +157,74 @@ CREATE TABLE [dbo].[FTPSettings] (
     [username] NVARCHAR(100) NOT NULL, -- Логін FTP
     [password] NVARCHAR(100) NOT NULL, -- Пароль FTP
     [dir] NVARCHAR(200) NOT NULL, -- Директорія на FTP
+    [row_version] ROWVERSION,
     PRIMARY KEY (host, username) -- Композитний первинний ключ для унікальності хоста та логіна
 );
 GO
 
 -- Створення таблиці [TelegramChatIds]
 CREATE TABLE [dbo].[TelegramChatIds] (
-    [chat_id] NVARCHAR(50) PRIMARY KEY -- Ідентифікатор чату (може бути числом або рядком)
+    [chat_id] NVARCHAR(50) PRIMARY KEY, -- Ідентифікатор чату (може бути числом або рядком)
+    [row_version] ROWVERSION
+);
+GO
+
+-- Створення таблиці [ConfigChanges] (історія змін конфігурації за .rsc експортами)
+CREATE TABLE [dbo].[ConfigChanges] (
+    [id] INT IDENTITY(1,1) PRIMARY KEY,
+    [device_id] INT NOT NULL, -- Посилання на [MikroTikDevices].[id]
+    [created_at] DATETIME2 NOT NULL DEFAULT SYSDATETIME(), -- Час виявлення змін
+    [export_name] NVARCHAR(200), -- Новий експорт
+    [previous_export_name] NVARCHAR(200), -- Попередній експорт
+    [sections_changed] INT, -- Кількість змінених секцій
+    [lines_added] INT,
+    [lines_removed] INT,
+    [delta] NVARCHAR(MAX) -- Структурована дельта у JSON
+);
+GO
+
+-- Створення таблиці [ComplianceFindings] (актуальні порушення правил за останнім експортом)
+CREATE TABLE [dbo].[ComplianceFindings] (
+    [id] INT IDENTITY(1,1) PRIMARY KEY,
+    [device_id] INT NOT NULL, -- Посилання на [MikroTikDevices].[id]
+    [checked_at] DATETIME2 NOT NULL DEFAULT SYSDATETIME(), -- Час перевірки
+    [export_name] NVARCHAR(200), -- Перевірений експорт
+    [rule_id] NVARCHAR(100) NOT NULL, -- Ідентифікатор правила з compliance_rules.json
+    [severity] NVARCHAR(20), -- high / medium / low
+    [description] NVARCHAR(400)
+);
+GO
+
+-- Створення таблиці [JobQueue] (спільна черга задач для кількох воркерів, job_queue.py)
+CREATE TABLE [dbo].[JobQueue] (
+    [id] BIGINT IDENTITY(1,1) PRIMARY KEY,
+    [job_type] NVARCHAR(20) NOT NULL, -- backup / check / upgrade
+    [device_id] INT NOT NULL, -- Посилання на [MikroTikDevices].[id]
+    [status] NVARCHAR(20) NOT NULL DEFAULT 'pending', -- pending / leased / done / failed
+    [attempts] INT NOT NULL DEFAULT 0,
+    [max_attempts] INT NOT NULL DEFAULT 3,
+    [worker_id] NVARCHAR(100), -- Воркер, який орендував задачу
+    [lease_expires_at] DATETIME2, -- Після цього часу задачу може забрати інший воркер
+    [enqueued_at] DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+    [updated_at] DATETIME2,
+    [result] NVARCHAR(400)
 );
 GO
 
 -- Додавання індексів для оптимізації (опціонально)
 CREATE INDEX IX_MikroTikDevices_Host ON [dbo].[MikroTikDevices] ([host]);
 CREATE INDEX IX_MikroTikDevices_Name ON [dbo].[MikroTikDevices] ([name]);
+CREATE INDEX IX_MikroTikDevices_NeedsUpdate ON [dbo].[MikroTikDevices] ([needs_update], [name])
+    INCLUDE ([host], [installed_version], [latest_version], [backup_status_final], [routerboard_firmware]);
+CREATE INDEX IX_MikroTikDevices_InstalledVersion ON [dbo].[MikroTikDevices] ([installed_version_key]);
+CREATE INDEX IX_MikroTikDevices_Status ON [dbo].[MikroTikDevices] ([backup_status_final]);
+CREATE INDEX IX_MikroTikDevices_Site ON [dbo].[MikroTikDevices] ([site_id]);
+CREATE INDEX IX_MikroTikDevices_Serial ON [dbo].[MikroTikDevices] ([serial_number]) WHERE [serial_number] IS NOT NULL;
+CREATE INDEX IX_Sites_Parent ON [dbo].[Sites] ([parent_id]);
+CREATE INDEX IX_DeviceGroupMembers_Device ON [dbo].[DeviceGroupMembers] ([device_id], [group_id]);
+CREATE INDEX IX_ConfigChanges_Device ON [dbo].[ConfigChanges] ([device_id], [created_at]);
+CREATE INDEX IX_ComplianceFindings_Device ON [dbo].[ComplianceFindings] ([device_id]);
+CREATE INDEX IX_JobQueue_Claim ON [dbo].[JobQueue] ([status], [lease_expires_at]) INCLUDE ([job_type], [device_id]);
 GO
 
 -- Початкове заповнення даних для тестування
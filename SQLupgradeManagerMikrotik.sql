@@ -0,0 +1,223 @@
+﻿-- Оновлення наявної бази ManagerMikrotik до поточної схеми (можна запускати повторно).
+-- Нова база створюється скриптом SLQcreateBaseManagerMikrotik.sql.
+USE ManagerMikrotik;
+GO
+
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
+-- Обчислювані стовпці версій і needs_update для фільтрації та сторінок на сервері (inventory.py)
+-- Функцію не можна змінити, поки на неї посилаються стовпці, тож створюємо лише за відсутності
+IF OBJECT_ID(N'[dbo].[RouterOSVersionKey]', N'FN') IS NOT NULL
+    SET NOEXEC ON;
+GO
+
+CREATE FUNCTION [dbo].[RouterOSVersionKey] (@version NVARCHAR(50))
+RETURNS BIGINT
+WITH SCHEMABINDING
+AS
+BEGIN
+    -- Ключ версії одним числом, як routeros_parsers.version_number:
+    -- major.minor.patch по три цифри, канал (alpha 0, beta 1, rc 2, реліз 3), номер передрелізу.
+    -- 7.15.3 -> 7015003003000, 7.15rc2 -> 7015000002002. Нерозпізнана версія - NULL.
+    DECLARE @start INT = PATINDEX(N'%[0-9]%', @version);
+    IF @version IS NULL OR @start = 0
+        RETURN NULL;
+    DECLARE @text NVARCHAR(50) = LOWER(SUBSTRING(@version, @start, 50));
+    DECLARE @i INT = 1, @length INT = LEN(@text), @part INT = 0, @value INT = 0, @char NCHAR(1);
+    DECLARE @major INT = 0, @minor INT = 0, @patch INT = 0, @rank INT = 3, @pre INT = 0;
+    WHILE @i <= @length
+    BEGIN
+        SET @char = SUBSTRING(@text, @i, 1);
+        IF @char LIKE N'[0-9]'
+            SET @value = CASE WHEN @value >= 100 THEN 999 ELSE @value * 10 + UNICODE(@char) - 48 END;
+        ELSE IF @char = N'.' AND SUBSTRING(@text, @i + 1, 1) LIKE N'[0-9]'
+        BEGIN
+            IF @part = 0 SET @major = @value;
+            ELSE IF @part = 1 SET @minor = @value;
+            ELSE IF @part = 2 SET @patch = @value;
+            SET @part = @part + 1;
+            SET @value = 0;
+        END
+        ELSE
+            BREAK;
+        SET @i = @i + 1;
+    END
+    IF @part = 0 SET @major = @value;
+    ELSE IF @part = 1 SET @minor = @value;
+    ELSE IF @part = 2 SET @patch = @value;
+
+    -- Канал випуску одразу після номера: 7.15rc2, 7.16 beta4
+    SET @text = LTRIM(SUBSTRING(@text, @i, 50));
+    SET @rank = CASE WHEN @text LIKE N'alpha%' THEN 0 WHEN @text LIKE N'beta%' THEN 1
+                     WHEN @text LIKE N'rc%' THEN 2 ELSE 3 END;
+    IF @rank < 3
+    BEGIN
+        SET @text = LTRIM(SUBSTRING(@text, CASE @rank WHEN 0 THEN 6 WHEN 1 THEN 5 ELSE 3 END, 50));
+        SET @i = 1;
+        WHILE @i <= LEN(@text) AND SUBSTRING(@text, @i, 1) LIKE N'[0-9]'
+        BEGIN
+            SET @pre = CASE WHEN @pre >= 100 THEN 999 ELSE @pre * 10 + UNICODE(SUBSTRING(@text, @i, 1)) - 48 END;
+            SET @i = @i + 1;
+        END
+    END
+    RETURN CAST(@major AS BIGINT) * 1000000000000 + CAST(@minor AS BIGINT) * 1000000000
+         + CAST(@patch AS BIGINT) * 1000000 + @rank * 1000 + @pre;
+END
+GO
+
+SET NOEXEC OFF;
+GO
+
+IF COL_LENGTH(N'[dbo].[MikroTikDevices]', N'installed_version_key') IS NULL
+    ALTER TABLE [dbo].[MikroTikDevices] ADD
+        [installed_version_key] AS [dbo].[RouterOSVersionKey]([installed_version]) PERSISTED,
+        [latest_version_key] AS [dbo].[RouterOSVersionKey]([latest_version]) PERSISTED,
+        [needs_update] AS CAST(CASE WHEN [dbo].[RouterOSVersionKey]([installed_version])
+                                         >= [dbo].[RouterOSVersionKey]([latest_version]) THEN 0 ELSE 1 END AS BIT) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_MikroTikDevices_NeedsUpdate')
+    CREATE INDEX IX_MikroTikDevices_NeedsUpdate ON [dbo].[MikroTikDevices] ([needs_update], [name])
+        INCLUDE ([host], [installed_version], [latest_version], [backup_status_final], [routerboard_firmware]);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_MikroTikDevices_InstalledVersion')
+    CREATE INDEX IX_MikroTikDevices_InstalledVersion ON [dbo].[MikroTikDevices] ([installed_version_key]);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_MikroTikDevices_Status')
+    CREATE INDEX IX_MikroTikDevices_Status ON [dbo].[MikroTikDevices] ([backup_status_final]);
+GO
+
+-- Історія змін конфігурації, порушення правил відповідності і спільна черга задач
+-- (export_diff.py, compliance.py, job_queue.py)
+IF OBJECT_ID(N'[dbo].[ConfigChanges]', N'U') IS NULL
+    CREATE TABLE [dbo].[ConfigChanges] (
+        [id] INT IDENTITY(1,1) PRIMARY KEY,
+        [device_id] INT NOT NULL,
+        [created_at] DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+        [export_name] NVARCHAR(200),
+        [previous_export_name] NVARCHAR(200),
+        [sections_changed] INT,
+        [lines_added] INT,
+        [lines_removed] INT,
+        [delta] NVARCHAR(MAX)
+    );
+IF OBJECT_ID(N'[dbo].[ComplianceFindings]', N'U') IS NULL
+    CREATE TABLE [dbo].[ComplianceFindings] (
+        [id] INT IDENTITY(1,1) PRIMARY KEY,
+        [device_id] INT NOT NULL,
+        [checked_at] DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+        [export_name] NVARCHAR(200),
+        [rule_id] NVARCHAR(100) NOT NULL,
+        [severity] NVARCHAR(20),
+        [description] NVARCHAR(400)
+    );
+IF OBJECT_ID(N'[dbo].[JobQueue]', N'U') IS NULL
+    CREATE TABLE [dbo].[JobQueue] (
+        [id] BIGINT IDENTITY(1,1) PRIMARY KEY,
+        [job_type] NVARCHAR(20) NOT NULL,
+        [device_id] INT NOT NULL,
+        [status] NVARCHAR(20) NOT NULL DEFAULT 'pending',
+        [attempts] INT NOT NULL DEFAULT 0,
+        [max_attempts] INT NOT NULL DEFAULT 3,
+        [worker_id] NVARCHAR(100),
+        [lease_expires_at] DATETIME2,
+        [enqueued_at] DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        [updated_at] DATETIME2,
+        [result] NVARCHAR(400)
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_ConfigChanges_Device')
+    CREATE INDEX IX_ConfigChanges_Device ON [dbo].[ConfigChanges] ([device_id], [created_at]);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_ComplianceFindings_Device')
+    CREATE INDEX IX_ComplianceFindings_Device ON [dbo].[ComplianceFindings] ([device_id]);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_JobQueue_Claim')
+    CREATE INDEX IX_JobQueue_Claim ON [dbo].[JobQueue] ([status], [lease_expires_at]) INCLUDE ([job_type], [device_id]);
+GO
+
+-- Сайти, групи, теги і збережені запити (цілі задач, ліміти паралельності за сайтами)
+IF OBJECT_ID(N'[dbo].[Sites]', N'U') IS NULL
+    CREATE TABLE [dbo].[Sites] (
+        [id] INT IDENTITY(1,1) PRIMARY KEY,
+        [name] NVARCHAR(100) NOT NULL UNIQUE,
+        [parent_id] INT NULL REFERENCES [dbo].[Sites] ([id]),
+        [max_concurrency] INT NULL
+    );
+IF COL_LENGTH(N'[dbo].[MikroTikDevices]', N'site_id') IS NULL
+    ALTER TABLE [dbo].[MikroTikDevices] ADD [site_id] INT NULL REFERENCES [dbo].[Sites] ([id]);
+IF OBJECT_ID(N'[dbo].[DeviceGroups]', N'U') IS NULL
+    CREATE TABLE [dbo].[DeviceGroups] (
+        [id] INT IDENTITY(1,1) PRIMARY KEY,
+        [kind] NVARCHAR(10) NOT NULL DEFAULT 'group' CHECK ([kind] IN ('group', 'tag')),
+        [name] NVARCHAR(100) NOT NULL,
+        CONSTRAINT UQ_DeviceGroups_KindName UNIQUE ([kind], [name])
+    );
+IF OBJECT_ID(N'[dbo].[DeviceGroupMembers]', N'U') IS NULL
+    CREATE TABLE [dbo].[DeviceGroupMembers] (
+        [group_id] INT NOT NULL REFERENCES [dbo].[DeviceGroups] ([id]) ON DELETE CASCADE,
+        [device_id] INT NOT NULL REFERENCES [dbo].[MikroTikDevices] ([id]) ON DELETE CASCADE,
+        PRIMARY KEY ([group_id], [device_id])
+    );
+IF OBJECT_ID(N'[dbo].[SavedQueries]', N'U') IS NULL
+    CREATE TABLE [dbo].[SavedQueries] (
+        [id] INT IDENTITY(1,1) PRIMARY KEY,
+        [name] NVARCHAR(100) NOT NULL UNIQUE,
+        [definition] NVARCHAR(MAX) NOT NULL,
+        [created_at] DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+        [updated_at] DATETIME2
+    );
+GO
+
+CREATE OR ALTER FUNCTION [dbo].[SiteSubtree] (@name NVARCHAR(100))
+RETURNS TABLE
+AS
+RETURN (
+    WITH tree AS (
+        SELECT [id] FROM [dbo].[Sites] WHERE [name] = @name
+        UNION ALL
+        SELECT s.[id] FROM [dbo].[Sites] s JOIN tree t ON s.[parent_id] = t.[id]
+    )
+    SELECT [id] FROM tree
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_MikroTikDevices_Site')
+    CREATE INDEX IX_MikroTikDevices_Site ON [dbo].[MikroTikDevices] ([site_id]);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Sites_Parent')
+    CREATE INDEX IX_Sites_Parent ON [dbo].[Sites] ([parent_id]);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_DeviceGroupMembers_Device')
+    CREATE INDEX IX_DeviceGroupMembers_Device ON [dbo].[DeviceGroupMembers] ([device_id], [group_id]);
+GO
+
+-- Серійні номери для пошуку нових пристроїв (discovery.py)
+IF COL_LENGTH(N'[dbo].[MikroTikDevices]', N'serial_number') IS NULL
+    ALTER TABLE [dbo].[MikroTikDevices] ADD [serial_number] NVARCHAR(50) NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_MikroTikDevices_Serial')
+    CREATE INDEX IX_MikroTikDevices_Serial ON [dbo].[MikroTikDevices] ([serial_number]) WHERE [serial_number] IS NOT NULL;
+GO
+
+-- Ліміти швидкості передачі бекапів за сайтами (throttle.py)
+IF COL_LENGTH(N'[dbo].[Sites]', N'bandwidth_kbps') IS NULL
+    ALTER TABLE [dbo].[Sites] ADD [bandwidth_kbps] INT NULL;
+GO
+
+-- Версії рядків для відбитка налаштувань та інвентарю (settings_store.py): MAX([row_version]) і COUNT(*) на таблицю
+IF COL_LENGTH(N'[dbo].[TelegramSettings]', N'row_version') IS NULL
+    ALTER TABLE [dbo].[TelegramSettings] ADD [row_version] ROWVERSION;
+IF COL_LENGTH(N'[dbo].[FTPSettings]', N'row_version') IS NULL
+    ALTER TABLE [dbo].[FTPSettings] ADD [row_version] ROWVERSION;
+IF COL_LENGTH(N'[dbo].[TelegramChatIds]', N'row_version') IS NULL
+    ALTER TABLE [dbo].[TelegramChatIds] ADD [row_version] ROWVERSION;
+IF COL_LENGTH(N'[dbo].[MikroTikDevices]', N'row_version') IS NULL
+    ALTER TABLE [dbo].[MikroTikDevices] ADD [row_version] ROWVERSION;
+IF COL_LENGTH(N'[dbo].[Sites]', N'row_version') IS NULL
+    ALTER TABLE [dbo].[Sites] ADD [row_version] ROWVERSION;
+IF COL_LENGTH(N'[dbo].[DeviceGroups]', N'row_version') IS NULL
+    ALTER TABLE [dbo].[DeviceGroups] ADD [row_version] ROWVERSION;
+IF COL_LENGTH(N'[dbo].[DeviceGroupMembers]', N'row_version') IS NULL
+    ALTER TABLE [dbo].[DeviceGroupMembers] ADD [row_version] ROWVERSION;
+IF COL_LENGTH(N'[dbo].[SavedQueries]', N'row_version') IS NULL
+    ALTER TABLE [dbo].[SavedQueries] ADD [row_version] ROWVERSION;
+GO
@@ -3,9 +3,9 @@
 
 a = Analysis(
     ['ico\\icon.ico', 'myUi.py'],
-    pathex=[],
+    pathex=['..'],
     binaries=[],
-    datas=[('ico', 'UI/ico')],
+    datas=[('ico', 'UI/ico'), ('..\\compliance_rules.json', '.')],
     hiddenimports=['PyQt5', 'netmiko', 'paramiko', 'pyodbc', 'routeros_api', 'qdarkstyle', 'requests--icon'],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,175 @@
+import os
+import re
+import queue
+import logging
+import logging.handlers
+from collections import deque
+from datetime import datetime
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QComboBox, QLineEdit
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtCore import QTimer
+
+# Панель логу для MainWindow: повідомлення від воркерів буферизуються і додаються у віджет
+# пачкою з фіксованою частотою кадрів, видима історія обмежена (maximumBlockCount),
+# повний лог пишеться у файл з ротацією окремим потоком (QueueListener).
+
+FLUSH_INTERVAL_MS = 100  # 10 кадрів на секунду
+MAX_VISIBLE_LINES = 5000
+LOG_FILE_BYTES = 5 * 1024 * 1024
+LOG_FILE_COUNT = 5
+
+INFO, WARNING, ERROR = 0, 1, 2
+SEVERITY_LEVELS = {INFO: logging.INFO, WARNING: logging.WARNING, ERROR: logging.ERROR}
+ERROR_RE = re.compile(r'❌|\bпомилка\b|\bне вдалося\b|\berror\b', re.IGNORECASE)
+WARNING_RE = re.compile(r'⚠|попередження|перерван', re.IGNORECASE)
+# Розрив рядка всередині блоку: багаторядкове повідомлення (звіт профілю) залишається одним блоком
+LINE_SEPARATOR = "\u2028"
+
+
+def classify_severity(message):
+    if ERROR_RE.search(message):
+        return ERROR
+    if WARNING_RE.search(message):
+        return WARNING
+    return INFO
+
+
+def open_file_log(log_dir, name="gui.log"):
+    """Логер з RotatingFileHandler за QueueListener: запис на диск не блокує потік GUI."""
+    os.makedirs(log_dir, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(os.path.join(log_dir, name), maxBytes=LOG_FILE_BYTES,
+                                                   backupCount=LOG_FILE_COUNT, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    logger = logging.getLogger(f"mikrotik_manager.{name}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [logging.handlers.QueueHandler(records)]
+    return logger, listener
+
+
+class LogPanel(QWidget):
+    """
+    Замінник QTextEdit для логу: append() лише кладе повідомлення в буфер, QTimer раз на
+    FLUSH_INTERVAL_MS вставляє все накопичене одним редагуванням документа.
+    Кожне повідомлення - один блок QPlainTextEdit; рівень і пристрій зберігаються в userState блоку,
+    тож фільтр лише ховає/показує блоки без повторного заповнення віджета.
+    """
+
+    def __init__(self, log_dir=None, max_lines=MAX_VISIBLE_LINES, flush_interval_ms=FLUSH_INTERVAL_MS, parent=None):
+        super().__init__(parent)
+        self._pending = deque()
+        self._device_ids = {}  # назва пристрою -> номер (0 - повідомлення без пристрою)
+        self._device_re = None
+        self._min_severity = INFO
+        self._visible_devices = None  # None - усі пристрої
+        self.logger, self._listener = open_file_log(log_dir) if log_dir else (None, None)
+
+        self.view = QPlainTextEdit()
+        self.view.setReadOnly(True)
+        self.view.setMaximumBlockCount(max_lines)
+        self.view.setUndoRedoEnabled(False)
+
+        self.severity_filter = QComboBox()
+        self.severity_filter.addItems(["Усі", "Попередження і помилки", "Лише помилки"])
+        self.severity_filter.currentIndexChanged.connect(self._filter_changed)
+        self.device_filter = QLineEdit()
+        self.device_filter.setPlaceholderText("Фільтр за пристроєм")
+        self.device_filter.textChanged.connect(self._filter_changed)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.setContentsMargins(0, 0, 0, 0)
+        filter_layout.addWidget(self.severity_filter)
+        filter_layout.addWidget(self.device_filter)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.view)
+        self.setLayout(layout)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(flush_interval_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def set_devices(self, names):
+        """Відомі назви пристроїв для визначення, якого пристрою стосується повідомлення."""
+        for name in names:
+            if name and name not in self._device_ids:
+                self._device_ids[name] = len(self._device_ids) + 1
+        names = sorted(self._device_ids, key=len, reverse=True)  # Довші назви першими: "R1-core" раніше за "R1"
+        self._device_re = re.compile(r"(?<![\w-])(?:" + "|".join(map(re.escape, names)) + r")(?![\w-])") \
+            if names else None
+
+    def append(self, message):
+        message = str(message)
+        severity = classify_severity(message)
+        self._pending.append((datetime.now(), message, severity, self._device_of(message)))
+        if self.logger:
+            self.logger.log(SEVERITY_LEVELS[severity], message.replace("\n", " | "))
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _device_of(self, message):
+        if self._device_re is None:
+            return 0
+        match = self._device_re.search(message)
+        return self._device_ids[match.group(0)] if match else 0
+
+    def _is_visible(self, severity, device_id):
+        if severity < self._min_severity:
+            return False
+        return self._visible_devices is None or device_id in self._visible_devices
+
+    def flush(self):
+        if not self._pending:
+            self._timer.stop()
+            return
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        # Старіші рядки однаково витіснить maximumBlockCount - не вставляємо їх зовсім
+        batch = batch[-self.view.maximumBlockCount():]
+
+        scrollbar = self.view.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 2
+        document = self.view.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for logged_at, message, severity, device_id in batch:
+            if not document.isEmpty():
+                cursor.insertBlock()
+            cursor.insertText(f"{logged_at:%H:%M:%S} {message}".replace("\n", LINE_SEPARATOR))
+            block = cursor.block()
+            block.setUserState(device_id * 4 + severity)
+            block.setVisible(self._is_visible(severity, device_id))
+        cursor.endEditBlock()
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def _filter_changed(self, *_):
+        self._min_severity = self.severity_filter.currentIndex()
+        text = self.device_filter.text().strip().lower()
+        self._visible_devices = None if not text else \
+            {device_id for name, device_id in self._device_ids.items() if text in name.lower()}
+        document = self.view.document()
+        block = document.firstBlock()
+        while block.isValid():
+            state = max(block.userState(), 0)
+            block.setVisible(self._is_visible(state % 4, state // 4))
+            block = block.next()
+        # Перерахунок розмітки без зміни тексту
+        document.markContentsDirty(0, document.characterCount())
+        self.view.viewport().update()
+
+    def clear(self):
+        self._pending.clear()
+        self.view.clear()
+
+    def close_file_log(self):
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
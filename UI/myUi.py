@@ -1,394 +1,347 @@
 import sys
 import os
 import time as time_module
-import re
+import json
 from datetime import datetime
-import ftplib
-import paramiko
-from netmiko import ConnectHandler, exceptions as netmiko_exceptions
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, \
-    QLineEdit, QMessageBox, QTableWidget, QTableWidgetItem, QCheckBox, QTextEdit, QFrame
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
+    QLineEdit, QMessageBox, QTableWidget, QTableWidgetItem, QCheckBox, QFrame, QComboBox, QInputDialog, \
+    QFileDialog
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal, Qt
 from PyQt5.QtGui import QFont, QColor, QPalette, QIcon
-import pyodbc
-import requests
-from concurrent.futures import ThreadPoolExecutor
 import traceback
-import routeros_api
-import subprocess
-from importlib.metadata import distribution
+import multiprocessing
+
+# Спільні модулі (операції з пристроями, очищення бекапів тощо) лежать у корені репозиторію
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lazy_import import lazy, preload
+from export_diff import BACKUP_DIR, diff_export, format_summary
+from export_index import index_exports
+from compliance import evaluate_fleet, format_digest, save_findings
+from job_journal import JobJournal, device_key
+from concurrency import AimdController, run_adaptive
+from stage_timing import RunProfiler, bind, span
+from routeros_parsers import needs_update, parse_update_check, parse_version
+from log_sink import LogPanel
+from sparkline import VALUES_ROLE, SparklineDelegate
+import device_events
+
+# Мережеві бібліотеки і драйвер БД завантажуються при першому використанні або у фоні після показу вікна входу
+netmiko = lazy("netmiko")
+pyodbc = lazy("pyodbc")
+requests = lazy("requests")
+routeros_api = lazy("routeros_api")
+mikrotik_ops = lazy("mikrotik_ops")
+backup_cleanup = lazy("backup_cleanup")
+settings_store = lazy("settings_store")
+inventory = lazy("inventory")
+device_import = lazy("device_import")
+health_poller = lazy("health_poller")
+command_runner = lazy("command_runner")
+config_push = lazy("config_push")
+throttle = lazy("throttle")
+PRELOAD_MODULES = ("pyodbc", "requests", "paramiko", "netmiko", "routeros_api", "mikrotik_ops", "backup_cleanup",
+                   "settings_store", "inventory")
 
 try:
     import qdarkstyle
 except ImportError:
     print("Бібліотека qdarkstyle не встановлена. Використовуватиму стандартний стиль.")
 
-# Початкові константи
-BACKUP_DIR = "./BackUp/"
-CHAT_IDS = []  # Буде завантажено з бази
+REQUIRED_PACKAGES = {
+    'PyQt5': 'PyQt5',
+    'pyodbc': 'pyodbc',
+    'netmiko': 'netmiko',
+    'paramiko': 'paramiko',
+    'requests': 'requests',
+    'routeros_api': 'routeros_api',
+    'qdarkstyle': 'qdarkstyle',
+    'cryptography': 'cryptography'  # Шифрування локального кешу налаштувань (settings_store.py)
+}
 
-def check_and_install_dependencies():
+
+def check_dependencies(install=False):
     """
-    Перевіряє наявність залежностей і встановлює їх, якщо код запускається як .py.
+    Діагностика залежностей (myUi.py --check-deps): версія і час імпорту кожного пакета.
+    З --install відсутні пакети встановлюються через pip (лише для запуску як .py).
     У скомпільованому .exe залежності мають бути включені PyInstaller'ом.
+    Повертає кількість відсутніх пакетів.
     """
-    if getattr(sys, 'frozen', False):  # Перевіряємо, чи код скомпільовано в .exe
+    import importlib
+    import subprocess
+    from importlib.metadata import version, PackageNotFoundError
+
+    frozen = getattr(sys, 'frozen', False)
+    if frozen:
         print("Запущено скомпільований .exe. Усі залежності мають бути включені під час компіляції.")
-        return
-
-    required_packages = {
-        'PyQt5': 'PyQt5',
-        'pyodbc': 'pyodbc',
-        'netmiko': 'netmiko',
-        'paramiko': 'paramiko',
-        'requests': 'requests',
-        'routeros_api': 'routeros_api',
-        'qdarkstyle': 'qdarkstyle'
-    }
 
     max_attempts = 3
-
-    for package_name, pip_name in required_packages.items():
-        attempts = 0
-        installed = False
-
-        while attempts < max_attempts and not installed:
-            try:
-                print(f"Перевіряємо залежність: {package_name} (спроба {attempts + 1}/{max_attempts})...")
-                distribution(package_name)
-                print(f"Залежність {package_name} вже встановлена.")
-                installed = True
-            except ImportError as e:
-                print(f"Залежність {package_name} не знайдена. Встановлюємо... (Помилка: {str(e)})")
-                try:
-                    print(f"Виконуємо: {sys.executable} -m pip install {pip_name}")
-                    subprocess.check_call([sys.executable, "-m", "pip", "install", pip_name])
-                    print(f"Успішно встановлено {package_name}.")
-                    installed = True
-                except subprocess.CalledProcessError as e:
-                    print(f"Помилка при встановленні {package_name}: {str(e)}")
-                    attempts += 1
-                    if attempts == max_attempts:
-                        print(f"Не вдалося встановити {package_name} після {max_attempts} спроб.")
-                        sys.exit(1)
-
-def attempt_connection(mikrotik, max_retries=3):
-    for attempt in range(1, max_retries + 1):
+    missing = 0
+    for package_name, pip_name in REQUIRED_PACKAGES.items():
+        started = time_module.perf_counter()
         try:
-            device = {
-                "device_type": "mikrotik_routeros",
-                "host": mikrotik['host'],
-                "username": mikrotik['user'] if 'user' in mikrotik and mikrotik['user'] else "admin",
-                # Типовий логін MikroTik
-                "password": mikrotik['password'] if 'password' in mikrotik and mikrotik['password'] else "",
-                # Типовий пароль (може бути порожнім або заданим)
-                "port": 22,  # Явно вказуємо порт
-                "timeout": 20,
-                "conn_timeout": 30  # Таймаут для з'єднання
-            }
-            print(f"Спроба {attempt} підключення до {mikrotik['host']} з логіном {device['username']} і паролем ****")
-            with ConnectHandler(**device) as ssh_conn:
-                print(f"Успішно підключено до {mikrotik['host']} з логіном {device['username']} і паролем ****")
-                return True
-        except netmiko_exceptions.NetmikoAuthenticationException as e:
-            print(f"Помилка автентифікації до {mikrotik['host']} (спроба {attempt}): {str(e)}")
-            if attempt < max_retries:
-                print(f"Зачекайте 1 секунду перед повторною спробою для {mikrotik['host']}...")
-                time_module.sleep(1)
+            importlib.import_module(package_name)
+            elapsed = time_module.perf_counter() - started
+            try:
+                package_version = version(pip_name)
+            except PackageNotFoundError:
+                package_version = "?"
+            print(f"✅ {package_name} {package_version} (імпорт {elapsed * 1000:.0f} мс)")
             continue
-        except Exception as e:
-            print(f"Помилка підключення до {mikrotik['host']} (спроба {attempt}): {str(e)}")
-            if attempt < max_retries:
-                print(f"Зачекайте 1 секунду перед повторною спробою для {mikrotik['host']}...")
-                time_module.sleep(1)
-    print(f"Не вдалося підключитися до {mikrotik['host']} після {max_retries} спроб.")
-    return False
-
-
-def check_versions(mikrotik):
-    try:
-        device = {
-            "device_type": "mikrotik_routeros",
-            "host": mikrotik['host'],
-            "username": mikrotik['user'],
-            "password": mikrotik['password'],
-            "port": 22,  # Явно вказуємо порт
-            "timeout": 20,
-            "conn_timeout": 30  # Таймаут для з'єднання
-        }
-        with ConnectHandler(**device) as ssh_conn:
-            print(f"Успішно підключено до {mikrotik['host']} для перевірки версій")
-            output_package = ssh_conn.send_command('/system package update check-for-updates', delay_factor=2.0)
-            output_routerboard = ssh_conn.send_command('/system routerboard print', delay_factor=2.0)
-
-            # Отримання версії пакету
-            installed_version = next(
-                (line.split(':')[1].strip() for line in output_package.splitlines() if "installed-version" in line),
-                None)
-            latest_version = next(
-                (line.split(':')[1].strip() for line in output_package.splitlines() if "latest-version" in line), None)
-
-            # Отримання версії прошивки RouterBoard
-            routerboard_firmware = None
-            for line in output_routerboard.splitlines():
-                if "current-firmware" in line:
-                    routerboard_firmware = line.split(':')[1].strip()
-                    break
-
-            return installed_version, latest_version, routerboard_firmware
-    except Exception as e:
-        print(f"Помилка перевірки версій для {mikrotik['host']}: {str(e)}")
-        return None, None, None
-
-
-def create_backup(mikrotik):
-    try:
-        backup_name = f"{mikrotik['name']}-Backup-{datetime.now().strftime('%Y%m%d-%H%M')}"
-        device = {
-            "device_type": "mikrotik_routeros",
-            "host": mikrotik['host'],
-            "username": mikrotik['user'],
-            "password": mikrotik['password'],
-            "port": 22,  # Явно вказуємо порт
-            "timeout": 20,
-            "conn_timeout": 30  # Таймаут для з'єднання
-        }
-
-        print(f"Підключення до {mikrotik['host']}...")
-        with ConnectHandler(**device) as ssh_conn:
-            print(f"Успішно підключено до {mikrotik['host']} для створення бекапу")
-            print(f"Підключено до {mikrotik['host']}. Створення бекапу...")
-            ssh_conn.send_command(f'/system backup save name={backup_name}', delay_factor=2.0)
-            time_module.sleep(3)
-            ssh_conn.send_command(f'/export file={backup_name}', delay_factor=2.0)
-            time_module.sleep(1)
-        return backup_name, None
-    except Exception as e:
-        error_message = f"Помилка авторизації на #{mikrotik['name']} ({mikrotik['host']}): {str(e)}"[
-                        :200]  # Обмежуємо довжину до 200 символів
-        print(error_message)
-        return None, error_message
-
-
-def download_backup(mikrotik, backup_name):
-    try:
-        mikrotik_dir = os.path.join(BACKUP_DIR, mikrotik['name'])
-        os.makedirs(mikrotik_dir, exist_ok=True)
-
-        local_backup = os.path.join(mikrotik_dir, f"{backup_name}.backup")
-        local_rsc = os.path.join(mikrotik_dir, f"{backup_name}.rsc")
-
-        print(f"Завантаження бекапу з {mikrotik['host']}...")
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(mikrotik['host'], username=mikrotik['user'], password=mikrotik['password'], port=22, timeout=20)
-
-        sftp = ssh.open_sftp()
-        sftp.get(f"/{backup_name}.backup", local_backup)
-        time_module.sleep(3)
-        sftp.get(f"/{backup_name}.rsc", local_rsc)
-        time_module.sleep(1)
-        sftp.close()
-        ssh.close()
-
-        return local_backup, local_rsc, None
-    except Exception as e:
-        error_message = f"Помилка авторизації або завантаження на #{mikrotik['name']} ({mikrotik['host']}): {str(e)}"[
-                        :200]  # Обмежуємо довжину до 200 символів
-        print(error_message)
-        return None, None, error_message
-
-
-def upload_backup_to_ftp(local_file, backup_name, ftp_config, file_type='backup'):
-    try:
-        print(f"Завантаження на FTP {backup_name}...")
-        ftp = ftplib.FTP(ftp_config['host'], timeout=20)
-        ftp.login(ftp_config['username'], ftp_config['password'])
-        remote_dir = f"{ftp_config['dir']}/{backup_name.split('-')[0]}"
-
-        try:
-            ftp.mkd(remote_dir)
-        except ftplib.error_perm:
-            pass
-
-        remote_file = f"{remote_dir}/{backup_name}.{file_type}"
-        with open(local_file, 'rb') as file:
-            ftp.storbinary(f"STOR {remote_file}", file)
-
-        ftp.quit()
-        return True, None
-    except Exception as e:
-        error_message = f"Помилка завантаження на FTP {backup_name}: {str(e)}"[
-                        :200]  # Обмежуємо довжину до 200 символів
-        print(error_message)
-        return False, error_message
-
-
-def delete_old_backups(mikrotik, keep_count=2):
-    try:
-        device = {
-            "device_type": "mikrotik_routeros",
-            "host": mikrotik['host'],
-            "username": mikrotik['user'],
-            "password": mikrotik['password'],
-            "port": 22,  # Явно вказуємо порт
-            "timeout": 20,
-            "conn_timeout": 30  # Таймаут для з'єднання
-        }
-
-        with ConnectHandler(**device) as ssh_conn:
-            print(f"Успішно підключено до {mikrotik['host']} для видалення старих бекапів")
-            backups = ssh_conn.send_command('/file print', delay_factor=2.0)
-            print(f"📜 Отриманий список файлів:\n{backups}")
-
-            backup_files = []
-            for line in backups.splitlines():
-                match = re.search(r'(\S+\.backup|\S+\.rsc)', line)
-                if match:
-                    backup_files.append(match.group(1))
-
-            print(f"📂 Вибрані файли для аналізу: {backup_files}")
-
-            if not backup_files:
-                print(f"⚠ На {mikrotik['name']} немає файлів для видалення.")
-                return False
-
-            def extract_datetime(file_name):
-                match = re.search(r'(\d{8}-\d{4})', file_name)
-                if match:
-                    try:
-                        dt = datetime.strptime(match.group(1), "%Y%m%d-%H%M")
-                        return dt
-                    except ValueError:
-                        print(f"⚠ Помилка парсингу дати у файлі: {file_name}")
-                        return None
-                print(f"⚠ Дата не знайдена у файлі: {file_name}")
-                return None
-
-            backup_files_with_dates = [(file, extract_datetime(file)) for file in backup_files]
-            backup_files_with_dates = [item for item in backup_files_with_dates if item[1] is not None]
-
-            if not backup_files_with_dates:
-                print(f"⚠ Жоден файл не має правильної дати! Перевір регулярний вираз.")
-                return False
-
-            backup_files_with_dates.sort(key=lambda x: x[1])
-
-            sorted_files = "\n".join(f"{file} ({date})" for file, date in backup_files_with_dates)
-            print(f"📂 Відсортований список файлів на {mikrotik['name']}:\n{sorted_files}")
-
-            files_to_delete = backup_files_with_dates[:-keep_count]
-
-            if not files_to_delete:
-                print(f"✅ На {mikrotik['name']} немає файлів для видалення.")
-                return False
-
-            for file, date in files_to_delete:
-                print(f"❌ Видаляємо файл: {file} ({date})")
-                ssh_conn.send_command(f'/file remove "{file}"', delay_factor=2.0)
-
-            return True
-    except Exception as e:
-        error_message = f"Помилка видалення бекапів на {mikrotik['name']} ({mikrotik['host']}): {str(e)}"[
-                        :200]  # Обмежуємо довжину до 200 символів
-        print(error_message)
-        return False
-
-
-def send_telegram_message_async(token, message):
-    if not CHAT_IDS:
-        print("Не знайдено жодного chat_id для відправки повідомлення. Повідомлення не відправлено.")
-        return
-
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    successes = 0
-    failures = 0
-
-    for chat_id in CHAT_IDS:
-        try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                cleaned_message = message.replace('*', '').replace('_', '').strip()
-                future = executor.submit(requests.get, url, params={'chat_id': chat_id, 'text': cleaned_message},
-                                         timeout=15)
-                response = future.result(timeout=20)
-                print(f"Telegram API відповідь для chat_id {chat_id}: {response.status_code}, {response.text}")
-                if response.status_code == 200 and response.json().get('ok'):
-                    successes += 1
-                else:
-                    failures += 1
-                    print(f"Помилка відправки повідомлення до chat_id {chat_id}: {response.text}")
-        except requests.RequestException as e:
-            failures += 1
-            print(f"Мережева помилка відправки до chat_id {chat_id}: {str(e)}")
-        except Exception as e:
-            failures += 1
-            print(f"Невідома помилка відправки до chat_id {chat_id}: {str(e)}")
-        time_module.sleep(0.5)  # Затримка між відправками для уникнення лімітів Telegram
-
-    print(f"Успішно надіслано повідомлення: {successes}, невдало: {failures}")
+        except ImportError as e:
+            print(f"❌ {package_name}: {str(e)}")
 
+        if not install or frozen:
+            missing += 1
+            continue
+        for attempt in range(1, max_attempts + 1):
+            try:
+                print(f"Виконуємо: {sys.executable} -m pip install {pip_name} (спроба {attempt}/{max_attempts})")
+                subprocess.check_call([sys.executable, "-m", "pip", "install", pip_name])
+                print(f"Успішно встановлено {package_name}.")
+                break
+            except subprocess.CalledProcessError as e:
+                print(f"Помилка при встановленні {package_name}: {str(e)}")
+        else:
+            print(f"Не вдалося встановити {package_name} після {max_attempts} спроб.")
+            missing += 1
+    return missing
 
 # Потік для резервного копіювання
 class BackupWorker(QThread):
     update_signal = pyqtSignal(str)
+    concurrency_signal = pyqtSignal(int)
     finished_signal = pyqtSignal()
 
-    def __init__(self, devices, conn_str, telegram_token, ftp_config):
+    def __init__(self, devices, conn_str, telegram_token, ftp_config, resume_run_id=None):
         super().__init__()
         self.devices = devices
         self.conn_str = conn_str
         self.telegram_token = telegram_token
         self.ftp_config = ftp_config
+        self.resume_run_id = resume_run_id
+        self.backed_up = []
 
     def run(self):
+        # Кількість пристроїв, що обробляються одночасно, підлаштовується під затримки етапів та помилки
+        self.controller = AimdController(on_change=self.concurrency_changed)
+        self.profiler = RunProfiler("backup", on_span=self.controller.observe)
+        try:
+            # Ліміти швидкості передачі: config.json "throttle" (якщо є) і Sites.bandwidth_kbps
+            throttle.configure(throttle.load_settings(), self.conn_str)
+        except Exception as e:
+            self.update_signal.emit(f"Помилка налаштувань обмеження швидкості: {str(e)[:200]}")
+        throttle_mark = throttle.THROTTLE.mark()
+        with bind(self.profiler):
+            self.run_backups()
+        self.report_profile()
+        throttle_summary = throttle.THROTTLE.summary(throttle_mark)
+        if throttle_summary:
+            self.update_signal.emit(throttle_summary)
+        self.finished_signal.emit()
+
+    def run_backups(self):
+        self.journal = JobJournal(BACKUP_DIR)
+        if self.resume_run_id:
+            self.run_id = self.resume_run_id
+            states = self.journal.device_states(self.run_id)
+            self.update_signal.emit(f"Продовжуємо перерваний запуск #{self.run_id}")
+        else:
+            self.run_id = self.journal.start_run("backup", self.devices)
+            states = {}
+        self.profiler.run_ref = self.run_id
+
         self.update_signal.emit(f"Розпочато планові бекапи! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
-        send_telegram_message_async(self.telegram_token,
-                                    f"🔹 Розпочато планові бекапи! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
+        mikrotik_ops.send_telegram_message_async(self.telegram_token,
+                                                 f"🔹 Розпочато планові бекапи! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
 
+        pending = []
         for idx, mikrotik in enumerate(self.devices, start=1):
-            if self.isInterruptionRequested():
-                self.update_signal.emit("Резервне копіювання перервано.")
-                break
+            stage, data = states.get(device_key(mikrotik), (None, {}))
+            if stage == "done":
+                self.update_signal.emit(f"{mikrotik['name']}: бекап уже виконано в цьому запуску, пропускаємо.")
+                continue
+            pending.append((idx, mikrotik, stage, data))
+
+        self.concurrency_signal.emit(self.controller.limit)
+        # Ліміти сайтів (Sites.max_concurrency) - поверх загального адаптивного ліміту
+        completed = run_adaptive(pending, self.process_device, self.controller,
+                                 should_stop=self.isInterruptionRequested,
+                                 site_limits=inventory.load_site_limits(self.conn_str),
+                                 site_of=lambda item: item[1].get('site_id'))
+        if completed:
+            self.journal.finish_run(self.run_id)
+        else:
+            self.update_signal.emit("Резервне копіювання перервано.")
+        self.journal.close()
+
+        self.run_compliance_check(self.backed_up)
+        concurrency_summary = self.controller.summary()
+        self.update_signal.emit(concurrency_summary)
+        mikrotik_ops.send_telegram_message_async(self.telegram_token, concurrency_summary)
+        self.update_signal.emit(f"Завдання виконано! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
+        mikrotik_ops.send_telegram_message_async(self.telegram_token,
+                                                 f"✅ Завдання виконано! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
+
+    def concurrency_changed(self, limit, reason):
+        self.update_signal.emit(f"Паралельність змінено на {limit} ({reason})")
+        self.concurrency_signal.emit(limit)
+
+    def report_profile(self):
+        try:
+            report = self.profiler.finish(BACKUP_DIR)
+        except Exception as e:
+            self.update_signal.emit(f"Помилка збереження профілю запуску: {str(e)}")
+            return
+        if report:
+            self.update_signal.emit(report)
 
+    def process_device(self, item):
+        idx, mikrotik, stage, data = item
+        with device_events.track("backup", mikrotik):
             try:
-                if attempt_connection(mikrotik):
-                    backup_name, backup_error = create_backup(mikrotik)
-                    if backup_name:
-                        local_backup, local_rsc, download_error = download_backup(mikrotik, backup_name)
-                        if local_backup and local_rsc:
-                            upload_backup_to_ftp(local_backup, backup_name, self.ftp_config, 'backup')
-                            upload_backup_to_ftp(local_rsc, backup_name, self.ftp_config, 'rsc')
-                            delete_old_backups(mikrotik)
-                        status = f"Бекап для {mikrotik['name']} завершено успішно: {backup_name}"
-                        self.update_device_status(mikrotik['id'], status, "OK")
-                        self.update_signal.emit(f"Успіх для {mikrotik['name']}: {status}")
-                        send_telegram_message_async(self.telegram_token,
-                                                    f"🔹 #{idx} *#{mikrotik['name']}* ({mikrotik['host']}):\n{status}")
-                    else:
-                        self.update_signal.emit(backup_error)
-                        self.update_device_status(mikrotik['id'], backup_error, "Error")
-                        send_telegram_message_async(self.telegram_token, backup_error)
-                else:
-                    error_msg = f"❌ Не вдалося підключитись до {mikrotik['host']} після 3 спроб. Пропускаємо."
-                    self.update_signal.emit(error_msg)
-                    self.update_device_status(mikrotik['id'], error_msg, "Error")
-                    send_telegram_message_async(self.telegram_token, error_msg)
+                with bind(self.profiler, mikrotik['name']):
+                    return self.backup_device(idx, mikrotik, stage, data)
             except Exception as e:
                 error_msg = f"Помилка обробки {mikrotik['name']} ({mikrotik['host']}): {str(e)}"
-                self.update_signal.emit(error_msg)
-                self.update_device_status(mikrotik['id'], error_msg, "Error")
-                send_telegram_message_async(self.telegram_token, error_msg)
+                self.fail_device(mikrotik, error_msg)
+                return False, error_msg
+
+    def backup_device(self, idx, mikrotik, stage, data):
+        """
+        Виконує етапи бекапу пристрою, починаючи з останнього завершеного етапу з журналу:
+        якщо бекап уже створено на роутері - лише завантаження і вивантаження на FTP.
+        Повертає (успіх, помилка) для контролера паралельності.
+        """
+        backup_name = data.get('backup_name')
+        local_backup, local_rsc = data.get('local_backup'), data.get('local_rsc')
+        if stage in ("downloaded", "uploaded") and not (
+                local_backup and local_rsc and os.path.exists(local_backup) and os.path.exists(local_rsc)):
+            stage = "created"  # Локальних файлів уже немає - завантажуємо повторно
+
+        if stage in ("created", "downloaded", "uploaded") and backup_name:
+            self.update_signal.emit(f"Продовжуємо {mikrotik['name']} з етапу '{stage}' ({backup_name})")
+        else:
+            device_events.progress("connect")
+            if not mikrotik_ops.attempt_connection(mikrotik):
+                error_msg = f"❌ Не вдалося підключитись до {mikrotik['host']} після 3 спроб. Пропускаємо."
+                self.fail_device(mikrotik, error_msg)
+                return False, "timeout"
+            self.journal.record(self.run_id, mikrotik, "connected")
+            device_events.progress("backup")
+            backup_name, backup_error = mikrotik_ops.create_backup(mikrotik)
+            if not backup_name:
+                self.fail_device(mikrotik, backup_error)
+                return False, backup_error
+            self.journal.record(self.run_id, mikrotik, "created", backup_name=backup_name)
+            stage = "created"
+
+        if stage == "created":
+            device_events.progress("download")
+            local_backup, local_rsc, download_error = mikrotik_ops.download_backup(mikrotik, backup_name)
+            if not (local_backup and local_rsc):
+                error_msg = download_error or f"❌ Не вдалося завантажити бекап {backup_name} з {mikrotik['host']}"
+                self.fail_device(mikrotik, error_msg)
+                return False, error_msg
+            self.journal.record(self.run_id, mikrotik, "downloaded", backup_name=backup_name,
+                                local_backup=local_backup, local_rsc=local_rsc)
+            stage = "downloaded"
+
+        if stage == "downloaded":
+            device_events.progress("upload")
+            # Етапи "uploaded" і "done" - лише після успішного вивантаження обох файлів
+            for local_file, file_type in ((local_backup, 'backup'), (local_rsc, 'rsc')):
+                uploaded, upload_error = mikrotik_ops.upload_backup_to_ftp(local_file, backup_name, self.ftp_config,
+                                                                           file_type, mikrotik)
+                if not uploaded:
+                    self.fail_device(mikrotik, upload_error)
+                    return False, upload_error
+            self.journal.record(self.run_id, mikrotik, "uploaded", backup_name=backup_name,
+                                local_backup=local_backup, local_rsc=local_rsc)
+            stage = "uploaded"
+
+        if stage == "uploaded":
+            device_events.progress("cleanup")
+            with span("cleanup"):
+                backup_cleanup.delete_old_backups(mikrotik)
+            with span("diff"):
+                self.report_config_changes(mikrotik, local_rsc)
+            with span("index"):
+                self.index_export(mikrotik, local_rsc)
+            self.backed_up.append(mikrotik)
+
+        status = f"Бекап для {mikrotik['name']} завершено успішно: {backup_name}"
+        self.update_device_status(mikrotik['id'], status, "OK")
+        self.update_signal.emit(f"Успіх для {mikrotik['name']}: {status}")
+        mikrotik_ops.send_telegram_message_async(self.telegram_token,
+                                                 f"🔹 #{idx} *#{mikrotik['name']}* ({mikrotik['host']}):\n{status}")
+        self.journal.record(self.run_id, mikrotik, "done", backup_name=backup_name)
+        return True, None
 
-            time_module.sleep(2)  # Збільшена затримка для зменшення навантаження
+    def fail_device(self, mikrotik, error_msg):
+        self.update_signal.emit(error_msg)
+        self.update_device_status(mikrotik['id'], error_msg, "Error")
+        mikrotik_ops.send_telegram_message_async(self.telegram_token, error_msg)
+        self.journal.record(self.run_id, mikrotik, "failed", error=error_msg[:200])
 
-        self.update_signal.emit(f"Завдання виконано! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
-        send_telegram_message_async(self.telegram_token,
-                                    f"✅ Завдання виконано! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
-        self.finished_signal.emit()
+    def report_config_changes(self, mikrotik, local_rsc):
+        try:
+            delta = diff_export(mikrotik['name'], local_rsc, BACKUP_DIR)
+        except Exception as e:
+            self.update_signal.emit(f"Помилка порівняння експорту для {mikrotik['name']}: {str(e)}")
+            return
+        summary = format_summary(delta)
+        if not summary:
+            return
+        self.update_signal.emit(summary)
+        self.save_config_change(mikrotik['id'], delta)
+        mikrotik_ops.send_telegram_message_async(self.telegram_token, summary)
+
+    def run_compliance_check(self, devices):
+        if not devices:
+            return
+        try:
+            results = evaluate_fleet(BACKUP_DIR, devices=[mikrotik['name'] for mikrotik in devices])
+        except Exception as e:
+            self.update_signal.emit(f"Помилка перевірки відповідності: {str(e)}")
+            return
+        self.save_compliance_findings(devices, results)
+        digest = format_digest(results)
+        if digest:
+            self.update_signal.emit(digest)
+            mikrotik_ops.send_telegram_message_async(self.telegram_token, digest)
+
+    def save_compliance_findings(self, devices, results):
+        try:
+            with span("db"):
+                save_findings(self.conn_str, {mikrotik['name']: mikrotik['id'] for mikrotik in devices}, results)
+        except Exception as e:
+            self.update_signal.emit(f"Помилка збереження результатів перевірки: {str(e)}")
+
+    def index_export(self, mikrotik, local_rsc):
+        try:
+            index_exports([local_rsc], BACKUP_DIR, workers=0)
+        except Exception as e:
+            self.update_signal.emit(f"Помилка індексації експорту для {mikrotik['name']}: {str(e)}")
+
+    def save_config_change(self, device_id, delta):
+        try:
+            with span("db"), pyodbc.connect(self.conn_str, timeout=30) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO [ManagerMikrotik].[dbo].[ConfigChanges] 
+                        ([device_id], [export_name], [previous_export_name], [sections_changed], 
+                         [lines_added], [lines_removed], [delta])
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, device_id, delta['current'], delta['previous'], len(delta['changed']),
+                               delta['lines_added'], delta['lines_removed'], json.dumps(delta, ensure_ascii=False))
+                conn.commit()
+        except Exception as e:
+            self.update_signal.emit(f"Помилка збереження змін конфігурації: {str(e)}")
 
     def update_device_status(self, device_id, status, final_status):
+        device_events.finish(final_status, status)  # Таблиця в GUI оновлюється одразу, без перезавантаження
         try:
-            with pyodbc.connect(self.conn_str, timeout=30) as conn:
+            with span("db"), pyodbc.connect(self.conn_str, timeout=30) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE [ManagerMikrotik].[dbo].[MikroTikDevices] 
@@ -404,6 +357,7 @@ class BackupWorker(QThread):
 # Потік для перевірки оновлень
 class CheckUpdatesWorker(QThread):
     update_signal = pyqtSignal(str)
+    concurrency_signal = pyqtSignal(int)
     finished_signal = pyqtSignal()
 
     def __init__(self, devices, conn_str, telegram_token):
@@ -413,42 +367,64 @@ class CheckUpdatesWorker(QThread):
         self.telegram_token = telegram_token
 
     def run(self):
-        for mikrotik in self.devices:
-            if self.isInterruptionRequested():
-                self.update_signal.emit("Перевірка оновлень перервана.")
-                break
+        self.controller = AimdController(on_change=self.concurrency_changed)
+        self.profiler = RunProfiler("check", on_span=self.controller.observe)
+        self.concurrency_signal.emit(self.controller.limit)
+        if not run_adaptive(self.devices, self.check_device, self.controller,
+                            should_stop=self.isInterruptionRequested,
+                            site_limits=inventory.load_site_limits(self.conn_str)):
+            self.update_signal.emit("Перевірка оновлень перервана.")
+        self.update_signal.emit(self.controller.summary())
+        try:
+            report = self.profiler.finish(BACKUP_DIR)
+            if report:
+                self.update_signal.emit(report)
+        except Exception as e:
+            self.update_signal.emit(f"Помилка збереження профілю запуску: {str(e)}")
+        self.finished_signal.emit()
 
-            try:
-                installed_version, latest_version, routerboard_firmware = check_versions(mikrotik)
-                if installed_version and latest_version:
-                    update_needed = tuple(map(int, str(installed_version).split('.'))) < tuple(
-                        map(int, str(latest_version).split('.')))
-                    status = f"MikroTik *#{mikrotik['name']}* має актуальну версію." if not update_needed else f"#{mikrotik['name']} потребує оновлення: {installed_version} -> {latest_version}"
-                    self.update_versions_and_firmware(mikrotik['id'], installed_version, latest_version, routerboard_firmware)
-                    self.update_device_status(mikrotik['id'], status, "OK" if not update_needed else "Needs Update")
-                    self.update_signal.emit(f"{mikrotik['name']}: {status} | RouterBoard Firmware: {routerboard_firmware}")
-                    if update_needed and self.telegram_token:
-                        send_telegram_message_async(self.telegram_token,
-                                                    f"⚠ #{mikrotik['name']} потребує оновлення: {installed_version} -> {latest_version} | RouterBoard Firmware: {routerboard_firmware}")
-                else:
-                    error = f"Помилка при перевірці версій для #{mikrotik['name']} ({mikrotik['host']})"
-                    self.update_device_status(mikrotik['id'], error, "Error")
-                    self.update_signal.emit(error)
-                    if self.telegram_token:
-                        send_telegram_message_async(self.telegram_token, error)
-            except Exception as e:
-                error = f"Помилка при перевірці версій для #{mikrotik['name']} ({mikrotik['host']}): {str(e)}"
-                self.update_device_status(mikrotik['id'], error, "Error")
-                self.update_signal.emit(error)
-                if self.telegram_token:
-                    send_telegram_message_async(self.telegram_token, error)
+    def concurrency_changed(self, limit, reason):
+        self.update_signal.emit(f"Паралельність змінено на {limit} ({reason})")
+        self.concurrency_signal.emit(limit)
 
-            time_module.sleep(2)  # Збільшена затримка для зменшення навантаження
-        self.finished_signal.emit()
+    def check_device(self, mikrotik):
+        with bind(self.profiler, mikrotik['name']), device_events.track("check", mikrotik):
+            device_events.progress("check")
+            return self.check_versions_for(mikrotik)
+
+    def check_versions_for(self, mikrotik):
+        try:
+            installed_version, latest_version, routerboard_firmware = mikrotik_ops.check_versions(mikrotik)
+            if installed_version and latest_version:
+                update_needed = needs_update(installed_version, latest_version)
+                status = f"MikroTik *#{mikrotik['name']}* має актуальну версію." if not update_needed else f"#{mikrotik['name']} потребує оновлення: {installed_version} -> {latest_version}"
+                self.update_versions_and_firmware(mikrotik['id'], installed_version, latest_version, routerboard_firmware)
+                self.update_device_status(mikrotik['id'], status, "OK" if not update_needed else "Needs Update")
+                self.update_signal.emit(f"{mikrotik['name']}: {status} | RouterBoard Firmware: {routerboard_firmware}")
+                if update_needed and self.telegram_token:
+                    mikrotik_ops.send_telegram_message_async(self.telegram_token,
+                                                             f"⚠ #{mikrotik['name']} потребує оновлення: {installed_version} -> {latest_version} | RouterBoard Firmware: {routerboard_firmware}")
+                return True, None
+            # check_versions не повертає причину - найчастіше це недоступний пристрій
+            error = f"Помилка при перевірці версій для #{mikrotik['name']} ({mikrotik['host']})"
+            self.update_device_status(mikrotik['id'], error, "Error")
+            self.update_signal.emit(error)
+            if self.telegram_token:
+                mikrotik_ops.send_telegram_message_async(self.telegram_token, error)
+            return False, "timeout"
+        except Exception as e:
+            error = f"Помилка при перевірці версій для #{mikrotik['name']} ({mikrotik['host']}): {str(e)}"
+            self.update_device_status(mikrotik['id'], error, "Error")
+            self.update_signal.emit(error)
+            if self.telegram_token:
+                mikrotik_ops.send_telegram_message_async(self.telegram_token, error)
+            return False, str(e)
 
     def update_versions_and_firmware(self, device_id, installed_version, latest_version, routerboard_firmware):
+        device_events.progress("check", installed_version=installed_version, latest_version=latest_version,
+                               firmware=routerboard_firmware)
         try:
-            with pyodbc.connect(self.conn_str, timeout=30) as conn:
+            with span("db"), pyodbc.connect(self.conn_str, timeout=30) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE [ManagerMikrotik].[dbo].[MikroTikDevices] 
@@ -460,8 +436,9 @@ class CheckUpdatesWorker(QThread):
             self.update_signal.emit(f"Помилка оновлення версій та прошивки для пристрою ID {device_id}: {str(e)}")
 
     def update_device_status(self, device_id, status, final_status):
+        device_events.finish(final_status, status)  # Таблиця в GUI оновлюється одразу, без перезавантаження
         try:
-            with pyodbc.connect(self.conn_str, timeout=30) as conn:
+            with span("db"), pyodbc.connect(self.conn_str, timeout=30) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE [ManagerMikrotik].[dbo].[MikroTikDevices] 
@@ -479,18 +456,36 @@ class UpgradeWorker(QThread):
     update_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
 
-    def __init__(self, devices, conn_str, telegram_token):
+    def __init__(self, devices, conn_str, telegram_token, resume_run_id=None):
         super().__init__()
         self.devices = devices
         self.conn_str = conn_str
         self.telegram_token = telegram_token
+        self.resume_run_id = resume_run_id
 
     def run(self):
+        journal = JobJournal(BACKUP_DIR)
+        if self.resume_run_id:
+            run_id = self.resume_run_id
+            states = journal.device_states(run_id)
+            self.update_signal.emit(f"Продовжуємо перерваний запуск оновлення #{run_id}")
+        else:
+            run_id = journal.start_run("upgrade", self.devices)
+            states = {}
+
+        interrupted = False
         for mikrotik in self.devices:
             if self.isInterruptionRequested():
                 self.update_signal.emit("Оновлення перервано.")
+                interrupted = True
                 break
 
+            stage, _ = states.get(device_key(mikrotik), (None, {}))
+            if stage == "done":
+                self.update_signal.emit(f"{mikrotik['name']}: оновлення вже виконано в цьому запуску, пропускаємо.")
+                continue
+            device_events.begin("upgrade", mikrotik).progress("connect")
+
             try:
                 device = {
                     "device_type": "mikrotik_routeros",
@@ -501,73 +496,72 @@ class UpgradeWorker(QThread):
                     "timeout": 20,  # Загальний таймаут з'єднання
                     "conn_timeout": 30  # Таймаут для з'єднання
                 }
-                with ConnectHandler(**device) as ssh_conn:
+                with netmiko.ConnectHandler(**device) as ssh_conn:
                     print(f"Успішно підключено до {mikrotik['host']} з логіном {mikrotik['user']} і паролем ****")
                     self.update_signal.emit(f"Розпочато перевірку оновлень для {mikrotik['name']} ({mikrotik['host']})")
+                    device_events.progress("check")
                     output = ssh_conn.send_command('/system package update check-for-updates', delay_factor=2.0)
 
-                    # Парсинг версій з обробкою можливих форматів
-                    def parse_version(version_str):
-                        if not version_str:
-                            return None
-                        # Видаляємо суфікси типу "rc1", "beta" тощо
-                        version_str = re.sub(r'[^0-9.]', '', version_str)
-                        try:
-                            return tuple(map(int, version_str.split('.')))
-                        except ValueError:
-                            return None
-
-                    installed_version = next(
-                        (line.split(':')[1].strip() for line in output.splitlines() if "installed-version" in line),
-                        None)
-                    latest_version = next(
-                        (line.split(':')[1].strip() for line in output.splitlines() if "latest-version" in line), None)
+                    installed_version, latest_version = parse_update_check(output)
+                    installed_ver = parse_version(installed_version)
+                    latest_ver = parse_version(latest_version)
+                    journal.record(run_id, mikrotik, "checked", installed_version=installed_version,
+                                   latest_version=latest_version)
 
-                    installed_ver_tuple = parse_version(installed_version)
-                    latest_ver_tuple = parse_version(latest_version)
-
-                    if installed_ver_tuple and latest_ver_tuple:
-                        if installed_ver_tuple < latest_ver_tuple:
+                    if installed_ver and latest_ver:
+                        if installed_ver < latest_ver:
                             self.update_signal.emit(
                                 f"Виконується оновлення для {mikrotik['name']} до версії {latest_version}")
+                            journal.record(run_id, mikrotik, "install_sent", latest_version=latest_version)
+                            device_events.progress("install", installed_version=installed_version,
+                                                   latest_version=latest_version)
                             ssh_conn.send_command('/system package update install',
                                                   delay_factor=2.0)  # Без expect_string
                             time_module.sleep(60)  # Чекаємо 1 хвилину для ребуту
                             status = f"Оновлення для MikroTik *#{mikrotik['name']}* завершено до версії {latest_version}."
                             self.update_device_status(mikrotik['id'], status, "OK")
+                            journal.record(run_id, mikrotik, "done", latest_version=latest_version)
                             self.update_signal.emit(status)
                             if self.telegram_token:
-                                send_telegram_message_async(self.telegram_token, status)
+                                mikrotik_ops.send_telegram_message_async(self.telegram_token, status)
                         else:
                             status = f"MikroTik *#{mikrotik['name']}* має актуальну версію {installed_version}."
                             self.update_device_status(mikrotik['id'], status, "OK")
+                            journal.record(run_id, mikrotik, "done", installed_version=installed_version)
                             self.update_signal.emit(status)
                             if self.telegram_token:
-                                send_telegram_message_async(self.telegram_token, status)
+                                mikrotik_ops.send_telegram_message_async(self.telegram_token, status)
                     else:
                         error = f"Помилка при отриманні версій для #{mikrotik['name']} ({mikrotik['host']})"
                         self.update_device_status(mikrotik['id'], error, "Error")
+                        journal.record(run_id, mikrotik, "failed", error=error)
                         self.update_signal.emit(error)
                         if self.telegram_token:
-                            send_telegram_message_async(self.telegram_token, error)
-            except (netmiko_exceptions.NetmikoTimeoutException, netmiko_exceptions.NetmikoAuthenticationException,
+                            mikrotik_ops.send_telegram_message_async(self.telegram_token, error)
+            except (netmiko.exceptions.NetmikoTimeoutException, netmiko.exceptions.NetmikoAuthenticationException,
                     Exception) as e:
                 error = f"Помилка при оновленні #{mikrotik['name']} ({mikrotik['host']}): {str(e)}"[
                         :200]  # Обмежуємо довжину до 200 символів
                 self.update_device_status(mikrotik['id'], error, "Error")
+                journal.record(run_id, mikrotik, "failed", error=error)
                 self.update_signal.emit(error)
                 if self.telegram_token:
-                    send_telegram_message_async(self.telegram_token, error)
+                    mikrotik_ops.send_telegram_message_async(self.telegram_token, error)
 
             time_module.sleep(1)  # Зменшена затримка для швидкості
 
+        if not interrupted:
+            journal.finish_run(run_id)
+        journal.close()
+
         self.update_signal.emit(
             f"Оновлення завершено для всіх пристроїв! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
-        send_telegram_message_async(self.telegram_token,
-                                    f"✅ Оновлення завершено для всіх пристроїв! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
+        mikrotik_ops.send_telegram_message_async(self.telegram_token,
+                                                 f"✅ Оновлення завершено для всіх пристроїв! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
         self.finished_signal.emit()
 
     def update_device_status(self, device_id, status, final_status):
+        device_events.finish(final_status, status)
         try:
             with pyodbc.connect(self.conn_str, timeout=30) as conn:
                 cursor = conn.cursor()
@@ -631,6 +625,182 @@ class ChatIdWorker(QThread):
         self.running = False
 
 
+# Потік для фонової перевірки актуальності знімка налаштувань та інвентарю
+class SnapshotWorker(QThread):
+    update_signal = pyqtSignal(str)
+    loaded_signal = pyqtSignal(object)
+
+    def __init__(self, conn_str, fingerprint):
+        super().__init__()
+        self.conn_str = conn_str
+        self.fingerprint = fingerprint
+
+    def run(self):
+        try:
+            snapshot = settings_store.load_if_changed(self.conn_str, self.fingerprint, inventory.PAGE_SIZE)
+        except Exception as e:
+            self.update_signal.emit(f"⚠ Не вдалося перевірити налаштування в БД, показано збережену копію: {str(e)[:200]}")
+            return
+        if snapshot is None:
+            self.update_signal.emit("Збережена копія налаштувань і пристроїв актуальна.")
+            return
+        try:
+            settings_store.SnapshotCache(self.conn_str).write(snapshot)
+        except Exception as e:
+            self.update_signal.emit(f"Помилка збереження кешу налаштувань: {str(e)[:200]}")
+        self.loaded_signal.emit(snapshot)
+
+
+# Потік для завантаження сторінки інвентарю (фільтр, сортування, прокручування таблиці)
+class InventoryPageWorker(QThread):
+    update_signal = pyqtSignal(str)
+    loaded_signal = pyqtSignal(int, object, object)  # покоління запиту, пристрої, кількість за фільтром
+
+    def __init__(self, conn_str, query, offset, generation, target=None):
+        super().__init__()
+        self.conn_str = conn_str
+        self.query = query
+        self.offset = offset
+        self.generation = generation
+        self.target = target
+
+    def run(self):
+        try:
+            devices, total = inventory.load_page(self.conn_str, self.query, self.offset,
+                                                 with_total=self.offset == 0, target=self.target)
+        except Exception as e:
+            self.update_signal.emit(f"Помилка завантаження пристроїв: {str(e)[:200]}")
+            devices, total = None, None
+        self.loaded_signal.emit(self.generation, devices, total)
+
+
+# Потік для періодичного опитування стану пристроїв (CPU, пам'ять, uptime, помилки інтерфейсів)
+class HealthWorker(QThread):
+    update_signal = pyqtSignal(str)
+    sample_signal = pyqtSignal(object)  # {ключ пристрою: (ряд CPU, ряд приросту помилок)}
+
+    def __init__(self, devices, store):
+        super().__init__()
+        self.store = store
+        self.poller = health_poller.HealthPoller(devices, store, on_cycle=self.cycle_done)
+
+    def series(self, key):
+        return (self.store.values(key, "cpu", points=SPARKLINE_POINTS),
+                self.store.values(key, "errors", points=SPARKLINE_POINTS))
+
+    def cycle_done(self, samples):
+        self.sample_signal.emit({key: self.series(key) for key in samples})
+        failed = sum(1 for values in samples.values() if values is None)
+        if failed:
+            self.update_signal.emit(f"⚠ Моніторинг: не відповіли {failed} з {len(samples)} пристроїв")
+
+    def run(self):
+        try:
+            self.poller.run()
+        except Exception as e:
+            self.update_signal.emit(f"Помилка моніторингу стану: {str(e)[:200]}")
+
+    def stop(self):
+        self.poller.stop_event.set()
+
+
+# Потік для масового імпорту (CSV/JSON) або експорту пристроїв
+class DeviceTransferWorker(QThread):
+    update_signal = pyqtSignal(str)
+
+    def __init__(self, conn_str, mode, path, update=False, target=None):
+        super().__init__()
+        self.conn_str = conn_str
+        self.mode = mode  # "import" або "export"
+        self.path = path
+        self.update = update
+        self.target = target
+
+    def run(self):
+        try:
+            if self.mode == "import":
+                self.update_signal.emit(device_import.import_file(self.conn_str, self.path, update=self.update).format())
+            else:
+                count = device_import.export_devices(self.conn_str, self.path, target=self.target)
+                self.update_signal.emit(f"Експортовано пристроїв: {count} -> {self.path} (без паролів)")
+        except Exception as e:
+            self.update_signal.emit(f"Помилка {'імпорту' if self.mode == 'import' else 'експорту'} пристроїв "
+                                    f"({self.path}): {str(e)[:200]}")
+
+
+# Потік для виконання команди лише для читання на вибраних пристроях; однакові виводи групуються
+class CommandWorker(QThread):
+    update_signal = pyqtSignal(str)
+    concurrency_signal = pyqtSignal(int)
+    finished_signal = pyqtSignal()
+
+    def __init__(self, devices, command, conn_str):
+        super().__init__()
+        self.devices = devices
+        self.command = command
+        self.conn_str = conn_str
+
+    def run(self):
+        self.controller = AimdController(initial=command_runner.DEFAULT_WORKERS,
+                                         maximum=command_runner.DEFAULT_WORKERS, on_change=self.concurrency_changed)
+        self.concurrency_signal.emit(self.controller.limit)
+        try:
+            groups, completed = command_runner.run_command(
+                self.devices, self.command, self.device_done, controller=self.controller,
+                should_stop=self.isInterruptionRequested, site_limits=inventory.load_site_limits(self.conn_str))
+            if not completed:
+                self.update_signal.emit("Виконання команди перервано.")
+            self.update_signal.emit(groups.summary())
+            self.update_signal.emit(f"Результати збережено: {groups.export(groups.default_path())}")
+        except Exception as e:
+            self.update_signal.emit(f"Помилка виконання команди '{self.command}': {str(e)[:200]}")
+        self.finished_signal.emit()
+
+    def device_done(self, result, group, first):
+        self.update_signal.emit(command_runner.format_result(result, group, first))
+
+    def concurrency_changed(self, limit, reason):
+        self.update_signal.emit(f"Паралельність змінено на {limit} ({reason})")
+        self.concurrency_signal.emit(limit)
+
+
+# Потік для розгортання фрагмента конфігурації хвилями з бекапом перед змінами та відкатом
+class ConfigPushWorker(QThread):
+    update_signal = pyqtSignal(str)
+    concurrency_signal = pyqtSignal(int)
+    finished_signal = pyqtSignal()
+
+    def __init__(self, devices, script, conn_str, telegram_token):
+        super().__init__()
+        self.devices = devices
+        self.script = script
+        self.conn_str = conn_str
+        self.telegram_token = telegram_token
+
+    def run(self):
+        try:
+            controller = AimdController(on_change=self.concurrency_changed)
+            self.concurrency_signal.emit(controller.limit)
+            push = config_push.ConfigPush(self.devices, self.script, controller=controller,
+                                          site_limits=inventory.load_site_limits(self.conn_str),
+                                          on_result=self.device_done, on_message=self.update_signal.emit,
+                                          should_stop=self.isInterruptionRequested)
+            report = push.run()
+            self.update_signal.emit(controller.summary())
+            self.update_signal.emit(report.format())
+            mikrotik_ops.send_telegram_message_async(self.telegram_token, report.format())
+        except Exception as e:
+            self.update_signal.emit(f"Помилка розгортання конфігурації: {str(e)[:200]}")
+        self.finished_signal.emit()
+
+    def device_done(self, mikrotik, status, message):
+        self.update_signal.emit(f"{config_push.STATUS_TITLES[status]} {mikrotik['name']}: {message}")
+
+    def concurrency_changed(self, limit, reason):
+        self.update_signal.emit(f"Паралельність змінено на {limit} ({reason})")
+        self.concurrency_signal.emit(limit)
+
+
 # Потік для оновлення RouterBoard
 class RouterBoardWorker(QThread):
     update_signal = pyqtSignal(str)
@@ -647,6 +817,7 @@ class RouterBoardWorker(QThread):
             if self.isInterruptionRequested():
                 self.update_signal.emit("Оновлення RouterBoard перервано.")
                 break
+            device_events.begin("routerboard", mikrotik).progress("routerboard")
 
             try:
                 # Використовуємо routeros_api для підключення
@@ -666,8 +837,8 @@ class RouterBoardWorker(QThread):
 
                 print(f"Успішно підключено до {mikrotik['host']} через API з логіном {mikrotik['user']} і паролем ****")
                 self.update_signal.emit(f"Розпочато оновлення RouterBoard для {mikrotik['name']} ({mikrotik['host']})")
-                send_telegram_message_async(self.telegram_token,
-                                            f"🔹 Розпочато оновлення RouterBoard для *#{mikrotik['name']}* ({mikrotik['host']})")
+                mikrotik_ops.send_telegram_message_async(self.telegram_token,
+                                                         f"🔹 Розпочато оновлення RouterBoard для *#{mikrotik['name']}* ({mikrotik['host']})")
 
                 # Встановлення auto-upgrade=no (ручне оновлення)
                 self.update_signal.emit(f"Налаштування ручного оновлення RouterBoard для {mikrotik['name']}...")
@@ -694,8 +865,8 @@ class RouterBoardWorker(QThread):
                 print(f"Оновлення RouterBoard та перезавантаження завершено для {mikrotik['name']}")
                 self.update_signal.emit(
                     f"Виконано ручне оновлення RouterBoard та перезавантаження для {mikrotik['name']}")
-                send_telegram_message_async(self.telegram_token,
-                                            f"✅ Виконано ручне оновлення RouterBoard та перезавантаження для *#{mikrotik['name']}*")
+                mikrotik_ops.send_telegram_message_async(self.telegram_token,
+                                                         f"✅ Виконано ручне оновлення RouterBoard та перезавантаження для *#{mikrotik['name']}*")
 
                 # Закриття підключення
                 api.disconnect()
@@ -711,17 +882,18 @@ class RouterBoardWorker(QThread):
                 self.update_signal.emit(error)
                 self.update_device_status(mikrotik['id'], error, "Error")
                 if self.telegram_token:
-                    send_telegram_message_async(self.telegram_token, error)
+                    mikrotik_ops.send_telegram_message_async(self.telegram_token, error)
 
             time_module.sleep(2)  # Затримка між пристроями для стабільності
 
         self.update_signal.emit(
             f"Оновлення RouterBoard завершено для всіх пристроїв! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
-        send_telegram_message_async(self.telegram_token,
-                                    f"✅ Оновлення RouterBoard завершено для всіх пристроїв! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
+        mikrotik_ops.send_telegram_message_async(self.telegram_token,
+                                                 f"✅ Оновлення RouterBoard завершено для всіх пристроїв! ({datetime.now().strftime('%Y-%m-%d %H:%M')})")
         self.finished_signal.emit()
 
     def update_device_status(self, device_id, status, final_status):
+        device_events.finish(final_status, status)
         try:
             with pyodbc.connect(self.conn_str, timeout=30) as conn:
                 cursor = conn.cursor()
@@ -839,10 +1011,27 @@ class LoginWindow(QWidget):
         )
 
         try:
-            with pyodbc.connect(conn_str, timeout=30) as conn:
-                self.main_window = MainWindow(conn_str)
-                self.main_window.showMaximized()
-                self.close()
+            # Збережений знімок розшифровується лише з тим самим паролем, але пароль могли змінити чи
+            # відкликати на сервері - тож спершу вхід перевіряється легким запитом відбитка, а повний знімок
+            # оновлюється у фоні. Без кешу вхід перевіряється завантаженням знімка з БД.
+            cache = settings_store.SnapshotCache(conn_str)
+            snapshot = cache.read()
+            cached = snapshot is not None
+            if cached:
+                settings_store.load_fingerprint(conn_str)
+            else:
+                snapshot = settings_store.load_snapshot(conn_str, inventory.PAGE_SIZE)
+                try:
+                    cache.write(snapshot)
+                except OSError as e:
+                    print(f"Помилка збереження кешу налаштувань: {str(e)}")
+            self.main_window = MainWindow(conn_str, snapshot, cached=cached)
+            self.main_window.showMaximized()
+            self.close()
+        except ImportError as e:
+            # Перевіряється до pyodbc.Error: без драйвера звернення до pyodbc.Error знову підніме ImportError
+            error_msg = f"Не вдалося завантажити pyodbc: {str(e)}. Перевірте залежності: myUi.py --check-deps"
+            QMessageBox.critical(self, "Помилка входу", error_msg)
         except pyodbc.Error as e:
             error_msg = f"Помилка авторизації: {str(e)}"
             QMessageBox.critical(self, "Помилка входу", error_msg)
@@ -851,15 +1040,36 @@ class LoginWindow(QWidget):
             QMessageBox.critical(self, "Помилка входу", error_msg)
 
 
+# Стовпець таблиці -> поле сортування inventory.InventoryQuery
+SPARKLINE_POINTS = 30  # Останні точки рядів у стовпцях CPU і помилок інтерфейсів
+SORT_FIELDS_BY_COLUMN = {0: "needs_update", 1: "name", 2: "host", 3: "installed_version", 4: "latest_version",
+                         5: "status", 6: "firmware"}
+
+
+class DeviceEventBridge(QObject):
+    """Переносить події з device_events.bus (потоки воркерів) у потік GUI через чергу сигналів Qt."""
+    device_event = pyqtSignal(object)
+
+
 class MainWindow(QMainWindow):
-    def __init__(self, conn_str):
+    def __init__(self, conn_str, snapshot=None, cached=False):
         super().__init__()
         self.setWindowTitle("Mikrotik Manager by M. Zhukovskyi")
         self.conn_str = conn_str
+        # Знімок налаштувань та інвентарю (settings_store): з LoginWindow або завантажується тут
+        self.snapshot = snapshot
         self.telegram_token = None
         self.ftp_config = None
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
+        # Лог буферизується і виводиться пачками; повна копія - у BackUp/logs/gui.log з ротацією
+        self.log_text = LogPanel(os.path.join(BACKUP_DIR, "logs"))
+        # Події пристроїв оновлюють лише свій рядок таблиці: id пристрою -> номер рядка
+        self.devices_data = []
+        self.device_rows = {}
+        self.health_worker = None
+        self.health_store = None  # health_poller.SeriesStore - завантажується при першому ввімкненні моніторингу
+        self.event_bridge = DeviceEventBridge()
+        self.event_bridge.device_event.connect(self.on_device_event)
+        self.unsubscribe_events = device_events.bus.subscribe(self.event_bridge.device_event.emit)
 
         icon_path = get_resource_path("UI/ico/icon.ico")  # Або "ui/ico/icon.ico"
         print(f"Шлях до іконки: {icon_path}")  # Для відладки
@@ -891,7 +1101,7 @@ class MainWindow(QMainWindow):
             QTableWidget::item {
                 padding: 4px;
             }
-            QTextEdit {
+            QTextEdit, QPlainTextEdit {
                 background-color: #34495e;
                 color: #ffffff;
                 border: 1px solid #465c71;
@@ -925,7 +1135,9 @@ class MainWindow(QMainWindow):
             }
         """)
 
-        self.load_settings()
+        if self.snapshot is None:
+            self.snapshot = self.fetch_snapshot()
+        self.load_settings(self.snapshot)
 
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
@@ -976,6 +1188,10 @@ class MainWindow(QMainWindow):
         if clear_icon.isNull():
             clear_icon = QIcon("UI/ico/clear_icon.png")
             print("Стандартна іконка 'edit-clear' не знайдена. Використовуйте власну іконку або перевірте тему системи.")
+        resume_icon = QIcon.fromTheme("view-refresh")
+        if resume_icon.isNull():
+            resume_icon = QIcon("UI/ico/resume_icon.png")
+            print("Стандартна іконка 'view-refresh' не знайдена. Використовуйте власну іконку або перевірте тему системи.")
         exit_icon = QIcon.fromTheme("application-exit")
         if exit_icon.isNull():
             exit_icon = QIcon("UI/ico/exit_icon.png")
@@ -1001,6 +1217,14 @@ class MainWindow(QMainWindow):
         self.check_updates_button.setIcon(update_check_icon)
         self.clear_log_button = QPushButton("Очистити лог")
         self.clear_log_button.setIcon(clear_icon)
+        self.resume_button = QPushButton("Продовжити перерваний запуск")
+        self.resume_button.setIcon(resume_icon)
+        self.health_button = QPushButton("Моніторинг стану")
+        self.health_button.setCheckable(True)
+        self.import_button = QPushButton("Імпорт пристроїв")
+        self.export_button = QPushButton("Експорт пристроїв")
+        self.command_button = QPushButton("Виконати команду")
+        self.push_button = QPushButton("Розгорнути конфігурацію")
         self.exit_button = QPushButton("Вихід")
         self.exit_button.setIcon(exit_icon)
 
@@ -1014,12 +1238,20 @@ class MainWindow(QMainWindow):
         self.uncheck_all_button.clicked.connect(self.uncheck_all)
         self.check_updates_button.clicked.connect(self.check_for_updates)
         self.clear_log_button.clicked.connect(self.clear_log)
+        self.resume_button.clicked.connect(self.resume_interrupted_run)
+        self.health_button.toggled.connect(self.toggle_health_polling)
+        self.import_button.clicked.connect(self.import_devices)
+        self.export_button.clicked.connect(self.export_devices)
+        self.command_button.clicked.connect(self.run_command)
+        self.push_button.clicked.connect(self.push_config)
         self.exit_button.clicked.connect(self.exit_application)
 
         # Встановлюємо мінімальну ширину для кожної кнопки (альтернативний спосіб)
         for button in [self.backup_button, self.check_update_button, self.upgrade_button, self.routerboard_button,
                        self.get_chatid_button, self.stop_chatid_button, self.check_all_button, self.uncheck_all_button,
-                       self.check_updates_button, self.clear_log_button, self.exit_button]:
+                       self.check_updates_button, self.clear_log_button, self.resume_button, self.health_button,
+                       self.import_button,
+                       self.export_button, self.command_button, self.push_button, self.exit_button]:
             button.setMinimumWidth(100)  # Зменшена ширина (можете налаштувати на свій розсуд)
 
         button_frame.layout().addWidget(self.backup_button)
@@ -1032,6 +1264,12 @@ class MainWindow(QMainWindow):
         button_frame.layout().addWidget(self.uncheck_all_button)
         button_frame.layout().addWidget(self.check_updates_button)
         button_frame.layout().addWidget(self.clear_log_button)
+        button_frame.layout().addWidget(self.resume_button)
+        button_frame.layout().addWidget(self.health_button)
+        button_frame.layout().addWidget(self.import_button)
+        button_frame.layout().addWidget(self.export_button)
+        button_frame.layout().addWidget(self.command_button)
+        button_frame.layout().addWidget(self.push_button)
         button_frame.layout().addWidget(self.exit_button)
 
         # Додаємо надпис у футер
@@ -1039,14 +1277,22 @@ class MainWindow(QMainWindow):
         footer_label.setObjectName("footer-label")  # Для стилізації через setStyleSheet
         footer_label.setAlignment(Qt.AlignCenter)  # Центруємо текст
 
+        # Поточна кількість пристроїв, що обробляються одночасно
+        self.concurrency_label = QLabel("Паралельність: -")
+        self.concurrency_label.setAlignment(Qt.AlignCenter)
+
         left_layout.addWidget(button_frame)
+        left_layout.addWidget(self.concurrency_label)
         left_layout.addWidget(footer_label)  # Додаємо надпис внизу
         left_layout.addStretch()  # Додаємо розтягування для вирівнювання
 
         self.table = QTableWidget()
-        self.table.setColumnCount(7)  # Додано стовпець для routerboard_firmware
+        self.table.setColumnCount(9)  # Додано стовпець для routerboard_firmware і спарклайни моніторингу
         self.table.setHorizontalHeaderLabels(
-            ["Pick", "Назва", "Хост", "Встановлена версія", "Остання версія", "Статус бекапу", "RouterBoard Firmware"])
+            ["Pick", "Назва", "Хост", "Встановлена версія", "Остання версія", "Статус бекапу", "RouterBoard Firmware",
+             "CPU", "Помилки інтерфейсів"])
+        self.table.setItemDelegateForColumn(7, SparklineDelegate(0, 100, alert=90, suffix="%", parent=self.table))
+        self.table.setItemDelegateForColumn(8, SparklineDelegate(low=0, alert=1, parent=self.table))
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setStyleSheet("""
             QHeaderView::section {
@@ -1067,14 +1313,60 @@ class MainWindow(QMainWindow):
         self.table.setColumnWidth(4, 130)  # "Остання версія" (збільшено для повного тексту)
         self.table.setColumnWidth(5, 120)  # "Статус бекапу"
         self.table.setColumnWidth(6, 200)  # "RouterBoard Firmware" (збільшено для повного тексту)
-
-        self.load_devices()
+        self.table.setColumnWidth(7, 140)  # "CPU" (спарклайн)
+
+        # Фільтрація, сортування і сторінки - на боці SQL Server (inventory.py); таблиця містить лише завантажені рядки
+        self.inventory_query = None
+        self.inventory_target = None  # Сайт, група, тег або збережений запит ("site:Київ")
+        self.inventory_total = 0
+        self.page_generation = 0
+        self.page_loading = False
+        self.page_workers = set()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Пошук: початок назви або хоста")
+        self.status_filter = QComboBox()
+        for title, status in (("Усі статуси", None), ("OK", "OK"), ("Error", "Error"),
+                              ("Needs Update", "Needs Update"), ("Невідомо", "unknown")):
+            self.status_filter.addItem(title, status)
+        self.needs_update_filter = QCheckBox("Лише з оновленням")
+        self.target_filter = QComboBox()
+        self.populate_targets(self.snapshot.get("targets", []) if self.snapshot else [])
+        self.save_query_button = QPushButton("Зберегти запит")
+        self.save_query_button.clicked.connect(self.save_current_query)
+        self.inventory_label = QLabel("")
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(300)  # Запит до БД після паузи у введенні, а не на кожну літеру
+        self.filter_timer.timeout.connect(self.apply_filter)
+        self.search_input.textChanged.connect(self.filter_timer.start)
+        self.status_filter.currentIndexChanged.connect(self.filter_timer.start)
+        self.needs_update_filter.stateChanged.connect(self.filter_timer.start)
+        self.target_filter.currentIndexChanged.connect(self.filter_timer.start)
+        self.sort_field, self.sort_descending = "needs_update", True
+        self.table.horizontalHeader().setSortIndicatorShown(True)
+        self.table.horizontalHeader().sectionClicked.connect(self.sort_by_column)
+        self.table.verticalScrollBar().valueChanged.connect(self.table_scrolled)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.target_filter, 1)
+        filter_layout.addWidget(self.search_input, 2)
+        filter_layout.addWidget(self.status_filter, 1)
+        filter_layout.addWidget(self.needs_update_filter)
+        filter_layout.addWidget(self.save_query_button)
+        filter_layout.addWidget(self.inventory_label)
+        table_layout = QVBoxLayout()
+        table_layout.addLayout(filter_layout)
+        table_layout.addWidget(self.table)
+
+        # Із збереженої копії версії не перевіряємо - це зробить load_devices після фонової перевірки, якщо дані змінились
+        self.load_devices(refresh_versions=not cached)
+        self.report_interrupted_runs()
 
         self.log_text.setMinimumWidth(400)
         self.log_text.setMaximumWidth(500)
 
         main_layout.addLayout(left_layout, 1)  # Лівий блок займає 1 частину
-        main_layout.addWidget(self.table, 2)  # Таблиця займає 2 частини
+        main_layout.addLayout(table_layout, 2)  # Таблиця з фільтрами займає 2 частини
         main_layout.addWidget(self.log_text, 1)  # Лог займає 1 частину
 
         container = QWidget()
@@ -1091,112 +1383,106 @@ class MainWindow(QMainWindow):
         self.check_updates_worker = None
         self.upgrade_worker = None
         self.routerboard_worker = None
-
-    def load_settings(self):
+        self.transfer_worker = None
+
+        # Збережена копія могла застаріти - перевіряємо відбиток таблиць у фоні
+        self.snapshot_worker = None
+        if cached:
+            self.log_text.append(f"Показано збережену копію налаштувань і пристроїв від {self.snapshot.get('loaded_at')}, "
+                                 f"перевіряємо актуальність...")
+            self.snapshot_worker = SnapshotWorker(self.conn_str, self.snapshot.get("fingerprint"))
+            self.snapshot_worker.update_signal.connect(self.update_log)
+            self.snapshot_worker.loaded_signal.connect(self.snapshot_loaded)
+            self.snapshot_worker.start()
+
+    def fetch_snapshot(self):
+        """Знімок з БД одним пакетом запитів; зберігається в зашифрований кеш. None - якщо БД недоступна."""
         try:
-            with pyodbc.connect(self.conn_str, timeout=30) as conn:
-                cursor = conn.cursor()
-                # Завантажуємо Telegram токен
-                cursor.execute("SELECT TOP 1 [token] FROM [ManagerMikrotik].[dbo].[TelegramSettings]")
-                row = cursor.fetchone()
-                if row:
-                    self.telegram_token = row.token
-                else:
-                    self.log_text.append("Не знайдено Telegram токен у базі даних!")
-
-                # Завантажуємо FTP налаштування
-                cursor.execute(
-                    "SELECT TOP 1 [host], [username], [password], [dir] FROM [ManagerMikrotik].[dbo].[FTPSettings]")
-                row = cursor.fetchone()
-                if row:
-                    self.ftp_config = {
-                        "host": row.host,
-                        "username": row.username,
-                        "password": row.password,
-                        "dir": row.dir
-                    }
-                else:
-                    self.log_text.append("Не знайдено FTP налаштування у базі даних!")
-
-                # Завантажуємо chat_ids
-                cursor.execute("SELECT [chat_id] FROM [ManagerMikrotik].[dbo].[TelegramChatIds]")
-                CHAT_IDS.clear()
-                chat_ids = [str(row.chat_id) for row in cursor.fetchall()]
-                CHAT_IDS.extend(chat_ids)
-                if not CHAT_IDS:
-                    self.log_text.append("Не знайдено жодного chat_id у базі даних.")
-                else:
-                    self.log_text.append(f"Завантажено {len(CHAT_IDS)} chat_id: {', '.join(CHAT_IDS)}")
+            snapshot = settings_store.load_snapshot(self.conn_str, inventory.PAGE_SIZE)
         except Exception as e:
             self.log_text.append(f"Помилка завантаження налаштувань: {str(e)}")
             traceback.print_exc()
+            return None
+        try:
+            settings_store.SnapshotCache(self.conn_str).write(snapshot)
+        except Exception as e:
+            self.log_text.append(f"Помилка збереження кешу налаштувань: {str(e)[:200]}")
+        return snapshot
+
+    def snapshot_loaded(self, snapshot):
+        self.snapshot = snapshot
+        self.log_text.append("Налаштування або пристрої змінились у БД - оновлюємо.")
+        self.load_settings(snapshot)
+        self.get_chatid_button.setEnabled(bool(self.telegram_token))
+        self.populate_targets(snapshot.get("targets", []))
+        # Знімок містить першу сторінку без фільтра; з фільтром запитуємо сторінку заново
+        if self.inventory_target is None and (self.inventory_query is None or self.inventory_query.is_default):
+            self.load_devices(snapshot["devices"], total=snapshot.get("device_total"))
+        else:
+            self.apply_filter()
+
+    def load_settings(self, snapshot=None):
+        if snapshot is None:
+            snapshot = self.fetch_snapshot()
+            if snapshot is None:
+                return
+        self.snapshot = snapshot
+
+        # Telegram токен
+        if snapshot["telegram_token"]:
+            self.telegram_token = snapshot["telegram_token"]
+        else:
+            self.log_text.append("Не знайдено Telegram токен у базі даних!")
+        if getattr(self, "chatid_worker", None) is not None:
+            self.chatid_worker.token = self.telegram_token
 
-    def load_devices(self):
+        # FTP налаштування
+        if snapshot["ftp_config"]:
+            self.ftp_config = dict(snapshot["ftp_config"])
+        else:
+            self.log_text.append("Не знайдено FTP налаштування у базі даних!")
+
+        # chat_ids
+        mikrotik_ops.CHAT_IDS.clear()
+        mikrotik_ops.CHAT_IDS.extend(snapshot["chat_ids"])
+        if not mikrotik_ops.CHAT_IDS:
+            self.log_text.append("Не знайдено жодного chat_id у базі даних.")
+        else:
+            self.log_text.append(f"Завантажено {len(mikrotik_ops.CHAT_IDS)} chat_id: {', '.join(mikrotik_ops.CHAT_IDS)}")
+
+    def load_devices(self, devices=None, refresh_versions=True, total=None):
+        """
+        Заповнює таблицю першою сторінкою інвентарю (вже відсортованою на сервері), решта догружається
+        під час прокручування. Без devices - сторінка зі знімка settings_store.
+        """
         try:
-            with pyodbc.connect(self.conn_str, timeout=30) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT [id], [name], [host], [username], [password], [installed_version], [latest_version], 
-                           [backup_status], [backup_status_final], [routerboard_firmware] 
-                    FROM [ManagerMikrotik].[dbo].[MikroTikDevices]
-                """)
-                rows = cursor.fetchall()
-
-                # Сортуємо пристрої: ті, що потребують оновлення (installed_version < latest_version), зверху
-                sorted_rows = []
-                for row in rows:
-                    if row.installed_version and row.latest_version:
-                        installed = tuple(map(int, str(row.installed_version).split('.'))) if '.' in str(
-                            row.installed_version) else (0,)
-                        latest = tuple(map(int, str(row.latest_version).split('.'))) if '.' in str(
-                            row.latest_version) else (0,)
-                        needs_update = installed < latest
-                    else:
-                        needs_update = True  # Якщо версії відсутні, ставимо зверху для перевірки
-                    sorted_rows.append((row, needs_update))
-
-                sorted_rows.sort(key=lambda x: x[1], reverse=True)  # Зверху ті, що потребують оновлення
-
-                self.table.setRowCount(0)
-                self.devices_data = []
-                for i, (row, _) in enumerate(sorted_rows):
-                    self.table.insertRow(i)
-                    checkbox = QCheckBox()
-                    checkbox.setFont(QFont("Arial", 18))  # Збільшений шрифт для чекбоксів
-                    self.table.setCellWidget(i, 0, checkbox)
-                    self.table.setItem(i, 1, QTableWidgetItem(row.name or "Без назви"))
-                    self.table.setItem(i, 2, QTableWidgetItem(row.host or "Невідомий хост"))
-                    self.table.setItem(i, 3, QTableWidgetItem(
-                        str(row.installed_version) if row.installed_version else "Невідомо"))
-                    self.table.setItem(i, 4,
-                                       QTableWidgetItem(str(row.latest_version) if row.latest_version else "Невідомо"))
-                    self.table.setItem(i, 5, QTableWidgetItem(
-                        str(row.backup_status_final) if row.backup_status_final else "Невідомо"))
-                    self.table.setItem(i, 6, QTableWidgetItem(
-                        str(row.routerboard_firmware) if row.routerboard_firmware else "Невідомо"))
-                    self.devices_data.append({
-                        "id": row.id,
-                        "name": row.name,
-                        "host": row.host,
-                        "user": row.username,
-                        "password": row.password,
-                        "installed_version": row.installed_version,
-                        "latest_version": row.latest_version,
-                        "backup_status": row.backup_status,
-                        "backup_status_final": row.backup_status_final,
-                        "routerboard_firmware": row.routerboard_firmware
+            if devices is None:
+                if self.snapshot is None:
+                    raise RuntimeError("налаштування та пристрої не завантажено з БД")
+                devices = self.snapshot["devices"]
+                total = self.snapshot.get("device_total")
+
+            # Позначені пристрої лишаються позначеними після перезавантаження сторінки
+            checked = {mikrotik['id'] for mikrotik in self.get_selected_devices()}
+            self.table.setRowCount(0)
+            self.devices_data = []
+            self.device_rows = {}
+            self.inventory_total = total if total is not None else len(devices)
+            self.append_devices(devices)
+            for device_id in checked & self.device_rows.keys():
+                self.table.cellWidget(self.device_rows[device_id], 0).setChecked(True)
+
+            # Оновлюємо версії, якщо вони відсутні або застарілі (лише для завантаженої сторінки)
+            for row in (devices if refresh_versions else []):
+                if not row["installed_version"] or not row["latest_version"] or not row["routerboard_firmware"]:
+                    installed_ver, latest_ver, routerboard_firmware = mikrotik_ops.check_versions({
+                        "host": row["host"],
+                        "user": row["user"],
+                        "password": row["password"]
                     })
-
-                    # Оновлюємо версії, якщо вони відсутні або застарілі
-                    if not row.installed_version or not row.latest_version or not row.routerboard_firmware:
-                        installed_ver, latest_ver, routerboard_firmware = check_versions({
-                            "host": row.host,
-                            "user": row.username,
-                            "password": row.password
-                        })
-                        if installed_ver and latest_ver and routerboard_firmware:
-                            self.update_versions_and_firmware(row.id, installed_ver, latest_ver, routerboard_firmware)
-                self.log_text.append("Пристрої завантажено та відсортовані.")
+                    if installed_ver and latest_ver and routerboard_firmware:
+                        self.update_versions_and_firmware(row["id"], installed_ver, latest_ver, routerboard_firmware)
+            self.log_text.append("Пристрої завантажено та відсортовані.")
         except Exception as e:
             self.log_text.append(f"Помилка завантаження пристроїв: {str(e)}")
             traceback.print_exc()
@@ -1213,6 +1499,282 @@ class MainWindow(QMainWindow):
                 self.table.setItem(i, 5, QTableWidgetItem("Невідомо"))
                 self.table.setItem(i, 6, QTableWidgetItem("Невідомо"))
 
+    def append_devices(self, devices):
+        first = self.table.rowCount()
+        self.table.setRowCount(first + len(devices))
+        for i, row in enumerate(devices, first):
+            checkbox = QCheckBox()
+            checkbox.setFont(QFont("Arial", 18))  # Збільшений шрифт для чекбоксів
+            self.table.setCellWidget(i, 0, checkbox)
+            self.table.setItem(i, 1, QTableWidgetItem(row["name"] or "Без назви"))
+            self.table.setItem(i, 2, QTableWidgetItem(row["host"] or "Невідомий хост"))
+            self.table.setItem(i, 3, QTableWidgetItem(
+                str(row["installed_version"]) if row["installed_version"] else "Невідомо"))
+            self.table.setItem(i, 4,
+                               QTableWidgetItem(str(row["latest_version"]) if row["latest_version"] else "Невідомо"))
+            self.table.setItem(i, 5, QTableWidgetItem(
+                str(row["backup_status_final"]) if row["backup_status_final"] else "Невідомо"))
+            self.table.setItem(i, 6, QTableWidgetItem(
+                str(row["routerboard_firmware"]) if row["routerboard_firmware"] else "Невідомо"))
+            self.table.setItem(i, 7, QTableWidgetItem())
+            self.table.setItem(i, 8, QTableWidgetItem())
+            self.devices_data.append(dict(row))
+            self.device_rows[row["id"]] = i
+        self.log_text.set_devices([row['name'] for row in devices])
+        if self.health_store is not None:
+            self.show_sparklines({device_key(row): self.health_series(device_key(row)) for row in devices})
+        if self.health_worker is not None:
+            self.health_worker.poller.set_devices(self.devices_data)
+        self.inventory_total = max(self.inventory_total, len(self.devices_data))
+        self.inventory_label.setText(f"Показано {len(self.devices_data)} з {self.inventory_total}")
+
+    def current_query(self):
+        return inventory.InventoryQuery(search=self.search_input.text(), status=self.status_filter.currentData(),
+                                        needs_update=True if self.needs_update_filter.isChecked() else None,
+                                        sort=self.sort_field, descending=self.sort_descending)
+
+    def populate_targets(self, targets):
+        """Цілі для вибору пристроїв: сайти, групи, теги, збережені запити (з знімка settings_store)."""
+        current = self.target_filter.currentData()
+        self.target_filter.blockSignals(True)
+        self.target_filter.clear()
+        self.target_filter.addItem("Усі пристрої", None)
+        for target, title in targets:
+            self.target_filter.addItem(title, target)
+        index = self.target_filter.findData(current)
+        self.target_filter.setCurrentIndex(max(index, 0))
+        self.target_filter.blockSignals(False)
+
+    def save_current_query(self):
+        name, ok = QInputDialog.getText(self, "Зберегти запит", "Назва запиту:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        query, target = self.current_query(), self.target_filter.currentData()
+        try:
+            with pyodbc.connect(self.conn_str, timeout=30) as conn:
+                cursor = conn.cursor()
+                # Фільтр у межах вибраної цілі зберігається разом з нею
+                if target:
+                    query = inventory.resolve_target(cursor, target).combined(query)
+                inventory.save_query(cursor, name, query)
+                conn.commit()
+        except Exception as e:
+            self.log_text.append(f"Помилка збереження запиту '{name}': {str(e)[:200]}")
+            return
+        if self.target_filter.findData(f"query:{name}") < 0:
+            self.target_filter.addItem(f"Запит: {name}", f"query:{name}")
+        self.log_text.append(f"Запит '{name}' збережено: {query.to_dict()}")
+
+    def apply_filter(self):
+        self.inventory_target = self.target_filter.currentData()
+        try:
+            self.inventory_query = self.current_query()
+        except ValueError as e:
+            self.log_text.append(f"Помилка фільтра: {str(e)}")
+            return
+        self.request_page(0)
+
+    def sort_by_column(self, column):
+        if column not in SORT_FIELDS_BY_COLUMN:
+            return  # Спарклайни не сортуються на сервері
+        field = SORT_FIELDS_BY_COLUMN[column]
+        # Повторне натискання на той самий стовпець змінює напрямок
+        self.sort_descending = not self.sort_descending if field == self.sort_field else field == "needs_update"
+        self.sort_field = field
+        self.table.horizontalHeader().setSortIndicator(
+            column, Qt.DescendingOrder if self.sort_descending else Qt.AscendingOrder)
+        self.apply_filter()
+
+    def request_page(self, offset):
+        """Сторінка з offset у фоновому потоці; offset 0 - новий запит (відповіді попередніх ігноруються)."""
+        if offset == 0:
+            self.page_generation += 1
+        elif self.page_loading:
+            return
+        if self.inventory_query is None:
+            self.inventory_query = self.current_query()
+        self.page_loading = True
+        worker = InventoryPageWorker(self.conn_str, self.inventory_query, offset, self.page_generation,
+                                     self.inventory_target)
+        worker.update_signal.connect(self.update_log)
+        worker.loaded_signal.connect(self.page_loaded)
+        worker.finished.connect(lambda: self.page_workers.discard(worker))
+        self.page_workers.add(worker)
+        worker.start()
+
+    def page_loaded(self, generation, devices, total):
+        if generation != self.page_generation:
+            return  # Фільтр змінився, поки сторінка завантажувалась
+        self.page_loading = False
+        if devices is None:
+            return
+        if total is not None:
+            self.load_devices(devices, refresh_versions=False, total=total)
+        else:
+            self.append_devices(devices)
+
+    def table_scrolled(self, value):
+        scrollbar = self.table.verticalScrollBar()
+        if value >= scrollbar.maximum() - 5 and len(self.devices_data) < self.inventory_total:
+            self.request_page(len(self.devices_data))
+
+    def load_remaining_devices(self):
+        """Догружає всі рядки за поточним фільтром (перед масовим виділенням) одним запитом."""
+        remaining = self.inventory_total - len(self.devices_data)
+        if remaining <= 0:
+            return
+        if self.inventory_query is None:
+            self.inventory_query = self.current_query()
+        self.page_generation += 1  # Сторінка, що вже завантажується, більше не потрібна
+        self.page_loading = False
+        try:
+            devices, _ = inventory.load_page(self.conn_str, self.inventory_query, len(self.devices_data), remaining,
+                                             target=self.inventory_target)
+        except Exception as e:
+            self.log_text.append(f"Помилка завантаження пристроїв: {str(e)[:200]}")
+            return
+        self.append_devices(devices)
+        self.log_text.append(f"Догружено {len(devices)} пристроїв за поточним фільтром.")
+
+    def toggle_health_polling(self, enabled):
+        """Опитування завантажених у таблицю пристроїв через пул RouterOS API; ряди зберігаються між запусками."""
+        if not enabled:
+            if self.health_worker is not None:
+                self.health_worker.stop()
+                self.log_text.append("Моніторинг стану зупиняється після поточного циклу.")
+            return
+        if self.health_worker is not None and self.health_worker.isRunning():
+            return
+        if self.health_store is None:
+            self.health_store = health_poller.SeriesStore.load()
+        self.health_worker = HealthWorker(self.devices_data, self.health_store)
+        self.health_worker.update_signal.connect(self.update_log)
+        self.health_worker.sample_signal.connect(self.show_sparklines)
+        self.health_worker.finished.connect(self.health_finished)
+        self.health_worker.start()
+        self.log_text.append(f"Моніторинг стану: {len(self.devices_data)} пристроїв кожні "
+                             f"{health_poller.DEFAULT_INTERVAL} с.")
+
+    def health_finished(self):
+        self.health_worker = None
+        self.health_button.setChecked(False)
+
+    def health_series(self, key):
+        return (self.health_store.values(key, "cpu", points=SPARKLINE_POINTS),
+                self.health_store.values(key, "errors", points=SPARKLINE_POINTS))
+
+    def show_sparklines(self, series):
+        for row, mikrotik in enumerate(self.devices_data):
+            values = series.get(device_key(mikrotik))
+            if values is None:
+                continue
+            for column, points in zip((7, 8), values):
+                self.table.item(row, column).setData(VALUES_ROLE, points)
+
+    def import_devices(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Імпорт пристроїв", "", "CSV або JSON (*.csv *.json)")
+        if not path:
+            return
+        answer = QMessageBox.question(self, "Імпорт пристроїв",
+                                      "Оновлювати наявні пристрої з тими самими хостами (назва, логін, пароль, сайт)?",
+                                      QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.No)
+        if answer == QMessageBox.Cancel:
+            return
+        self.start_transfer_worker("import", path, update=answer == QMessageBox.Yes)
+
+    def export_devices(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Експорт пристроїв", "devices.csv", "CSV (*.csv);;JSON (*.json)")
+        if path:
+            self.start_transfer_worker("export", path, target=self.inventory_target)
+
+    def start_transfer_worker(self, mode, path, update=False, target=None):
+        if self.transfer_worker is not None and self.transfer_worker.isRunning():
+            self.log_text.append("Імпорт або експорт пристроїв уже виконується.")
+            return
+        self.import_button.setEnabled(False)
+        self.export_button.setEnabled(False)
+        self.transfer_worker = DeviceTransferWorker(self.conn_str, mode, path, update, target)
+        self.transfer_worker.update_signal.connect(self.update_log)
+        self.transfer_worker.finished.connect(self.transfer_finished)
+        self.transfer_worker.start()
+
+    def transfer_finished(self):
+        self.import_button.setEnabled(True)
+        self.export_button.setEnabled(True)
+        if self.transfer_worker.mode != "import":
+            return
+        # Після імпорту змінився відбиток таблиць - знімок (пристрої, сайти) перечитується у фоні
+        self.snapshot_worker = SnapshotWorker(self.conn_str, (self.snapshot or {}).get("fingerprint"))
+        self.snapshot_worker.update_signal.connect(self.update_log)
+        self.snapshot_worker.loaded_signal.connect(self.snapshot_loaded)
+        self.snapshot_worker.start()
+
+    def run_command(self):
+        selected_devices = self.get_selected_devices()
+        if not selected_devices:
+            self.log_text.append("Попередження: Виберіть хоча б один пристрій!")
+            return
+        command, ok = QInputDialog.getText(self, "Виконати команду",
+                                           f"Команда лише для читання для {len(selected_devices)} пристроїв:",
+                                           text="/ip address print")
+        command = command.strip()
+        if not ok or not command:
+            return
+        if not command_runner.is_read_only(command):
+            QMessageBox.warning(self, "Виконати команду", "Дозволено лише одну команду, що читає стан: "
+                                                          "print, export, get або monitor ... once (без file=).")
+            return
+        self.log_text.append(f"Виконання '{command}' на {len(selected_devices)} пристроях...")
+        self.command_worker = CommandWorker(selected_devices, command, self.conn_str)
+        self.command_worker.update_signal.connect(self.update_log)
+        self.command_worker.concurrency_signal.connect(self.update_concurrency)
+        self.command_worker.finished_signal.connect(lambda: self.command_button.setEnabled(True))
+        self.command_worker.start()
+        self.command_button.setEnabled(False)
+
+    def push_config(self):
+        selected_devices = self.get_selected_devices()
+        if not selected_devices:
+            self.log_text.append("Попередження: Виберіть хоча б один пристрій!")
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Фрагмент конфігурації", "", "RouterOS скрипт (*.rsc);;Усі файли (*)")
+        if not path:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                script = f.read()
+            commands, sections = config_push.parse_script(script)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Розгорнути конфігурацію", f"Фрагмент не прийнято: {str(e)[:200]}")
+            return
+        waves = " + ".join(str(len(wave)) for wave in config_push.plan_waves(selected_devices))
+        answer = QMessageBox.question(
+            self, "Розгорнути конфігурацію",
+            f"Застосувати {len(commands)} команд (секції: {', '.join(sorted(sections))}) "
+            f"до {len(selected_devices)} пристроїв?\nХвилі: {waves}. Перед змінами створюється бекап; "
+            f"пристрої з невдалою перевіркою відкочуються з перезавантаженням.",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if answer != QMessageBox.Yes:
+            return
+        self.log_text.append(f"Розгортання {os.path.basename(path)} на {len(selected_devices)} пристроях (хвилі: {waves})")
+        self.push_worker = ConfigPushWorker(selected_devices, script, self.conn_str, self.telegram_token)
+        self.push_worker.update_signal.connect(self.update_log)
+        self.push_worker.concurrency_signal.connect(self.update_concurrency)
+        self.push_worker.finished_signal.connect(lambda: self.push_button.setEnabled(True))
+        self.push_worker.start()
+        self.push_button.setEnabled(False)
+
+    def report_interrupted_runs(self):
+        try:
+            for started_at, job_type, run_id, pending in self.find_interrupted_runs():
+                if pending:
+                    self.log_text.append(f"⚠ Знайдено перерваний запуск #{run_id} ({job_type}, розпочато {started_at}), "
+                                         f"необроблених пристроїв: {len(pending)}. "
+                                         f"Натисніть 'Продовжити перерваний запуск'.")
+        except Exception as e:
+            self.log_text.append(f"Помилка читання журналу запусків: {str(e)}")
+
     def update_versions_and_firmware(self, device_id, installed_version, latest_version, routerboard_firmware):
         try:
             with pyodbc.connect(self.conn_str, timeout=30) as conn:
@@ -1254,8 +1816,12 @@ class MainWindow(QMainWindow):
             self.log_text.append("Попередження: Виберіть хоча б один пристрій!")
             return
 
-        self.backup_worker = BackupWorker(selected_devices, self.conn_str, self.telegram_token, self.ftp_config)
+        self.start_backup_worker(selected_devices)
+
+    def start_backup_worker(self, devices, resume_run_id=None):
+        self.backup_worker = BackupWorker(devices, self.conn_str, self.telegram_token, self.ftp_config, resume_run_id)
         self.backup_worker.update_signal.connect(self.update_log)
+        self.backup_worker.concurrency_signal.connect(self.update_concurrency)
         self.backup_worker.finished_signal.connect(self.backup_finished)
         self.backup_worker.start()
         self.backup_button.setEnabled(False)
@@ -1272,14 +1838,14 @@ class MainWindow(QMainWindow):
 
         self.check_updates_worker = CheckUpdatesWorker(selected_devices, self.conn_str, self.telegram_token)
         self.check_updates_worker.update_signal.connect(self.update_log)
+        self.check_updates_worker.concurrency_signal.connect(self.update_concurrency)
         self.check_updates_worker.finished_signal.connect(self.check_updates_finished)
         self.check_updates_worker.start()
         self.check_update_button.setEnabled(False)
 
     def check_updates_finished(self):
         self.check_update_button.setEnabled(True)
-        self.log_text.append("Перевірка оновлень завершена.")
-        self.load_devices()  # Оновлюємо таблицю для відображення нових версій
+        self.log_text.append("Перевірка оновлень завершена.")  # Версії в таблиці вже оновлено подіями
 
     def perform_upgrade(self):
         selected_devices = self.get_selected_devices()
@@ -1287,7 +1853,10 @@ class MainWindow(QMainWindow):
             self.log_text.append("Попередження: Виберіть хоча б один пристрій!")
             return
 
-        self.upgrade_worker = UpgradeWorker(selected_devices, self.conn_str, self.telegram_token)
+        self.start_upgrade_worker(selected_devices)
+
+    def start_upgrade_worker(self, devices, resume_run_id=None):
+        self.upgrade_worker = UpgradeWorker(devices, self.conn_str, self.telegram_token, resume_run_id)
         self.upgrade_worker.update_signal.connect(self.update_log)
         self.upgrade_worker.finished_signal.connect(self.upgrade_finished)
         self.upgrade_worker.start()
@@ -1296,7 +1865,45 @@ class MainWindow(QMainWindow):
     def upgrade_finished(self):
         self.upgrade_button.setEnabled(True)
         self.log_text.append("Оновлення завершено.")
-        self.load_devices()  # Оновлюємо таблицю для відображення нових версій
+
+    def find_interrupted_runs(self):
+        journal = JobJournal(BACKUP_DIR)
+        try:
+            runs = []
+            for job_type in ("backup", "upgrade"):
+                run = journal.last_unfinished_run(job_type)
+                if run:
+                    run_id, keys, started_at = run
+                    devices_by_key = {device_key(mikrotik): mikrotik for mikrotik in self.devices_data}
+                    devices = [devices_by_key[key] for key in keys if key in devices_by_key]
+                    runs.append((started_at, job_type, run_id, journal.pending_devices(run_id, devices)))
+            return sorted(runs, reverse=True)
+        finally:
+            journal.close()
+
+    def resume_interrupted_run(self):
+        try:
+            runs = self.find_interrupted_runs()
+        except Exception as e:
+            self.log_text.append(f"Помилка читання журналу запусків: {str(e)}")
+            return
+        if not runs:
+            self.log_text.append("Перерваних запусків не знайдено.")
+            return
+
+        started_at, job_type, run_id, pending = runs[0]
+        if not pending:
+            self.log_text.append(f"У перерваному запуску #{run_id} не залишилось необроблених пристроїв.")
+            return
+        self.log_text.append(f"Продовжуємо запуск #{run_id} ({job_type}, розпочато {started_at}): "
+                             f"залишилось пристроїв {len(pending)}")
+        if job_type == "backup":
+            if not self.telegram_token or not self.ftp_config:
+                self.log_text.append("Помилка: Не завантажено Telegram токен або FTP налаштування!")
+                return
+            self.start_backup_worker(pending, run_id)
+        else:
+            self.start_upgrade_worker(pending, run_id)
 
     def perform_routerboard(self):
         selected_devices = self.get_selected_devices()
@@ -1316,13 +1923,14 @@ class MainWindow(QMainWindow):
 
     def get_selected_devices(self):
         selected = []
-        for i in range(self.table.rowCount()):
+        for i in range(len(self.devices_data)):
             checkbox = self.table.cellWidget(i, 0)
             if checkbox.isChecked():
                 selected.append(self.devices_data[i])
         return selected
 
     def check_all(self):
+        self.load_remaining_devices()
         for i in range(self.table.rowCount()):
             checkbox = self.table.cellWidget(i, 0)
             checkbox.setChecked(True)
@@ -1335,15 +1943,14 @@ class MainWindow(QMainWindow):
         self.log_text.append("Усі галочки зняті.")
 
     def check_for_updates(self):
+        self.load_remaining_devices()
         for i in range(self.table.rowCount()):
             mikrotik = self.devices_data[i]
             installed_version = mikrotik['installed_version']
             latest_version = mikrotik['latest_version']
             checkbox = self.table.cellWidget(i, 0)
             if installed_version and latest_version:
-                update_needed = tuple(map(int, str(installed_version).split('.'))) < tuple(
-                    map(int, str(latest_version).split('.')))
-                checkbox.setChecked(update_needed)
+                checkbox.setChecked(needs_update(installed_version, latest_version))
         self.log_text.append("Позначено пристрої, що потребують оновлення.")
 
     def start_collecting_chat_ids(self):
@@ -1361,10 +1968,45 @@ class MainWindow(QMainWindow):
     def update_log(self, message):
         self.log_text.append(message)
 
+    def on_device_event(self, event):
+        row = self.device_rows.get(event.device_id)
+        if row is None:
+            return
+        mikrotik = self.devices_data[row]
+        for column, key, value in ((3, 'installed_version', event.installed_version),
+                                   (4, 'latest_version', event.latest_version),
+                                   (6, 'routerboard_firmware', event.firmware)):
+            if value and value != mikrotik[key]:
+                mikrotik[key] = value
+                self.table.item(row, column).setText(str(value))
+        if event.final:
+            mikrotik['backup_status_final'] = event.final_status
+            if event.message:
+                mikrotik['backup_status'] = event.message[:200]
+            text = event.final_status
+        else:
+            text = f"⏳ {device_events.STAGE_NAMES.get(event.stage, event.stage)}"
+        item = self.table.item(row, 5)
+        item.setText(text)
+        if event.message:
+            item.setToolTip(event.message)
+
+    def update_concurrency(self, limit):
+        self.concurrency_label.setText(f"Паралельність: {limit}")
+
     def clear_log(self):
         self.log_text.clear()
         self.log_text.append("Лог очищено.")
 
+    def closeEvent(self, event):
+        if self.health_worker is not None:
+            self.health_worker.stop()
+            self.health_worker.wait(5000)
+        self.unsubscribe_events()
+        self.log_text.flush()
+        self.log_text.close_file_log()
+        super().closeEvent(event)
+
     def exit_application(self):
         self.close()
         if not QApplication.instance().topLevelWidgets():  # Перевірка, чи немає відкритих вікон
@@ -1375,11 +2017,13 @@ class MainWindow(QMainWindow):
         self.get_chatid_button.setEnabled(True)
         self.stop_chatid_button.setEnabled(False)
         self.log_text.append("Збір chat_id завершено.")
-        self.load_settings()  # Оновлюємо CHAT_IDS після завершення
+        self.load_settings()  # Оновлюємо mikrotik_ops.CHAT_IDS після завершення
 
 
 if __name__ == "__main__":
-    check_and_install_dependencies()
+    multiprocessing.freeze_support()  # Пул процесів (перевірка відповідності) у зібраному .exe
+    if "--check-deps" in sys.argv:
+        sys.exit(1 if check_dependencies(install="--install" in sys.argv) else 0)
 
     try:
         app = QApplication(sys.argv)
@@ -1413,7 +2057,7 @@ if __name__ == "__main__":
                 QTableWidget::item {
                     padding: 4px;
                 }
-                QTextEdit {
+                QTextEdit, QPlainTextEdit {
                     background-color: #34495e;
                     color: #ffffff;
                     border: 1px solid #465c71;
@@ -1448,6 +2092,8 @@ if __name__ == "__main__":
             """)
         login_window = LoginWindow()
         login_window.show()
+        # Поки користувач вводить дані для входу, у фоні імпортуємо драйвер БД і мережеві бібліотеки
+        preload(PRELOAD_MODULES)
         sys.exit(app.exec_())
     except Exception as e:
         print(f"Критична помилка: {str(e)}")
@@ -3,10 +3,10 @@
 
 a = Analysis(
     ['myUi.py'],
-    pathex=[],
+    pathex=['..'],
     binaries=[],
-    datas=[('C:\\Users\\zhuko\\PycharmProjects\\PythonProject1\\UI\\ico', 'UI/ico')],
-    hiddenimports=['PyQt5', 'PyQt5.QtCore', 'PyQt5.QtGui', 'PyQt5.QtWidgets', 'netmiko', 'paramiko', 'pyodbc', 'routeros_api', 'qdarkstyle', 'requests'],
+    datas=[('C:\\Users\\zhuko\\PycharmProjects\\PythonProject1\\UI\\ico', 'UI/ico'), ('..\\compliance_rules.json', '.')],
+    hiddenimports=['PyQt5', 'PyQt5.QtCore', 'PyQt5.QtGui', 'PyQt5.QtWidgets', 'netmiko', 'paramiko', 'pyodbc', 'routeros_api', 'qdarkstyle', 'requests', 'cryptography', 'cryptography.fernet', 'mikrotik_ops', 'backup_cleanup', 'settings_store', 'inventory', 'device_import', 'health_poller', 'command_runner', 'config_push', 'throttle', 'ftp_upload'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,64 @@
+import math
+
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyle
+from PyQt5.QtGui import QColor, QPainter, QPen, QPolygonF
+from PyQt5.QtCore import QPointF, Qt
+
+# Спарклайни в клітинках таблиці пристроїв: ряд значень лежить у Qt.UserRole елемента,
+# делегат малює ламану та останнє значення. Елементів-віджетів на клітинку не створюється.
+
+VALUES_ROLE = Qt.UserRole
+LINE_COLOR = QColor("#3498db")
+ALERT_COLOR = QColor("#e74c3c")
+
+
+class SparklineDelegate(QStyledItemDelegate):
+    """
+    low/high - фіксована шкала (CPU 0..100); None - масштаб за значеннями ряду.
+    alert - поріг останнього значення, з якого лінія червона. NaN - розрив лінії (пристрій не відповідав).
+    """
+
+    def __init__(self, low=None, high=None, alert=None, suffix="", parent=None):
+        super().__init__(parent)
+        self.low = low
+        self.high = high
+        self.alert = alert
+        self.suffix = suffix
+
+    def paint(self, painter, option, index):
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+        values = index.data(VALUES_ROLE) or []
+        present = [value for value in values if not math.isnan(value)]
+        if not present:
+            return
+        last = present[-1]
+        rect = option.rect.adjusted(3, 4, -3, -4)
+        text_width = option.fontMetrics.horizontalAdvance("0000" + self.suffix)
+        chart_width = rect.width() - text_width - 4
+        low = self.low if self.low is not None else min(present)
+        high = self.high if self.high is not None else max(present)
+        scale = (high - low) or 1.0
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        color = ALERT_COLOR if self.alert is not None and last >= self.alert else LINE_COLOR
+        painter.setPen(QPen(color, 1.5))
+        step = chart_width / max(len(values) - 1, 1)
+        segment = QPolygonF()
+        for position, value in enumerate(values):
+            if math.isnan(value):
+                if segment.size() > 1:
+                    painter.drawPolyline(segment)
+                segment = QPolygonF()
+                continue
+            ratio = (min(max(value, low), high) - low) / scale
+            segment.append(QPointF(rect.left() + position * step, rect.bottom() - ratio * rect.height()))
+        if segment.size() > 1:
+            painter.drawPolyline(segment)
+        elif segment.size() == 1:
+            painter.drawPoint(segment.at(0))
+        painter.setPen(option.palette.text().color())
+        painter.drawText(rect.adjusted(chart_width + 4, 0, 0, 0), Qt.AlignRight | Qt.AlignVCenter,
+                         f"{last:.0f}{self.suffix}")
+        painter.restore()
@@ -0,0 +1,113 @@
+import time
+
+import routeros_api
+
+from mikrotik_ops import ssh_session
+from routeros_parsers import backup_timestamp, terse_names
+
+# Типи файлів у /file для .backup і .rsc
+BACKUP_FILE_TYPES = ('backup', 'script')
+API_PORT = 8728
+
+# Дата з імені <назва>-Backup-YYYYMMDD-HHMM.backup / .rsc (розбір у routeros_parsers)
+extract_datetime = backup_timestamp
+
+
+def select_stale_files(files, keep_count=2):
+    """
+    Приймає список словників з ключем 'name' і повертає ті, що підлягають видаленню:
+    усі датовані бекапи, крім keep_count найновіших. Файли без дати в імені не чіпаємо.
+    """
+    dated = [(extract_datetime(item['name']), item) for item in files]
+    dated = [(dt, item) for dt, item in dated if dt is not None]
+    dated.sort(key=lambda x: (x[0], x[1]['name']))
+    if keep_count <= 0:
+        return [item for _, item in dated]
+    return [item for _, item in dated[:-keep_count]]
+
+
+def _cleanup_files_api(files, keep_count):
+    commands = 0
+    found = []
+    # Фільтрація по типу виконується на роутері, назад приходять лише id та ім'я
+    for file_type in BACKUP_FILE_TYPES:
+        found.extend(files.call('print', {'.proplist': '.id,name'}, {'type': file_type}))
+        commands += 1
+
+    stale = select_stale_files(found, keep_count)
+    if stale:
+        # Один виклик remove з переліком id через кому
+        files.remove(id=','.join(item['id'] for item in stale))
+        commands += 1
+    return {"method": "api", "commands": commands, "found": len(found), "removed": [f['name'] for f in stale]}
+
+
+def _cleanup_via_api(mikrotik, keep_count, pool=None):
+    if pool is not None:
+        with pool.api(mikrotik) as connection:
+            return _cleanup_files_api(connection.get_resource('/file'), keep_count)
+
+    api = routeros_api.RouterOsApiPool(
+        host=mikrotik['host'],
+        username=mikrotik['user'],
+        password=mikrotik['password'],
+        plaintext_login=True,
+        port=mikrotik.get('api_port') or API_PORT
+    )
+    try:
+        return _cleanup_files_api(api.get_api().get_resource('/file'), keep_count)
+    finally:
+        api.disconnect()
+
+
+def _cleanup_via_ssh(mikrotik, keep_count, pool=None):
+    type_filter = " or ".join(f'type="{file_type}"' for file_type in BACKUP_FILE_TYPES)
+    with ssh_session(mikrotik, pool) as ssh_conn:
+        output = ssh_conn.send_command(f'/file print terse without-paging where {type_filter}', delay_factor=2.0)
+        commands = 1
+        found = [{"name": name} for name in terse_names(output)]
+
+        stale = select_stale_files(found, keep_count)
+        if stale:
+            names = " or ".join(f'name="{item["name"]}"' for item in stale)
+            ssh_conn.send_command(f'/file remove [find where {names}]', delay_factor=2.0)
+            commands += 1
+        return {"method": "ssh", "commands": commands, "found": len(found), "removed": [f['name'] for f in stale]}
+
+
+def delete_old_backups(mikrotik, keep_count=2, use_api=True, pool=None):
+    """
+    Видаляє старі бекапи на роутері, залишаючи keep_count найновіших файлів.
+    Спершу пробує RouterOS API (порт 8728), якщо він вимкнений - SSH з `print terse`.
+    В обох випадках усі зайві файли видаляються однією командою.
+    pool - необов'язковий connection_pool.SessionPool для перевикористання з'єднань.
+    Повертає True, якщо щось було видалено.
+    """
+    started = time.perf_counter()
+    stats = None
+
+    if use_api:
+        try:
+            stats = _cleanup_via_api(mikrotik, keep_count, pool)
+        except Exception as e:
+            print(f"⚠ API недоступний на {mikrotik['name']} ({mikrotik['host']}): {str(e)}. Використовуємо SSH.")
+
+    if stats is None:
+        try:
+            stats = _cleanup_via_ssh(mikrotik, keep_count, pool)
+        except Exception as e:
+            error_message = f"Помилка видалення бекапів на {mikrotik['name']} ({mikrotik['host']}): {str(e)}"[
+                            :200]  # Обмежуємо довжину до 200 символів
+            print(error_message)
+            return False
+
+    elapsed = time.perf_counter() - started
+    for name in stats['removed']:
+        print(f"❌ Видалено файл: {name}")
+    print(f"📊 Очищення на {mikrotik['name']}: метод={stats['method']}, команд={stats['commands']}, "
+          f"знайдено={stats['found']}, видалено={len(stats['removed'])}, час={elapsed:.2f} с")
+
+    if not stats['removed']:
+        print(f"✅ На {mikrotik['name']} немає файлів для видалення.")
+        return False
+    return True
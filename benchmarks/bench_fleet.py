@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# Наскрізна пропускна здатність конвеєра бекапів на симульованому парку (fleet_sim.py):
+#   python benchmarks/bench_fleet.py --sizes 10 100 1000 --targets daemon worker
+#   python benchmarks/bench_fleet.py --json results.json --baseline previous.json
+# daemon - scheduler_daemon.py (--once backup), worker - BackupWorker з UI/myUi.py,
+# script - MikrotikBackUp.py окремим процесом (потрібні окремі адреси 127.1.x.y і права на порти 22/21/8728).
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "UI"))
+
+import fleet_sim
+import mikrotik_ops
+
+TARGETS = ("daemon", "worker", "script")
+
+
+def count_backed_up(work_dir):
+    """Кількість пристроїв, для яких у BackUp/ з'явився .rsc."""
+    backup_dir = os.path.join(work_dir, "BackUp")
+    if not os.path.isdir(backup_dir):
+        return 0
+    return sum(1 for name in os.listdir(backup_dir)
+               if os.path.isdir(os.path.join(backup_dir, name)) and
+               any(file.endswith(".rsc") for file in os.listdir(os.path.join(backup_dir, name))))
+
+
+def run_daemon(simulator, work_dir, max_workers):
+    from scheduler_daemon import SchedulerDaemon
+    config = simulator.config()
+    config["schedule"] = {"max_workers": max_workers, "idle_timeout": 300, "jobs": []}
+    daemon = SchedulerDaemon(config, os.path.join(work_dir, "config.json"))
+    run = daemon.run_once("backup")
+    return len(run.succeeded), len(run.failed)
+
+
+def run_worker(simulator, work_dir, max_workers):
+    from PyQt5.QtCore import QCoreApplication
+    from myUi import BackupWorker
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    messages = []
+    worker = BackupWorker(simulator.devices(), "", "sim-token", simulator.ftp_config())
+    worker.update_signal.connect(messages.append)
+    worker.run()  # Синхронно в поточному потоці - без циклу подій Qt
+    app.processEvents()  # Сигнали з потоків пулу ставляться в чергу головного потоку - доставляємо їх
+    succeeded = sum(1 for message in messages if message.startswith("Успіх для"))
+    return succeeded, len(simulator.devices()) - succeeded
+
+
+def run_script(simulator, work_dir, max_workers):
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, "MikrotikBackUp.py")], cwd=work_dir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            env=dict(os.environ, PYTHONPATH=REPO_DIR))
+    succeeded = count_backed_up(work_dir)
+    if result.returncode != 0:
+        print(f"  MikrotikBackUp.py завершився з кодом {result.returncode}")
+    return succeeded, len(simulator.devices()) - succeeded
+
+
+RUNNERS = {"daemon": run_daemon, "worker": run_worker, "script": run_script}
+
+
+def bench(target, size, settings, max_workers):
+    script = target == "script"
+    try:
+        # Скрипт не підтримує нестандартні порти - кожен роутер отримує свою адресу зі стандартними портами
+        simulator = fleet_sim.FleetSimulator(size, settings, loopback_ips=script,
+                                             ssh_port=22 if script else 0, api_port=8728 if script else 0,
+                                             ftp_port=21 if script else 0, seed=size).start()
+    except OSError as e:
+        print(f"  {target}/{size}: пропущено, не вдалося запустити симулятор ({str(e)})")
+        return None
+
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{target}_{size}_")
+    previous_dir = os.getcwd()
+    previous_url = mikrotik_ops.TELEGRAM_API_URL
+    try:
+        os.chdir(work_dir)
+        with open("config.json", "w", encoding="utf-8") as file:
+            json.dump(simulator.config(), file, ensure_ascii=False)
+        if not script:
+            with open("chat_ids.json", "w", encoding="utf-8") as file:
+                json.dump(["1"], file)
+        mikrotik_ops.TELEGRAM_API_URL = simulator.telegram_url
+        mikrotik_ops.CHAT_IDS[:] = ["1"]
+
+        started = time.perf_counter()
+        try:
+            succeeded, failed = RUNNERS[target](simulator, work_dir, max_workers)
+        except ImportError as e:
+            print(f"  {target}/{size}: пропущено, відсутня залежність ({str(e)})")
+            return None
+        elapsed = time.perf_counter() - started
+        return {"target": target, "devices": size, "seconds": round(elapsed, 2),
+                "devices_per_second": round(size / elapsed, 3) if elapsed else 0.0,
+                "succeeded": succeeded, "failed": failed, "simulator": dict(simulator.stats)}
+    finally:
+        mikrotik_ops.TELEGRAM_API_URL = previous_url
+        os.chdir(previous_dir)
+        simulator.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline_path, tolerance):
+    """Повертає список регресій пропускної здатності відносно попередніх результатів."""
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = {(item["target"], item["devices"]): item for item in json.load(file)}
+    regressions = []
+    for item in results:
+        previous = baseline.get((item["target"], item["devices"]))
+        if not previous or not previous["devices_per_second"]:
+            continue
+        change = item["devices_per_second"] / previous["devices_per_second"] - 1
+        if change < -tolerance:
+            regressions.append(f"{item['target']}/{item['devices']}: {previous['devices_per_second']} -> "
+                               f"{item['devices_per_second']} пристроїв/с ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк бекапу парку на симуляторі RouterOS")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=["daemon", "worker"])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--auth-failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--backup-size", type=int, default=256 * 1024)
+    parser.add_argument("--max-workers", type=int, default=16, help="Потоки scheduler_daemon")
+    parser.add_argument("--json", help="Зберегти результати у файл")
+    parser.add_argument("--baseline", help="Порівняти з попередніми результатами (JSON)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустиме падіння пропускної здатності")
+    args = parser.parse_args(argv)
+
+    settings = {"latency": args.latency, "jitter": args.jitter, "auth_failure_rate": args.auth_failure_rate,
+                "hang_rate": args.hang_rate, "hang_seconds": 30, "disconnect_rate": args.disconnect_rate,
+                "backup_size": args.backup_size}
+    results = []
+    for target in args.targets:
+        for size in args.sizes:
+            print(f"{target}: {size} пристроїв...")
+            result = bench(target, size, settings, args.max_workers)
+            if result:
+                results.append(result)
+                print(f"  {result['seconds']} с, {result['devices_per_second']} пристроїв/с, "
+                      f"успішно {result['succeeded']}, з помилками {result['failed']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"⚠ Регресія: {line}")
+        sys.exit(1 if regressions else 0)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
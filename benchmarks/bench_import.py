@@ -0,0 +1,54 @@
+import os
+import csv
+import sys
+import random
+
+import pytest
+
+# Бенчмарк масового імпорту пристроїв (pytest-benchmark):
+#   python -m pytest benchmarks/bench_import.py --benchmark-only
+# Розбір і перевірка CSV на BENCH_DEVICES рядках (за замовчуванням 20000). З BENCH_CONN_STR додатково
+# вимірюється завантаження в SQL Server (dry run - транзакція відкочується, база не змінюється).
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from device_import import FIELDS, import_devices, read_records, validate_records  # noqa: E402
+
+DEVICES = int(os.environ.get("BENCH_DEVICES", "20000"))
+
+
+@pytest.fixture(scope="module")
+def csv_path(tmp_path_factory, seed=44):
+    rng = random.Random(seed)
+    path = tmp_path_factory.mktemp("import") / "devices.csv"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for index in range(DEVICES):
+            host = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}" if rng.random() < 0.9 \
+                else f"r{index}.branch{index % 50}.example.net"
+            writer.writerow([f"R{index}", host, "admin", f"pw{rng.randint(0, 10 ** 6)}", f"site{index % 40}"])
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def records(csv_path):
+    return read_records(csv_path)
+
+
+def test_read_csv(benchmark, csv_path):
+    result = benchmark(read_records, csv_path)
+    assert len(result) == DEVICES
+
+
+def test_validate(benchmark, records):
+    rows, errors, conflicts = benchmark(validate_records, records)
+    assert len(rows) == DEVICES and not errors and not conflicts
+
+
+@pytest.mark.skipif(not os.environ.get("BENCH_CONN_STR"), reason="BENCH_CONN_STR не задано")
+def test_import_dry_run(benchmark, records):
+    report = benchmark.pedantic(import_devices, args=(os.environ["BENCH_CONN_STR"], records),
+                                kwargs={"dry_run": True}, rounds=3)
+    assert report.inserted + report.updated + report.unchanged + len(report.conflicts) == DEVICES
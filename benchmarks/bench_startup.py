@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Холодний старт GUI: час від запуску інтерпретатора до показаного вікна входу (UI/myUi.py).
+#   python benchmarks/bench_startup.py --runs 10
+#   python benchmarks/bench_startup.py --json startup.json --baseline previous.json
+# lazy - як запускається програма зараз, eager - з попереднім імпортом мережевих бібліотек і драйвера БД
+# (так стартувала програма до відкладеного імпорту). Кожен запуск - окремий процес, без Qt-дисплея (offscreen).
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UI_DIR = os.path.join(REPO_DIR, "UI")
+HEAVY_MODULES = ("pyodbc", "requests", "paramiko", "netmiko", "routeros_api")
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+eager, ui_dir = sys.argv[1] == "eager", sys.argv[2]
+preloaded = []
+if eager:
+    for name in {heavy!r}:
+        try:
+            __import__(name)
+            preloaded.append(name)
+        except ImportError:
+            pass
+sys.path.insert(0, ui_dir)
+import myUi
+imported = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv[:1])
+window = myUi.LoginWindow()
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+print(json.dumps({{"import": imported - started, "shown": shown - started, "preloaded": preloaded,
+                   "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+""".format(heavy=HEAVY_MODULES)
+
+
+def run_once(mode):
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    result = subprocess.run([sys.executable, "-c", PROBE, mode, UI_DIR], cwd=UI_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "невідома помилка")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench(mode, runs):
+    samples = [run_once(mode) for _ in range(runs)]
+    shown = sorted(sample["shown"] for sample in samples)
+    return {"mode": mode, "runs": runs, "median": round(statistics.median(shown), 4), "min": round(shown[0], 4),
+            "import_median": round(statistics.median(sample["import"] for sample in samples), 4),
+            "loaded_at_login": samples[-1]["loaded"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старту вікна входу")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", choices=("lazy", "eager"), default=["lazy", "eager"])
+    parser.add_argument("--json", help="Зберегти результати у файл")
+    parser.add_argument("--baseline", help="Порівняти з попередніми результатами (JSON)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустиме зростання медіани")
+    args = parser.parse_args(argv)
+
+    results = []
+    for mode in args.modes:
+        try:
+            result = bench(mode, args.runs)
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"{mode}: пропущено ({str(e)[:200]})")
+            continue
+        results.append(result)
+        print(f"{mode}: вікно входу за {result['median'] * 1000:.0f} мс (медіана, мін {result['min'] * 1000:.0f} мс), "
+              f"імпорт myUi {result['import_median'] * 1000:.0f} мс, "
+              f"завантажено до входу: {', '.join(result['loaded_at_login']) or 'лише PyQt'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = {item["mode"]: item for item in json.load(file)}
+        regressions = [f"{item['mode']}: {baseline[item['mode']]['median']} -> {item['median']} с"
+                       for item in results if item["mode"] in baseline and
+                       item["median"] > baseline[item["mode"]]["median"] * (1 + args.tolerance)]
+        for line in regressions:
+            print(f"⚠ Регресія: {line}")
+        sys.exit(1 if regressions else 0)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import os
+import re
+import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+
+from concurrency import AimdController, classify_error, run_adaptive
+from mikrotik_ops import BACKUP_DIR, ssh_session
+
+# Виконання однієї команди лише для читання на вибраних пристроях з адаптивною паралельністю
+# (AimdController + run_adaptive, як у задачах бекапу й перевірки). Результат кожного пристрою
+# передається on_result одразу після завершення; однакові виводи групуються за хешем нормалізованого тексту,
+# тож 500 однакових відповідей - одна група зі списком пристроїв.
+
+RESULTS_DIR = os.path.join(BACKUP_DIR, "commands")
+DEFAULT_WORKERS = 16
+# Дієслова RouterOS, що лише читають стан; monitor* - тільки з "once", інакше виводить нескінченно
+READ_ONLY_VERBS = {"print", "export", "get", "monitor", "monitor-traffic"}
+MONITOR_VERBS = {"monitor", "monitor-traffic"}
+WRITE_VERBS = {"add", "set", "unset", "remove", "enable", "disable", "edit", "move", "comment", "reset", "reboot",
+               "shutdown", "install", "upgrade", "downgrade", "uninstall", "import", "run", "execute", "save", "load",
+               "send", "fetch", "flush", "clear", "make-static", "reset-configuration", "reset-counters", "ping",
+               "traceroute", "bandwidth-test", "sniff", "torch", "check-for-updates"}
+# Аргументи, з якими навіть print пише файл або не завершується
+UNSAFE_ARGS_RE = re.compile(r'(?:^|\s)(?:file=|follow\b|follow-only\b|interval=)')
+# Заголовок /export з датою і часом - різний на кожному пристрої, не враховується при групуванні
+VOLATILE_LINE_RE = re.compile(r'^#.* by RouterOS ')
+# Відповіді консолі RouterOS на помилкову команду - пристрій відповів, але команда не виконана
+ROUTEROS_ERROR_RE = re.compile(r'^(?:bad command name|syntax error|expected |no such (?:item|command)|'
+                               r'input does not match|failure:|invalid value)', re.IGNORECASE)
+
+
+def is_read_only(command):
+    """True для однієї команди з дієсловом print/export/get або monitor ... once без запису у файл."""
+    command = command.strip()
+    if not command or any(char in command for char in ";\r\n[]{}$") or command.startswith(":"):
+        return False
+    if UNSAFE_ARGS_RE.search(command):
+        return False
+    tokens = [token for token in re.split(r'[\s/]+', command) if token]
+    verb = next((token for token in tokens if token in READ_ONLY_VERBS or token in WRITE_VERBS), None)
+    if verb is None or verb in WRITE_VERBS:
+        return False
+    return verb not in MONITOR_VERBS or "once" in tokens
+
+
+def normalize_output(text):
+    """Вивід без \\r, хвостових пробілів, порожніх рядків на краях і заголовка експорту з датою."""
+    lines = [line.rstrip() for line in (text or "").replace("\r", "").split("\n")]
+    lines = [line for line in lines if not VOLATILE_LINE_RE.match(line)]
+    while lines and not lines[0]:
+        lines.pop(0)
+    while lines and not lines[-1]:
+        lines.pop()
+    return "\n".join(lines)
+
+
+def output_digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+class CommandResult:
+    __slots__ = ("device_id", "device", "host", "ok", "output", "error", "seconds", "digest")
+
+    def __init__(self, mikrotik, ok, output=None, error=None, seconds=0.0):
+        self.device_id = mikrotik.get('id')
+        self.device = mikrotik.get('name') or mikrotik['host']
+        self.host = mikrotik['host']
+        self.ok = ok
+        self.output = output
+        self.error = error
+        self.seconds = seconds
+        # Помилки групуються за видом і текстом без адреси пристрою
+        key = output if ok else f"{classify_error(error)}:{(error or '').replace(self.host, '<host>')}"
+        self.digest = output_digest(key)
+
+
+class ResultGroups:
+    """Групи однакових результатів у порядку появи; потокобезпечний."""
+
+    def __init__(self, command):
+        self.command = command
+        self.started = datetime.now()
+        self._lock = threading.Lock()
+        self.groups = {}  # digest -> {"number", "ok", "text", "devices"}
+        self.results = []
+
+    def add(self, result):
+        """(група, чи це перший пристрій групи)."""
+        with self._lock:
+            self.results.append(result)
+            group = self.groups.get(result.digest)
+            first = group is None
+            if first:
+                group = self.groups[result.digest] = {"number": len(self.groups) + 1, "ok": result.ok,
+                                                      "text": result.output if result.ok else result.error,
+                                                      "devices": []}
+            group["devices"].append(result.device)
+        return group, first
+
+    def summary(self, max_devices=10):
+        with self._lock:
+            groups = sorted(self.groups.values(), key=lambda item: len(item["devices"]), reverse=True)
+            total = len(self.results)
+        failed = sum(len(group["devices"]) for group in groups if not group["ok"])
+        lines = [f"Команда '{self.command}': {total} пристроїв, {len(groups)} різних результатів, помилок {failed}"]
+        for group in groups:
+            devices = group["devices"]
+            names = ", ".join(devices[:max_devices]) + (f" і ще {len(devices) - max_devices}"
+                                                        if len(devices) > max_devices else "")
+            lines.append(f"{'✅' if group['ok'] else '❌'} Група #{group['number']} ({len(devices)}): {names}")
+        return "\n".join(lines)
+
+    def export(self, path):
+        """.json - групи з текстом і пристроями, .csv - рядок на пристрій."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            results = list(self.results)
+            groups = [dict(group, digest=digest) for digest, group in self.groups.items()]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            if path.lower().endswith(".csv"):
+                writer = csv.writer(f)
+                writer.writerow(["device_id", "device", "host", "ok", "seconds", "group", "output"])
+                for result in results:
+                    writer.writerow([result.device_id, result.device, result.host, int(result.ok),
+                                     f"{result.seconds:.2f}", self.groups[result.digest]["number"],
+                                     result.output if result.ok else result.error])
+            else:
+                json.dump({"command": self.command, "started": self.started.strftime('%Y-%m-%d %H:%M:%S'),
+                           "groups": groups}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def default_path(self, extension="json"):
+        return os.path.join(RESULTS_DIR, f"command-{self.started:%Y%m%d-%H%M%S}.{extension}")
+
+
+def format_result(result, group, first, max_lines=40):
+    """Рядок для логу: повний вивід для першого пристрою групи, далі - посилання на групу."""
+    if not result.ok:
+        return f"❌ {result.device}: {result.error}"
+    if not first:
+        return f"{result.device}: як у групі #{group['number']} ({len(group['devices'])} пристроїв)"
+    lines = result.output.split("\n")
+    text = "\n".join(lines[:max_lines]) + (f"\n... ще {len(lines) - max_lines} рядків" if len(lines) > max_lines else "")
+    return f"📋 {result.device} (група #{group['number']}, {result.seconds:.1f} с):\n{text}"
+
+
+def run_command(devices, command, on_result=None, workers=DEFAULT_WORKERS, pool=None, should_stop=None,
+                controller=None, allow_write=False, site_limits=None):
+    """
+    Виконує command на devices; on_result(результат, група, перший_у_групі) - з потоку виконання.
+    site_limits (concurrency.SiteLimits) - ліміти одночасних підключень на сайт, як у бекапі.
+    Повертає (ResultGroups, чи виконано для всіх пристроїв).
+    """
+    if not allow_write and not is_read_only(command):
+        raise ValueError(f"Команда '{command}' не лише для читання (дозволено print, export, get, monitor ... once)")
+    groups = ResultGroups(command)
+    controller = controller or AimdController(initial=workers, maximum=workers)
+
+    def execute(mikrotik):
+        started = time.perf_counter()
+        try:
+            with ssh_session(mikrotik, pool) as ssh_conn:
+                output = ssh_conn.send_command(command, delay_factor=2.0)
+            output = normalize_output(output)
+            if ROUTEROS_ERROR_RE.match(output):
+                raise RuntimeError(output.split("\n")[0])
+            result = CommandResult(mikrotik, True, output, seconds=time.perf_counter() - started)
+        except Exception as e:
+            result = CommandResult(mikrotik, False, error=" ".join(str(e).split())[:200],
+                                   seconds=time.perf_counter() - started)
+        group, first = groups.add(result)
+        if on_result:
+            on_result(result, group, first)
+        return result.ok, result.error
+
+    completed = run_adaptive(devices, execute, controller, should_stop=should_stop, site_limits=site_limits)
+    return groups, completed
+
+
+def main(argv=None):
+    from scheduler_daemon import CONFIG_FILE, load_config, load_inventory
+
+    parser = argparse.ArgumentParser(description="Виконання команди лише для читання на багатьох роутерах")
+    parser.add_argument("command", help="Напр. \"/ip address print\"")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--target", help="site:<назва>, group:<назва>, tag:<назва> або query:<збережений запит>")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--export", help="Файл результатів .json або .csv (за замовчуванням BackUp/commands)")
+    parser.add_argument("--allow-write", action="store_true", help="Дозволити команди, що змінюють конфігурацію")
+    parser.add_argument("--quiet", action="store_true", help="Лише підсумок, без виводу пристроїв")
+    args = parser.parse_args(argv)
+
+    devices = load_inventory(load_config(args.config), args.target)[0]
+    print_lock = threading.Lock()
+
+    def show(result, group, first):
+        if not args.quiet:
+            with print_lock:
+                print(format_result(result, group, first), flush=True)
+
+    try:
+        groups, _ = run_command(devices, args.command, show, args.workers, allow_write=args.allow_write)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(groups.summary())
+    print(f"Результати: {groups.export(args.export or groups.default_path())}")
+    sys.exit(0 if all(result.ok for result in groups.results) else 1)
+
+
+if __name__ == "__main__":
+    main()
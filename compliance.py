@@ -0,0 +1,244 @@
+import os
+import re
+import sys
+import glob
+import json
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+from export_diff import BACKUP_DIR, read_export, parse_sections
+from export_index import export_date
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compliance_rules.json")
+# Результати за хешем експорту і останній ключ кожного пристрою, лежить у BACKUP_DIR:
+# {"devices": {пристрій: ключ}, "findings": {ключ: [...]}} - зберігаються лише ключі, на які посилаються пристрої
+CACHE_FILE = "compliance_cache.json"
+SEVERITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+# Правила, скомпільовані в поточному процесі (ініціалізується один раз на процес пулу)
+_compiled_rules = None
+
+
+def load_rules(path=RULES_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)["rules"]
+
+
+def rules_fingerprint(rules):
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def compile_rules(rules):
+    """
+    Правило: {"id", "description", "severity", "section"?, "scope"?, "position"?, "require"|"forbid": regex}.
+    require - хоча б один рядок секції має збігтися, forbid - жоден не має збігтися.
+    Без "section" перевіряються всі рядки експорту; "scope" - regex, що відбирає рядки секції (напр. правила
+    одного ланцюжка), "position": "last" - перевіряється лише останній відібраний рядок (порядок правил важливий).
+    """
+    compiled = []
+    for rule in rules:
+        if "require" in rule:
+            mode, pattern = "require", rule["require"]
+        elif "forbid" in rule:
+            mode, pattern = "forbid", rule["forbid"]
+        else:
+            raise ValueError(f"Правило {rule.get('id')} не містить require або forbid")
+        scope = re.compile(rule["scope"]) if rule.get("scope") else None
+        compiled.append((rule, rule.get("section"), scope, rule.get("position"), mode, re.compile(pattern)))
+    return compiled
+
+
+def _init_worker(rules):
+    global _compiled_rules
+    _compiled_rules = compile_rules(rules)
+
+
+def evaluate_sections(sections, compiled_rules):
+    findings = []
+    for rule, section, scope, position, mode, regex in compiled_rules:
+        lines = sections.get(section, []) if section else [line for body in sections.values() for line in body]
+        if scope:
+            lines = [line for line in lines if scope.search(line)]
+        if position == "last":
+            lines = lines[-1:]
+        matched = any(regex.search(line) for line in lines)
+        if (mode == "require" and not matched) or (mode == "forbid" and matched):
+            findings.append({
+                "rule": rule["id"],
+                "severity": rule.get("severity", "medium"),
+                "description": rule.get("description", rule["id"]),
+            })
+    findings.sort(key=lambda item: SEVERITY_ORDER.get(item["severity"], 3))
+    return findings
+
+
+def _evaluate_text(text):
+    return evaluate_sections(parse_sections(text), _compiled_rules)
+
+
+def export_hash(text):
+    # Коментарі не враховуються: дата в заголовку експорту змінюється при кожному запуску
+    content = "\n".join(line for line in text.splitlines() if not line.lstrip().startswith("#"))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def latest_exports(backup_dir=BACKUP_DIR, devices=None):
+    """Повертає {пристрій: шлях до найновішого .rsc}."""
+    result = {}
+    for device_dir in glob.glob(os.path.join(backup_dir, "*")):
+        device = os.path.basename(device_dir)
+        if not os.path.isdir(device_dir) or (devices and device not in devices):
+            continue
+        exports = glob.glob(os.path.join(device_dir, "*.rsc"))
+        if exports:
+            result[device] = max(exports, key=export_date)
+    return result
+
+
+def load_cache(backup_dir):
+    try:
+        with open(os.path.join(backup_dir, CACHE_FILE), 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cache = {}
+    if not isinstance(cache.get("devices"), dict) or not isinstance(cache.get("findings"), dict):
+        cache = {"devices": {}, "findings": {}}  # Кеш старого формату - перевіряємо заново
+    return cache
+
+
+def prune_cache(backup_dir, cache):
+    """
+    Видаляє пристрої, чиїх каталогів з експортами вже немає, і результати, на які не посилається жоден пристрій
+    (попередні експорти, старі правила). Повертає True, якщо кеш змінився.
+    """
+    removed = [device for device in cache["devices"]
+               if not glob.glob(os.path.join(backup_dir, glob.escape(device), "*.rsc"))]
+    for device in removed:
+        del cache["devices"][device]
+    used = set(cache["devices"].values())
+    stale = [key for key in cache["findings"] if key not in used]
+    for key in stale:
+        del cache["findings"][key]
+    return bool(removed or stale)
+
+
+def save_cache(backup_dir, cache):
+    path = os.path.join(backup_dir, CACHE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def evaluate_fleet(backup_dir=BACKUP_DIR, devices=None, rules=None, workers=None):
+    """
+    Перевіряє останній експорт кожного пристрою на відповідність правилам.
+    Експорти, що не змінились з минулої перевірки (той самий sha256 і ті самі правила),
+    беруться з кешу; решта перевіряється у пулі процесів.
+    Повертає {пристрій: {"export": ім'я файлу, "findings": [...], "cached": bool}}.
+    """
+    rules = rules if rules is not None else load_rules()
+    fingerprint = rules_fingerprint(rules)
+    cache = load_cache(backup_dir)
+    previous = dict(cache["devices"])
+    results = {}
+    pending = []  # (пристрій, шлях, ключ кешу, текст)
+
+    for device, path in latest_exports(backup_dir, devices).items():
+        text = read_export(path)
+        key = f"{fingerprint}:{export_hash(text)}"
+        if key in cache["findings"]:
+            cache["devices"][device] = key
+            results[device] = {"export": os.path.basename(path), "findings": cache["findings"][key], "cached": True}
+        else:
+            pending.append((device, path, key, text))
+
+    if pending:
+        texts = [item[3] for item in pending]
+        if workers == 0 or len(pending) == 1:
+            _init_worker(rules)
+            evaluated = list(map(_evaluate_text, texts))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rules,)) as executor:
+                evaluated = list(executor.map(_evaluate_text, texts, chunksize=8))
+
+        for (device, path, key, _), findings in zip(pending, evaluated):
+            cache["devices"][device] = key
+            cache["findings"][key] = findings
+            results[device] = {"export": os.path.basename(path), "findings": findings, "cached": False}
+
+    if prune_cache(backup_dir, cache) or cache["devices"] != previous:
+        save_cache(backup_dir, cache)
+
+    return results
+
+
+def save_findings(conn_str, device_ids, results):
+    """
+    Записує результати evaluate_fleet у ComplianceFindings. device_ids - назва пристрою -> id у MikroTikDevices;
+    у таблиці лише актуальні порушення, тож старі записи перевірених пристроїв замінюються.
+    Помилки pyodbc піднімаються - виклик логує їх сам.
+    """
+    if pyodbc is None:
+        raise ImportError("pyodbc не встановлено")
+    ids_to_clear = [(device_ids[device],) for device in results if device_ids.get(device) is not None]
+    rows = [(device_ids[device], item['export'], finding['rule'], finding['severity'], finding['description'][:400])
+            for device, item in results.items() if device_ids.get(device) is not None
+            for finding in item['findings']]
+    if not ids_to_clear:
+        return
+    with pyodbc.connect(conn_str, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.executemany("DELETE FROM [ManagerMikrotik].[dbo].[ComplianceFindings] WHERE device_id = ?",
+                           ids_to_clear)
+        if rows:
+            cursor.fast_executemany = True
+            cursor.executemany("""
+                INSERT INTO [ManagerMikrotik].[dbo].[ComplianceFindings]
+                    ([device_id], [export_name], [rule_id], [severity], [description])
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+        conn.commit()
+
+
+def format_digest(results, max_devices=10):
+    """Короткий підсумок для Telegram / логу."""
+    failing = {device: item for device, item in results.items() if item["findings"]}
+    if not results:
+        return None
+    lines = [f"🛡 Перевірка відповідності: {len(results) - len(failing)}/{len(results)} пристроїв без порушень"]
+    for device, item in sorted(failing.items())[:max_devices]:
+        rules = ", ".join(finding["rule"] for finding in item["findings"])
+        lines.append(f"⚠ #{device}: {rules}")
+    if len(failing) > max_devices:
+        lines.append(f"... і ще {len(failing) - max_devices} пристроїв з порушеннями")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перевірка .rsc експортів на відповідність правилам")
+    parser.add_argument("--backup-dir", default=BACKUP_DIR)
+    parser.add_argument("--rules", default=RULES_FILE)
+    parser.add_argument("--device", action="append", help="Можна вказати кілька разів")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    results = evaluate_fleet(args.backup_dir, args.device, load_rules(args.rules), args.workers)
+    for device, item in sorted(results.items()):
+        for finding in item["findings"]:
+            print(f"{device}\t{item['export']}\t{finding['severity']}\t{finding['rule']}\t{finding['description']}")
+    digest = format_digest(results)
+    if digest:
+        print(digest, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,213 @@
+import time
+import threading
+import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_INITIAL = 4
+DEFAULT_MINIMUM = 1
+DEFAULT_MAXIMUM = 16
+
+# Ознаки помилок, після яких одразу зменшуємо паралельність
+TIMEOUT_MARKERS = ("timed out", "timeout", "таймаут")
+AUTH_MARKERS = ("authentication", "автентифікац")
+
+
+def classify_error(error):
+    """'timeout', 'auth' або 'error' за текстом помилки чи винятком."""
+    text = str(error).lower()
+    if any(marker in text for marker in TIMEOUT_MARKERS):
+        return "timeout"
+    if any(marker in text for marker in AUTH_MARKERS):
+        return "auth"
+    return "error"
+
+
+class AimdController:
+    """
+    Ліміт одночасних пристроїв за схемою AIMD (як вікно TCP):
+    - після кожного "вікна" (стільки завершених пристроїв, скільки зараз дозволено паралельно)
+      ліміт зростає на increase, якщо затримки етапів не виросли більш ніж у latency_tolerance
+      разів від базових і частка помилок не перевищує error_threshold;
+    - інакше, а також одразу на таймаут чи помилку автентифікації, ліміт множиться на decrease.
+    Зменшення не частіше одного разу за вікно, щоб хвиля помилок від уже запущених
+    пристроїв не обвалила ліміт до мінімуму.
+    """
+
+    def __init__(self, initial=DEFAULT_INITIAL, minimum=DEFAULT_MINIMUM, maximum=DEFAULT_MAXIMUM,
+                 increase=1, decrease=0.5, latency_tolerance=1.5, error_threshold=0.2, on_change=None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.error_threshold = error_threshold
+        self.on_change = on_change
+        self._limit = max(minimum, min(maximum, initial))
+        self._lock = threading.Lock()
+        self._baseline = {}  # етап -> базова (найменша медіана вікна) затримка
+        self._samples = {}  # етап -> затримки поточного вікна
+        self._completed = 0
+        self._errors = 0
+        self._backed_off = False
+        self.history = [(time.time(), self._limit, "start")]
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def observe(self, stage, seconds):
+        """Затримка етапу (секунди); зазвичай надходить від stage_timing.RunProfiler."""
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+
+    def on_result(self, ok, error=None):
+        with self._lock:
+            self._completed += 1
+            if not ok:
+                self._errors += 1
+                kind = classify_error(error) if error else "error"
+                if kind in ("timeout", "auth") and not self._backed_off:
+                    self._set_limit(self._limit * self.decrease, kind)
+                    self._backed_off = True
+            if self._completed >= self._limit:
+                self._close_window()
+
+    def _latency_ratio(self):
+        ratio = 1.0
+        for stage, samples in self._samples.items():
+            median = statistics.median(samples)
+            baseline = self._baseline.get(stage)
+            if baseline is None or median < baseline:
+                self._baseline[stage] = median
+            elif baseline > 0:
+                ratio = max(ratio, median / baseline)
+        return ratio
+
+    def _close_window(self):
+        error_rate = self._errors / self._completed
+        ratio = self._latency_ratio() if self._samples else 1.0
+        if not self._backed_off:
+            if error_rate > self.error_threshold:
+                self._set_limit(self._limit * self.decrease, f"errors {error_rate:.0%}")
+            elif ratio > self.latency_tolerance:
+                self._set_limit(self._limit * self.decrease, f"latency x{ratio:.1f}")
+            else:
+                self._set_limit(self._limit + self.increase, "ok")
+        self._samples = {}
+        self._completed = 0
+        self._errors = 0
+        self._backed_off = False
+
+    def _set_limit(self, value, reason):
+        new_limit = max(self.minimum, min(self.maximum, int(value)))
+        if new_limit == self._limit:
+            return
+        self._limit = new_limit
+        self.history.append((time.time(), new_limit, reason))
+        if self.on_change:
+            self.on_change(new_limit, reason)
+
+    def summary(self):
+        limits = [limit for _, limit, _ in self.history]
+        trail = " → ".join(str(limit) for limit in limits[-15:])
+        return (f"⚙ Паралельність: старт {limits[0]}, мін {min(limits)}, макс {max(limits)}, "
+                f"кінець {limits[-1]} (змін: {len(limits) - 1})\n{trail}")
+
+
+class SiteLimits:
+    """
+    Ліміти одночасних пристроїв на сайт (Sites.max_concurrency) з урахуванням ієрархії:
+    пристрій займає слот свого сайту і всіх батьківських сайтів, для яких задано ліміт,
+    тож, наприклад, область з лімітом 10 не перевантажить спільний канал, навіть якщо кожне місто має свій ліміт 4.
+    Пристрої без сайту обмежує лише загальний ліміт.
+    """
+
+    def __init__(self, limits, parents=None):
+        self.limits = dict(limits)  # id сайту -> максимум одночасних пристроїв
+        self.parents = dict(parents or {})  # id сайту -> id батьківського сайту
+        self._active = {}
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.limits)
+
+    def chain(self, site_id):
+        """Сайти з лімітом від site_id до кореня."""
+        chain = self._chains.get(site_id)
+        if chain is None:
+            chain, seen, current = [], set(), site_id
+            while current is not None and current not in seen:  # seen - захист від циклу в parent_id
+                seen.add(current)
+                if current in self.limits:
+                    chain.append(current)
+                current = self.parents.get(current)
+            chain = self._chains[site_id] = tuple(chain)
+        return chain
+
+    def try_acquire(self, site_id):
+        chain = self.chain(site_id)
+        with self._lock:
+            if any(self._active.get(site, 0) >= self.limits[site] for site in chain):
+                return False
+            for site in chain:
+                self._active[site] = self._active.get(site, 0) + 1
+        return True
+
+    def release(self, site_id):
+        with self._lock:
+            for site in self.chain(site_id):
+                self._active[site] -= 1
+
+
+def run_adaptive(items, func, controller, should_stop=None, site_limits=None, site_of=None):
+    """
+    Викликає func(item) для кожного елемента, тримаючи одночасно не більше controller.limit викликів.
+    func повертає (успіх, помилка) - результат передається контролеру; виняток вважається помилкою.
+    З site_limits (SiteLimits) наступним запускається перший елемент, сайт якого має вільний слот:
+    пристрої переповненого сайту чекають, не займаючи загальних слотів.
+    site_of(item) повертає id сайту елемента (за замовчуванням item['site_id']).
+    """
+    site_of = site_of or (lambda item: item.get('site_id'))
+    condition = threading.Condition()
+    state = {"in_flight": 0}
+    pending = deque(items)
+
+    def next_item():
+        if not site_limits:
+            return pending.popleft()
+        for index, item in enumerate(pending):
+            if site_limits.try_acquire(site_of(item)):
+                del pending[index]
+                return item
+        return None
+
+    def call(item):
+        try:
+            ok, error = func(item)
+        except Exception as e:
+            ok, error = False, str(e)
+        try:
+            controller.on_result(ok, error)
+        finally:
+            with condition:
+                if site_limits:
+                    site_limits.release(site_of(item))
+                state["in_flight"] -= 1
+                condition.notify_all()
+
+    with ThreadPoolExecutor(max_workers=controller.maximum) as executor:
+        while pending:
+            with condition:
+                item = None
+                while item is None:
+                    if should_stop and should_stop():
+                        return False
+                    if state["in_flight"] < controller.limit:
+                        item = next_item()
+                    if item is None:
+                        condition.wait(0.5)
+                state["in_flight"] += 1
+            executor.submit(call, item)
+    return True
@@ -0,0 +1,400 @@
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime
+
+from command_runner import READ_ONLY_VERBS, ROUTEROS_ERROR_RE, WRITE_VERBS, normalize_output
+from concurrency import AimdController, run_adaptive
+from connection_pool import SessionPool
+from device_events import FAILED, OK, RunDigest, progress, track
+from export_diff import (BACKUP_DIR, COMMAND_VERBS, diff_export, hash_sections, normalize_path, parse_sections,
+                         read_export, split_command)
+from health_poller import parse_uptime
+from job_journal import JobJournal
+from mikrotik_ops import create_backup, download_backup, ssh_session
+from stage_timing import RunProfiler, bind, span
+
+# Масове застосування фрагмента конфігурації RouterOS хвилями: спершу один пристрій (canary), далі частка парку,
+# потім решта. Для кожного пристрою: бекап перед змінами (create_backup/download_backup, як у задачі бекапу),
+# застосування команд, повторний експорт і порівняння секцій (diff_export). Якщо команда повернула помилку
+# або змінились секції, яких фрагмент не стосується, пристрій відкочується до бекапу (/system backup load).
+# Паралельність - той самий AimdController, ліміти сайтів і SessionPool, що в бекапах.
+
+JOB_TYPE = "push"
+# Розміри хвиль: ціле - кількість пристроїв, дробове - частка парку; решта пристроїв - остання хвиля
+DEFAULT_WAVES = (1, 0.1)
+# Частка пристроїв хвилі з відкатом, після якої наступні хвилі не запускаються
+MAX_FAILURE_RATE = 0.05
+REBOOT_DELAY = 20  # Секунд від підтвердження відкату до першої спроби підключення (роутер ще не перезавантажився)
+REBOOT_TIMEOUT = 300  # Скільки чекати повернення роутера після відкату, с
+RECONNECT_INTERVAL = 5
+UPTIME_LINE_RE = re.compile(r'^\s*uptime:\s*(\S+)', re.MULTILINE)
+# Шляхи, команди яких перезавантажують роутер або ламають відкат - у фрагменті заборонені
+FORBIDDEN_PATHS = ("/system backup", "/system reset-configuration", "/system reboot", "/system shutdown",
+                   "/system package", "/system routerboard", "/file", "/user")
+
+# Підсумок пристрою
+APPLIED = "applied"  # Зміни застосовано і перевірено
+ROLLED_BACK = "rolled_back"  # Перевірка не пройшла, конфігурацію відновлено з бекапу
+ROLLBACK_FAILED = "rollback_failed"  # Відкат не вдався - потрібне втручання
+SKIPPED = "skipped"  # Бекап не вдався, змін не вносилось
+NOT_STARTED = "not_started"  # Хвиля не запускалась (зупинка після невдалої хвилі або переривання)
+STATUS_TITLES = {APPLIED: "✅ Застосовано", ROLLED_BACK: "↩ Відкочено", ROLLBACK_FAILED: "🛑 Відкат не вдався",
+                 SKIPPED: "⏭ Пропущено (без змін)", NOT_STARTED: "⏸ Не запускались"}
+
+
+def parse_script(text):
+    """
+    Фрагмент .rsc -> (команди з повним шляхом у порядку виконання, множина шляхів секцій).
+    Рядки після заголовка секції ("/ip firewall filter" або "/ip/firewall/filter") отримують його шлях;
+    рядки-продовження склеюються. Приймаються лише дієслова COMMAND_VERBS: скриптові конструкції (:foreach, :local)
+    і команди на кшталт run/reboot/import не приймаються - їх зміни неможливо перевірити по секціях.
+    """
+    commands, sections = [], set()
+    current = None
+    pending = ""
+    for number, raw_line in enumerate(text.splitlines(), start=1):
+        line = raw_line.strip()
+        if pending:
+            line = pending + line
+            pending = ""
+        if line.endswith("\\"):
+            pending = line[:-1]
+            continue
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith(":") or any(char in line for char in "{};"):
+            raise ValueError(f"Рядок {number}: скриптові конструкції не підтримуються: {line[:80]}")
+        if line.startswith("/"):
+            path, rest = split_command(normalize_path(line))
+        elif current is None:
+            raise ValueError(f"Рядок {number}: команда без шляху секції: {line[:80]}")
+        else:
+            path, rest = current, line
+        command = f"{path} {rest}".strip()
+        if any(command == forbidden or command.startswith(forbidden + " ") for forbidden in FORBIDDEN_PATHS):
+            raise ValueError(f"Рядок {number}: команди {command[:80]} у фрагменті заборонені")
+        if not rest:
+            # Заголовок секції складається лише з назв меню; дієслово в ньому - команда, яку не можна перевірити
+            verb = next((word for word in path.split(" ")[1:] if word in WRITE_VERBS or word in READ_ONLY_VERBS), None)
+            if verb:
+                raise ValueError(f"Рядок {number}: команда '{verb}' у фрагменті не підтримується: {line[:80]}")
+            current = path
+            continue
+        if rest.split(" ")[0] not in COMMAND_VERBS:
+            raise ValueError(f"Рядок {number}: невідоме дієслово '{rest.split(' ')[0]}' "
+                             f"(дозволено {', '.join(COMMAND_VERBS)}): {line[:80]}")
+        commands.append(command)
+        sections.add(path)
+    if pending:
+        raise ValueError("Фрагмент закінчується рядком-продовженням (\\)")
+    if not commands:
+        raise ValueError("Фрагмент не містить команд")
+    return commands, sections
+
+
+def plan_waves(devices, waves=DEFAULT_WAVES):
+    result, start = [], 0
+    for size in waves:
+        if start >= len(devices):
+            break
+        count = size if isinstance(size, int) else max(1, round(len(devices) * size))
+        result.append(devices[start:start + count])
+        start += count
+    if start < len(devices):
+        result.append(devices[start:])
+    return result
+
+
+def unexpected_changes(delta, sections):
+    """Секції, змінені поза шляхами фрагмента (None або порожня дельта - змін немає)."""
+    return sorted(set((delta or {}).get("changed", {})) - {normalize_path(section) for section in sections})
+
+
+def save_export(mikrotik, name, pool=None):
+    """Експорт конфігурації текстом через SSH у каталог пристрою; повертає шлях .rsc."""
+    with span("export"), ssh_session(mikrotik, pool) as ssh_conn:
+        text = ssh_conn.send_command('/export', delay_factor=4.0)
+    path = os.path.join(BACKUP_DIR, mikrotik['name'], f"{name}.rsc")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text.replace("\r", ""))
+    return path
+
+
+def apply_commands(mikrotik, commands, pool=None):
+    """Виконує команди по черзі; повертає помилку першої невдалої команди або None."""
+    with ssh_session(mikrotik, pool) as ssh_conn:
+        for command in commands:
+            output = normalize_output(ssh_conn.send_command(command, delay_factor=2.0))
+            if ROUTEROS_ERROR_RE.match(output):
+                return f"{command[:80]}: {output.splitlines()[0]}"
+    return None
+
+
+def device_uptime(mikrotik):
+    """uptime пристрою в секундах (None, якщо не розпізнано); сесія не з пулу."""
+    with ssh_session(mikrotik) as ssh_conn:
+        output = ssh_conn.send_command('/system resource print')
+    match = UPTIME_LINE_RE.search(output)
+    return parse_uptime(match.group(1)) if match else None
+
+
+def wait_for_device(mikrotik, since, delay=REBOOT_DELAY, timeout=REBOOT_TIMEOUT):
+    """
+    Чекає, поки пристрій перезавантажиться після відкату і знову прийме SSH. since - time.monotonic() перед
+    відкатом: роутер повернувся, коли його uptime менший за час від since. Підключення до перезавантаження
+    (роутер ще обробляє backup load) так не зараховується; якщо uptime не розпізнано - лише після обриву зв'язку.
+    """
+    time.sleep(delay)
+    deadline = time.monotonic() + timeout
+    dropped = False
+    while True:
+        try:
+            uptime = device_uptime(mikrotik)
+            if (uptime is None and dropped) or (uptime is not None and uptime <= time.monotonic() - since):
+                return True
+        except Exception:
+            dropped = True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(RECONNECT_INTERVAL)
+
+
+def restore_backup(mikrotik, backup_name):
+    """/system backup load з підтвердженням; роутер перезавантажується, тож сесія не з пулу."""
+    try:
+        with ssh_session(mikrotik) as ssh_conn:
+            output = ssh_conn.send_command_timing(f'/system backup load name={backup_name}.backup password=""')
+            if ROUTEROS_ERROR_RE.match(normalize_output(output)):
+                raise RuntimeError(normalize_output(output).splitlines()[0])
+            ssh_conn.write_channel("y\r\n")
+            time.sleep(1)
+    except (OSError, EOFError):
+        pass  # З'єднання розривається перезавантаженням
+
+
+class PushReport:
+    def __init__(self, commands, sections):
+        self.commands = commands
+        self.sections = sections
+        self.started = datetime.now()
+        self._lock = threading.Lock()
+        self.devices = {status: [] for status in STATUS_TITLES}
+        self.messages = {}  # назва пристрою -> опис результату
+        self.waves = []  # (номер, пристроїв, відкатів)
+        self.halted = None
+
+    def add(self, mikrotik, status, message):
+        with self._lock:
+            self.devices[status].append(mikrotik['name'])
+            self.messages[mikrotik['name']] = message
+
+    @property
+    def failed(self):
+        return self.devices[ROLLED_BACK] + self.devices[ROLLBACK_FAILED]
+
+    def format(self, max_devices=10):
+        elapsed = str(datetime.now() - self.started).split('.')[0]
+        lines = [f"📦 Розгортання конфігурації ({len(self.commands)} команд, секції: {', '.join(sorted(self.sections))}), "
+                 f"хвиль {len(self.waves)}, тривалість {elapsed}"]
+        for status, title in STATUS_TITLES.items():
+            names = self.devices[status]
+            if names:
+                lines.append(f"{title}: {len(names)} - " + ", ".join(names[:max_devices]) +
+                             (f" і ще {len(names) - max_devices}" if len(names) > max_devices else ""))
+        if self.halted:
+            lines.append(f"⛔ {self.halted}")
+        return "\n".join(lines)
+
+
+class ConfigPush:
+    """
+    Один запуск розгортання. on_result(mikrotik, статус, повідомлення) викликається з потоків виконання,
+    on_message(текст) - для повідомлень про хвилі. pool (SessionPool) - спільний з іншими задачами або власний.
+    """
+
+    def __init__(self, devices, script, waves=DEFAULT_WAVES, max_failure_rate=MAX_FAILURE_RATE, controller=None,
+                 pool=None, site_limits=None, on_result=None, on_message=None, should_stop=None,
+                 reboot_delay=REBOOT_DELAY, reboot_timeout=REBOOT_TIMEOUT):
+        self.commands, self.sections = parse_script(script)
+        self.devices = devices
+        self.waves = waves
+        self.max_failure_rate = max_failure_rate
+        self.controller = controller or AimdController()
+        self.pool = pool
+        self.site_limits = site_limits
+        self.on_result = on_result
+        self.on_message = on_message or print
+        self.should_stop = should_stop
+        self.reboot_delay = reboot_delay
+        self.reboot_timeout = reboot_timeout
+        self.profiler = RunProfiler(JOB_TYPE, on_span=self.controller.observe)
+        self.digest = RunDigest(JOB_TYPE)
+        self.report = PushReport(self.commands, self.sections)
+
+    def push_device(self, mikrotik):
+        """(статус, повідомлення) для одного пристрою."""
+        progress("backup")
+        backup_name, error = create_backup(mikrotik, pool=self.pool)
+        if not backup_name:
+            return SKIPPED, error
+        progress("download")
+        local_backup, local_rsc, error = download_backup(mikrotik, backup_name)
+        if not local_rsc:
+            return SKIPPED, error
+        # Базова точка для перевірки; дрейф з минулого бекапу потрапляє в історію змін як звичайно
+        diff_export(mikrotik['name'], local_rsc, BACKUP_DIR)
+        self.journal.record(self.run_id, mikrotik, "backed_up", backup=backup_name)
+
+        progress("apply")
+        try:
+            error = apply_commands(mikrotik, self.commands, self.pool)
+        except Exception as e:
+            error = f"Помилка застосування: {str(e)[:200]}"
+        self.journal.record(self.run_id, mikrotik, "applied", backup=backup_name, error=error)
+
+        progress("verify")
+        if not error:
+            try:
+                delta = diff_export(mikrotik['name'], save_export(mikrotik, f"{backup_name}-push", self.pool),
+                                    BACKUP_DIR)
+                unexpected = unexpected_changes(delta, self.sections)
+                if unexpected:
+                    error = f"Змінено секції поза фрагментом: {', '.join(unexpected[:5])}"
+                else:
+                    changed = len((delta or {}).get("changed", {}))
+                    return APPLIED, f"Застосовано, змінено секцій: {changed}" if changed else \
+                        "Застосовано, конфігурація вже відповідала фрагменту"
+            except Exception as e:
+                error = f"Помилка перевірки: {str(e)[:200]}"
+        return self.rollback(mikrotik, backup_name, local_rsc, error)
+
+    def rollback(self, mikrotik, backup_name, local_rsc, reason):
+        progress("rollback")
+        if self.pool is not None:
+            self.pool.discard(mikrotik)  # Сесія пулу обірветься перезавантаженням
+        try:
+            since = time.monotonic()
+            restore_backup(mikrotik, backup_name)
+            if not wait_for_device(mikrotik, since, self.reboot_delay, self.reboot_timeout):
+                return ROLLBACK_FAILED, f"{reason}; після відкату пристрій не відповідає {self.reboot_timeout} с"
+            restored = save_export(mikrotik, f"{backup_name}-rollback")
+            diff_export(mikrotik['name'], restored, BACKUP_DIR)
+            expected = hash_sections(parse_sections(read_export(local_rsc)))
+            actual = hash_sections(parse_sections(read_export(restored)))
+            differing = sorted(name for name in set(expected) | set(actual) if expected.get(name) != actual.get(name))
+            if differing:
+                return ROLLBACK_FAILED, f"{reason}; після відкату відрізняються секції: {', '.join(differing[:5])}"
+        except Exception as e:
+            return ROLLBACK_FAILED, f"{reason}; помилка відкату: {str(e)[:200]}"
+        return ROLLED_BACK, f"{reason}; відкочено до {backup_name}"
+
+    def execute(self, mikrotik):
+        with bind(self.profiler, mikrotik['name']), track(JOB_TYPE, mikrotik) as tracker:
+            try:
+                status, message = self.push_device(mikrotik)
+            except Exception as e:
+                status, message = SKIPPED, f"Помилка обробки {mikrotik['name']} ({mikrotik['host']}): {str(e)}"[:200]
+            self.digest(tracker.finish(OK if status == APPLIED else FAILED, message))
+        self.journal.record(self.run_id, mikrotik, "done", status=status, message=message)
+        self.report.add(mikrotik, status, message)
+        if self.on_result:
+            self.on_result(mikrotik, status, message)
+        # Для контролера паралельності помилка - лише проблема зв'язку, а не відкочена зміна
+        return status in (APPLIED, ROLLED_BACK), None if status in (APPLIED, ROLLED_BACK) else message
+
+    def report_interrupted(self):
+        """Попереджає про пристрої попереднього незавершеного розгортання, змінені без перевірки."""
+        previous = self.journal.last_unfinished_run(JOB_TYPE)
+        if not previous:
+            return
+        unverified = [(key, data.get("backup")) for key, (stage, data) in
+                      self.journal.device_states(previous[0]).items() if stage in ("backed_up", "applied")]
+        if unverified:
+            self.on_message(f"⚠ Перерване розгортання #{previous[0]} ({previous[2]}): пристрої без перевірки змін - " +
+                            ", ".join(f"{key} (бекап {backup})" for key, backup in unverified[:10]))
+
+    def run(self):
+        own_pool = self.pool is None
+        if own_pool:
+            self.pool = SessionPool()
+        self.journal = JobJournal(BACKUP_DIR)
+        try:
+            self.report_interrupted()
+            self.run_id = self.journal.start_run(JOB_TYPE, self.devices)
+            self.profiler.run_ref = self.run_id
+            with bind(self.profiler):
+                completed = self.run_waves()
+            self.journal.finish_run(self.run_id, "finished" if completed else "interrupted")
+        finally:
+            self.journal.close()
+            if own_pool:
+                self.pool.close_all()
+        try:
+            profile = self.profiler.finish(BACKUP_DIR)
+            if profile:
+                self.on_message(profile)
+        except Exception as e:
+            self.on_message(f"Помилка збереження профілю запуску: {str(e)}")
+        return self.report
+
+    def run_waves(self):
+        waves = plan_waves(self.devices, self.waves)
+        for number, wave in enumerate(waves, start=1):
+            self.on_message(f"🌊 Хвиля {number}/{len(waves)}: {len(wave)} пристроїв")
+            before = len(self.report.failed)
+            completed = run_adaptive(wave, self.execute, self.controller, should_stop=self.should_stop,
+                                     site_limits=self.site_limits)
+            failed = len(self.report.failed) - before
+            self.report.waves.append((number, len(wave), failed))
+            remaining = [mikrotik for later in waves[number:] for mikrotik in later]
+            if not completed:
+                self.report.halted = "Розгортання перервано"
+            elif self.report.devices[ROLLBACK_FAILED] or failed > len(wave) * self.max_failure_rate:
+                self.report.halted = (f"Хвиля {number}: відкатів {failed} з {len(wave)} - "
+                                      f"наступні хвилі ({len(remaining)} пристроїв) не запускались")
+            if self.report.halted:
+                for mikrotik in remaining:
+                    self.report.add(mikrotik, NOT_STARTED, self.report.halted)
+                return completed
+        return True
+
+
+def main(argv=None):
+    from scheduler_daemon import CONFIG_FILE, load_config, load_inventory
+    from inventory import load_site_limits
+
+    parser = argparse.ArgumentParser(description="Розгортання фрагмента конфігурації RouterOS хвилями з відкатом")
+    parser.add_argument("script", help="Файл .rsc з командами")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--target", help="site:<назва>, group:<назва>, tag:<назва> або query:<збережений запит>")
+    parser.add_argument("--waves", default=",".join(str(size) for size in DEFAULT_WAVES),
+                        help="Розміри хвиль: цілі - кількість пристроїв, дробові - частка парку (за замовчуванням 1,0.1)")
+    parser.add_argument("--max-failure-rate", type=float, default=MAX_FAILURE_RATE)
+    parser.add_argument("--dry-run", action="store_true", help="Лише розібрати фрагмент і показати хвилі")
+    args = parser.parse_args(argv)
+
+    with open(args.script, 'r', encoding='utf-8-sig') as f:
+        script = f.read()
+    commands, sections = parse_script(script)
+    devices, _, _, _, conn_str = load_inventory(load_config(args.config), args.target)
+    waves = tuple(float(size) if "." in size else int(size) for size in args.waves.split(",") if size.strip())
+    print(f"Команд: {len(commands)}, секції: {', '.join(sorted(sections))}")
+    print("Хвилі: " + " + ".join(str(len(wave)) for wave in plan_waves(devices, waves)))
+    if args.dry_run:
+        return
+
+    push = ConfigPush(devices, script, waves, args.max_failure_rate, site_limits=load_site_limits(conn_str),
+                      on_result=lambda mikrotik, status, message: print(f"[{status}] {mikrotik['name']}: {message}"))
+    report = push.run()
+    print(push.controller.summary())
+    print(report.format())
+    sys.exit(0 if not report.failed and not report.halted else 1)
+
+
+if __name__ == "__main__":
+    main()
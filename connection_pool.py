@@ -0,0 +1,133 @@
+import time
+import threading
+from contextlib import contextmanager
+
+import routeros_api
+from netmiko import ConnectHandler
+
+from mikrotik_ops import netmiko_device
+
+API_PORT = 8728
+
+
+class SessionPool:
+    """
+    Пул "теплих" з'єднань з роутерами: SSH (netmiko) та RouterOS API.
+    З'єднання видається одному користувачу за раз, після використання повертається в пул
+    і перевикористовується наступними задачами (перевірка -> бекап -> очищення) без
+    повторного SSH-рукостискання. Неактивні довше idle_timeout секунд закриваються.
+    """
+
+    def __init__(self, idle_timeout=300):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._ssh = {}  # (host, port, user) -> (з'єднання, час останнього використання)
+        self._api = {}  # (host, port, user) -> (RouterOsApiPool, час останнього використання)
+        self.stats = {"ssh_opened": 0, "ssh_reused": 0, "api_opened": 0, "api_reused": 0}
+
+    @staticmethod
+    def _key(mikrotik):
+        return mikrotik['host'], mikrotik.get('port'), mikrotik.get('user') or "admin"
+
+    def _take(self, store, key):
+        with self._lock:
+            item = store.pop(key, None)
+        return item[0] if item else None
+
+    def _put(self, store, key, conn, close):
+        with self._lock:
+            if key not in store:
+                store[key] = (conn, time.monotonic())
+                return
+        close(conn)  # Для цього хоста в пулі вже є з'єднання
+
+    @staticmethod
+    def _close_ssh(conn):
+        try:
+            conn.disconnect()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _close_api(api):
+        try:
+            api.disconnect()
+        except Exception:
+            pass
+
+    @contextmanager
+    def ssh(self, mikrotik):
+        key = self._key(mikrotik)
+        conn = self._take(self._ssh, key)
+        if conn is not None and not conn.is_alive():
+            self._close_ssh(conn)
+            conn = None
+        if conn is None:
+            conn = ConnectHandler(**netmiko_device(mikrotik))
+            self.stats["ssh_opened"] += 1
+        else:
+            self.stats["ssh_reused"] += 1
+        try:
+            yield conn
+        except Exception:
+            self._close_ssh(conn)  # Після помилки стан сесії невідомий - не повертаємо в пул
+            raise
+        self._put(self._ssh, key, conn, self._close_ssh)
+
+    @contextmanager
+    def api(self, mikrotik):
+        key = self._key(mikrotik)
+        api = self._take(self._api, key)
+        if api is None:
+            api = routeros_api.RouterOsApiPool(
+                host=mikrotik['host'],
+                username=mikrotik['user'],
+                password=mikrotik['password'],
+                plaintext_login=True,
+                port=mikrotik.get('api_port') or API_PORT
+            )
+            self.stats["api_opened"] += 1
+        else:
+            self.stats["api_reused"] += 1
+        try:
+            yield api.get_api()
+        except Exception:
+            self._close_api(api)
+            raise
+        self._put(self._api, key, api, self._close_api)
+
+    def discard(self, mikrotik):
+        """Закриває з'єднання пристрою (наприклад, після перезавантаження роутера)."""
+        key = self._key(mikrotik)
+        with self._lock:
+            ssh_item = self._ssh.pop(key, None)
+            api_item = self._api.pop(key, None)
+        if ssh_item:
+            self._close_ssh(ssh_item[0])
+        if api_item:
+            self._close_api(api_item[0])
+
+    def close_idle(self):
+        deadline = time.monotonic() - self.idle_timeout
+        expired_ssh, expired_api = [], []
+        with self._lock:
+            for store, expired in ((self._ssh, expired_ssh), (self._api, expired_api)):
+                for key, (conn, last_used) in list(store.items()):
+                    if last_used < deadline:
+                        expired.append(store.pop(key)[0])
+        for conn in expired_ssh:
+            self._close_ssh(conn)
+        for api in expired_api:
+            self._close_api(api)
+        return len(expired_ssh) + len(expired_api)
+
+    def close_all(self):
+        with self._lock:
+            ssh_items = list(self._ssh.values())
+            api_items = list(self._api.values())
+            self._ssh.clear()
+            self._api.clear()
+        for conn, _ in ssh_items:
+            self._close_ssh(conn)
+        for api, _ in api_items:
+            self._close_api(api)
@@ -0,0 +1,175 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Структуровані події обробки пристроїв замість вільного тексту: GUI оновлює лише потрібний рядок таблиці,
+# а scheduler_daemon, metrics.py і підсумки запуску підписуються на ту саму шину.
+
+# Етапи (stage) у порядку виконання
+STAGES = ("queued", "connect", "backup", "download", "upload", "cleanup", "check", "install", "routerboard",
+          "apply", "verify", "rollback", "done")
+# Стан (status): running - етап розпочато, ok / failed / needs_update - пристрій оброблено
+RUNNING, OK, FAILED, NEEDS_UPDATE = "running", "ok", "failed", "needs_update"
+FINAL_STATUSES = (OK, FAILED, NEEDS_UPDATE)
+# Значення backup_status_final у MikroTikDevices
+FINAL_STATUS_NAMES = {OK: "OK", FAILED: "Error", NEEDS_UPDATE: "Needs Update"}
+STATUS_BY_FINAL_NAME = {name: status for status, name in FINAL_STATUS_NAMES.items()}
+STAGE_NAMES = {"queued": "У черзі", "connect": "Підключення", "backup": "Створення бекапу",
+               "download": "Завантаження", "upload": "Вивантаження на FTP", "cleanup": "Очищення",
+               "check": "Перевірка версій", "install": "Встановлення оновлення",
+               "routerboard": "Оновлення RouterBoard", "apply": "Застосування змін", "verify": "Перевірка змін",
+               "rollback": "Відкат змін", "done": "Завершено"}
+
+
+class DeviceEvent:
+    """Подія одного пристрою: job - backup/check/upgrade/routerboard/push, seconds - від початку обробки пристрою."""
+    __slots__ = ("job", "device_id", "device", "stage", "status", "message", "installed_version", "latest_version",
+                 "firmware", "seconds", "timestamp")
+
+    def __init__(self, job, device_id, device, stage, status=RUNNING, message=None, installed_version=None,
+                 latest_version=None, firmware=None, seconds=None):
+        self.job = job
+        self.device_id = device_id
+        self.device = device
+        self.stage = stage
+        self.status = status
+        self.message = message
+        self.installed_version = installed_version
+        self.latest_version = latest_version
+        self.firmware = firmware
+        self.seconds = seconds
+        self.timestamp = time.time()
+
+    @property
+    def final(self):
+        return self.status in FINAL_STATUSES
+
+    @property
+    def final_status(self):
+        return FINAL_STATUS_NAMES.get(self.status)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"DeviceEvent({self.job}, {self.device}, {self.stage}, {self.status})"
+
+
+class EventBus:
+    """
+    Синхронна шина подій: publish() викликає підписників у потоці, що публікує.
+    Підписники мають бути швидкими (GUI перекидає подію в Qt-сигнал, metrics збільшує лічильник).
+    Помилка підписника не зупиняє обробку пристрою.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = ()  # Копіюється при зміні - publish() читає без блокування
+
+    def subscribe(self, callback, job=None):
+        """callback(event) для всіх подій або лише для задачі job. Повертає функцію відписки."""
+        entry = (callback, job)
+        with self._lock:
+            self._subscribers = self._subscribers + (entry,)
+
+        def unsubscribe():
+            with self._lock:
+                self._subscribers = tuple(item for item in self._subscribers if item is not entry)
+        return unsubscribe
+
+    def publish(self, event):
+        for callback, job in self._subscribers:
+            if job is not None and job != event.job:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Помилка обробника подій {getattr(callback, '__name__', callback)}: {str(e)}")
+
+
+class DeviceTracker:
+    """Публікує події одного пристрою в межах запуску і рахує тривалість від початку обробки."""
+
+    def __init__(self, bus, job, mikrotik):
+        self.bus = bus
+        self.job = job
+        self.device_id = mikrotik.get('id')
+        self.device = mikrotik.get('name')
+        self.started = time.perf_counter()
+        self.stage = "queued"
+
+    def progress(self, stage, **fields):
+        self.stage = stage
+        self.bus.publish(DeviceEvent(self.job, self.device_id, self.device, stage, RUNNING,
+                                     seconds=time.perf_counter() - self.started, **fields))
+
+    def finish(self, status, message=None, **fields):
+        """Підсумкова подія; етап - той, на якому сталася помилка, або done. Повертає подію."""
+        event = DeviceEvent(self.job, self.device_id, self.device, self.stage if status == FAILED else "done",
+                            status, message, seconds=time.perf_counter() - self.started, **fields)
+        self.bus.publish(event)
+        return event
+
+
+class RunDigest:
+    """Підписник для підсумку запуску: скільки пристроїв завершено і на яких етапах були помилки."""
+
+    def __init__(self, job=None):
+        self.job = job
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.failed_stages = {}
+
+    def __call__(self, event):
+        if not event.final or (self.job and event.job != self.job):
+            return
+        with self._lock:
+            self.counts[event.status] = self.counts.get(event.status, 0) + 1
+            if event.status == FAILED:
+                self.failed_stages[event.stage] = self.failed_stages.get(event.stage, 0) + 1
+
+    def format(self):
+        if not self.failed_stages:
+            return None
+        stages = ", ".join(f"{stage} {count}" for stage, count in
+                           sorted(self.failed_stages.items(), key=lambda item: item[1], reverse=True))
+        return f"Помилки за етапами: {stages}"
+
+
+# Шина процесу за замовчуванням
+bus = EventBus()
+
+_local = threading.local()
+
+
+def begin(job, mikrotik, event_bus=None):
+    """Прив'язує новий DeviceTracker до потоку до наступного begin() - для послідовних циклів по пристроях."""
+    tracker = _local.tracker = DeviceTracker(event_bus or bus, job, mikrotik)
+    return tracker
+
+
+@contextmanager
+def track(job, mikrotik, event_bus=None):
+    """Прив'язує DeviceTracker до потоку, щоб задачі повідомляли етапи через progress() без передачі параметром."""
+    tracker = DeviceTracker(event_bus or bus, job, mikrotik)
+    previous = getattr(_local, "tracker", None)
+    _local.tracker = tracker
+    try:
+        yield tracker
+    finally:
+        _local.tracker = previous
+
+
+def progress(stage, **fields):
+    """Подія етапу для пристрою поточного потоку; без track() нічого не робить."""
+    tracker = getattr(_local, "tracker", None)
+    if tracker is not None:
+        tracker.progress(stage, **fields)
+
+
+def finish(status, message=None, **fields):
+    """Підсумкова подія для пристрою поточного потоку (status - ok/failed/needs_update або "OK"/"Error")."""
+    tracker = getattr(_local, "tracker", None)
+    if tracker is not None:
+        return tracker.finish(STATUS_BY_FINAL_NAME.get(status, status), message, **fields)
+    return None
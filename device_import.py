@@ -0,0 +1,361 @@
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+import ipaddress
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+from inventory import DEVICES_TABLE, SITES_TABLE, resolve_target
+
+# Масовий імпорт і експорт MikroTikDevices: CSV, JSON і секція mikrotiks з config.json.
+# Рядки перевіряються в Python, вивантажуються пачками у тимчасову таблицю (fast_executemany - один
+# round trip на пачку замість одного на рядок) і зливаються з таблицею пристроїв одним MERGE за хостом.
+# Хост - ключ пристрою: збіг хоста з іншою назвою повідомляється як конфлікт.
+
+BATCH_SIZE = 5000
+MAX_LENGTH = 100  # NVARCHAR(100) у MikroTikDevices і Sites
+FIELDS = ("name", "host", "user", "password", "site")
+# Назви стовпців з інших експортів -> поле імпорту
+FIELD_ALIASES = {"username": "user", "login": "user", "ip": "host", "address": "host", "site_name": "site"}
+FORMATS = ("csv", "json")
+HOSTNAME_RE = re.compile(r'^(?!-)[A-Za-z0-9-]{1,63}(?<!-)(?:\.(?!-)[A-Za-z0-9-]{1,63}(?<!-))*\.?$')
+
+# Тимчасова таблиця сесії; COLLATE DATABASE_DEFAULT - tempdb може мати інше сортування, ніж ManagerMikrotik
+STAGE_SQL = """
+CREATE TABLE #ImportDevices (
+    [row_no] INT NOT NULL,
+    [name] NVARCHAR(100) COLLATE DATABASE_DEFAULT NOT NULL,
+    [host] NVARCHAR(100) COLLATE DATABASE_DEFAULT NOT NULL PRIMARY KEY,
+    [username] NVARCHAR(100) COLLATE DATABASE_DEFAULT NULL,
+    [password] NVARCHAR(100) COLLATE DATABASE_DEFAULT NULL,
+    [site] NVARCHAR(100) COLLATE DATABASE_DEFAULT NULL
+);
+"""
+STAGE_INSERT_SQL = ("INSERT INTO #ImportDevices ([row_no], [name], [host], [username], [password], [site]) "
+                    "VALUES (?, ?, ?, ?, ?, ?)")
+
+# Хости, що вже повторюються в базі: MERGE не може однозначно вибрати пристрій - пропускаємо і повідомляємо
+DUPLICATE_HOSTS_SQL = f"""
+SELECT s.[row_no], s.[host], COUNT(*) AS [matches]
+FROM #ImportDevices AS s JOIN {DEVICES_TABLE} AS d ON d.[host] = s.[host]
+GROUP BY s.[row_no], s.[host] HAVING COUNT(*) > 1;
+"""
+# Той самий хост під іншою назвою
+RENAMED_SQL = f"""
+SELECT s.[row_no], s.[host], s.[name], d.[name] AS [existing_name]
+FROM #ImportDevices AS s JOIN {DEVICES_TABLE} AS d ON d.[host] = s.[host]
+WHERE d.[name] <> s.[name];
+"""
+CREATE_SITES_SQL = f"""
+INSERT INTO {SITES_TABLE} ([name])
+SELECT DISTINCT s.[site] FROM #ImportDevices AS s
+WHERE s.[site] IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {SITES_TABLE} AS st WHERE st.[name] = s.[site]);
+"""
+# Порожні логін/пароль/сайт у файлі не затирають наявні значення (експорт без паролів можна імпортувати назад)
+MERGE_SQL = f"""
+SET NOCOUNT ON;
+MERGE {DEVICES_TABLE} WITH (HOLDLOCK) AS d
+USING (
+    SELECT s.[name], s.[host], s.[username], s.[password], st.[id] AS [site_id]
+    FROM #ImportDevices AS s LEFT JOIN {SITES_TABLE} AS st ON st.[name] = s.[site]
+    WHERE s.[host] NOT IN (SELECT [host] FROM {DEVICES_TABLE} GROUP BY [host] HAVING COUNT(*) > 1)
+) AS s ON d.[host] = s.[host]
+WHEN MATCHED AND ? = 1 AND (d.[name] <> s.[name]
+        OR (s.[username] IS NOT NULL AND ISNULL(d.[username], '') <> s.[username])
+        OR (s.[password] IS NOT NULL AND ISNULL(d.[password], '') <> s.[password])
+        OR (s.[site_id] IS NOT NULL AND ISNULL(d.[site_id], -1) <> s.[site_id])) THEN
+    UPDATE SET [name] = s.[name], [username] = COALESCE(s.[username], d.[username]),
+               [password] = COALESCE(s.[password], d.[password]), [site_id] = COALESCE(s.[site_id], d.[site_id])
+WHEN NOT MATCHED BY TARGET THEN
+    INSERT ([name], [host], [username], [password], [site_id])
+    VALUES (s.[name], s.[host], s.[username], s.[password], s.[site_id])
+OUTPUT $action;
+"""
+EXPORT_SQL = (f"SELECT [name], [host], [username], [password], "
+              f"(SELECT st.[name] FROM {SITES_TABLE} AS st WHERE st.[id] = [MikroTikDevices].[site_id]) AS [site] "
+              f"FROM {DEVICES_TABLE}")
+
+
+class ImportReport:
+    """Підсумок імпорту: лічильники, помилки перевірки і конфлікти за хостом ([(рядок, хост, опис)])."""
+
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.sites_created = 0
+        self.errors = []
+        self.conflicts = []
+        self.seconds = 0.0
+        self.dry_run = False
+
+    def format(self, max_lines=20):
+        lines = [f"{'Перевірка імпорту' if self.dry_run else 'Імпорт пристроїв'}: рядків {self.total}, "
+                 f"додано {self.inserted}, оновлено {self.updated}, без змін {self.unchanged}, "
+                 f"помилок {len(self.errors)}, конфліктів {len(self.conflicts)} за {self.seconds:.1f} с"]
+        if self.sites_created:
+            lines.append(f"Створено сайтів: {self.sites_created}")
+        for title, items in (("❌ Помилка", self.errors), ("⚠ Конфлікт", self.conflicts)):
+            for row_no, host, message in items[:max_lines]:
+                lines.append(f"{title} (рядок {row_no}, {host or '-'}): {message}")
+            if len(items) > max_lines:
+                lines.append(f"... і ще {len(items) - max_lines}")
+        return "\n".join(lines)
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension not in FORMATS:
+        raise ValueError(f"Невідомий формат файлу '{path}': очікується {', '.join(FORMATS)}")
+    return extension
+
+
+def _normalize_record(record):
+    normalized = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        field = key.strip().lower()
+        field = FIELD_ALIASES.get(field, field)
+        if field in FIELDS and field not in normalized:
+            normalized[field] = value
+    return normalized
+
+
+def read_records(path, fmt=None):
+    """Записи з CSV (роздільник , або ;) чи JSON (список, {"devices": [...]} або config.json з mikrotiks)."""
+    fmt = fmt or detect_format(path)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == "json":
+            data = json.load(f)
+            if isinstance(data, dict):
+                data = data.get("mikrotiks", data.get("devices"))
+            if not isinstance(data, list):
+                raise ValueError(f"{path}: очікується список пристроїв або секція mikrotiks")
+            return [_normalize_record(item) if isinstance(item, dict) else {} for item in data]
+        sample = f.read(4096)
+        f.seek(0)
+        delimiter = ';' if sample.count(';') > sample.count(',') else ','
+        return [_normalize_record(row) for row in csv.DictReader(f, delimiter=delimiter)]
+
+
+def normalize_host(host):
+    """IP-адреса в канонічному вигляді, ім'я хоста - у нижньому регістрі без крапки в кінці; None - некоректний."""
+    host = host.strip()
+    try:
+        return str(ipaddress.ip_address(host))
+    except ValueError:
+        pass
+    if HOSTNAME_RE.match(host) and not host.replace('.', '').isdigit():
+        return host.rstrip('.').lower()
+    return None
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate_records(records, first_row=2):
+    """
+    (рядки для імпорту, помилки, конфлікти). Рядки - кортежі STAGE_INSERT_SQL.
+    Повтор хоста у файлі - конфлікт, залишається перше входження. first_row - номер рядка першого запису
+    (2 для CSV із заголовком).
+    """
+    rows, errors, conflicts = [], [], []
+    seen = {}
+    for row_no, record in enumerate(records, start=first_row):
+        name, host = _text(record.get("name")), _text(record.get("host"))
+        user, password, site = _text(record.get("user")), _text(record.get("password")), _text(record.get("site"))
+        if not name or not host:
+            errors.append((row_no, host, "не задано name або host"))
+            continue
+        normalized = normalize_host(host)
+        if normalized is None:
+            errors.append((row_no, host, "некоректна IP-адреса або ім'я хоста"))
+            continue
+        too_long = [field for field, value in (("name", name), ("user", user), ("password", password), ("site", site))
+                    if value and len(value) > MAX_LENGTH]
+        if too_long:
+            errors.append((row_no, host, f"довше {MAX_LENGTH} символів: {', '.join(too_long)}"))
+            continue
+        if normalized in seen:
+            conflicts.append((row_no, normalized, f"хост повторюється у файлі (рядок {seen[normalized]}), пропущено"))
+            continue
+        seen[normalized] = row_no
+        rows.append((row_no, name, normalized, user, password, site))
+    return rows, errors, conflicts
+
+
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def import_rows(conn, rows, update=False, dry_run=False, batch_size=BATCH_SIZE, report=None):
+    """
+    Злиття перевірених рядків з MikroTikDevices в одній транзакції; dry_run - відкат після підрахунку.
+    Без update наявні пристрої не змінюються (лише нові хости додаються).
+    """
+    report = report or ImportReport()
+    report.dry_run = dry_run
+    cursor = conn.cursor()
+    try:
+        cursor.execute(STAGE_SQL)
+        cursor.fast_executemany = True
+        cursor.setinputsizes([(pyodbc.SQL_INTEGER, 0, 0)] + [(pyodbc.SQL_WVARCHAR, MAX_LENGTH, 0)] * 5)
+        for batch in _batches(rows, batch_size):
+            cursor.executemany(STAGE_INSERT_SQL, batch)
+        cursor.fast_executemany = False
+        cursor.setinputsizes(None)
+
+        cursor.execute(DUPLICATE_HOSTS_SQL)
+        ambiguous = [(row.row_no, row.host, f"у базі {row.matches} пристроїв з цим хостом, пропущено")
+                     for row in cursor.fetchall()]
+        report.conflicts += ambiguous
+        cursor.execute(RENAMED_SQL)
+        report.conflicts += [(row.row_no, row.host, f"хост уже належить пристрою '{row.existing_name}', "
+                                                    f"{'перейменовано на' if update else 'не змінено на'} '{row.name}'")
+                             for row in cursor.fetchall()]
+        cursor.execute(CREATE_SITES_SQL)
+        report.sites_created = max(cursor.rowcount, 0)
+
+        cursor.execute(MERGE_SQL, 1 if update else 0)
+        actions = [row[0] for row in cursor.fetchall()]
+        report.inserted += actions.count("INSERT")
+        report.updated += actions.count("UPDATE")
+        report.unchanged = len(rows) - len(ambiguous) - report.inserted - report.updated
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return report
+
+
+def import_devices(conn_str, records, update=False, dry_run=False, batch_size=BATCH_SIZE, first_row=2, timeout=30):
+    """Перевірка та імпорт записів (read_records / секція mikrotiks). Повертає ImportReport."""
+    if pyodbc is None:
+        raise ImportError("pyodbc не встановлено")
+    started = time.perf_counter()
+    report = ImportReport()
+    report.total = len(records)
+    rows, report.errors, report.conflicts = validate_records(records, first_row)
+    if rows:
+        with pyodbc.connect(conn_str, timeout=timeout, autocommit=False) as conn:
+            import_rows(conn, rows, update, dry_run, batch_size, report)
+    else:
+        report.dry_run = dry_run
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def import_file(conn_str, path, fmt=None, update=False, dry_run=False, batch_size=BATCH_SIZE):
+    fmt = fmt or detect_format(path)
+    return import_devices(conn_str, read_records(path, fmt), update, dry_run, batch_size,
+                          first_row=2 if fmt == "csv" else 1)
+
+
+def export_devices(conn_str, path, fmt=None, with_passwords=False, target=None, timeout=30):
+    """
+    Експорт у CSV/JSON з полями FIELDS (формат read_records - файл можна імпортувати назад).
+    Без with_passwords пароль не записується. target - лише пристрої цілі (site:/group:/tag:/query:).
+    Повертає кількість пристроїв.
+    """
+    if pyodbc is None:
+        raise ImportError("pyodbc не встановлено")
+    fmt = fmt or detect_format(path)
+    count = 0
+    with pyodbc.connect(conn_str, timeout=timeout) as conn:
+        cursor = conn.cursor()
+        where, params = resolve_target(cursor, target).where() if target else ("", [])
+        cursor.execute(f"{EXPORT_SQL}{where} ORDER BY [name], [id]", *params)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f) if fmt == "csv" else None
+            if writer:
+                writer.writerow(FIELDS)
+            else:
+                f.write("[")
+            while True:
+                rows = cursor.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    values = (row.name, row.host, row.username, row.password if with_passwords else None, row.site)
+                    if writer:
+                        writer.writerow(["" if value is None else value for value in values])
+                    else:
+                        item = {field: value for field, value in zip(FIELDS, values) if value is not None}
+                        f.write(("," if count else "") + "\n  " + json.dumps(item, ensure_ascii=False))
+                    count += 1
+            if not writer:
+                f.write("\n]\n")
+        os.replace(tmp_path, path)
+    return count
+
+
+def migrate_config(conn_str, config_path, update=False, dry_run=False):
+    """Перенесення секції mikrotiks з config.json у базу."""
+    return import_file(conn_str, config_path, "json", update, dry_run)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Масовий імпорт і експорт пристроїв MikroTikDevices")
+    parser.add_argument("--config", default="config.json", help="config.json з database.conn_str")
+    parser.add_argument("--conn-str", help="Рядок підключення (перекриває config.json)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = sub.add_parser("import", help="Імпорт з CSV або JSON")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("--update", action="store_true", help="Оновлювати наявні пристрої за хостом")
+    import_parser.add_argument("--dry-run", action="store_true", help="Лише перевірка, без змін у базі")
+    import_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    export_parser = sub.add_parser("export", help="Експорт у CSV або JSON")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=FORMATS)
+    export_parser.add_argument("--with-passwords", action="store_true")
+    export_parser.add_argument("--target", help="site:<назва>, group:<назва>, tag:<назва> або query:<збережений запит>")
+
+    migrate_parser = sub.add_parser("migrate-config", help="Перенести mikrotiks з config.json у базу")
+    migrate_parser.add_argument("--update", action="store_true")
+    migrate_parser.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args(argv)
+    conn_str = args.conn_str
+    if not conn_str:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            conn_str = (json.load(f).get('database') or {}).get('conn_str')
+    if not conn_str:
+        raise SystemExit("Не задано рядок підключення: --conn-str або database.conn_str у config.json")
+
+    if args.command == "import":
+        report = import_file(conn_str, args.path, args.format, args.update, args.dry_run, args.batch_size)
+    elif args.command == "migrate-config":
+        report = migrate_config(conn_str, args.config, args.update, args.dry_run)
+    else:
+        count = export_devices(conn_str, args.path, args.format, args.with_passwords, args.target)
+        print(f"Експортовано пристроїв: {count} -> {args.path}")
+        return
+    print(report.format())
+    sys.exit(1 if report.errors else 0)
+
+
+if __name__ == "__main__":
+    main()
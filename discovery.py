@@ -0,0 +1,467 @@
+import os
+import csv
+import json
+import time
+import socket
+import struct
+import asyncio
+import argparse
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: ProactorEventLoop не обмежений кількістю дескрипторів
+
+from connection_pool import API_PORT, SessionPool
+from device_import import FIELDS, import_devices, normalize_host
+from inventory import DEVICES_TABLE, InventoryQuery, fetch_devices
+
+# Пошук нових роутерів: асинхронне сканування підмереж (SSH з банером ROSSSH, RouterOS API),
+# прослуховування MNDP (MikroTik Neighbor Discovery, UDP 5678) і /ip neighbor з відомих пристроїв через API.
+# Знайдене об'єднується за серійним номером, software-id, MAC і адресою, звіряється з MikroTikDevices
+# (хост або serial_number) і записується у CSV формату device_import або одразу імпортується.
+
+SSH_PORT = 22
+API_SSL_PORT = 8729
+DEFAULT_PORTS = (SSH_PORT, API_PORT)
+DEFAULT_CONCURRENCY = 2000  # Одночасних спроб з'єднання
+DEFAULT_TIMEOUT = 1.0  # Таймаут TCP-з'єднання і читання банера, с
+ROUTEROS_SSH_BANNER = "ROSSSH"
+MNDP_PORT = 5678
+MNDP_SECONDS = 65  # RouterOS розсилає MNDP раз на хвилину
+FD_RESERVE = 64  # Дескриптори для решти процесу (файли, з'єднання з БД)
+NEIGHBOR_WORKERS = 16
+
+# Типи TLV у пакеті MNDP
+MNDP_FIELDS = {1: "mac", 5: "identity", 7: "version", 8: "platform", 10: "uptime", 11: "software_id", 12: "board",
+               14: "unpack", 15: "ipv6", 16: "interface", 17: "ipv4"}
+# Додаткові стовпці CSV з результатами (device_import їх ігнорує)
+EXTRA_FIELDS = ("serial", "mac", "software_id", "version", "board", "ports", "sources")
+
+
+class Candidate:
+    """Знайдений пристрій; sources - sweep / mndp / neighbor / probe."""
+    __slots__ = ("host", "identity", "mac", "serial", "software_id", "version", "board", "ports", "sources",
+                 "addresses")
+
+    def __init__(self, host, source, identity=None, mac=None, serial=None, software_id=None, version=None,
+                 board=None, ports=()):
+        self.host = host
+        self.identity = identity or None
+        self.mac = mac.upper() if mac else None
+        self.serial = serial or None
+        self.software_id = software_id or None
+        self.version = version or None
+        self.board = board or None
+        self.ports = set(ports)
+        self.sources = {source}
+        self.addresses = {host} if host else set()
+
+    def keys(self):
+        keys = [(kind, value) for kind, value in (("serial", self.serial), ("software_id", self.software_id),
+                                                  ("mac", self.mac)) if value]
+        return keys + [("host", address) for address in self.addresses]
+
+    def merge(self, other):
+        for name in ("host", "identity", "mac", "serial", "software_id", "version", "board"):
+            if getattr(self, name) is None:
+                setattr(self, name, getattr(other, name))
+        self.ports |= other.ports
+        self.sources |= other.sources
+        self.addresses |= other.addresses
+
+    def record(self, user=None, password=None):
+        """Запис для device_import (name, host, user, password, site) з додатковими полями."""
+        return {"name": self.identity or self.host, "host": self.host, "user": user, "password": password,
+                "site": None, "serial": self.serial, "mac": self.mac, "software_id": self.software_id,
+                "version": self.version, "board": self.board,
+                "ports": " ".join(map(str, sorted(self.ports))), "sources": " ".join(sorted(self.sources))}
+
+    def __repr__(self):
+        return f"Candidate({self.host}, {self.identity}, {'/'.join(sorted(self.sources))})"
+
+
+def raise_fd_limit(concurrency):
+    """Підіймає м'який ліміт відкритих файлів до потрібного; повертає допустиму паралельність."""
+    if resource is None:
+        return concurrency
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = concurrency + FD_RESERVE
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        new_soft = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
+            soft = new_soft
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return concurrency
+    return max(1, min(concurrency, soft - FD_RESERVE))
+
+
+async def probe(host, port, timeout=DEFAULT_TIMEOUT):
+    """None - порт закритий; інакше банер SSH (для SSH_PORT) або порожній рядок."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    banner = ""
+    try:
+        if port == SSH_PORT:
+            banner = (await asyncio.wait_for(reader.readline(), timeout)).decode('ascii', 'replace').strip()
+    except (OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+    return banner
+
+
+def is_routeros(port, banner):
+    """SSH RouterOS представляється як ROSSSH; відкритий порт API (8728/8729) - ознака RouterOS."""
+    if port == SSH_PORT:
+        return ROUTEROS_SSH_BANNER in banner
+    return port in (API_PORT, API_SSL_PORT)
+
+
+def sweep_targets(networks, ports=DEFAULT_PORTS):
+    """Генератор (хост, порт) - /16 не розгортається в список."""
+    for network in networks:
+        network = ipaddress.ip_network(network, strict=False)
+        hosts = network.hosts() if network.num_addresses > 2 else iter(network)
+        for host in hosts:
+            for port in ports:
+                yield str(host), port
+
+
+async def sweep(networks, ports=DEFAULT_PORTS, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                progress=None):
+    """
+    Сканування підмереж: concurrency корутин беруть наступну пару (хост, порт) зі спільного генератора,
+    тож у пам'яті лише поточні спроби. progress(перевірено, знайдено) викликається раз на 1000 спроб.
+    """
+    targets = sweep_targets(networks, ports)
+    found = {}
+    checked = 0
+
+    async def worker():
+        nonlocal checked
+        for host, port in targets:
+            banner = await probe(host, port, timeout)
+            checked += 1
+            if banner is not None and is_routeros(port, banner):
+                if host in found:
+                    found[host].ports.add(port)
+                else:
+                    found[host] = Candidate(host, "sweep", ports=(port,))
+            if progress and checked % 1000 == 0:
+                progress(checked, len(found))
+
+    await asyncio.gather(*(worker() for _ in range(raise_fd_limit(concurrency))))
+    return list(found.values())
+
+
+def parse_mndp(data):
+    """Словник полів MNDP_FIELDS з пакета (4 байти заголовка, далі TLV: тип і довжина big-endian)."""
+    fields = {}
+    offset = 4
+    while offset + 4 <= len(data):
+        kind, length = struct.unpack_from('>HH', data, offset)
+        value = data[offset + 4:offset + 4 + length]
+        offset += 4 + length
+        name = MNDP_FIELDS.get(kind)
+        if name is None or len(value) != length:
+            continue
+        if name == "mac":
+            value = ":".join(f"{byte:02X}" for byte in value)
+        elif name == "uptime":
+            value = struct.unpack('<I', value)[0] if length == 4 else None
+        elif name == "ipv4":
+            value = socket.inet_ntoa(value) if length == 4 else None
+        elif name == "ipv6":
+            value = socket.inet_ntop(socket.AF_INET6, value) if length == 16 else None
+        else:
+            value = value.decode('utf-8', 'replace')
+        fields[name] = value
+    return fields
+
+
+def candidate_from_mndp(fields, sender):
+    return Candidate(fields.get("ipv4") or sender, "mndp", fields.get("identity"), fields.get("mac"),
+                     software_id=fields.get("software_id"), version=fields.get("version"), board=fields.get("board"))
+
+
+class _MndpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, candidates):
+        self.candidates = candidates
+
+    def datagram_received(self, data, addr):
+        fields = parse_mndp(data)
+        if fields:
+            self.candidates.append(candidate_from_mndp(fields, addr[0]))
+
+
+async def listen_mndp(seconds=MNDP_SECONDS, port=MNDP_PORT, solicit=True):
+    """
+    Прослуховує MNDP seconds секунд. solicit - запит на розсилку (як у Winbox: 4 нульові байти на broadcast),
+    тоді роутери в сегменті відповідають одразу, а не за таймером.
+    Порт може бути зайнятий (Winbox, інший сканер) - тоді повертається порожній список.
+    """
+    candidates = []
+    loop = asyncio.get_running_loop()
+    try:
+        transport, _ = await loop.create_datagram_endpoint(lambda: _MndpProtocol(candidates),
+                                                           local_addr=("0.0.0.0", port), allow_broadcast=True)
+    except OSError as e:
+        print(f"MNDP: не вдалося відкрити UDP {port}: {str(e)[:200]}")
+        return candidates
+    try:
+        if solicit:
+            transport.sendto(b"\x00\x00\x00\x00", ("255.255.255.255", MNDP_PORT))
+        await asyncio.sleep(seconds)
+    finally:
+        transport.close()
+    return candidates
+
+
+def _api_rows(api, path):
+    return api.get_resource(path).get()
+
+
+def query_device(pool, mikrotik):
+    """(serial, кандидати з /ip neighbor) для відомого пристрою через RouterOS API."""
+    with pool.api(mikrotik) as api:
+        routerboard = _api_rows(api, '/system/routerboard')
+        neighbors = _api_rows(api, '/ip/neighbor')
+    serial = routerboard[0].get('serial-number') if routerboard else None
+    candidates = []
+    for entry in neighbors:
+        address = entry.get('address4') or entry.get('address')
+        if not address or ':' in address:  # Без IPv4 адреси підключитися за інвентарем не вийде
+            continue
+        candidates.append(Candidate(address, "neighbor", entry.get('identity'), entry.get('mac-address'),
+                                    software_id=entry.get('software-id'), version=entry.get('version'),
+                                    board=entry.get('board')))
+    return serial, candidates
+
+
+def fetch_neighbors(devices, workers=NEIGHBOR_WORKERS, pool=None):
+    """
+    Сусіди всіх відомих пристроїв (паралельно, routeros_api блокуючий). Повертає (кандидати,
+    {id пристрою: serial}). Недоступні пристрої пропускаються з повідомленням.
+    """
+    pool = pool or SessionPool()
+    candidates, serials = [], {}
+
+    def run(mikrotik):
+        try:
+            return mikrotik, query_device(pool, mikrotik)
+        except Exception as e:
+            print(f"/ip neighbor з {mikrotik.get('name')} ({mikrotik.get('host')}): {str(e)[:200]}")
+            return mikrotik, None
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for mikrotik, result in executor.map(run, devices):
+                if result is None:
+                    continue
+                serial, found = result
+                candidates += found
+                if serial and mikrotik.get('id') is not None:
+                    serials[mikrotik['id']] = serial
+    finally:
+        pool.close_all()
+    return candidates, serials
+
+
+def probe_candidates(candidates, user, password, workers=NEIGHBOR_WORKERS):
+    """Серійний номер та identity нових кандидатів з відкритим API, якщо підходять облікові дані парку."""
+    pool = SessionPool()
+
+    def run(candidate):
+        mikrotik = {"host": candidate.host, "user": user, "password": password}
+        try:
+            with pool.api(mikrotik) as api:
+                routerboard = _api_rows(api, '/system/routerboard')
+                identity = _api_rows(api, '/system/identity')
+        except Exception:
+            return
+        candidate.serial = candidate.serial or (routerboard[0].get('serial-number') if routerboard else None)
+        candidate.identity = candidate.identity or (identity[0].get('name') if identity else None)
+        candidate.sources.add("probe")
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, [candidate for candidate in candidates if API_PORT in candidate.ports]))
+    finally:
+        pool.close_all()
+
+
+def deduplicate(candidates):
+    """Об'єднує записи одного роутера (serial, software-id, MAC або адреса збігаються)."""
+    merged, index = [], {}
+    for candidate in candidates:
+        if candidate.host:
+            candidate.host = normalize_host(candidate.host) or candidate.host
+            candidate.addresses = {candidate.host}
+        existing = next((index[key] for key in candidate.keys() if key in index), None)
+        if existing is None:
+            merged.append(candidate)
+            existing = candidate
+        else:
+            existing.merge(candidate)
+        for key in existing.keys():
+            index[key] = existing
+    return merged
+
+
+def load_known(conn_str=None, devices=None, timeout=30):
+    """(хости, серійні номери) відомих пристроїв: з MikroTikDevices або зі списку devices (config.json)."""
+    if conn_str:
+        if pyodbc is None:
+            raise ImportError("pyodbc не встановлено")
+        with pyodbc.connect(conn_str, timeout=timeout) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT [host], [serial_number] FROM {DEVICES_TABLE}")
+            rows = cursor.fetchall()
+        pairs = [(row.host, row.serial_number) for row in rows]
+    else:
+        pairs = [(device.get('host'), device.get('serial_number')) for device in devices or []]
+    hosts = {normalize_host(host) or host.strip().lower() for host, _ in pairs if host}
+    return hosts, {serial for _, serial in pairs if serial}
+
+
+def new_candidates(candidates, known_hosts, known_serials):
+    return [candidate for candidate in candidates
+            if not (candidate.addresses & known_hosts) and candidate.serial not in known_serials]
+
+
+def save_serials(conn_str, serials_by_id=None, serials_by_host=None, timeout=30):
+    """Записує серійні номери відомих пристроїв (за id) і щойно імпортованих (за хостом)."""
+    if not conn_str or not (serials_by_id or serials_by_host):
+        return
+    with pyodbc.connect(conn_str, timeout=timeout) as conn:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        if serials_by_id:
+            cursor.executemany(f"UPDATE {DEVICES_TABLE} SET [serial_number] = ? WHERE [id] = ?",
+                               [(serial, device_id) for device_id, serial in serials_by_id.items()])
+        if serials_by_host:
+            cursor.executemany(f"UPDATE {DEVICES_TABLE} SET [serial_number] = ? WHERE [host] = ? "
+                               f"AND [serial_number] IS NULL",
+                               [(serial, host) for host, serial in serials_by_host.items()])
+        conn.commit()
+
+
+def write_candidates(path, candidates, user=None, password=None):
+    """CSV у форматі device_import (додаткові стовпці імпорт пропускає); без password стовпець порожній."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS + EXTRA_FIELDS)
+        writer.writeheader()
+        for candidate in sorted(candidates, key=lambda item: item.host or ""):
+            writer.writerow({key: "" if value is None else value
+                             for key, value in candidate.record(user, password).items()})
+    os.replace(tmp_path, path)
+
+
+async def discover(subnets=(), ports=DEFAULT_PORTS, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                   mndp_seconds=0, devices=(), progress=None):
+    """
+    Сканування, MNDP і /ip neighbor одночасно (MNDP і API-запити не чекають завершення сканування).
+    Повертає (кандидати до дедуплікації, {id пристрою: serial}).
+    """
+    loop = asyncio.get_running_loop()
+    tasks = []
+    if subnets:
+        tasks.append(sweep(subnets, ports, concurrency, timeout, progress))
+    if mndp_seconds:
+        tasks.append(listen_mndp(mndp_seconds))
+    neighbors = loop.run_in_executor(None, fetch_neighbors, list(devices)) if devices else None
+    results = await asyncio.gather(*tasks)
+    candidates = [candidate for found in results for candidate in found]
+    serials = {}
+    if neighbors is not None:
+        found, serials = await neighbors
+        candidates += found
+    return candidates, serials
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пошук нових роутерів MikroTik: підмережі, MNDP, /ip neighbor")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--subnet", action="append", help="Підмережа для сканування (можна кілька), напр. 10.0.0.0/16")
+    parser.add_argument("--ports", type=int, nargs="+", help=f"За замовчуванням {' '.join(map(str, DEFAULT_PORTS))}")
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--timeout", type=float)
+    parser.add_argument("--mndp", type=int, metavar="SECONDS", help="Слухати MNDP вказану кількість секунд")
+    parser.add_argument("--no-neighbors", action="store_true", help="Не опитувати /ip neighbor відомих пристроїв")
+    parser.add_argument("--user", help="Облікові дані для нових пристроїв (перевірка serial через API та імпорт)")
+    parser.add_argument("--password")
+    parser.add_argument("--csv-password", action="store_true",
+                        help="Записати пароль у CSV відкритим текстом (за замовчуванням стовпець password порожній)")
+    parser.add_argument("--output", default="discovered.csv")
+    parser.add_argument("--import", dest="do_import", action="store_true", help="Одразу імпортувати нові пристрої")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    settings = config.get('discovery') or {}
+    conn_str = (config.get('database') or {}).get('conn_str')
+    subnets = args.subnet or settings.get('subnets', [])
+    ports = tuple(args.ports or settings.get('ports', DEFAULT_PORTS))
+    concurrency = args.concurrency or settings.get('concurrency', DEFAULT_CONCURRENCY)
+    timeout = args.timeout or settings.get('timeout', DEFAULT_TIMEOUT)
+    mndp_seconds = args.mndp if args.mndp is not None else settings.get('mndp_seconds', 0)
+
+    if conn_str and pyodbc is not None:
+        with pyodbc.connect(conn_str, timeout=30) as conn:
+            devices = fetch_devices(conn.cursor(), InventoryQuery(sort="name", descending=False))
+    else:
+        conn_str = None
+        devices = [dict(mikrotik, id=mikrotik.get('id')) for mikrotik in config.get('mikrotiks', [])]
+    # Відомий інвентар потрібен для дедуплікації завжди, а /ip neighbor опитується лише за налаштуванням
+    neighbor_devices = [] if args.no_neighbors or not settings.get('neighbors', True) else devices
+    if not (subnets or mndp_seconds or neighbor_devices):
+        raise SystemExit("Нічого шукати: задайте --subnet, --mndp або відомі пристрої для /ip neighbor")
+
+    started = time.perf_counter()
+    candidates, serials = asyncio.run(discover(
+        subnets, ports, concurrency, timeout, mndp_seconds, neighbor_devices,
+        progress=lambda checked, found: print(f"\rПеревірено {checked}, знайдено {found}", end="", flush=True)))
+    print()
+    candidates = deduplicate(candidates)
+    known_hosts, known_serials = load_known(conn_str, devices)
+    known_serials |= set(serials.values())
+    fresh = new_candidates(candidates, known_hosts, known_serials)
+    if args.user and fresh:
+        probe_candidates(fresh, args.user, args.password)
+        fresh = new_candidates(fresh, known_hosts, known_serials)
+    print(f"Знайдено роутерів: {len(candidates)}, нових: {len(fresh)} за {time.perf_counter() - started:.1f} с")
+    write_candidates(args.output, fresh, args.user, args.password if args.csv_password else None)
+    print(f"Нові пристрої записано в {args.output} (імпорт: python device_import.py import {args.output})")
+
+    if conn_str:
+        save_serials(conn_str, serials)
+    if args.do_import and fresh:
+        if not conn_str:
+            raise SystemExit("--import потребує database.conn_str у config.json")
+        report = import_devices(conn_str, [candidate.record(args.user, args.password) for candidate in fresh],
+                                first_row=1)
+        print(report.format())
+        save_serials(conn_str, serials_by_host={candidate.host: candidate.serial for candidate in fresh
+                                                if candidate.serial})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+import difflib
+from datetime import datetime
+
+BACKUP_DIR = "./BackUp/"
+STATE_FILE = "sections.json"  # Хеші та вміст секцій останнього експорту
+HISTORY_FILE = "changes.jsonl"  # Історія змін пристрою, один JSON на рядок
+ROOT_SECTION = "/"  # Для команд до першого заголовка секції
+# Дієслова, що завершують шлях секції в команді з повним шляхом
+COMMAND_VERBS = ("add", "set", "remove", "unset", "enable", "disable", "move", "comment")
+
+
+def read_export(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def normalize_path(line):
+    """Синтаксис RouterOS v7 "/ip/address/add ..." -> "/ip address add ..." (змінюється лише перше слово)."""
+    head, separator, tail = line.partition(" ")
+    if not head.startswith("/") or "/" not in head[1:]:
+        return line
+    head = "/" + " ".join(part for part in head[1:].split("/") if part)
+    return head + separator + tail
+
+
+def split_command(line):
+    """
+    "/ip address add address=..." -> ("/ip address", "add address=..."), "/ip address" -> ("/ip address", "").
+    Шлях закінчується на дієслові, першому аргументі (з "=") або виразі в []; "/ip/address" - як "/ip address".
+    """
+    line = normalize_path(line)
+    parts = line.split(" ")
+    path_parts = [parts[0]]
+    for word in parts[1:]:
+        if "=" in word or word in COMMAND_VERBS or word.startswith("["):
+            break
+        path_parts.append(word)
+    path = " ".join(path_parts)
+    return path, line[len(path):].strip()
+
+
+def parse_sections(text):
+    """
+    Розбирає .rsc експорт на секції: {"/ip firewall filter": [рядки команд], ...}.
+    Рядки-продовження (з "\\" в кінці) склеюються, коментарі та порожні рядки
+    пропускаються - у заголовку експорту дата змінюється при кожному запуску.
+    Секція, що зустрічається кілька разів, зливається в одну.
+    """
+    sections = {}
+    current = ROOT_SECTION
+    pending = ""
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if pending:
+            line = pending + line
+            pending = ""
+        if line.endswith("\\"):
+            pending = line[:-1]
+            continue
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("/"):
+            current, rest = split_command(line)
+            sections.setdefault(current, [])
+            if rest:
+                sections[current].append(rest)
+            continue
+        sections.setdefault(current, []).append(line)
+    if pending:
+        sections.setdefault(current, []).append(pending)
+    return sections
+
+
+def hash_sections(sections):
+    return {name: hashlib.sha1("\n".join(lines).encode('utf-8')).hexdigest() for name, lines in sections.items()}
+
+
+def diff_sections(old_sections, old_hashes, new_sections, new_hashes):
+    """Порівнює тільки секції з різними хешами, решта не розбирається взагалі."""
+    added_sections = sorted(set(new_hashes) - set(old_hashes))
+    removed_sections = sorted(set(old_hashes) - set(new_hashes))
+    changed = {}
+    for name in sorted(set(new_hashes) & set(old_hashes)):
+        if new_hashes[name] == old_hashes[name]:
+            continue
+        old_lines = old_sections.get(name, [])
+        new_lines = new_sections.get(name, [])
+        added, removed = [], []
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag in ("replace", "delete"):
+                removed.extend(old_lines[i1:i2])
+            if tag in ("replace", "insert"):
+                added.extend(new_lines[j1:j2])
+        changed[name] = {"added": added, "removed": removed}
+
+    for name in added_sections:
+        changed[name] = {"added": list(new_sections[name]), "removed": []}
+    for name in removed_sections:
+        changed[name] = {"added": [], "removed": list(old_sections.get(name, []))}
+
+    return {
+        "added_sections": added_sections,
+        "removed_sections": removed_sections,
+        "changed": changed,
+        "lines_added": sum(len(item["added"]) for item in changed.values()),
+        "lines_removed": sum(len(item["removed"]) for item in changed.values()),
+    }
+
+
+def load_state(device_dir):
+    try:
+        with open(os.path.join(device_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_state(device_dir, state):
+    path = os.path.join(device_dir, STATE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def append_history(device_dir, delta):
+    with open(os.path.join(device_dir, HISTORY_FILE), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(delta, ensure_ascii=False) + "\n")
+
+
+def diff_export(device_name, rsc_path, backup_dir=BACKUP_DIR):
+    """
+    Порівнює новий експорт пристрою з попереднім і зберігає структуровану дельту
+    в історію пристрою. Повертає дельту (None для першого експорту - це базова точка).
+    """
+    device_dir = os.path.join(backup_dir, device_name)
+    os.makedirs(device_dir, exist_ok=True)
+
+    new_sections = parse_sections(read_export(rsc_path))
+    new_hashes = hash_sections(new_sections)
+    state = load_state(device_dir)
+    new_state = {"export": os.path.basename(rsc_path), "hashes": new_hashes, "sections": new_sections}
+
+    if state is None:
+        save_state(device_dir, new_state)
+        return None
+
+    if state.get("hashes") == new_hashes:
+        delta = {"changed": {}, "added_sections": [], "removed_sections": [], "lines_added": 0, "lines_removed": 0}
+    else:
+        delta = diff_sections(state.get("sections", {}), state.get("hashes", {}), new_sections, new_hashes)
+    save_state(device_dir, new_state)
+
+    delta.update({
+        "device": device_name,
+        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "previous": state.get("export"),
+        "current": new_state["export"],
+    })
+    if delta["changed"]:
+        append_history(device_dir, delta)
+    return delta
+
+
+def load_history(device_name, backup_dir=BACKUP_DIR, limit=None):
+    path = os.path.join(backup_dir, device_name, HISTORY_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            history = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    return history[-limit:] if limit else history
+
+
+def format_summary(delta, max_sections=5):
+    """Компактний опис змін для Telegram."""
+    if not delta or not delta["changed"]:
+        return None
+    parts = []
+    for name, item in list(delta["changed"].items())[:max_sections]:
+        marker = ""
+        if name in delta["added_sections"]:
+            marker = " [нова]"
+        elif name in delta["removed_sections"]:
+            marker = " [видалена]"
+        parts.append(f"{name}{marker} (+{len(item['added'])}/-{len(item['removed'])})")
+    more = len(delta["changed"]) - max_sections
+    if more > 0:
+        parts.append(f"... і ще {more}")
+    return (f"🔀 #{delta['device']}: змінено секцій {len(delta['changed'])} "
+            f"(+{delta['lines_added']}/-{delta['lines_removed']} рядків)\n" + "\n".join(parts))
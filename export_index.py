@@ -0,0 +1,240 @@
+import os
+import re
+import sys
+import glob
+import time
+import sqlite3
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from export_diff import BACKUP_DIR, read_export, parse_sections
+from routeros_parsers import backup_timestamp
+
+INDEX_FILE = "exports_index.sqlite"
+SCHEMA_VERSION = 2  # PRAGMA user_version; старіший індекс перебудовується з нуля
+
+# Рядки зберігаються в звичайній таблиці export_rows з індексом за export_id, а FTS5 - лише зовнішній вміст
+# (content='export_rows'), що синхронізується тригерами: видалення рядків експорту і JOIN з exports
+# ідуть за індексами, без повного перегляду FTS-таблиці.
+# '-', '.', '/', ':' та '_' - частина токена, щоб "10.0.0.1/24", "address-list" і "vlan-id"
+# шукались як одне слово, а "=" залишається роздільником ("vlan-id=100" -> "vlan-id", "100")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    export_date TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_exports_device_date ON exports (device, export_date);
+CREATE INDEX IF NOT EXISTS ix_exports_date ON exports (export_date);
+CREATE TABLE IF NOT EXISTS export_rows (
+    id INTEGER PRIMARY KEY,
+    export_id INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_export_rows_export ON export_rows (export_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS export_lines USING fts5(
+    content,
+    content = 'export_rows',
+    content_rowid = 'id',
+    tokenize = "unicode61 tokenchars '-_./:'"
+);
+CREATE TRIGGER IF NOT EXISTS export_rows_insert AFTER INSERT ON export_rows BEGIN
+    INSERT INTO export_lines (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS export_rows_delete AFTER DELETE ON export_rows BEGIN
+    INSERT INTO export_lines (export_lines, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+def connect(backup_dir=BACKUP_DIR):
+    os.makedirs(backup_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(backup_dir, INDEX_FILE), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        # Індекс попереднього формату (рядки прямо в FTS5) - перебудовується при наступній індексації
+        conn.executescript("DROP TABLE IF EXISTS export_lines; DROP TABLE IF EXISTS exports;")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    conn.create_function("REGEXP", 2, _regexp, deterministic=True)
+    return conn
+
+
+_regex_cache = {}
+
+
+def _regexp(pattern, value):
+    regex = _regex_cache.get(pattern)
+    if regex is None:
+        regex = _regex_cache[pattern] = re.compile(pattern, re.IGNORECASE)
+    return value is not None and regex.search(value) is not None
+
+
+def export_date(path):
+    dated = backup_timestamp(os.path.basename(path))
+    if dated:
+        return dated.strftime('%Y-%m-%d %H:%M')
+    return datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M')
+
+
+def parse_export_file(path):
+    """Виконується у дочірньому процесі: читає і розбирає один експорт."""
+    stat = os.stat(path)
+    rows = []
+    for section, lines in parse_sections(read_export(path)).items():
+        rows.append((section, section))  # Заголовок секції теж шукається
+        rows.extend((line, section) for line in lines)
+    device = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return path, device, export_date(path), stat.st_mtime, stat.st_size, rows
+
+
+def _is_indexed(conn, path):
+    stat = os.stat(path)
+    row = conn.execute("SELECT mtime, size FROM exports WHERE path = ?", (path,)).fetchone()
+    return row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size
+
+
+def _store(conn, parsed):
+    path, device, date, mtime, size, rows = parsed
+    old = conn.execute("SELECT id FROM exports WHERE path = ?", (path,)).fetchone()
+    if old:
+        conn.execute("DELETE FROM export_rows WHERE export_id = ?", (old[0],))
+        conn.execute("DELETE FROM exports WHERE id = ?", (old[0],))
+    cursor = conn.execute("INSERT INTO exports (device, export_date, path, mtime, size) VALUES (?, ?, ?, ?, ?)",
+                          (device, date, path, mtime, size))
+    export_id = cursor.lastrowid
+    conn.executemany("INSERT INTO export_rows (content, section, export_id) VALUES (?, ?, ?)",
+                     ((content, section, export_id) for content, section in rows))
+
+
+def index_exports(paths, backup_dir=BACKUP_DIR, workers=None):
+    """
+    Індексує експорти, яких ще немає в індексі (або які змінились).
+    workers=0 - розбір у поточному процесі (для одного щойно завантаженого файлу),
+    інакше розбір іде у пулі процесів, а запис - однією транзакцією в цьому процесі.
+    Повертає кількість проіндексованих файлів.
+    """
+    paths = [os.path.abspath(path) for path in paths]
+    conn = connect(backup_dir)
+    try:
+        pending = [path for path in paths if os.path.exists(path) and not _is_indexed(conn, path)]
+        if not pending:
+            return 0
+
+        if workers == 0 or len(pending) == 1:
+            parsed_items = map(parse_export_file, pending)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            parsed_items = executor.map(parse_export_file, pending, chunksize=16)
+
+        try:
+            with conn:
+                for parsed in parsed_items:
+                    _store(conn, parsed)
+        finally:
+            if executor:
+                executor.shutdown()
+        return len(pending)
+    finally:
+        conn.close()
+
+
+def index_backup_dir(backup_dir=BACKUP_DIR, workers=None):
+    return index_exports(glob.glob(os.path.join(backup_dir, "*", "*.rsc")), backup_dir, workers)
+
+
+def _fts_query(text):
+    # Кожне слово в лапках, щоб "10.0.0.1/24" не трактувалось як синтаксис FTS5
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+def search(query=None, regex=None, device=None, since=None, until=None, latest_only=False,
+           limit=200, backup_dir=BACKUP_DIR):
+    """
+    Пошук по проіндексованих експортах.
+    query - слова (усі мають бути в рядку), regex - регулярний вираз по рядку.
+    Якщо задано обидва, FTS звужує вибірку, а regex перевіряється лише на ній.
+    Повертає список (device, export_date, section, content).
+    """
+    if not query and not regex:
+        raise ValueError("Потрібно задати query або regex")
+
+    conditions, params = [], []
+    if query:
+        conditions.append("export_lines MATCH ?")
+        params.append(_fts_query(query))
+    if regex:
+        conditions.append("r.content REGEXP ?")
+        params.append(regex)
+    if device:
+        conditions.append("e.device = ?")
+        params.append(device)
+    if since:
+        conditions.append("e.export_date >= ?")
+        params.append(since)
+    if until:
+        conditions.append("e.export_date <= ?")
+        params.append(until)
+    if latest_only:
+        conditions.append("e.export_date = (SELECT MAX(x.export_date) FROM exports x WHERE x.device = e.device)")
+
+    # Лише regex - перебір export_rows без FTS; з query FTS відбирає rowid, решта - за первинними ключами
+    source = "export_lines JOIN export_rows r ON r.id = export_lines.rowid" if query else "export_rows r"
+    sql = f"""
+        SELECT e.device, e.export_date, r.section, r.content
+        FROM {source} JOIN exports e ON e.id = r.export_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY e.device, e.export_date DESC
+        LIMIT ?
+    """
+    params.append(limit)
+    conn = connect(backup_dir)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Індекс пошуку по .rsc експортах")
+    parser.add_argument("--backup-dir", default=BACKUP_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Проіндексувати нові експорти")
+    build.add_argument("--workers", type=int, default=None)
+
+    find = sub.add_parser("search", help="Пошук")
+    find.add_argument("query", nargs="?")
+    find.add_argument("--regex")
+    find.add_argument("--device")
+    find.add_argument("--since", help="YYYY-MM-DD")
+    find.add_argument("--until", help="YYYY-MM-DD")
+    find.add_argument("--latest", action="store_true", help="Лише останній експорт кожного пристрою")
+    find.add_argument("--limit", type=int, default=200)
+
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+
+    if args.command == "build":
+        count = index_backup_dir(args.backup_dir, args.workers)
+        print(f"Проіндексовано файлів: {count} за {time.perf_counter() - started:.2f} с")
+        return
+
+    until = f"{args.until} 23:59" if args.until and len(args.until) == 10 else args.until
+    rows = search(args.query, args.regex, args.device, args.since, until, args.latest, args.limit, args.backup_dir)
+    for device, date, section, content in rows:
+        print(f"{device}\t{date}\t{section}\t{content}")
+    print(f"Знайдено: {len(rows)} за {(time.perf_counter() - started) * 1000:.1f} мс", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
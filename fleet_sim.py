@@ -0,0 +1,897 @@
+import io
+import os
+import re
+import sys
+import json
+import stat
+import time
+import random
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import selectors
+import threading
+import socketserver
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import paramiko
+
+# Симулятор парку RouterOS для навантажувальних тестів і бенчмарків (benchmarks/):
+# SSH (netmiko-сумісна консоль) + SFTP, API на 8728, FTP-сервер і фейковий Telegram Bot API.
+
+DEFAULT_SETTINGS = {
+    "latency": 0.0,  # Затримка відповіді на кожну команду, с
+    "jitter": 0.0,  # Додаткова випадкова затримка 0..jitter, с
+    "auth_failure_rate": 0.0,  # Частка спроб входу, що відхиляються
+    "hang_rate": 0.0,  # Частка з'єднань, які приймаються, але ніколи не відповідають (таймаут)
+    "hang_seconds": 30,
+    "disconnect_rate": 0.0,  # Частка з'єднань, які розриваються одразу
+    "backup_size": 256 * 1024,  # Розмір .backup, байт
+    "export_lines": 400,  # Кількість рядків у .rsc
+    "installed_version": "7.12.1",
+    "latest_version": "7.15",
+    "firmware": "7.12.1",
+    "telegram_latency": 0.0,
+    "telegram_failure_rate": 0.0,  # Частка відповідей 429 від Telegram
+    "ftp_abort_rate": 0.0,  # Частка FTP-вивантажень, обірваних сервером на половині (докачування, ftp_upload.py)
+    "user": "admin",
+    "password": "admin",
+}
+
+ACCEPTOR_CHUNK = 200  # Сокетів на один потік прийому (select() у Windows обмежений 512)
+
+NAME_ARG_RE = re.compile(r'\b(?:name|file)=("?)([^"\s]+)\1')
+WHERE_NAME_RE = re.compile(r'name="([^"]+)"')
+WHERE_TYPE_RE = re.compile(r'type="([^"]+)"')
+# Команда зміни конфігурації з повним шляхом: "/ip firewall address-list add list=x address=..."
+CONFIG_COMMAND_RE = re.compile(r'^(/[a-z0-9\- ]+?) (add|set|remove) (.*)$')
+
+EXPORT_SECTIONS = ("/interface bridge", "/interface ethernet", "/ip address", "/ip firewall filter",
+                   "/ip firewall nat", "/ip route", "/ip service", "/system ntp client", "/user")
+
+
+def _file_type(name):
+    if name.endswith(".backup"):
+        return "backup"
+    if name.endswith(".rsc"):
+        return "script"
+    return "file"
+
+
+class FakeRouter:
+    """Стан одного симульованого роутера: файли, версії та відповіді на команди консолі."""
+
+    def __init__(self, index, settings, rng):
+        self.index = index
+        self.name = f"SimRouter{index:04d}"
+        self.serial = f"HD{index:08X}"
+        self.started = time.monotonic()
+        self.interface_errors = 0
+        self.settings = settings
+        self.rng = rng
+        self.installed_version = settings["installed_version"]
+        self.latest_version = settings["latest_version"]
+        self.firmware = settings["firmware"]
+        self._lock = threading.Lock()
+        self.files = {}
+        self.config = []  # Рядки (шлях, команда), застосовані через консоль (config_push.py)
+        self.snapshots = {}  # назва .backup -> знімок self.config для /system backup load
+        self.pending_restore = None
+        self._ids = {}
+        self._next_id = 1
+        self.host = "127.0.0.1"
+        self.ssh_port = None
+        self.api_port = None
+
+    def delay(self):
+        latency = self.settings["latency"] + self.rng.uniform(0, self.settings["jitter"])
+        if latency > 0:
+            time.sleep(latency)
+
+    def put_file(self, name, data):
+        with self._lock:
+            self.files[name] = data
+            if name not in self._ids:
+                self._ids[name] = f"*{self._next_id:X}"
+                self._next_id += 1
+
+    def remove_files(self, names):
+        with self._lock:
+            for name in names:
+                self.files.pop(name, None)
+                self._ids.pop(name, None)
+
+    def list_files(self, types=None):
+        with self._lock:
+            return [(self._ids[name], name, _file_type(name), len(data)) for name, data in self.files.items()
+                    if not types or _file_type(name) in types]
+
+    def names_by_ids(self, ids):
+        with self._lock:
+            by_id = {file_id: name for name, file_id in self._ids.items()}
+        return [by_id[file_id] for file_id in ids if file_id in by_id]
+
+    def resource(self):
+        """/system/resource: випадкове навантаження, uptime від старту симулятора."""
+        uptime = int(time.monotonic() - self.started)
+        return {"uptime": f"{uptime // 86400}d{uptime % 86400 // 3600}h{uptime % 3600 // 60}m{uptime % 60}s",
+                "version": f"{self.installed_version} (stable)", "cpu-load": self.rng.randint(0, 100),
+                "free-memory": self.rng.randint(100, 900) * 1024 * 1024, "total-memory": 1024 * 1024 * 1024,
+                "board-name": "RB4011iGS+"}
+
+    def interfaces(self):
+        """/interface: лічильники помилок лише зростають."""
+        with self._lock:
+            self.interface_errors += self.rng.randint(0, 3)
+            errors = self.interface_errors
+        return [{"name": f"ether{number}", "type": "ether", "rx-error": errors if number == 1 else 0,
+                 "tx-error": 0, "running": "true"} for number in range(1, 5)]
+
+    def neighbors(self):
+        """/ip neighbor: один некерований сусід на роутер (для discovery.py)."""
+        return [{"interface": "ether1", "address4": f"10.200.{self.index // 250}.{self.index % 250 + 1}",
+                 "mac-address": f"4C:5E:0C:00:{self.index // 256:02X}:{self.index % 256:02X}",
+                 "identity": f"Unmanaged{self.index:04d}", "platform": "MikroTik", "version": self.latest_version,
+                 "board": "hAP ac2", "software-id": f"SIM-{self.index:04d}"}]
+
+    def export_text(self):
+        lines = [f"# {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} by RouterOS {self.installed_version}",
+                 "# model = RB4011iGS+"]
+        per_section = max(1, self.settings["export_lines"] // len(EXPORT_SECTIONS))
+        for section in EXPORT_SECTIONS:
+            lines.append(section)
+            for row in range(per_section):
+                lines.append(f"add comment=\"{self.name} {section.split()[-1]} {row}\" "
+                             f"address=10.{self.index % 250}.{row % 250}.1/24 interface=ether{row % 8 + 1}")
+        lines.append("/system identity")
+        lines.append(f"set name={self.name}")
+        for path, line in self.config:
+            lines.extend((path, line))
+        return "\n".join(lines) + "\n"
+
+    def execute(self, command):
+        """Повертає (вивід, закрити_з'єднання)."""
+        self.delay()
+        command = command.strip()
+        pending_restore, self.pending_restore = self.pending_restore, None
+        if pending_restore and command.lower() == "y":
+            self.config = list(self.snapshots.get(pending_restore, []))
+            self.started = time.monotonic()  # Перезавантаження: uptime з нуля
+            return "Restoring system configuration\nSystem configuration restored, rebooting now", True
+        if command.startswith("/system backup save"):
+            match = NAME_ARG_RE.search(command)
+            name = match.group(2) if match else f"{self.name}-{datetime.now():%Y%m%d-%H%M}"
+            self.put_file(f"{name}.backup", os.urandom(self.settings["backup_size"]))
+            self.snapshots[f"{name}.backup"] = list(self.config)
+            return "Configuration backup saved", False
+        if command.startswith("/system backup load"):
+            match = NAME_ARG_RE.search(command)
+            if not match or match.group(2) not in self.files:
+                return "failure: no such file", False
+            self.pending_restore = match.group(2)
+            return "Restore and reboot? [y/N]:", False
+        if command.startswith("/export"):
+            match = NAME_ARG_RE.search(command)
+            if match:
+                self.put_file(f"{match.group(2)}.rsc", self.export_text().encode('utf-8'))
+                return "", False
+            return self.export_text(), False
+        if command.startswith("/file print"):
+            types = WHERE_TYPE_RE.findall(command)
+            rows = [f"{number:>2} name={name} type={file_type} size={size} "
+                    f"creation-time={datetime.now():%Y-%m-%d %H:%M:%S}"
+                    for number, (_, name, file_type, size) in enumerate(self.list_files(types))]
+            return "\n".join(rows), False
+        if command.startswith("/file remove"):
+            self.remove_files(WHERE_NAME_RE.findall(command))
+            return "", False
+        if command.startswith("/system package update check-for-updates"):
+            status = "New version is available" if self.installed_version != self.latest_version \
+                else "System is already up to date"
+            return (f"          channel: stable\n"
+                    f"installed-version: {self.installed_version}\n"
+                    f"   latest-version: {self.latest_version}\n"
+                    f"           status: {status}"), False
+        if command.startswith("/system package update install"):
+            self.installed_version = self.latest_version
+            self.started = time.monotonic()
+            return "Downloaded, rebooting...", True
+        if command.startswith("/system routerboard print"):
+            return (f"       routerboard: yes\n"
+                    f"             model: RB4011iGS+\n"
+                    f"     serial-number: {self.serial}\n"
+                    f"  current-firmware: {self.firmware}\n"
+                    f"  upgrade-firmware: {self.installed_version}"), False
+        if command.startswith("/system routerboard upgrade"):
+            self.firmware = self.installed_version
+            return "", False
+        if command.startswith("/system reboot"):
+            self.started = time.monotonic()
+            return "Rebooting...", True
+        if command.startswith("/system resource print"):
+            resource = self.resource()
+            return "\n".join(f"{key:>17}: {value}" for key, value in resource.items()), False
+        if command.startswith("/system identity print"):
+            return f"  name: {self.name}", False
+        match = CONFIG_COMMAND_RE.match(command)
+        if match:
+            path, verb, arguments = match.groups()
+            if "=" not in arguments and not arguments.startswith("["):
+                return f"expected end of command (line 1 column {len(path) + len(verb) + 3})", False
+            self.config.append((path, f"{verb} {arguments}"))
+            return "", False
+        return "bad command name", False
+
+
+class _SshServer(paramiko.ServerInterface):
+    def __init__(self, router, simulator):
+        self.router = router
+        self.simulator = simulator
+
+    def check_auth_password(self, username, password):
+        username = username.split('+')[0]  # netmiko додає до логіну опції консолі MikroTik (+cetw511h4098)
+        settings = self.router.settings
+        if username != settings["user"] or password != settings["password"]:
+            return paramiko.AUTH_FAILED
+        if self.router.rng.random() < settings["auth_failure_rate"]:
+            return paramiko.AUTH_FAILED
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self.simulator.serve_shell, args=(channel, self.router), daemon=True).start()
+        return True
+
+
+class _SftpHandle(paramiko.SFTPHandle):
+    def __init__(self, name, data):
+        super().__init__()
+        self.readfile = io.BytesIO(data)
+        self._attributes = _attributes(name, len(data))
+
+    def stat(self):
+        return self._attributes
+
+
+def _attributes(name, size, directory=False):
+    attributes = paramiko.SFTPAttributes()
+    attributes.filename = name
+    attributes.st_size = size
+    attributes.st_mode = (stat.S_IFDIR | 0o755) if directory else (stat.S_IFREG | 0o644)
+    attributes.st_mtime = int(time.time())
+    return attributes
+
+
+class _SftpServer(paramiko.SFTPServerInterface):
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.router = server.router
+        self.simulator = server.simulator
+
+    def _lookup(self, path):
+        name = path.lstrip('/')
+        return name, self.router.files.get(name)
+
+    def open(self, path, flags, attr):
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            return paramiko.SFTP_PERMISSION_DENIED
+        self.router.delay()
+        name, data = self._lookup(path)
+        if data is None:
+            return paramiko.SFTP_NO_SUCH_FILE
+        self.simulator.add_stat("sftp_bytes", len(data))
+        return _SftpHandle(name, data)
+
+    def stat(self, path):
+        if path.strip('/') in ("", "."):
+            return _attributes("/", 0, directory=True)
+        name, data = self._lookup(path)
+        return paramiko.SFTP_NO_SUCH_FILE if data is None else _attributes(name, len(data))
+
+    lstat = stat
+
+    def list_folder(self, path):
+        return [_attributes(name, size) for _, name, _, size in self.router.list_files()]
+
+    def canonicalize(self, path):
+        return "/" + path.strip('/') if path not in (".", "") else "/"
+
+
+def _encode_length(length):
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("API-з'єднання закрито")
+        data += chunk
+    return data
+
+
+def _read_length(sock):
+    first = _recv_exact(sock, 1)[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return ((first & 0x3F) << 8) | _recv_exact(sock, 1)[0]
+    if first < 0xE0:
+        return ((first & 0x1F) << 16) | int.from_bytes(_recv_exact(sock, 2), 'big')
+    if first < 0xF0:
+        return ((first & 0x0F) << 24) | int.from_bytes(_recv_exact(sock, 3), 'big')
+    return int.from_bytes(_recv_exact(sock, 4), 'big')
+
+
+def _read_sentence(sock):
+    words = []
+    while True:
+        length = _read_length(sock)
+        if length == 0:
+            return words
+        words.append(_recv_exact(sock, length).decode('utf-8', errors='replace'))
+
+
+def _send_sentence(sock, words):
+    payload = b''.join(_encode_length(len(word.encode('utf-8'))) + word.encode('utf-8') for word in words)
+    sock.sendall(payload + b'\x00')
+
+
+class _FtpHandler(socketserver.StreamRequestHandler):
+    """Мінімальний FTP (пасивний режим): USER/PASS, CWD/MKD/PWD, STOR/APPE з REST, RETR, NLST, SIZE, RNFR/RNTO, DELE."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode('utf-8'))
+
+    def resolve(self, cwd, path):
+        path = path if path.startswith('/') else f"{cwd.rstrip('/')}/{path}"
+        relative = os.path.normpath(path).replace('\\', '/').lstrip('/')
+        if relative.startswith('..'):
+            return None, None
+        relative = "" if relative == "." else relative
+        return "/" + relative, os.path.join(self.server.root, relative)
+
+    def open_data(self, passive):
+        if passive is None:
+            return None
+        passive.settimeout(20)
+        connection, _ = passive.accept()
+        passive.close()
+        return connection
+
+    def handle(self):
+        simulator = self.server.simulator
+        settings = simulator.settings
+        self.reply("220 fleet_sim FTP ready")
+        cwd, user, authed, rest, passive, rename_from = "/", None, False, 0, None, None
+        for raw in self.rfile:
+            line = raw.decode('utf-8', errors='replace').rstrip("\r\n")
+            command, _, argument = line.partition(' ')
+            command = command.upper()
+            if command == "USER":
+                user = argument
+                self.reply("331 Password required")
+            elif command == "PASS":
+                authed = user == settings["user"] and argument == settings["password"]
+                self.reply("230 Logged in" if authed else "530 Login incorrect")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                break
+            elif not authed:
+                self.reply("530 Not logged in")
+            elif command in ("TYPE", "NOOP", "MODE", "STRU"):
+                self.reply("200 OK")
+            elif command == "PWD":
+                self.reply(f'257 "{cwd}"')
+            elif command == "CWD":
+                virtual, local = self.resolve(cwd, argument)
+                if local and os.path.isdir(local):
+                    cwd = virtual or "/"
+                    self.reply("250 OK")
+                else:
+                    self.reply("550 No such directory")
+            elif command == "MKD":
+                virtual, local = self.resolve(cwd, argument)
+                try:
+                    os.makedirs(local)
+                    self.reply(f'257 "{virtual}" created')
+                except (TypeError, OSError):  # Каталог уже є (або створений паралельним з'єднанням)
+                    self.reply("550 Directory exists")
+            elif command in ("PASV", "EPSV"):
+                if passive is not None:
+                    passive.close()
+                passive = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                passive.bind((self.server.server_address[0], 0))
+                passive.listen(1)
+                port = passive.getsockname()[1]
+                if command == "EPSV":
+                    self.reply(f"229 Entering Extended Passive Mode (|||{port}|)")
+                else:
+                    address = self.server.server_address[0].replace('.', ',')
+                    self.reply(f"227 Entering Passive Mode ({address},{port >> 8},{port & 0xFF})")
+            elif command == "REST":
+                rest = int(argument or 0)
+                self.reply(f"350 Restarting at {rest}")
+            elif command == "SIZE":
+                _, local = self.resolve(cwd, argument)
+                if local and os.path.isfile(local):
+                    self.reply(f"213 {os.path.getsize(local)}")
+                else:
+                    self.reply("550 No such file")
+            elif command in ("STOR", "APPE"):
+                _, local = self.resolve(cwd, argument)
+                if not local or not os.path.isdir(os.path.dirname(local)):
+                    self.reply("553 Could not create file")
+                    continue
+                self.reply("150 Opening data connection")
+                connection = self.open_data(passive)
+                passive = None
+                if connection is None:
+                    self.reply("425 Use PASV first")
+                    continue
+                mode = "ab" if command == "APPE" else ("r+b" if rest and os.path.exists(local) else "wb")
+                received = 0
+                # Обрив: сервер закриває з'єднання даних після ~половини типового бекапу
+                abort_after = settings["backup_size"] // 2 if simulator.rng.random() < settings["ftp_abort_rate"] \
+                    else None
+                with open(local, mode) as file, connection:
+                    if mode == "r+b":
+                        file.seek(rest)
+                        file.truncate()
+                    while abort_after is None or received < abort_after:
+                        chunk = connection.recv(65536)
+                        if not chunk:
+                            abort_after = None
+                            break
+                        file.write(chunk)
+                        received += len(chunk)
+                rest = 0
+                simulator.add_stat("ftp_bytes", received)
+                self.reply("426 Connection closed; transfer aborted" if abort_after is not None
+                           else "226 Transfer complete")
+            elif command == "RETR":
+                _, local = self.resolve(cwd, argument)
+                if not local or not os.path.isfile(local):
+                    self.reply("550 No such file")
+                    continue
+                self.reply("150 Opening data connection")
+                connection = self.open_data(passive)
+                passive = None
+                if connection is None:
+                    self.reply("425 Use PASV first")
+                    continue
+                with open(local, "rb") as file, connection:
+                    file.seek(rest)
+                    connection.sendall(file.read())
+                rest = 0
+                self.reply("226 Transfer complete")
+            elif command == "NLST":
+                virtual, local = self.resolve(cwd, argument or cwd)
+                if not local or not os.path.isdir(local):
+                    self.reply("550 No such directory")
+                    continue
+                self.reply("150 Opening data connection")
+                connection = self.open_data(passive)
+                passive = None
+                if connection is None:
+                    self.reply("425 Use PASV first")
+                    continue
+                with connection:
+                    names = "".join(f"{virtual.rstrip('/')}/{name}\r\n" for name in sorted(os.listdir(local)))
+                    connection.sendall(names.encode('utf-8'))
+                self.reply("226 Transfer complete")
+            elif command == "RNFR":
+                _, rename_from = self.resolve(cwd, argument)
+                if rename_from and os.path.exists(rename_from):
+                    self.reply("350 Ready for RNTO")
+                else:
+                    rename_from = None
+                    self.reply("550 No such file")
+            elif command == "RNTO":
+                _, local = self.resolve(cwd, argument)
+                if not rename_from or not local:
+                    self.reply("503 Bad sequence of commands")
+                    continue
+                os.replace(rename_from, local)
+                rename_from = None
+                self.reply("250 Renamed")
+            elif command == "DELE":
+                _, local = self.resolve(cwd, argument)
+                if local and os.path.isfile(local):
+                    os.remove(local)
+                    self.reply("250 Deleted")
+                else:
+                    self.reply("550 No such file")
+            else:
+                self.reply("502 Command not implemented")
+        if passive is not None:
+            passive.close()
+
+
+class _FtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _TelegramHandler(BaseHTTPRequestHandler):
+    def _handle(self):
+        simulator = self.server.simulator
+        settings = simulator.settings
+        method = urlparse(self.path).path.rsplit('/', 1)[-1]
+        if settings["telegram_latency"]:
+            time.sleep(settings["telegram_latency"])
+        if method == "sendMessage" and simulator.rng.random() < settings["telegram_failure_rate"]:
+            status, body = 429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                 "parameters": {"retry_after": 1}}
+        elif method == "sendMessage":
+            query = parse_qs(urlparse(self.path).query)
+            simulator.add_stat("telegram_messages")
+            status, body = 200, {"ok": True, "result": {"message_id": simulator.stats["telegram_messages"],
+                                                        "chat": {"id": query.get('chat_id', ['0'])[0]},
+                                                        "text": query.get('text', [''])[0]}}
+        elif method == "getUpdates":
+            status, body = 200, {"ok": True, "result": []}
+        else:
+            status, body = 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FleetSimulator:
+    """
+    Запускає count фейкових роутерів на локальній машині.
+    За замовчуванням кожен роутер слухає власний SSH/API порт на 127.0.0.1 (ключі "port"/"api_port"
+    у devices()). loopback_ips=True дає кожному роутеру окрему адресу 127.1.x.y зі стандартними
+    портами - для скриптів, що не підтримують нестандартний порт (лише Linux, потрібні права на порт 22).
+    """
+
+    def __init__(self, count, settings=None, loopback_ips=False, ssh_port=0, api_port=0, ftp_port=0,
+                 api=True, seed=None):
+        self.count = count
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.loopback_ips = loopback_ips
+        self.ssh_port = ssh_port
+        self.api_port = api_port
+        self.ftp_port = ftp_port
+        self.api = api
+        self.rng = random.Random(seed)
+        self.routers = []
+        self.stats = {"ssh_connections": 0, "api_connections": 0, "commands": 0, "sftp_bytes": 0,
+                      "ftp_bytes": 0, "telegram_messages": 0, "hung": 0, "dropped": 0}
+        self._stats_lock = threading.Lock()
+        self._listeners = []
+        self._selectors = []
+        self._stop = threading.Event()
+        self.ftp_root = None
+        self._ftp_server = None
+        self._telegram_server = None
+        self.telegram_url = None
+
+    def add_stat(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _listen(self, host, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(128)
+        sock.setblocking(False)
+        self._listeners.append(sock)
+        return sock, sock.getsockname()[1]
+
+    def start(self):
+        # Розриви з'єднань клієнтами (і інжектовані збої) - очікувана поведінка, не засмічуємо вивід
+        logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+        self.host_key = paramiko.RSAKey.generate(2048)
+        sockets = []
+        for index in range(self.count):
+            router = FakeRouter(index, self.settings, random.Random(self.rng.random()))
+            if self.loopback_ips:
+                router.host = f"127.1.{index // 250}.{index % 250 + 1}"
+            sock, router.ssh_port = self._listen(router.host, self.ssh_port)
+            sockets.append((sock, "ssh", router))
+            if self.api:
+                sock, router.api_port = self._listen(router.host, self.api_port)
+                sockets.append((sock, "api", router))
+            self.routers.append(router)
+
+        for offset in range(0, len(sockets), ACCEPTOR_CHUNK):
+            selector = selectors.DefaultSelector()
+            for sock, kind, router in sockets[offset:offset + ACCEPTOR_CHUNK]:
+                selector.register(sock, selectors.EVENT_READ, (kind, router))
+            self._selectors.append(selector)
+            threading.Thread(target=self._accept_loop, args=(selector,), daemon=True).start()
+
+        self.ftp_root = tempfile.mkdtemp(prefix="fleet_sim_ftp_")
+        self._ftp_server = _FtpServer(("127.0.0.1", self.ftp_port), _FtpHandler)
+        self._ftp_server.root = self.ftp_root
+        self._ftp_server.simulator = self
+        threading.Thread(target=self._ftp_server.serve_forever, daemon=True).start()
+
+        self._telegram_server = ThreadingHTTPServer(("127.0.0.1", 0), _TelegramHandler)
+        self._telegram_server.simulator = self
+        threading.Thread(target=self._telegram_server.serve_forever, daemon=True).start()
+        self.telegram_url = f"http://127.0.0.1:{self._telegram_server.server_address[1]}"
+        return self
+
+    def _accept_loop(self, selector):
+        while not self._stop.is_set():
+            for key, _ in selector.select(timeout=0.5):
+                try:
+                    connection, _ = key.fileobj.accept()
+                except (BlockingIOError, OSError):
+                    continue
+                connection.setblocking(True)
+                kind, router = key.data
+                target = self._serve_ssh if kind == "ssh" else self._serve_api
+                threading.Thread(target=target, args=(connection, router), daemon=True).start()
+        selector.close()
+
+    def _inject_connection_failure(self, connection, router):
+        roll = router.rng.random()
+        if roll < self.settings["disconnect_rate"]:
+            self.add_stat("dropped")
+            connection.close()
+            return True
+        if roll < self.settings["disconnect_rate"] + self.settings["hang_rate"]:
+            self.add_stat("hung")
+            self._stop.wait(self.settings["hang_seconds"])
+            connection.close()
+            return True
+        return False
+
+    def _serve_ssh(self, connection, router):
+        if self._inject_connection_failure(connection, router):
+            return
+        self.add_stat("ssh_connections")
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _SftpServer)
+        try:
+            transport.start_server(server=_SshServer(router, self))
+            channels = []  # Посилання на канали: інакше paramiko закриває їх при збиранні сміття
+            while transport.is_active() and not self._stop.is_set():
+                channel = transport.accept(timeout=1)
+                if channel is not None:
+                    channels.append(channel)
+        except Exception:
+            pass
+        finally:
+            transport.close()
+
+    def serve_shell(self, channel, router):
+        user = self.settings["user"]
+        prompt = f"[{user}@{router.name}] > "
+        try:
+            channel.sendall(f"\r\n\r\n{prompt}".encode('utf-8'))
+            buffer = ""
+            last_cr = False
+            while not self._stop.is_set():
+                data = channel.recv(4096)
+                if not data:
+                    break
+                for char in data.decode('utf-8', errors='replace'):
+                    if char == "\n" and last_cr:
+                        last_cr = False
+                        continue
+                    last_cr = char == "\r"
+                    if char not in "\r\n":
+                        buffer += char
+                        continue
+                    command, buffer = buffer, ""
+                    if not command.strip():
+                        channel.sendall(f"\r\n{prompt}".encode('utf-8'))
+                        continue
+                    self.add_stat("commands")
+                    output, close = router.execute(command)
+                    text = command + "\r\n" + (output.replace("\n", "\r\n") + "\r\n" if output else "")
+                    if close:
+                        channel.sendall(text.encode('utf-8'))
+                        return
+                    channel.sendall((text + "\r\n" + prompt).encode('utf-8'))
+        except Exception:
+            pass
+        finally:
+            try:
+                channel.close()
+            except Exception:
+                pass  # Клієнт уже розірвав з'єднання
+
+    def _serve_api(self, connection, router):
+        if self._inject_connection_failure(connection, router):
+            return
+        self.add_stat("api_connections")
+        authed = False
+        try:
+            with connection:
+                while not self._stop.is_set():
+                    words = _read_sentence(connection)
+                    if not words:
+                        continue
+                    command = words[0]
+                    attributes = {word[1:].split('=', 1)[0]: word[1:].split('=', 1)[1]
+                                  for word in words[1:] if word.startswith('=') and '=' in word[1:]}
+                    queries = {word[1:].split('=', 1)[0]: word[1:].split('=', 1)[1]
+                               for word in words[1:] if word.startswith('?') and '=' in word}
+                    tag = next((word for word in words[1:] if word.startswith('.tag=')), None)
+                    tail = [tag] if tag else []
+                    router.delay()
+                    self.add_stat("commands")
+                    if command == "/login":
+                        settings = self.settings
+                        authed = (attributes.get('name') == settings["user"] and
+                                  attributes.get('password') == settings["password"] and
+                                  router.rng.random() >= settings["auth_failure_rate"])
+                        if not authed:
+                            _send_sentence(connection, ["!trap", "=message=invalid user name or password (6)"] + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif not authed:
+                        _send_sentence(connection, ["!fatal", "not logged in"])
+                        return
+                    elif command == "/file/print":
+                        types = [queries['type']] if 'type' in queries else None
+                        for file_id, name, file_type, size in router.list_files(types):
+                            _send_sentence(connection, ["!re", f"=.id={file_id}", f"=name={name}",
+                                                        f"=type={file_type}", f"=size={size}"] + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command == "/file/remove":
+                        router.remove_files(router.names_by_ids(attributes.get('.id', '').split(',')))
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command in ("/system/routerboard/upgrade", "/system/reboot",
+                                     "/system/routerboard/settings/set"):
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command == "/system/routerboard/settings/print":
+                        _send_sentence(connection, ["!re", "=auto-upgrade=false", "=boot-device=nand-if-fail-then-ethernet"] + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command == "/system/routerboard/print":
+                        _send_sentence(connection, ["!re", "=routerboard=true", "=model=RB4011iGS+",
+                                                    f"=serial-number={router.serial}",
+                                                    f"=current-firmware={router.firmware}"] + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command == "/system/resource/print":
+                        _send_sentence(connection, ["!re"] + [f"={key}={value}" for key, value in router.resource().items()]
+                                       + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command == "/interface/print":
+                        for entry in router.interfaces():
+                            _send_sentence(connection, ["!re"] + [f"={key}={value}" for key, value in entry.items()]
+                                           + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command == "/system/identity/print":
+                        _send_sentence(connection, ["!re", f"=name={router.name}"] + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command == "/ip/neighbor/print":
+                        for entry in router.neighbors():
+                            _send_sentence(connection, ["!re"] + [f"={key}={value}" for key, value in entry.items()]
+                                           + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+                    elif command == "/quit":
+                        _send_sentence(connection, ["!fatal", "session terminated on request"])
+                        return
+                    else:
+                        _send_sentence(connection, ["!trap", "=message=no such command"] + tail)
+                        _send_sentence(connection, ["!done"] + tail)
+        except (ConnectionError, OSError):
+            pass
+
+    def devices(self):
+        """Пристрої у форматі інвентарю (config.json / MikroTikDevices)."""
+        devices = []
+        for index, router in enumerate(self.routers, start=1):
+            device = {"id": index, "name": router.name, "host": router.host,
+                      "user": self.settings["user"], "password": self.settings["password"]}
+            if not self.loopback_ips:
+                device["port"] = router.ssh_port
+                if router.api_port:
+                    device["api_port"] = router.api_port
+            devices.append(device)
+        return devices
+
+    def ftp_config(self):
+        return {"host": "127.0.0.1", "port": self._ftp_server.server_address[1], "username": self.settings["user"],
+                "password": self.settings["password"], "dir": "/"}
+
+    def config(self):
+        """config.json для scheduler_daemon.py та скриптів."""
+        ftp = self.ftp_config()
+        return {"mikrotiks": self.devices(),
+                "ftp": {"host": ftp["host"], "port": ftp["port"], "user": ftp["username"],
+                        "password": ftp["password"], "dir": ftp["dir"]},
+                "telegram_token": "sim-token",
+                "database": {"conn_str": ""}}
+
+    def stop(self):
+        self._stop.set()
+        for sock in self._listeners:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        for server in (self._ftp_server, self._telegram_server):
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+        if self.ftp_root:
+            shutil.rmtree(self.ftp_root, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Симулятор парку RouterOS (SSH/SFTP/API/FTP/Telegram)")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--auth-failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--backup-size", type=int, default=DEFAULT_SETTINGS["backup_size"])
+    parser.add_argument("--export-lines", type=int, default=DEFAULT_SETTINGS["export_lines"])
+    parser.add_argument("--loopback-ips", action="store_true", help="Окрема адреса 127.1.x.y на кожен роутер")
+    parser.add_argument("--ssh-port", type=int, default=0)
+    parser.add_argument("--api-port", type=int, default=0)
+    parser.add_argument("--ftp-port", type=int, default=0)
+    parser.add_argument("--write-config", help="Записати config.json з адресами симульованого парку")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    settings = {"latency": args.latency, "jitter": args.jitter, "auth_failure_rate": args.auth_failure_rate,
+                "hang_rate": args.hang_rate, "disconnect_rate": args.disconnect_rate,
+                "backup_size": args.backup_size, "export_lines": args.export_lines}
+    simulator = FleetSimulator(args.devices, settings, args.loopback_ips, args.ssh_port, args.api_port,
+                               args.ftp_port, seed=args.seed).start()
+    print(f"Запущено {args.devices} симульованих роутерів, FTP на порту {simulator.ftp_config()['port']}, "
+          f"Telegram API: {simulator.telegram_url}")
+    if args.write_config:
+        with open(args.write_config, 'w', encoding='utf-8') as file:
+            json.dump(simulator.config(), file, indent=2, ensure_ascii=False)
+        print(f"Конфігурацію записано у {args.write_config}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Статистика: {simulator.stats}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
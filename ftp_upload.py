@@ -0,0 +1,212 @@
+import io
+import os
+import sys
+import time
+import ftplib
+import hashlib
+import argparse
+
+from export_diff import BACKUP_DIR
+
+# Вивантаження бекапів на FTP з докачуванням і перевіркою. Файл пишеться як <назва>.part: після обриву
+# наступна спроба (або наступний запуск) дізнається розмір через SIZE і продовжує з REST+STOR (або APPE,
+# якщо сервер не підтримує REST для STOR). Лише після збігу розміру .part перейменовується в остаточну назву,
+# тож обрізаний файл ніколи не виглядає як бекап. Поруч з кожним файлом пишеться <назва>.sha256 у форматі
+# sha256sum - цілісність перевіряється без повторного завантаження файлів. Окремий файл на кожен бекап,
+# а не спільний маніфест каталогу: GUI, планувальник і воркери черги - різні процеси, і одночасне
+# оновлення спільного файлу втрачало б записи.
+
+FTP_TIMEOUT = 20
+UPLOAD_ATTEMPTS = 3
+RETRY_DELAY = 2  # Секунд перед докачуванням після обриву
+PART_SUFFIX = ".part"
+CHECKSUM_SUFFIX = ".sha256"
+HASH_CHUNK = 1024 * 1024
+# Обриви з'єднання і тимчасові помилки сервера (4xx) - докачуємо; 5xx (немає прав, немає місця) - ні
+RETRY_ERRORS = (OSError, EOFError, ftplib.error_temp, ftplib.error_reply)
+
+
+class UploadSizeError(Exception):
+    pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def connect(ftp_config):
+    ftp = ftplib.FTP(timeout=ftp_config.get('timeout') or FTP_TIMEOUT)
+    ftp.connect(ftp_config['host'], int(ftp_config.get('port') or 21))
+    ftp.login(ftp_config['username'], ftp_config['password'])
+    ftp.voidcmd("TYPE I")  # SIZE у двійковому режимі - розмір у байтах
+    return ftp
+
+
+def remote_size(ftp, path):
+    """Розмір файлу на сервері або None, якщо файлу немає."""
+    try:
+        return ftp.size(path)
+    except ftplib.error_perm:
+        return None
+
+
+def replace_file(ftp, source, target):
+    """RNFR/RNTO з видаленням наявного target (частина серверів не перезаписує файл при перейменуванні)."""
+    try:
+        ftp.delete(target)
+    except ftplib.error_perm:
+        pass
+    ftp.rename(source, target)
+
+
+def read_checksum(ftp, path):
+    """SHA-256 з <path>.sha256 або None, якщо файлу контрольної суми немає чи він пошкоджений."""
+    buffer = io.BytesIO()
+    try:
+        ftp.retrbinary(f"RETR {path}{CHECKSUM_SUFFIX}", buffer.write)
+    except ftplib.error_perm:
+        return None
+    digest = buffer.getvalue().decode('utf-8', errors='replace').split(" ")[0].strip().lower()
+    return digest if len(digest) == 64 else None
+
+
+def write_checksum(ftp, path, digest):
+    """<path>.sha256 ("<sha256>  <назва>", як у sha256sum) через тимчасовий файл і перейменування."""
+    data = f"{digest}  {os.path.basename(path)}\n".encode('utf-8')
+    partial = f"{path}{CHECKSUM_SUFFIX}{PART_SUFFIX}"
+    ftp.storbinary(f"STOR {partial}", io.BytesIO(data))
+    replace_file(ftp, partial, path + CHECKSUM_SUFFIX)
+
+
+def store(ftp, local_file, remote_file, offset=0, limiter=None):
+    """Надсилає файл з позиції offset; повертає кількість надісланих байтів."""
+    callback = limiter.on_block if limiter else None
+    with open(local_file, 'rb') as file:
+        file.seek(offset)
+        if not offset:
+            ftp.storbinary(f"STOR {remote_file}", file, callback=callback)
+        else:
+            try:
+                ftp.storbinary(f"STOR {remote_file}", file, callback=callback, rest=offset)
+            except ftplib.error_perm:
+                # REST перед STOR не підтримується (502/504) - дописуємо в кінець
+                file.seek(offset)
+                ftp.storbinary(f"APPE {remote_file}", file, callback=callback)
+        return file.tell() - offset
+
+
+def upload_file(ftp_config, local_file, remote_dir, remote_name, limiter=None, attempts=UPLOAD_ATTEMPTS):
+    """
+    Вивантажує local_file як remote_dir/remote_name з докачуванням і записом remote_name.sha256.
+    Повертає кількість надісланих байтів (0 - файл уже на сервері з тією ж контрольною сумою).
+    """
+    size = os.path.getsize(local_file)
+    digest = file_sha256(local_file)
+    target = f"{remote_dir}/{remote_name}"
+    partial = target + PART_SUFFIX
+    sent = 0
+    for attempt in range(1, attempts + 1):
+        try:
+            with connect(ftp_config) as ftp:
+                try:
+                    ftp.mkd(remote_dir)
+                except ftplib.error_perm:
+                    pass
+                if read_checksum(ftp, target) == digest and remote_size(ftp, target) == size:
+                    return sent
+                offset = remote_size(ftp, partial) or 0
+                if offset > size:
+                    offset = 0  # Залишок іншого файлу - вивантажуємо заново
+                if offset:
+                    print(f"Докачування {remote_name} з {offset} з {size} байт")
+                if offset < size:
+                    sent += store(ftp, local_file, partial, offset, limiter)
+                uploaded = remote_size(ftp, partial)
+                if uploaded != size:
+                    raise UploadSizeError(f"{remote_name}: на сервері {uploaded} байт замість {size}")
+                replace_file(ftp, partial, target)
+                write_checksum(ftp, target, digest)
+                return sent
+        except RETRY_ERRORS + (UploadSizeError,) as e:
+            if attempt == attempts:
+                raise
+            print(f"Обрив вивантаження {remote_name} (спроба {attempt}): {str(e)[:200]}. Докачуємо...")
+            time.sleep(RETRY_DELAY)
+
+
+def list_names(ftp, remote_dir):
+    try:
+        return [os.path.basename(name.rstrip('/')) for name in ftp.nlst(remote_dir)]
+    except ftplib.error_perm:
+        return []  # Порожній каталог: частина серверів відповідає 550
+
+
+def local_index(backup_dir=BACKUP_DIR):
+    """Назва файлу -> шлях локальної копії в BackUp/<пристрій>/."""
+    index = {}
+    for root, _, files in os.walk(backup_dir):
+        for name in files:
+            index.setdefault(name, os.path.join(root, name))
+    return index
+
+
+def verify_dir(ftp, remote_dir, local_files=None):
+    """
+    Перевірка каталогу за файлами .sha256: файли без контрольної суми, контрольні суми без файлів,
+    незавершені .part і, якщо є local_files (local_index()), розмір на сервері (SIZE) і SHA-256 локальних копій.
+    Повертає список проблем.
+    """
+    names = set(list_names(ftp, remote_dir))
+    problems = []
+    for name in sorted(names):
+        path = f"{remote_dir}/{name}"
+        if name.endswith(PART_SUFFIX):
+            problems.append(f"{path}: незавершене вивантаження")
+        elif name.endswith(CHECKSUM_SUFFIX):
+            if name[:-len(CHECKSUM_SUFFIX)] not in names:
+                problems.append(f"{path[:-len(CHECKSUM_SUFFIX)]}: відсутній на сервері")
+        elif name + CHECKSUM_SUFFIX not in names:
+            problems.append(f"{path}: немає {name}{CHECKSUM_SUFFIX} (вивантажено без перевірки)")
+        elif (local_files or {}).get(name):
+            local = local_files[name]
+            size = remote_size(ftp, path)
+            if size != os.path.getsize(local):
+                problems.append(f"{path}: розмір {size} замість {os.path.getsize(local)}")
+            elif read_checksum(ftp, path) != file_sha256(local):
+                problems.append(f"{path}: локальна копія {local} відрізняється від вивантаженої")
+    return problems
+
+
+def main(argv=None):
+    from scheduler_daemon import CONFIG_FILE, load_config, load_inventory
+
+    parser = argparse.ArgumentParser(description="Перевірка бекапів на FTP за файлами .sha256")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--dir", action="append", help="Каталог пристрою (за замовчуванням - усі в ftp.dir)")
+    parser.add_argument("--local", action="store_true", help="Звірити розміри і контрольні суми з локальними копіями в BackUp")
+    args = parser.parse_args(argv)
+
+    ftp_config = load_inventory(load_config(args.config))[2]
+    if not ftp_config:
+        raise SystemExit("FTP не налаштовано")
+    local_files = local_index() if args.local else None
+    root = ftp_config['dir'].rstrip('/')
+    problems, checked = [], 0
+    with connect(ftp_config) as ftp:
+        for name in args.dir or list_names(ftp, ftp_config['dir']):
+            remote_dir = f"{root}/{name}"
+            if remote_size(ftp, remote_dir) is not None:
+                continue  # Файл у корені, не каталог пристрою
+            problems += verify_dir(ftp, remote_dir, local_files)
+            checked += 1
+    print("\n".join(problems) if problems else "Проблем не знайдено")
+    print(f"Перевірено каталогів: {checked}, проблем: {len(problems)}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+import os
+import re
+import json
+import math
+import time
+import struct
+import argparse
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from connection_pool import SessionPool
+from job_journal import device_key
+from mikrotik_ops import BACKUP_DIR
+
+# Легке опитування стану парку через пул з'єднань RouterOS API (SessionPool.api - той самий
+# RouterOsApiPool, що й у RouterBoardWorker): /system/resource та лічильники помилок /interface.
+# Ряди зберігаються в SeriesStore: для кожного пристрою і рівня деталізації - кільцеві масиви float32
+# з неявним часом (номер слота = час // крок), без позначок часу й об'єктів на кожну точку.
+# Рівні: сирі точки з кроком опитування, 5-хвилинні та годинні агрегати.
+
+HEALTH_DIR = os.path.join(BACKUP_DIR, "health")
+STORE_FILE = os.path.join(HEALTH_DIR, "series.bin")
+STORE_MAGIC = b"MMH1"
+DEFAULT_INTERVAL = 60
+DEFAULT_WORKERS = 16
+SAVE_INTERVAL = 300  # Як часто записувати сховище на диск, с
+
+# Метрика -> агрегація при зменшенні деталізації
+METRICS = (("cpu", "avg"), ("memory", "avg"), ("uptime", "last"), ("errors", "sum"))
+METRIC_NAMES = tuple(name for name, _ in METRICS)
+# (крок, с; кількість точок): сирі дані - 2 год з кроком 60 с, 5 хв - доба, 1 год - тиждень
+TIERS = ((None, 120), (300, 288), (3600, 168))
+
+UPTIME_RE = re.compile(r'(\d+)([wdhms])')
+CLOCK_RE = re.compile(r'(\d+):(\d{2}):(\d{2})$')
+UPTIME_UNITS = {"w": 604800, "d": 86400, "h": 3600, "m": 60, "s": 1}
+NAN = float("nan")
+
+
+def parse_uptime(text):
+    """'2d3h4m5s' (API) або '1w2d03:04:05' (консоль) -> секунди; None, якщо не розпізнано."""
+    if not text:
+        return None
+    seconds = 0
+    clock = CLOCK_RE.search(text)
+    if clock:
+        hours, minutes, secs = map(int, clock.groups())
+        seconds = hours * 3600 + minutes * 60 + secs
+        text = text[:clock.start()]
+    units = UPTIME_RE.findall(text)
+    if not units and not clock:
+        return None
+    return seconds + sum(int(value) * UPTIME_UNITS[unit] for value, unit in units)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def sample_device(api):
+    """Один зріз: навантаження CPU (%), зайнята пам'ять (%), uptime (с), сума лічильників помилок інтерфейсів."""
+    resource = api.get_resource('/system/resource').get()
+    resource = resource[0] if resource else {}
+    interfaces = api.get_resource('/interface').get()
+    total_memory, free_memory = _number(resource.get('total-memory')), _number(resource.get('free-memory'))
+    memory = 100.0 * (total_memory - free_memory) / total_memory if total_memory and free_memory is not None else None
+    errors = sum(int(entry.get(key) or 0) for entry in interfaces for key in ("rx-error", "tx-error"))
+    return {"cpu": _number(resource.get('cpu-load')), "memory": memory,
+            "uptime": parse_uptime(resource.get('uptime')), "errors_total": errors}
+
+
+class Series:
+    """Кільцеві масиви одного рівня деталізації: слот = int(час // step), позиція = слот % capacity."""
+    __slots__ = ("step", "capacity", "last_slot", "columns", "_sums", "_counts")
+
+    def __init__(self, step, capacity):
+        self.step = step
+        self.capacity = capacity
+        self.last_slot = None
+        self.columns = {name: array('f', [NAN]) * capacity for name in METRIC_NAMES}
+        self._sums = dict.fromkeys(METRIC_NAMES, 0.0)
+        self._counts = dict.fromkeys(METRIC_NAMES, 0)
+
+    def _advance(self, slot):
+        if self.last_slot is not None and slot <= self.last_slot:
+            return slot == self.last_slot
+        # Пропущені слоти (пристрій був недоступний) - NaN
+        start = slot - self.capacity + 1 if self.last_slot is None else max(self.last_slot + 1, slot - self.capacity + 1)
+        for missed in range(start, slot + 1):
+            position = missed % self.capacity
+            for column in self.columns.values():
+                column[position] = NAN
+        self.last_slot = slot
+        self._sums = dict.fromkeys(METRIC_NAMES, 0.0)
+        self._counts = dict.fromkeys(METRIC_NAMES, 0)
+        return True
+
+    def add(self, timestamp, values, aggregations):
+        slot = int(timestamp // self.step)
+        if not self._advance(slot):
+            return  # Точка старша за вікно або за останній слот
+        position = slot % self.capacity
+        for name, how in aggregations:
+            value = values.get(name)
+            if value is None:
+                continue
+            if how == "last":
+                result = value
+            else:
+                self._sums[name] += value
+                self._counts[name] += 1
+                result = self._sums[name] if how == "sum" else self._sums[name] / self._counts[name]
+            self.columns[name][position] = result
+
+    def values(self, name, points=None):
+        """Останні points значень у хронологічному порядку (NaN - немає даних)."""
+        if self.last_slot is None:
+            return []
+        points = min(points or self.capacity, self.capacity)
+        column = self.columns[name]
+        return [column[slot % self.capacity] for slot in range(self.last_slot - points + 1, self.last_slot + 1)]
+
+
+class SeriesStore:
+    """
+    Ряди метрик за ключем пристрою (job_journal.device_key - id з БД або host) на кількох рівнях деталізації.
+    Потокобезпечний; save()/load() - компактний двійковий файл (заголовок JSON + масиви float32).
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, tiers=TIERS):
+        self.interval = interval
+        self.tiers = tuple((step or interval, capacity) for step, capacity in tiers)
+        self._lock = threading.Lock()
+        self._devices = {}
+
+    def _device(self, key):
+        series = self._devices.get(key)
+        if series is None:
+            series = self._devices[key] = [Series(step, capacity) for step, capacity in self.tiers]
+        return series
+
+    def add(self, key, timestamp, values):
+        with self._lock:
+            for series in self._device(key):
+                series.add(timestamp, values, METRICS)
+
+    def values(self, key, name, tier=0, points=None):
+        with self._lock:
+            series = self._devices.get(key)
+            return series[tier].values(name, points) if series else []
+
+    def latest(self, key, name):
+        values = self.values(key, name, points=1)
+        return values[-1] if values and not math.isnan(values[-1]) else None
+
+    def keys(self):
+        with self._lock:
+            return list(self._devices)
+
+    def save(self, path=STORE_FILE):
+        with self._lock:
+            keys = list(self._devices)
+            header = {"interval": self.interval, "tiers": self.tiers, "metrics": METRIC_NAMES,
+                      "devices": {key: [series.last_slot for series in self._devices[key]] for key in keys}}
+            chunks = [series.columns[name].tobytes() for key in keys for series in self._devices[key]
+                      for name in METRIC_NAMES]
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(STORE_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=STORE_FILE, interval=DEFAULT_INTERVAL):
+        """Сховище з файлу; інша конфігурація рівнів, метрик чи пошкоджений файл - порожнє сховище."""
+        store = cls(interval)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return store
+        try:
+            if not data.startswith(STORE_MAGIC):
+                raise ValueError("невідомий формат")
+            header_length = struct.unpack_from('<I', data, len(STORE_MAGIC))[0]
+            offset = len(STORE_MAGIC) + 4
+            header = json.loads(data[offset:offset + header_length].decode('utf-8'))
+            offset += header_length
+            if [tuple(tier) for tier in header["tiers"]] != list(store.tiers) or \
+                    tuple(header["metrics"]) != METRIC_NAMES:
+                raise ValueError("інша конфігурація рівнів або метрик")
+            for key, last_slots in header["devices"].items():
+                series_list = store._device(key)
+                for series, last_slot in zip(series_list, last_slots):
+                    series.last_slot = last_slot
+                    for name in METRIC_NAMES:
+                        size = series.capacity * 4
+                        series.columns[name] = array('f', data[offset:offset + size])
+                        offset += size
+        except (ValueError, KeyError, struct.error) as e:
+            print(f"Сховище метрик {path} не прочитано ({str(e)[:200]}), починаємо з порожнього")
+            return cls(interval)
+        return store
+
+
+class HealthPoller:
+    """
+    Опитування пристроїв кожні interval секунд у фоновому потоці. Лічильники помилок інтерфейсів
+    перетворюються на приріст за інтервал (після перезавантаження роутера - від нуля).
+    on_cycle(samples) викликається після кожного циклу з {ключ пристрою: значення або None}.
+    """
+
+    def __init__(self, devices, store=None, interval=DEFAULT_INTERVAL, workers=DEFAULT_WORKERS, pool=None,
+                 on_cycle=None, store_path=STORE_FILE):
+        self.devices = list(devices)
+        self.interval = interval
+        self.store = store if store is not None else SeriesStore.load(store_path, interval)
+        self.store_path = store_path
+        self.workers = workers
+        self.own_pool = pool is None
+        self.pool = pool or SessionPool(idle_timeout=max(300, interval * 3))
+        self.on_cycle = on_cycle
+        self.stop_event = threading.Event()
+        self._previous_errors = {}
+        self._thread = None
+
+    def set_devices(self, devices):
+        self.devices = list(devices)
+
+    def _sample(self, mikrotik):
+        try:
+            with self.pool.api(mikrotik) as api:
+                return mikrotik, sample_device(api)
+        except Exception as e:
+            print(f"Опитування {mikrotik.get('name')} ({mikrotik.get('host')}): {str(e)[:200]}")
+            return mikrotik, None
+
+    def poll_once(self, executor=None):
+        timestamp = time.time()
+        samples = {}
+        devices = list(self.devices)
+        results = executor.map(self._sample, devices) if executor else map(self._sample, devices)
+        for mikrotik, values in results:
+            key = device_key(mikrotik)
+            if values is not None:
+                total = values.pop("errors_total")
+                previous = self._previous_errors.get(key)
+                self._previous_errors[key] = total
+                values["errors"] = None if previous is None else (total - previous if total >= previous else total)
+                self.store.add(key, timestamp, values)
+            samples[key] = values
+        if self.on_cycle:
+            self.on_cycle(samples)
+        return samples
+
+    def run(self):
+        last_save = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not self.stop_event.is_set():
+                started = time.monotonic()
+                self.poll_once(executor)
+                if time.monotonic() - last_save >= SAVE_INTERVAL:
+                    self.save()
+                    last_save = time.monotonic()
+                self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        self.save()
+        if self.own_pool:
+            self.pool.close_all()
+
+    def save(self):
+        try:
+            self.store.save(self.store_path)
+        except OSError as e:
+            print(f"Не вдалося зберегти метрики в {self.store_path}: {str(e)[:200]}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="health-poller", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def sparkline(values):
+    """Текстовий спарклайн для консолі (NaN - пробіл)."""
+    blocks = "▁▂▃▄▅▆▇█"
+    present = [value for value in values if not math.isnan(value)]
+    if not present:
+        return ""
+    low, high = min(present), max(present)
+    scale = (high - low) or 1.0
+    return "".join(" " if math.isnan(value) else blocks[int((value - low) / scale * (len(blocks) - 1))]
+                   for value in values)
+
+
+def main(argv=None):
+    from scheduler_daemon import CONFIG_FILE, load_config, load_inventory
+
+    parser = argparse.ArgumentParser(description="Опитування стану парку MikroTik (CPU, пам'ять, uptime, помилки)")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--interval", type=int)
+    parser.add_argument("--target", help="site:<назва>, group:<назва>, tag:<назва> або query:<збережений запит>")
+    parser.add_argument("--once", action="store_true", help="Один цикл опитування і підсумок")
+    parser.add_argument("--show", action="store_true", help="Показати збережені ряди без опитування")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    settings = config.get('health') or {}
+    interval = args.interval or settings.get('interval', DEFAULT_INTERVAL)
+    if args.show:
+        store = SeriesStore.load(STORE_FILE, interval)
+        for key in sorted(store.keys()):
+            print(f"{key:<20} CPU {sparkline(store.values(key, 'cpu', points=60)):<60} "
+                  f"помилки {sparkline(store.values(key, 'errors', points=60))}")
+        return
+    devices = load_inventory(config, args.target)[0]
+    poller = HealthPoller(devices, interval=interval, workers=settings.get('workers', DEFAULT_WORKERS))
+    if args.once:
+        for key, values in sorted(poller.poll_once().items()):
+            print(f"{key:<20} {values if values is not None else 'недоступний'}")
+        poller.save()
+        poller.pool.close_all()
+        return
+    print(f"Опитування {len(devices)} пристроїв кожні {interval} с (Ctrl+C - зупинити)")
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        poller.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import json
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+from concurrency import SiteLimits
+
+# Запити до інвентарю MikroTikDevices з фільтрацією, сортуванням і посторінковою вибіркою на боці SQL Server.
+# Версії порівнюються за обчислюваними стовпцями installed_version_key / latest_version_key / needs_update
+# (функція [dbo].[RouterOSVersionKey], див. SLQcreateBaseManagerMikrotik.sql), тож GUI не розбирає рядки версій
+# для сортування і не завантажує всю таблицю: перша сторінка - одразу, наступні - під час прокручування.
+# Групування: сайти з ієрархією (Sites.parent_id), групи й теги (DeviceGroups, kind 'group'/'tag') і збережені
+# запити (SavedQueries). Ціль задачі ("site:Київ", "group:core", "tag:lte", "query:Без бекапу") перетворюється
+# на InventoryQuery і вибирається на сервері одним запитом.
+
+PAGE_SIZE = 200
+DEVICES_TABLE = "[ManagerMikrotik].[dbo].[MikroTikDevices]"
+DEVICE_COLUMNS = ("[id], [name], [host], [username], [password], [installed_version], [latest_version], "
+                  "[backup_status], [backup_status_final], [routerboard_firmware], [needs_update], [site_id]")
+SITES_TABLE = "[ManagerMikrotik].[dbo].[Sites]"
+GROUPS_TABLE = "[ManagerMikrotik].[dbo].[DeviceGroups]"
+MEMBERS_TABLE = "[ManagerMikrotik].[dbo].[DeviceGroupMembers]"
+SAVED_QUERIES_TABLE = "[ManagerMikrotik].[dbo].[SavedQueries]"
+
+# Сортування за назвою поля -> стовпець (версії - за числовим ключем, а не за рядком)
+SORT_COLUMNS = {
+    "name": "[name]",
+    "host": "[host]",
+    "installed_version": "[installed_version_key]",
+    "latest_version": "[latest_version_key]",
+    "status": "[backup_status_final]",
+    "firmware": "[routerboard_firmware]",
+    "needs_update": "[needs_update]",
+}
+# Фільтр за статусом: пристрої без фінального статусу
+STATUS_UNKNOWN = "unknown"
+# Види цілей задач: префікс -> поле InventoryQuery (query - збережений запит)
+TARGET_KINDS = ("site", "group", "tag", "query")
+
+
+def device_from_row(row):
+    return {
+        "id": row.id,
+        "name": row.name,
+        "host": row.host,
+        "user": row.username,
+        "password": row.password,
+        "installed_version": row.installed_version,
+        "latest_version": row.latest_version,
+        "backup_status": row.backup_status,
+        "backup_status_final": row.backup_status_final,
+        "routerboard_firmware": row.routerboard_firmware,
+        "needs_update": bool(row.needs_update),
+        "site_id": row.site_id
+    }
+
+
+def _like_prefix(text):
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("[", "\\[")
+    return escaped + "%"
+
+
+class InventoryQuery:
+    """
+    Фільтр і сортування таблиці пристроїв.
+    search - початок назви або хоста (LIKE 'x%' використовує індекси IX_MikroTikDevices_Name/_Host),
+    status - backup_status_final або STATUS_UNKNOWN, needs_update - True/False/None (без фільтра),
+    site - назва сайту (разом з дочірніми), group / tag - назва групи чи тегу.
+    За замовчуванням зверху пристрої, що потребують оновлення або перевірки версій.
+    """
+    FILTER_FIELDS = ("search", "status", "needs_update", "site", "group", "tag")
+
+    def __init__(self, search=None, status=None, needs_update=None, sort="needs_update", descending=True,
+                 site=None, group=None, tag=None):
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Невідоме поле сортування: {sort}")
+        self.search = (search or "").strip() or None
+        self.status = status or None
+        self.needs_update = needs_update
+        self.sort = sort
+        self.descending = descending
+        self.site = site or None
+        self.group = group or None
+        self.tag = tag or None
+
+    @property
+    def is_default(self):
+        return all(getattr(self, field) is None for field in self.FILTER_FIELDS) and \
+            (self.sort, self.descending) == ("needs_update", True)
+
+    def to_dict(self):
+        """Фільтр для SavedQueries.definition (без сортування)."""
+        return {field: getattr(self, field) for field in self.FILTER_FIELDS if getattr(self, field) is not None}
+
+    @classmethod
+    def from_dict(cls, definition):
+        unknown = set(definition) - set(cls.FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Невідомі поля збереженого запиту: {', '.join(sorted(unknown))}")
+        return cls(**definition)
+
+    def combined(self, other):
+        """Фільтри self, доповнені (і перекриті) заданими фільтрами other; сортування - з other."""
+        return InventoryQuery(sort=other.sort, descending=other.descending, **{**self.to_dict(), **other.to_dict()})
+
+    def where(self):
+        """(" WHERE ...", параметри) або ("", [])."""
+        clauses, params = [], []
+        if self.search:
+            pattern = _like_prefix(self.search)
+            clauses.append("([name] LIKE ? ESCAPE '\\' OR [host] LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        if self.status == STATUS_UNKNOWN:
+            clauses.append("([backup_status_final] IS NULL OR [backup_status_final] = '')")
+        elif self.status:
+            clauses.append("[backup_status_final] = ?")
+            params.append(self.status)
+        if self.needs_update is not None:
+            clauses.append("[needs_update] = ?")
+            params.append(1 if self.needs_update else 0)
+        if self.site:
+            # Сайт разом з усіма дочірніми (рекурсивний CTE у [dbo].[SiteSubtree])
+            clauses.append("[site_id] IN (SELECT [id] FROM [ManagerMikrotik].[dbo].[SiteSubtree](?))")
+            params.append(self.site)
+        for kind, name in (("group", self.group), ("tag", self.tag)):
+            if name:
+                clauses.append(f"EXISTS (SELECT 1 FROM {MEMBERS_TABLE} AS m JOIN {GROUPS_TABLE} AS g ON g.[id] = m.[group_id] "
+                               f"WHERE m.[device_id] = [MikroTikDevices].[id] AND g.[kind] = '{kind}' AND g.[name] = ?)")
+                params.append(name)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def order_by(self):
+        # [id] останнім - однозначний порядок, інакше сторінки OFFSET можуть перекриватися
+        tiebreak = "" if self.sort == "name" else ", [name]"
+        return f" ORDER BY {SORT_COLUMNS[self.sort]} {'DESC' if self.descending else 'ASC'}{tiebreak}, [id]"
+
+
+def fetch_page(cursor, query, offset=0, limit=PAGE_SIZE, with_total=False):
+    """
+    (пристрої, кількість за фільтром). Кількість рахується лише з with_total - другим набором результатів
+    того самого пакета, для наступних сторінок повертається None.
+    """
+    where, params = query.where()
+    sql = (f"SELECT {DEVICE_COLUMNS} FROM {DEVICES_TABLE}{where}{query.order_by()} "
+           f"OFFSET ? ROWS FETCH NEXT ? ROWS ONLY;")
+    params = params + [offset, limit]
+    if with_total:
+        sql = f"SET NOCOUNT ON; {sql} SELECT COUNT(*) FROM {DEVICES_TABLE}{where};"
+        params = params + query.where()[1]
+    cursor.execute(sql, *params)
+    devices = [device_from_row(row) for row in cursor.fetchall()]
+    total = None
+    if with_total and cursor.nextset():
+        total = cursor.fetchone()[0]
+    return devices, total
+
+
+def load_page(conn_str, query, offset=0, limit=PAGE_SIZE, with_total=False, target=None, timeout=30):
+    """Сторінка за фільтром query; з target - у межах цілі (сайт, група, тег, збережений запит)."""
+    if pyodbc is None:
+        raise ImportError("pyodbc не встановлено")
+    with pyodbc.connect(conn_str, timeout=timeout) as conn:
+        cursor = conn.cursor()
+        if target:
+            query = resolve_target(cursor, target).combined(query)
+        return fetch_page(cursor, query, offset, limit, with_total)
+
+
+def parse_target(text):
+    """'site:Київ' -> ('site', 'Київ'). Без префікса - збережений запит."""
+    kind, sep, name = text.partition(':')
+    if not sep:
+        return "query", text.strip()
+    kind = kind.strip().lower()
+    if kind not in TARGET_KINDS or not name.strip():
+        raise ValueError(f"Невідома ціль '{text}': очікується {', '.join(kind + ':<назва>' for kind in TARGET_KINDS)}")
+    return kind, name.strip()
+
+
+def resolve_target(cursor, target):
+    """InventoryQuery для цілі задачі; збережений запит читається з SavedQueries."""
+    kind, name = parse_target(target)
+    if kind != "query":
+        return InventoryQuery(**{kind: name})
+    cursor.execute(f"SELECT [definition] FROM {SAVED_QUERIES_TABLE} WHERE [name] = ?", name)
+    row = cursor.fetchone()
+    if not row:
+        raise ValueError(f"Збережений запит '{name}' не знайдено")
+    return InventoryQuery.from_dict(json.loads(row.definition))
+
+
+def fetch_devices(cursor, query):
+    """Усі пристрої за фільтром (для запуску задачі) - без посторінкової вибірки."""
+    where, params = query.where()
+    cursor.execute(f"SELECT {DEVICE_COLUMNS} FROM {DEVICES_TABLE}{where}{query.order_by()}", *params)
+    return [device_from_row(row) for row in cursor.fetchall()]
+
+
+def fetch_ids(cursor, query):
+    where, params = query.where()
+    cursor.execute(f"SELECT [id] FROM {DEVICES_TABLE}{where}", *params)
+    return {row[0] for row in cursor.fetchall()}
+
+
+def load_target_devices(conn_str, target, timeout=30):
+    if pyodbc is None:
+        raise ImportError("pyodbc не встановлено")
+    with pyodbc.connect(conn_str, timeout=timeout) as conn:
+        cursor = conn.cursor()
+        return fetch_devices(cursor, resolve_target(cursor, target))
+
+
+def save_query(cursor, name, query):
+    """Створює або замінює збережений запит name."""
+    definition = json.dumps(query.to_dict(), ensure_ascii=False)
+    cursor.execute(f"""
+        MERGE {SAVED_QUERIES_TABLE} AS target
+        USING (SELECT ? AS [name], ? AS [definition]) AS source ON target.[name] = source.[name]
+        WHEN MATCHED THEN UPDATE SET [definition] = source.[definition], [updated_at] = SYSDATETIME()
+        WHEN NOT MATCHED THEN INSERT ([name], [definition]) VALUES (source.[name], source.[definition]);
+    """, name, definition)
+
+
+# Три набори результатів: сайти, групи/теги, збережені запити (також частина пакета settings_store)
+TARGETS_SQL = f"""
+SELECT [name] FROM {SITES_TABLE} ORDER BY [name];
+SELECT [kind], [name] FROM {GROUPS_TABLE} ORDER BY [kind], [name];
+SELECT [name] FROM {SAVED_QUERIES_TABLE} ORDER BY [name];
+"""
+
+
+def read_targets(cursor):
+    """Список цілей для вибору в GUI: [(ціль, підпис)] з поточного набору результатів TARGETS_SQL і двох наступних."""
+    targets = [(f"site:{row.name}", f"Сайт: {row.name}") for row in cursor.fetchall()]
+    cursor.nextset()
+    targets += [(f"{row.kind}:{row.name}", f"{'Тег' if row.kind == 'tag' else 'Група'}: {row.name}")
+                for row in cursor.fetchall()]
+    cursor.nextset()
+    targets += [(f"query:{row.name}", f"Запит: {row.name}") for row in cursor.fetchall()]
+    return targets
+
+
+def fetch_targets(cursor):
+    cursor.execute("SET NOCOUNT ON;" + TARGETS_SQL)
+    return read_targets(cursor)
+
+
+def fetch_site_limits(cursor):
+    cursor.execute(f"SELECT [id], [parent_id], [max_concurrency] FROM {SITES_TABLE}")
+    rows = cursor.fetchall()
+    return SiteLimits({row.id: row.max_concurrency for row in rows if row.max_concurrency},
+                      {row.id: row.parent_id for row in rows})
+
+
+def load_site_limits(conn_str, timeout=30):
+    """SiteLimits з таблиці Sites або None, якщо ліміти не задані чи БД недоступна (без обмежень за сайтами)."""
+    if pyodbc is None or not conn_str:
+        return None
+    try:
+        with pyodbc.connect(conn_str, timeout=timeout) as conn:
+            limits = fetch_site_limits(conn.cursor())
+    except pyodbc.Error as e:
+        print(f"Не вдалося завантажити ліміти сайтів: {str(e)[:200]}")
+        return None
+    return limits if limits else None
+
+
+def fetch_site_bandwidth(cursor):
+    """({id сайту: кбіт/с}, {id сайту: id батьківського}) з Sites.bandwidth_kbps для throttle.py."""
+    cursor.execute(f"SELECT [id], [parent_id], [bandwidth_kbps] FROM {SITES_TABLE}")
+    rows = cursor.fetchall()
+    return {row.id: row.bandwidth_kbps for row in rows if row.bandwidth_kbps}, {row.id: row.parent_id for row in rows}
+
+
+def load_site_bandwidth(conn_str, timeout=30):
+    """Як load_site_limits: без БД або при помилці - ({}, {}), тобто лише ліміти з config.json."""
+    if pyodbc is None or not conn_str:
+        return {}, {}
+    try:
+        with pyodbc.connect(conn_str, timeout=timeout) as conn:
+            return fetch_site_bandwidth(conn.cursor())
+    except pyodbc.Error as e:
+        print(f"Не вдалося завантажити ліміти швидкості сайтів: {str(e)[:200]}")
+        return {}, {}
@@ -0,0 +1,120 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from export_diff import BACKUP_DIR
+
+JOURNAL_FILE = "job_journal.sqlite"
+
+# Етапи обробки пристрою в порядку виконання (плюс "failed" для помилок)
+BACKUP_STAGES = ("connected", "created", "downloaded", "uploaded", "done")
+UPGRADE_STAGES = ("checked", "install_sent", "done")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    job_type TEXT NOT NULL,
+    devices TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_runs_type_status ON runs (job_type, status);
+CREATE TABLE IF NOT EXISTS device_stages (
+    run_id INTEGER NOT NULL,
+    device_key TEXT NOT NULL,
+    device_name TEXT,
+    stage TEXT NOT NULL,
+    data TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, device_key)
+);
+CREATE TABLE IF NOT EXISTS stage_log (
+    run_id INTEGER NOT NULL,
+    device_key TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    at TEXT NOT NULL
+);
+"""
+
+
+def device_key(mikrotik):
+    return str(mikrotik['id']) if mikrotik.get('id') is not None else mikrotik['host']
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class JobJournal:
+    """
+    Журнал запусків у локальній SQLite (WAL): кожен перехід пристрою між етапами
+    фіксується одразу, тож після закриття програми чи перезавантаження ПК запуск
+    можна продовжити - завершені пристрої пропускаються, незавершені починаються
+    з останнього успішного етапу.
+    """
+
+    def __init__(self, backup_dir=BACKUP_DIR):
+        os.makedirs(backup_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(backup_dir, JOURNAL_FILE), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def start_run(self, job_type, devices):
+        with self._lock, self._conn:
+            # Новий запуск замінює незавершені попередні того ж типу
+            self._conn.execute("UPDATE runs SET status = 'abandoned' WHERE job_type = ? AND status = 'running'",
+                               (job_type,))
+            cursor = self._conn.execute(
+                "INSERT INTO runs (job_type, devices, started_at, status) VALUES (?, ?, ?, 'running')",
+                (job_type, json.dumps([device_key(mikrotik) for mikrotik in devices]), _now()))
+            return cursor.lastrowid
+
+    def record(self, run_id, mikrotik, stage, **data):
+        key = device_key(mikrotik)
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO device_stages (run_id, device_key, device_name, stage, data, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (run_id, device_key) DO UPDATE SET stage = excluded.stage, data = excluded.data,
+                    updated_at = excluded.updated_at
+            """, (run_id, key, mikrotik.get('name'), stage, json.dumps(data, ensure_ascii=False), now))
+            self._conn.execute("INSERT INTO stage_log (run_id, device_key, stage, at) VALUES (?, ?, ?, ?)",
+                               (run_id, key, stage, now))
+
+    def device_states(self, run_id):
+        """{device_key: (етап, дані)} для всіх пристроїв запуску."""
+        with self._lock:
+            rows = self._conn.execute("SELECT device_key, stage, data FROM device_stages WHERE run_id = ?",
+                                      (run_id,)).fetchall()
+        return {key: (stage, json.loads(data) if data else {}) for key, stage, data in rows}
+
+    def finish_run(self, run_id, status="finished"):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE runs SET status = ?, finished_at = ? WHERE id = ?", (status, _now(), run_id))
+
+    def last_unfinished_run(self, job_type):
+        """Повертає (run_id, [device_key], час старту) останнього незавершеного запуску або None."""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT id, devices, started_at FROM runs
+                WHERE job_type = ? AND status = 'running'
+                ORDER BY id DESC LIMIT 1
+            """, (job_type,)).fetchone()
+        if not row:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def pending_devices(self, run_id, devices):
+        """Пристрої запуску, які ще не завершені (failed повторюються)."""
+        states = self.device_states(run_id)
+        return [mikrotik for mikrotik in devices if states.get(device_key(mikrotik), (None,))[0] != "done"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
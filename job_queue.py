@@ -0,0 +1,463 @@
+import os
+import sys
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import mikrotik_ops
+from connection_pool import SessionPool
+from scheduler_daemon import CONFIG_FILE, JOBS, load_config, load_inventory, update_device_status
+from device_events import FAILED, OK, track
+from inventory import DEVICES_TABLE, resolve_target
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+SQLITE_QUEUE_FILE = "./job_queue.sqlite"
+DEFAULT_LEASE_SECONDS = 300
+POLL_INTERVAL = 5  # Пауза між спробами забрати задачі, коли черга порожня
+QUEUE_DEPTH_INTERVAL = 30  # Як часто оновлювати метрику глибини черги (запит до БД)
+
+
+def _device_from_row(row):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "host": row[2],
+        "user": row[3],
+        "password": row[4],
+    }
+
+
+class SqlServerQueue:
+    """
+    Черга задач у таблиці [ManagerMikrotik].[dbo].[JobQueue].
+    Кілька воркерів на різних машинах забирають задачі атомарно: UPDLOCK блокує
+    вибрані рядки до кінця транзакції, READPAST пропускає рядки, які вже забирає
+    інший воркер, тож вони не чекають один на одного і не отримують ту саму задачу.
+    Задача видається в оренду (lease) на lease_seconds; живий воркер продовжує оренду
+    heartbeat'ом, а задачі мертвого воркера після закінчення оренди забирають інші.
+    """
+
+    def __init__(self, conn_str):
+        if pyodbc is None:
+            raise RuntimeError("Для черги в SQL Server потрібен pyodbc")
+        self.conn_str = conn_str
+
+    def _connect(self):
+        return pyodbc.connect(self.conn_str, timeout=30)
+
+    def enqueue(self, job_type, device_ids=None, max_attempts=3, target=None):
+        with closing(self._connect()) as conn:
+            cursor = conn.cursor()
+            if target:
+                # Ціль (сайт, група, тег, збережений запит) розкривається в набір id на сервері, одним INSERT ... SELECT
+                where, params = resolve_target(cursor, target).where()
+                cursor.execute(f"""
+                    INSERT INTO [ManagerMikrotik].[dbo].[JobQueue] ([job_type], [device_id], [max_attempts])
+                    SELECT ?, d.[id], ? FROM [ManagerMikrotik].[dbo].[MikroTikDevices] d
+                    WHERE d.[id] IN (SELECT [id] FROM {DEVICES_TABLE}{where}) AND NOT EXISTS (
+                        SELECT 1 FROM [ManagerMikrotik].[dbo].[JobQueue] q
+                        WHERE q.[device_id] = d.[id] AND q.[job_type] = ? AND q.[status] IN ('pending', 'leased'))
+                """, job_type, max_attempts, *params, job_type)
+                count = cursor.rowcount
+            elif device_ids is None:
+                # Усі пристрої, для яких ще немає незавершеної задачі цього типу
+                cursor.execute("""
+                    INSERT INTO [ManagerMikrotik].[dbo].[JobQueue] ([job_type], [device_id], [max_attempts])
+                    SELECT ?, d.[id], ? FROM [ManagerMikrotik].[dbo].[MikroTikDevices] d
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM [ManagerMikrotik].[dbo].[JobQueue] q
+                        WHERE q.[device_id] = d.[id] AND q.[job_type] = ? AND q.[status] IN ('pending', 'leased'))
+                """, job_type, max_attempts, job_type)
+                count = cursor.rowcount
+            else:
+                cursor.fast_executemany = True
+                cursor.executemany("""
+                    INSERT INTO [ManagerMikrotik].[dbo].[JobQueue] ([job_type], [device_id], [max_attempts])
+                    VALUES (?, ?, ?)
+                """, [(job_type, device_id, max_attempts) for device_id in device_ids])
+                count = len(device_ids)
+            conn.commit()
+        return count
+
+    def claim(self, worker_id, limit, lease_seconds=DEFAULT_LEASE_SECONDS):
+        with closing(self._connect()) as conn:
+            cursor = conn.cursor()
+            # Задачі з простроченою орендою, які вичерпали спроби, більше не видаються
+            cursor.execute("""
+                UPDATE [ManagerMikrotik].[dbo].[JobQueue] WITH (READPAST)
+                SET [status] = 'failed', [result] = N'Оренда прострочена, спроби вичерпано',
+                    [updated_at] = SYSUTCDATETIME()
+                WHERE [status] = 'leased' AND [lease_expires_at] < SYSUTCDATETIME() AND [attempts] >= [max_attempts]
+            """)
+            cursor.execute("""
+                WITH next_jobs AS (
+                    SELECT TOP (?) * FROM [ManagerMikrotik].[dbo].[JobQueue] WITH (UPDLOCK, READPAST, ROWLOCK)
+                    WHERE [status] = 'pending'
+                       OR ([status] = 'leased' AND [lease_expires_at] < SYSUTCDATETIME())
+                    ORDER BY [id]
+                )
+                UPDATE next_jobs
+                SET [status] = 'leased', [worker_id] = ?, [attempts] = [attempts] + 1,
+                    [lease_expires_at] = DATEADD(SECOND, ?, SYSUTCDATETIME()), [updated_at] = SYSUTCDATETIME()
+                OUTPUT inserted.[id], inserted.[job_type], inserted.[device_id], inserted.[attempts]
+            """, limit, worker_id, lease_seconds)
+            claimed = cursor.fetchall()
+            conn.commit()
+
+            if not claimed:
+                return []
+            device_ids = sorted({row[2] for row in claimed})
+            placeholders = ", ".join("?" * len(device_ids))
+            cursor.execute(f"""
+                SELECT [id], [name], [host], [username], [password]
+                FROM [ManagerMikrotik].[dbo].[MikroTikDevices] WHERE [id] IN ({placeholders})
+            """, *device_ids)
+            devices = {row[0]: _device_from_row(row) for row in cursor.fetchall()}
+        return [{"id": row[0], "job_type": row[1], "device": devices.get(row[2]), "attempts": row[3]}
+                for row in claimed]
+
+    def heartbeat(self, worker_id, job_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" * len(job_ids))
+        with closing(self._connect()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE [ManagerMikrotik].[dbo].[JobQueue]
+                SET [lease_expires_at] = DATEADD(SECOND, ?, SYSUTCDATETIME()), [updated_at] = SYSUTCDATETIME()
+                WHERE [worker_id] = ? AND [status] = 'leased' AND [id] IN ({placeholders})
+            """, lease_seconds, worker_id, *job_ids)
+            conn.commit()
+
+    def complete(self, worker_id, job_id, ok, result):
+        with closing(self._connect()) as conn:
+            cursor = conn.cursor()
+            # Невдалу задачу повертаємо в чергу, поки не вичерпано спроби
+            cursor.execute("""
+                UPDATE [ManagerMikrotik].[dbo].[JobQueue]
+                SET [status] = CASE WHEN ? = 1 THEN 'done'
+                                    WHEN [attempts] < [max_attempts] THEN 'pending'
+                                    ELSE 'failed' END,
+                    [result] = ?, [lease_expires_at] = NULL, [updated_at] = SYSUTCDATETIME()
+                WHERE [id] = ? AND [worker_id] = ?
+            """, 1 if ok else 0, result[:400], job_id, worker_id)
+            conn.commit()
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT [status], COUNT(*) FROM [ManagerMikrotik].[dbo].[JobQueue] GROUP BY [status]")
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+class SqliteQueue:
+    """
+    Локальна заміна SqlServerQueue для тестів і одного ПК: та сама семантика оренди,
+    атомарність забезпечує BEGIN IMMEDIATE (SQLite блокує запис на час транзакції).
+    Пристрої для тестів зберігаються в таблиці devices того ж файлу.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS devices (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        host TEXT NOT NULL,
+        username TEXT,
+        password TEXT
+    );
+    CREATE TABLE IF NOT EXISTS job_queue (
+        id INTEGER PRIMARY KEY,
+        job_type TEXT NOT NULL,
+        device_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        worker_id TEXT,
+        lease_expires_at REAL,
+        enqueued_at REAL NOT NULL,
+        updated_at REAL,
+        result TEXT
+    );
+    CREATE INDEX IF NOT EXISTS ix_job_queue_claim ON job_queue (status, lease_expires_at);
+    """
+
+    def __init__(self, path=SQLITE_QUEUE_FILE):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def add_device(self, name, host, user, password):
+        with closing(self._connect()) as conn:
+            return conn.execute("INSERT INTO devices (name, host, username, password) VALUES (?, ?, ?, ?)",
+                                (name, host, user, password)).lastrowid
+
+    def enqueue(self, job_type, device_ids=None, max_attempts=3, target=None):
+        if target:
+            raise RuntimeError("Цілі (--target) підтримуються лише для черги в SQL Server")
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if device_ids is None:
+                device_ids = [row[0] for row in conn.execute("""
+                    SELECT d.id FROM devices d WHERE NOT EXISTS (
+                        SELECT 1 FROM job_queue q
+                        WHERE q.device_id = d.id AND q.job_type = ? AND q.status IN ('pending', 'leased'))
+                """, (job_type,))]
+            now = time.time()
+            conn.executemany("INSERT INTO job_queue (job_type, device_id, max_attempts, enqueued_at) VALUES (?, ?, ?, ?)",
+                             [(job_type, device_id, max_attempts, now) for device_id in device_ids])
+            conn.execute("COMMIT")
+            return len(device_ids)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim(self, worker_id, limit, lease_seconds=DEFAULT_LEASE_SECONDS):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            conn.execute("""
+                UPDATE job_queue SET status = 'failed', result = 'Оренда прострочена, спроби вичерпано', updated_at = ?
+                WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= max_attempts
+            """, (now, now))
+            rows = conn.execute("""
+                SELECT id, job_type, device_id, attempts FROM job_queue
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires_at < ?)
+                ORDER BY id LIMIT ?
+            """, (now, limit)).fetchall()
+            conn.executemany("""
+                UPDATE job_queue SET status = 'leased', worker_id = ?, attempts = attempts + 1,
+                    lease_expires_at = ?, updated_at = ?
+                WHERE id = ?
+            """, [(worker_id, now + lease_seconds, now, row[0]) for row in rows])
+            devices = {}
+            if rows:
+                device_ids = sorted({row[2] for row in rows})
+                placeholders = ", ".join("?" * len(device_ids))
+                devices = {row[0]: _device_from_row(row) for row in conn.execute(
+                    f"SELECT id, name, host, username, password FROM devices WHERE id IN ({placeholders})", device_ids)}
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return [{"id": row[0], "job_type": row[1], "device": devices.get(row[2]), "attempts": row[3] + 1}
+                for row in rows]
+
+    def heartbeat(self, worker_id, job_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if not job_ids:
+            return
+        now = time.time()
+        placeholders = ", ".join("?" * len(job_ids))
+        with closing(self._connect()) as conn:
+            conn.execute(f"""
+                UPDATE job_queue SET lease_expires_at = ?, updated_at = ?
+                WHERE worker_id = ? AND status = 'leased' AND id IN ({placeholders})
+            """, (now + lease_seconds, now, worker_id, *job_ids))
+
+    def complete(self, worker_id, job_id, ok, result):
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                UPDATE job_queue
+                SET status = CASE WHEN ? = 1 THEN 'done'
+                                  WHEN attempts < max_attempts THEN 'pending'
+                                  ELSE 'failed' END,
+                    result = ?, lease_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND worker_id = ?
+            """, (1 if ok else 0, result[:400], time.time(), job_id, worker_id))
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM job_queue GROUP BY status").fetchall())
+
+
+class WorkerContext:
+    """Те, що задачам із scheduler_daemon.JOBS потрібно від запуску: пул з'єднань, FTP, Telegram, БД."""
+
+    def __init__(self, pool, telegram_token, ftp_config, conn_str):
+        self.pool = pool
+        self.telegram_token = telegram_token
+        self.ftp_config = ftp_config
+        self.conn_str = conn_str
+
+    def notify(self, message):
+        print(message)
+        if self.telegram_token:
+            mikrotik_ops.send_telegram_message_async(self.telegram_token, message)
+
+
+class QueueWorker:
+    """Безголовий воркер: забирає задачі з черги, виконує їх паралельно і продовжує оренду."""
+
+    def __init__(self, queue, context, worker_id=None, concurrency=8, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.queue = queue
+        self.context = context
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.stop_event = threading.Event()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(concurrency)
+
+    def _heartbeat_loop(self):
+        while not self.stop_event.wait(self.lease_seconds / 3):
+            with self._lock:
+                job_ids = list(self._in_flight)
+            try:
+                self.queue.heartbeat(self.worker_id, job_ids, self.lease_seconds)
+            except Exception as e:
+                print(f"Помилка heartbeat для задач {job_ids}: {str(e)}")
+
+    def _queue_depth_loop(self):
+        while not self.stop_event.wait(QUEUE_DEPTH_INTERVAL):
+            try:
+                metrics.QUEUE_DEPTH_VALUE.set(self.queue.stats().get('pending', 0))
+            except Exception as e:
+                print(f"Помилка отримання глибини черги: {str(e)}")
+
+    def _execute(self, job):
+        mikrotik = job["device"]
+        if metrics.ENABLED:
+            metrics.IN_FLIGHT_VALUE.inc()
+        ok = False
+        try:
+            if mikrotik is None:
+                ok, status = False, f"Пристрій для задачі #{job['id']} не знайдено"
+            else:
+                with track(job["job_type"], mikrotik) as tracker:
+                    try:
+                        ok, status = JOBS[job["job_type"]](self.context, mikrotik)
+                    except Exception as e:
+                        ok, status = False, f"Помилка обробки {mikrotik['name']} ({mikrotik['host']}): {str(e)}"[:200]
+                    print(f"[{self.worker_id}] #{job['id']} {job['job_type']} {mikrotik['name']}: {status}")
+                    update_device_status(self.context.conn_str, mikrotik['id'], status, "OK" if ok else "Error")
+                    tracker.finish(OK if ok else FAILED, status)
+            self.queue.complete(self.worker_id, job["id"], ok, status or "")
+        except Exception as e:
+            print(f"Помилка завершення задачі #{job['id']}: {str(e)}")
+        finally:
+            if metrics.ENABLED:
+                metrics.IN_FLIGHT_VALUE.dec()
+            with self._lock:
+                self._in_flight.discard(job["id"])
+            self._slots.release()
+
+    def run(self, exit_when_empty=False):
+        print(f"Воркер {self.worker_id} запущено (паралельність {self.concurrency}, оренда {self.lease_seconds} с)")
+        heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeat.start()
+        if metrics.ENABLED:
+            threading.Thread(target=self._queue_depth_loop, daemon=True).start()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not self.stop_event.is_set():
+                self._slots.acquire()
+                free = 1
+                while free < self.concurrency and self._slots.acquire(blocking=False):
+                    free += 1
+                try:
+                    jobs = self.queue.claim(self.worker_id, free, self.lease_seconds)
+                except Exception as e:
+                    print(f"Помилка отримання задач з черги: {str(e)}")
+                    jobs = []
+                for _ in range(free - len(jobs)):
+                    self._slots.release()
+                if not jobs:
+                    with self._lock:
+                        idle = not self._in_flight
+                    if exit_when_empty and idle:
+                        break
+                    self.stop_event.wait(POLL_INTERVAL)
+                    continue
+                with self._lock:
+                    self._in_flight.update(job["id"] for job in jobs)
+                for job in jobs:
+                    executor.submit(self._execute, job)
+        self.stop_event.set()
+        self.context.pool.close_all()
+        print(f"Воркер {self.worker_id} зупинено")
+
+
+def open_queue(args, config):
+    if args.backend == "sqlite":
+        return SqliteQueue(args.sqlite_path)
+    conn_str = (config.get('database') or {}).get('conn_str')
+    if not conn_str:
+        raise SystemExit("У config.json не задано database.conn_str (або використайте --backend sqlite)")
+    return SqlServerQueue(conn_str)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Розподілена черга задач для кількох воркерів")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--backend", choices=("sqlserver", "sqlite"), default="sqlserver")
+    parser.add_argument("--sqlite-path", default=SQLITE_QUEUE_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help="Додати задачі в чергу")
+    enqueue.add_argument("job_type", choices=sorted(JOBS))
+    enqueue.add_argument("--device-id", type=int, nargs="*", help="Без параметра - усі пристрої")
+    enqueue.add_argument("--target", help="site:<назва>, group:<назва>, tag:<назва> або query:<збережений запит>")
+    enqueue.add_argument("--max-attempts", type=int, default=3)
+
+    worker = sub.add_parser("worker", help="Запустити воркер")
+    worker.add_argument("--worker-id")
+    worker.add_argument("--concurrency", type=int, default=8)
+    worker.add_argument("--lease", type=int, default=DEFAULT_LEASE_SECONDS, help="Тривалість оренди, с")
+    worker.add_argument("--exit-when-empty", action="store_true")
+    worker.add_argument("--metrics-port", type=int, help="Порт для /metrics (перекриває config.json)")
+
+    sub.add_parser("stats", help="Кількість задач за статусами")
+
+    add_device = sub.add_parser("add-device", help="Додати пристрій (лише --backend sqlite)")
+    add_device.add_argument("name")
+    add_device.add_argument("host")
+    add_device.add_argument("user")
+    add_device.add_argument("password")
+
+    args = parser.parse_args(argv)
+    config = load_config(args.config)
+    queue = open_queue(args, config)
+
+    if args.command == "enqueue":
+        count = queue.enqueue(args.job_type, args.device_id or None, args.max_attempts, args.target)
+        print(f"Додано задач '{args.job_type}': {count}")
+    elif args.command == "stats":
+        print(queue.stats())
+    elif args.command == "add-device":
+        if not isinstance(queue, SqliteQueue):
+            raise SystemExit("add-device доступний лише для --backend sqlite")
+        print(f"Додано пристрій з id {queue.add_device(args.name, args.host, args.user, args.password)}")
+    elif args.command == "worker":
+        metrics.start_from_config(config, args.metrics_port)
+        _, telegram_token, ftp_config, chat_ids, conn_str = load_inventory(config)
+        mikrotik_ops.CHAT_IDS[:] = chat_ids
+        context = WorkerContext(SessionPool(), telegram_token, ftp_config, conn_str)
+        queue_worker = QueueWorker(queue, context, args.worker_id, args.concurrency, args.lease)
+        try:
+            queue_worker.run(args.exit_when_empty)
+        except KeyboardInterrupt:
+            queue_worker.stop_event.set()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import sys
+import time
+import types
+import threading
+import importlib
+
+# Відкладений імпорт важких модулів (netmiko, paramiko, pyodbc, routeros_api, requests), щоб вікно входу
+# з'являлося з одним лише PyQt. Модуль імпортується при першому зверненні до атрибута або у фоні через preload().
+# PyInstaller не бачить таких імпортів - їх треба перелічити в hiddenimports (UI/myUi.spec).
+
+_modules = {}
+_lock = threading.Lock()
+# Час імпорту (секунди) і помилки фонового завантаження: назва -> значення
+import_times = {}
+import_errors = {}
+
+
+class LazyModule(types.ModuleType):
+    """Замінник модуля: справжній імпорт відбувається при першому зверненні до атрибута."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = self.__dict__["_module"] = _import(self.__name__)
+        return module
+
+    @property
+    def loaded(self):
+        return self.__dict__["_module"] is not None or self.__name__ in sys.modules
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self.__name__}' ({'завантажено' if self.loaded else 'не завантажено'})>"
+
+
+def _import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    started = time.perf_counter()
+    module = importlib.import_module(name)  # Має власне блокування - безпечно з кількох потоків
+    import_times.setdefault(name, time.perf_counter() - started)
+    return module
+
+
+def lazy(name):
+    """Повертає LazyModule для name (один екземпляр на назву)."""
+    with _lock:
+        module = _modules.get(name)
+        if module is None:
+            module = _modules[name] = LazyModule(name)
+        return module
+
+
+def preload(names, on_done=None):
+    """
+    Імпортує модулі у фоновому потоці, поки користувач заповнює форму входу.
+    Помилки не піднімаються: зберігаються в import_errors і повторяться при першому використанні.
+    on_done(помилки) викликається з фонового потоку.
+    """
+    def run():
+        for name in names:
+            try:
+                lazy(name)._load()
+            except Exception as e:
+                import_errors[name] = str(e)
+        if on_done:
+            on_done(dict(import_errors))
+
+    thread = threading.Thread(target=run, name="preload-modules", daemon=True)
+    thread.start()
+    return thread
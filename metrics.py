@@ -0,0 +1,254 @@
+import threading
+from bisect import bisect_left
+from itertools import product
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import stage_timing
+import device_events
+from concurrency import classify_error
+
+# Метрики для Prometheus (текстовий формат експозиції) на локальному /metrics.
+# Вимкнено за замовчуванням: місця виклику перевіряють metrics.ENABLED, а спостерігач етапів
+# реєструється лише в start_server(), тож без увімкнення метрики нічого не коштують.
+# Набори міток створюються заздалегідь, щоб на гарячому шляху не було алокацій.
+
+ENABLED = False
+
+JOB_TYPES = ("backup", "check", "upgrade")
+RESULTS = ("ok", "failed")
+FAILURE_REASONS = ("timeout", "auth", "error")
+PROTOCOLS = ("sftp", "ftp")
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+_registry_lock = threading.Lock()
+_server = None
+_unsubscribe = None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value", "labels")
+
+    def __init__(self, labels):
+        self._lock = threading.Lock()
+        self.value = 0
+        self.labels = labels
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "bounds", "counts", "sum", "labels", "bucket_labels")
+
+    def __init__(self, labels, bounds, bucket_labels):
+        self._lock = threading.Lock()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.labels = labels
+        self.bucket_labels = bucket_labels
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), labelsets=((),)):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        for values in labelsets:
+            self._children[tuple(values)] = self._create(tuple(values))
+        with _registry_lock:
+            _registry.append(self)
+
+    def _create(self, values):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            # Непередбачений набір міток: створюємо один раз
+            with _registry_lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._create(values)
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for child in list(self._children.values()):
+            lines.append(f"{self.name}{child.labels} {_format_value(child.value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _create(self, values):
+        return _CounterChild(_label_text(self.labelnames, values))
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _create(self, values):
+        return _GaugeChild(_label_text(self.labelnames, values))
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), labelsets=((),), buckets=DURATION_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, labelsets)
+
+    def _create(self, values):
+        bucket_labels = [_label_text(self.labelnames, values, f'le="{_format_value(bound)}"')
+                         for bound in self.buckets] + [_label_text(self.labelnames, values, 'le="+Inf"')]
+        return _HistogramChild(_label_text(self.labelnames, values), self.buckets, bucket_labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for child in list(self._children.values()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bucket_label, count in zip(child.bucket_labels, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{bucket_label} {cumulative}")
+            lines.append(f"{self.name}_sum{child.labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{child.labels} {cumulative}")
+        return lines
+
+
+DEVICES_PROCESSED = Counter("mikrotik_devices_processed_total", "Оброблені пристрої за типом задачі та результатом",
+                            ("job", "result"), product(JOB_TYPES, RESULTS))
+STAGE_FAILURES = Counter("mikrotik_stage_failures_total", "Помилки етапів за етапом і причиною",
+                         ("stage", "reason"), product(stage_timing.ALL_STAGES, FAILURE_REASONS))
+TRANSFER_BYTES = Counter("mikrotik_transfer_bytes_total", "Передані байти за протоколом",
+                         ("protocol",), [(protocol,) for protocol in PROTOCOLS])
+STAGE_DURATION = Histogram("mikrotik_stage_duration_seconds",
+                           "Тривалість етапів (зокрема telegram - відправка в Telegram, db - запис у БД)",
+                           ("stage",), [(stage,) for stage in stage_timing.ALL_STAGES])
+QUEUE_DEPTH = Gauge("mikrotik_queue_depth", "Пристрої, що очікують на обробку")
+IN_FLIGHT = Gauge("mikrotik_devices_in_flight", "Пристрої, що обробляються зараз")
+
+# Заздалегідь отримані дочірні метрики для гарячих шляхів
+SFTP_BYTES = TRANSFER_BYTES.labels("sftp")
+FTP_BYTES = TRANSFER_BYTES.labels("ftp")
+QUEUE_DEPTH_VALUE = QUEUE_DEPTH.labels()
+IN_FLIGHT_VALUE = IN_FLIGHT.labels()
+
+
+def device_processed(job_type, ok):
+    DEVICES_PROCESSED.labels(job_type, "ok" if ok else "failed").inc()
+
+
+def _on_device_event(event):
+    if event.final:
+        device_processed(event.job, event.status != device_events.FAILED)
+
+
+def _on_span(stage, seconds, error):
+    STAGE_DURATION.labels(stage).observe(seconds)
+    if error is not None:
+        STAGE_FAILURES.labels(stage, classify_error(error)).inc()
+
+
+def render():
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Не засмічуємо лог кожним запитом Prometheus
+
+
+def start_server(port, host="127.0.0.1"):
+    """Вмикає збір метрик і запускає HTTP /metrics у фоновому потоці."""
+    global ENABLED, _server, _unsubscribe
+    if _server is not None:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    if _on_span not in stage_timing.span_listeners:
+        stage_timing.span_listeners.append(_on_span)
+    _unsubscribe = device_events.bus.subscribe(_on_device_event)
+    ENABLED = True
+    print(f"Метрики Prometheus доступні на http://{host}:{port}/metrics")
+    return _server
+
+
+def start_from_config(config, port=None):
+    """Запускає /metrics, якщо задано port або в config.json "metrics": {"enabled": true}."""
+    metrics_config = config.get('metrics') or {}
+    if port is None and metrics_config.get('enabled'):
+        port = metrics_config.get('port', 9108)
+    if port:
+        start_server(int(port), metrics_config.get('host', "127.0.0.1"))
+
+
+def stop_server():
+    global ENABLED, _server, _unsubscribe
+    ENABLED = False
+    if _on_span in stage_timing.span_listeners:
+        stage_timing.span_listeners.remove(_on_span)
+    if _unsubscribe is not None:
+        _unsubscribe()
+        _unsubscribe = None
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,191 @@
+import os
+import time as time_module
+from datetime import datetime
+from contextlib import contextmanager
+import paramiko
+from netmiko import ConnectHandler, exceptions as netmiko_exceptions
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import ftp_upload
+import throttle
+from stage_timing import span
+from routeros_parsers import parse_routerboard, parse_update_check
+
+# Операції з пристроями, спільні для GUI (UI/myUi.py) і фонового планувальника (scheduler_daemon.py)
+
+BACKUP_DIR = "./BackUp/"
+CHAT_IDS = []  # Буде завантажено з бази або з chat_ids.json
+TELEGRAM_API_URL = "https://api.telegram.org"  # Змінюється на локальну адресу в симуляторі (fleet_sim.py)
+SSH_PORT = 22
+
+
+def netmiko_device(mikrotik):
+    return {
+        "device_type": "mikrotik_routeros",
+        "host": mikrotik['host'],
+        "username": mikrotik['user'] if 'user' in mikrotik and mikrotik['user'] else "admin",
+        # Типовий логін MikroTik
+        "password": mikrotik['password'] if 'password' in mikrotik and mikrotik['password'] else "",
+        # Типовий пароль (може бути порожнім або заданим)
+        "port": mikrotik.get('port') or SSH_PORT,  # Явно вказуємо порт (нестандартний - ключ "port" пристрою)
+        "timeout": 20,
+        "conn_timeout": 30  # Таймаут для з'єднання
+    }
+
+
+@contextmanager
+def ssh_session(mikrotik, pool=None):
+    """SSH-сесія з пулу (якщо переданий) або нове з'єднання, яке закривається після використання."""
+    if pool is not None:
+        with pool.ssh(mikrotik) as ssh_conn:
+            yield ssh_conn
+    else:
+        with ConnectHandler(**netmiko_device(mikrotik)) as ssh_conn:
+            yield ssh_conn
+
+
+def attempt_connection(mikrotik, max_retries=3, pool=None):
+    for attempt in range(1, max_retries + 1):
+        try:
+            device = netmiko_device(mikrotik)
+            print(f"Спроба {attempt} підключення до {mikrotik['host']} з логіном {device['username']} і паролем ****")
+            with span("ssh_connect"), ssh_session(mikrotik, pool):
+                print(f"Успішно підключено до {mikrotik['host']} з логіном {device['username']} і паролем ****")
+                return True
+        except netmiko_exceptions.NetmikoAuthenticationException as e:
+            print(f"Помилка автентифікації до {mikrotik['host']} (спроба {attempt}): {str(e)}")
+            if attempt < max_retries:
+                print(f"Зачекайте 1 секунду перед повторною спробою для {mikrotik['host']}...")
+                time_module.sleep(1)
+            continue
+        except Exception as e:
+            print(f"Помилка підключення до {mikrotik['host']} (спроба {attempt}): {str(e)}")
+            if attempt < max_retries:
+                print(f"Зачекайте 1 секунду перед повторною спробою для {mikrotik['host']}...")
+                time_module.sleep(1)
+    print(f"Не вдалося підключитися до {mikrotik['host']} після {max_retries} спроб.")
+    return False
+
+
+def check_versions(mikrotik, pool=None):
+    try:
+        with span("check"), ssh_session(mikrotik, pool) as ssh_conn:
+            print(f"Успішно підключено до {mikrotik['host']} для перевірки версій")
+            output_package = ssh_conn.send_command('/system package update check-for-updates', delay_factor=2.0)
+            output_routerboard = ssh_conn.send_command('/system routerboard print', delay_factor=2.0)
+
+            installed_version, latest_version = parse_update_check(output_package)
+            return installed_version, latest_version, parse_routerboard(output_routerboard)
+    except Exception as e:
+        print(f"Помилка перевірки версій для {mikrotik['host']}: {str(e)}")
+        return None, None, None
+
+
+def create_backup(mikrotik, pool=None):
+    try:
+        backup_name = f"{mikrotik['name']}-Backup-{datetime.now().strftime('%Y%m%d-%H%M')}"
+
+        print(f"Підключення до {mikrotik['host']}...")
+        with ssh_session(mikrotik, pool) as ssh_conn:
+            print(f"Успішно підключено до {mikrotik['host']} для створення бекапу")
+            print(f"Підключено до {mikrotik['host']}. Створення бекапу...")
+            with span("backup_save"):
+                ssh_conn.send_command(f'/system backup save name={backup_name}', delay_factor=2.0)
+                time_module.sleep(3)
+            with span("export"):
+                ssh_conn.send_command(f'/export file={backup_name}', delay_factor=2.0)
+                time_module.sleep(1)
+        return backup_name, None
+    except Exception as e:
+        error_message = f"Помилка авторизації на #{mikrotik['name']} ({mikrotik['host']}): {str(e)}"[
+                        :200]  # Обмежуємо довжину до 200 символів
+        print(error_message)
+        return None, error_message
+
+
+def download_backup(mikrotik, backup_name):
+    try:
+        mikrotik_dir = os.path.join(BACKUP_DIR, mikrotik['name'])
+        os.makedirs(mikrotik_dir, exist_ok=True)
+
+        local_backup = os.path.join(mikrotik_dir, f"{backup_name}.backup")
+        local_rsc = os.path.join(mikrotik_dir, f"{backup_name}.rsc")
+
+        print(f"Завантаження бекапу з {mikrotik['host']}...")
+        with span("sftp"):
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh.connect(mikrotik['host'], username=mikrotik['user'], password=mikrotik['password'],
+                        port=mikrotik.get('port') or SSH_PORT, timeout=20)
+
+            sftp = ssh.open_sftp()
+            limiter = throttle.THROTTLE.limiter(mikrotik)
+            throttle.sftp_get(sftp, f"/{backup_name}.backup", local_backup, limiter)
+            time_module.sleep(3)
+            throttle.sftp_get(sftp, f"/{backup_name}.rsc", local_rsc, limiter)
+            time_module.sleep(1)
+            sftp.close()
+            ssh.close()
+        if metrics.ENABLED:
+            metrics.SFTP_BYTES.inc(os.path.getsize(local_backup) + os.path.getsize(local_rsc))
+
+        return local_backup, local_rsc, None
+    except Exception as e:
+        error_message = f"Помилка авторизації або завантаження на #{mikrotik['name']} ({mikrotik['host']}): {str(e)}"[
+                        :200]  # Обмежуємо довжину до 200 символів
+        print(error_message)
+        return None, None, error_message
+
+
+def upload_backup_to_ftp(local_file, backup_name, ftp_config, file_type='backup', mikrotik=None):
+    """mikrotik - пристрій, чий бекап вивантажується: його кошики обмеження швидкості (throttle.py)."""
+    try:
+        print(f"Завантаження на FTP {backup_name}...")
+        with span("ftp"):
+            # Докачування після обриву, перевірка розміру і контрольна сума <файл>.sha256 - ftp_upload.py
+            remote_dir = f"{ftp_config['dir']}/{backup_name.split('-')[0]}"
+            sent = ftp_upload.upload_file(ftp_config, local_file, remote_dir, f"{backup_name}.{file_type}",
+                                          throttle.THROTTLE.limiter(mikrotik))
+        if metrics.ENABLED:
+            metrics.FTP_BYTES.inc(sent)
+        return True, None
+    except Exception as e:
+        error_message = f"Помилка завантаження на FTP {backup_name}: {str(e)}"[
+                        :200]  # Обмежуємо довжину до 200 символів
+        print(error_message)
+        return False, error_message
+
+
+def send_telegram_message_async(token, message):
+    if not CHAT_IDS:
+        print("Не знайдено жодного chat_id для відправки повідомлення. Повідомлення не відправлено.")
+        return
+
+    url = f"{TELEGRAM_API_URL}/bot{token}/sendMessage"
+    successes = 0
+    failures = 0
+
+    for chat_id in CHAT_IDS:
+        try:
+            with span("telegram"), ThreadPoolExecutor(max_workers=1) as executor:
+                cleaned_message = message.replace('*', '').replace('_', '').strip()
+                future = executor.submit(requests.get, url, params={'chat_id': chat_id, 'text': cleaned_message},
+                                         timeout=15)
+                response = future.result(timeout=20)
+                print(f"Telegram API відповідь для chat_id {chat_id}: {response.status_code}, {response.text}")
+                if response.status_code == 200 and response.json().get('ok'):
+                    successes += 1
+                else:
+                    failures += 1
+                    print(f"Помилка відправки повідомлення до chat_id {chat_id}: {response.text}")
+        except requests.RequestException as e:
+            failures += 1
+            print(f"Мережева помилка відправки до chat_id {chat_id}: {str(e)}")
+        except Exception as e:
+            failures += 1
+            print(f"Невідома помилка відправки до chat_id {chat_id}: {str(e)}")
+        time_module.sleep(0.5)  # Затримка між відправками для уникнення лімітів Telegram
+
+    print(f"Успішно надіслано повідомлення: {successes}, невдало: {failures}")
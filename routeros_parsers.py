@@ -0,0 +1,171 @@
+import re
+from datetime import datetime
+from functools import lru_cache, total_ordering
+
+# Спільні розбирачі виводу RouterOS і рядків версій. Регулярні вирази компілюються один раз,
+# версії кешуються - на тисячах пристроїв ті самі рядки ("7.15.3", "6.49.10") повторюються постійно.
+
+# Рядок `print` у форматі "   installed-version: 7.15.3"; значення може містити двокрапку (час, MAC)
+KEY_VALUE_RE = re.compile(r'^[ \t]*([A-Za-z][\w.-]*):[ \t]*(.*?)[ \t\r]*$', re.MULTILINE)
+# Пара з `print terse`: name=flash/x.rsc або comment="з пробілами"
+TERSE_PAIR_RE = re.compile(r'([\w.-]+)=("[^"]*"|\S*)')
+# Рядки terse завжди починаються з номера (" 0 name=..."), тож вистачає літерального ' name=' - це в рази швидше за \b
+TERSE_NAME_RE = re.compile(r' name=(\S+)')
+# Версія RouterOS: 7.15.3, 7.15rc2, 7.16beta4, 6.49.10 (long-term), v7.1
+VERSION_RE = re.compile(r'(\d+(?:\.\d+)*)(?:[ \t]*(alpha|beta|rc)[ \t]*(\d*))?', re.IGNORECASE)
+# Файли, які створюють наші скрипти: <назва>-Backup-YYYYMMDD-HHMM.backup / .rsc
+BACKUP_FILE_RE = re.compile(r'-Backup-(\d{4})(\d{2})(\d{2})-(\d{2})(\d{2})\.(backup|rsc)$')
+
+# Порядок каналів випуску в межах однієї версії: 7.15alpha1 < 7.15beta2 < 7.15rc1 < 7.15
+CHANNEL_RANK = {"alpha": 0, "beta": 1, "rc": 2, "": 3}
+
+
+@total_ordering
+class RouterOSVersion:
+    """
+    Порівнювана версія RouterOS з урахуванням каналу випуску.
+    Нулі в кінці не враховуються (7.15 == 7.15.0), передрелізи молодші за реліз (7.15rc2 < 7.15).
+    str() повертає вихідний рядок.
+    """
+    __slots__ = ("release", "channel", "pre", "text", "_key")
+
+    def __init__(self, release, channel="", pre=0, text=None):
+        self.release = tuple(release)
+        self.channel = channel.lower()
+        self.pre = pre
+        self.text = text if text is not None else self._format()
+        significant = list(self.release)
+        while len(significant) > 1 and significant[-1] == 0:
+            significant.pop()
+        self._key = (tuple(significant), CHANNEL_RANK[self.channel], pre)
+
+    def _format(self):
+        text = ".".join(map(str, self.release))
+        if self.channel:
+            text += f"{self.channel}{self.pre or ''}"
+        return text
+
+    @property
+    def is_stable(self):
+        return not self.channel
+
+    @property
+    def major(self):
+        return self.release[0]
+
+    def __eq__(self, other):
+        if not isinstance(other, RouterOSVersion):
+            return NotImplemented
+        return self._key == other._key
+
+    def __lt__(self, other):
+        if not isinstance(other, RouterOSVersion):
+            return NotImplemented
+        return self._key < other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"RouterOSVersion('{self.text}')"
+
+
+@lru_cache(maxsize=4096)
+def parse_version(text):
+    """RouterOSVersion з рядка ("7.15rc2", "7.15.3 (stable)") або None, якщо версії немає."""
+    if not text:
+        return None
+    match = VERSION_RE.search(str(text))
+    if not match:
+        return None
+    release = tuple(int(part) for part in match.group(1).split('.'))
+    return RouterOSVersion(release, match.group(2) or "", int(match.group(3) or 0), match.group(0).strip())
+
+
+def needs_update(installed, latest):
+    """True, якщо встановлена версія старша за доступну. Нерозпізнані версії - False."""
+    installed_version, latest_version = parse_version(installed), parse_version(latest)
+    return bool(installed_version and latest_version and installed_version < latest_version)
+
+
+def version_number(text):
+    """
+    Ключ версії одним числом - те саме, що обчислює [dbo].[RouterOSVersionKey] для стовпців
+    *_version_key у MikroTikDevices: major.minor.patch по три цифри, канал випуску, номер передрелізу.
+    7.15.3 -> 7015003003000, 7.15rc2 -> 7015000002002. Нерозпізнана версія - None.
+    """
+    version = parse_version(text)
+    if version is None:
+        return None
+    major, minor, patch = (min(part, 999) for part in (version.release + (0, 0, 0))[:3])
+    return (major * 10 ** 12 + minor * 10 ** 9 + patch * 10 ** 6 + CHANNEL_RANK[version.channel] * 1000
+            + min(version.pre, 999))
+
+
+def version_sort_key(text):
+    """Ключ сортування для рядків версій; нерозпізнані та порожні - на початку."""
+    version = parse_version(text)
+    return (0,) if version is None else (1,) + version._key
+
+
+def parse_print(output):
+    """Словник ключ -> значення з виводу `print` (перше входження ключа)."""
+    values = {}
+    for key, value in KEY_VALUE_RE.findall(output or ""):
+        values.setdefault(key, value)
+    return values
+
+
+def print_field(output, key):
+    """Значення одного ключа з виводу `print` без розбору решти рядків (str.find замість regex)."""
+    if not output:
+        return None
+    marker = key + ":"
+    start = output.find(marker)
+    # Ключ має стояти на початку рядка (після відступу), а не бути закінченням іншого ключа
+    while start > 0 and output[start - 1] not in " \t\n":
+        start = output.find(marker, start + 1)
+    if start < 0:
+        return None
+    end = output.find("\n", start)
+    value = output[start + len(marker):end if end >= 0 else len(output)].strip()
+    return value or None
+
+
+def parse_update_check(output):
+    """(installed-version, latest-version) з `/system package update check-for-updates`."""
+    return print_field(output, "installed-version"), print_field(output, "latest-version")
+
+
+def parse_routerboard(output):
+    """current-firmware з `/system routerboard print` або None."""
+    return print_field(output, "current-firmware")
+
+
+def parse_terse(output):
+    """Список словників з виводу `print terse` (по одному на рядок, лапки знімаються)."""
+    rows = []
+    for line in (output or "").splitlines():
+        row = {key: value[1:-1] if value.startswith('"') else value for key, value in TERSE_PAIR_RE.findall(line)}
+        if row:
+            rows.append(row)
+    return rows
+
+
+def terse_names(output):
+    """Лише імена (name=) з виводу `print terse` - одним проходом по всьому виводу."""
+    return TERSE_NAME_RE.findall(output or "")
+
+
+def backup_timestamp(file_name):
+    """Дата з імені <назва>-Backup-YYYYMMDD-HHMM.backup/.rsc або None."""
+    match = BACKUP_FILE_RE.search(file_name)
+    if not match:
+        return None
+    try:
+        return datetime(*map(int, match.group(1, 2, 3, 4, 5)))
+    except ValueError:
+        return None
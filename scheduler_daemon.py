@@ -0,0 +1,510 @@
+import sys
+import json
+import time
+import heapq
+import signal
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import mikrotik_ops
+import throttle
+from mikrotik_ops import BACKUP_DIR, attempt_connection, check_versions, create_backup, download_backup, \
+    upload_backup_to_ftp, send_telegram_message_async, ssh_session
+from connection_pool import SessionPool
+from backup_cleanup import delete_old_backups
+from export_diff import diff_export, format_summary
+from export_index import index_exports
+from compliance import evaluate_fleet, format_digest, save_findings
+from stage_timing import RunProfiler, bind, span
+from routeros_parsers import parse_update_check, parse_version
+from device_events import FAILED, OK, RunDigest, progress, track
+from settings_store import fetch_snapshot
+from inventory import fetch_devices, load_site_limits, resolve_target
+from health_poller import DEFAULT_INTERVAL as HEALTH_INTERVAL, DEFAULT_WORKERS as HEALTH_WORKERS, HealthPoller
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None  # Без pyodbc інвентар береться лише з config.json
+
+CONFIG_FILE = './config.json'
+CHAT_IDS_FILE = './chat_ids.json'
+SITE_RETRY_SECONDS = 1  # Через скільки повторити запуск пристрою, якщо ліміт його сайту зайнятий
+
+# Використовується, якщо в config.json немає секції "schedule"
+DEFAULT_SCHEDULE = {
+    "max_workers": 8,
+    "idle_timeout": 300,
+    "jobs": [
+        {"type": "backup", "cron": "0 2 * * *", "window_minutes": 120},
+        {"type": "check", "cron": "0 */6 * * *", "window_minutes": 30},
+    ]
+}
+
+
+class CronExpression:
+    """Стандартний 5-польовий cron: хвилина година день місяць день_тижня (0/7 - неділя)."""
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron-вираз має містити 5 полів: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.RANGES))
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/", 1)
+                step = int(step_text)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_text, end_text = part.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Некоректне поле cron: '{field}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt):
+        weekday = (dt.weekday() + 1) % 7  # У cron 0 - неділя
+        if self.any_day or self.any_weekday:
+            return (self.any_day or dt.day in self.days) and (self.any_weekday or weekday in self.weekdays)
+        return dt.day in self.days or weekday in self.weekdays  # Як у cron: або день місяця, або день тижня
+
+    def next_after(self, after):
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 4)
+        while dt < limit:
+            if dt.month not in self.months or not self._day_matches(dt):
+                dt = (dt + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if dt.hour not in self.hours:
+                dt = (dt + timedelta(hours=1)).replace(minute=0)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"Cron-вираз '{self.expression}' ніколи не спрацьовує")
+
+
+def load_config(path=CONFIG_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_chat_ids():
+    try:
+        with open(CHAT_IDS_FILE, 'r') as file:
+            return [str(chat_id) for chat_id in json.load(file)]
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def load_inventory(config, target=None):
+    """
+    Повертає (пристрої, telegram_token, ftp_config, chat_ids, conn_str).
+    Якщо в config.json задано "database": {"conn_str": ...}, інвентар і налаштування
+    читаються з бази ManagerMikrotik, інакше - з секцій mikrotiks/ftp/telegram_token.
+    target ("site:Київ", "group:core", "tag:lte", "query:<збережений запит>") вибирає пристрої на сервері.
+    """
+    conn_str = (config.get('database') or {}).get('conn_str')
+    if conn_str and pyodbc is not None:
+        with span("db"), pyodbc.connect(conn_str, timeout=30) as conn:
+            cursor = conn.cursor()
+            # Налаштування та інвентар одним пакетом запитів; для цілі пристрої вибираються окремим запитом
+            snapshot = fetch_snapshot(cursor, 0 if target else None)
+            devices = fetch_devices(cursor, resolve_target(cursor, target)) if target else snapshot["devices"]
+        return devices, snapshot["telegram_token"], snapshot["ftp_config"], snapshot["chat_ids"], conn_str
+    if target:
+        raise ValueError(f"Ціль '{target}' потребує інвентарю в БД (database.conn_str у config.json)")
+
+    devices = [dict(mikrotik, id=mikrotik.get('id')) for mikrotik in config.get('mikrotiks', [])]
+    ftp = config.get('ftp') or {}
+    ftp_config = {"host": ftp.get('host'), "username": ftp.get('user', ftp.get('username')),
+                  "password": ftp.get('password'), "dir": ftp.get('dir', '/'),
+                  "port": ftp.get('port')} if ftp.get('host') else None
+    return devices, config.get('telegram_token'), ftp_config, load_chat_ids(), None
+
+
+def update_device_status(conn_str, device_id, status, final_status):
+    if not conn_str or device_id is None:
+        return
+    try:
+        with span("db"), pyodbc.connect(conn_str, timeout=30) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE [ManagerMikrotik].[dbo].[MikroTikDevices]
+                SET backup_status = ?, backup_status_final = ?
+                WHERE id = ?
+            """, status[:200], final_status, device_id)  # Обмежуємо довжину до 200 символів
+            conn.commit()
+    except Exception as e:
+        print(f"Помилка оновлення статусу пристрою: {str(e)}")
+
+
+def update_versions_and_firmware(conn_str, device_id, installed_version, latest_version, routerboard_firmware):
+    if not conn_str or device_id is None:
+        return
+    try:
+        with span("db"), pyodbc.connect(conn_str, timeout=30) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE [ManagerMikrotik].[dbo].[MikroTikDevices]
+                SET installed_version = ?, latest_version = ?, routerboard_firmware = ?
+                WHERE id = ?
+            """, installed_version, latest_version, routerboard_firmware, device_id)
+            conn.commit()
+    except Exception as e:
+        print(f"Помилка оновлення версій та прошивки для пристрою ID {device_id}: {str(e)}")
+
+
+# Задачі: повертають (успіх, статус). Працюють через спільний пул з'єднань run.pool.
+
+def backup_job(run, mikrotik):
+    progress("connect")
+    if not attempt_connection(mikrotik, pool=run.pool):
+        return False, f"❌ Не вдалося підключитись до {mikrotik['host']} після 3 спроб. Пропускаємо."
+    progress("backup")
+    backup_name, backup_error = create_backup(mikrotik, pool=run.pool)
+    if not backup_name:
+        return False, backup_error
+    progress("download")
+    local_backup, local_rsc, download_error = download_backup(mikrotik, backup_name)
+    if not (local_backup and local_rsc):
+        return False, download_error
+    if run.ftp_config:
+        progress("upload")
+        for local_file, file_type in ((local_backup, 'backup'), (local_rsc, 'rsc')):
+            uploaded, upload_error = upload_backup_to_ftp(local_file, backup_name, run.ftp_config, file_type, mikrotik)
+            if not uploaded:
+                return False, upload_error
+    progress("cleanup")
+    with span("cleanup"):
+        delete_old_backups(mikrotik, pool=run.pool)
+    # Бекап уже на FTP - помилки порівняння та індексації лише логуються і не роблять пристрій невдалим
+    try:
+        summary = format_summary(diff_export(mikrotik['name'], local_rsc, BACKUP_DIR))
+        if summary:
+            run.notify(summary)
+    except Exception as e:
+        print(f"Помилка порівняння експорту для {mikrotik['name']}: {str(e)}")
+    try:
+        index_exports([local_rsc], BACKUP_DIR, workers=0)
+    except Exception as e:
+        print(f"Помилка індексації експорту для {mikrotik['name']}: {str(e)}")
+    return True, f"Бекап для {mikrotik['name']} завершено успішно: {backup_name}"
+
+
+def check_job(run, mikrotik):
+    progress("check")
+    installed_version, latest_version, routerboard_firmware = check_versions(mikrotik, pool=run.pool)
+    if not (installed_version and latest_version):
+        return False, f"Помилка при перевірці версій для #{mikrotik['name']} ({mikrotik['host']})"
+    progress("check", installed_version=installed_version, latest_version=latest_version, firmware=routerboard_firmware)
+    update_versions_and_firmware(run.conn_str, mikrotik.get('id'), installed_version, latest_version,
+                                 routerboard_firmware)
+    installed, latest = parse_version(installed_version), parse_version(latest_version)
+    if installed and latest and installed < latest:
+        status = f"#{mikrotik['name']} потребує оновлення: {installed_version} -> {latest_version}"
+        run.notify(f"⚠ {status} | RouterBoard Firmware: {routerboard_firmware}")
+        return True, status
+    return True, f"MikroTik *#{mikrotik['name']}* має актуальну версію."
+
+
+def upgrade_job(run, mikrotik):
+    progress("check")
+    with ssh_session(mikrotik, run.pool) as ssh_conn:
+        output = ssh_conn.send_command('/system package update check-for-updates', delay_factor=2.0)
+        installed_version, latest_version = parse_update_check(output)
+        installed, latest = parse_version(installed_version), parse_version(latest_version)
+        if not (installed and latest):
+            return False, f"Помилка при отриманні версій для #{mikrotik['name']} ({mikrotik['host']})"
+        if installed >= latest:
+            return True, f"MikroTik *#{mikrotik['name']}* має актуальну версію {installed_version}."
+        progress("install", installed_version=installed_version, latest_version=latest_version)
+        ssh_conn.send_command('/system package update install', delay_factor=2.0)
+    run.pool.discard(mikrotik)  # Роутер перезавантажується - сесія більше не дійсна
+    return True, f"Оновлення для MikroTik *#{mikrotik['name']}* запущено до версії {latest_version}."
+
+
+JOBS = {"backup": backup_job, "check": check_job, "upgrade": upgrade_job}
+JOB_TITLES = {"backup": "планові бекапи", "check": "перевірку оновлень", "upgrade": "планові оновлення"}
+
+
+class JobRun:
+    """Один запуск задачі (спрацювання cron) по всьому інвентарю."""
+
+    def __init__(self, job_type, devices, pool, telegram_token, ftp_config, conn_str, site_limits=None):
+        self.job_type = job_type
+        self.site_limits = site_limits
+        self.devices = devices
+        self.pool = pool
+        self.telegram_token = telegram_token
+        self.ftp_config = ftp_config
+        self.conn_str = conn_str
+        self.started = datetime.now()
+        self.profiler = RunProfiler(job_type)
+        self.digest = RunDigest(job_type)
+        self.throttle_mark = throttle.THROTTLE.mark()  # Кошики спільні з іншими запусками - підсумок лише цього
+        self.succeeded = []
+        self.failed = []
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._remaining = len(devices)
+        if not devices:
+            self.done.set()
+
+    def notify(self, message):
+        print(message)
+        if self.telegram_token:
+            send_telegram_message_async(self.telegram_token, message)
+
+    def execute(self, mikrotik):
+        if metrics.ENABLED:
+            metrics.IN_FLIGHT_VALUE.inc()
+        ok = False
+        try:
+            with bind(self.profiler, mikrotik['name']), track(self.job_type, mikrotik) as tracker:
+                try:
+                    ok, status = JOBS[self.job_type](self, mikrotik)
+                except Exception as e:
+                    ok, status = False, f"Помилка обробки {mikrotik['name']} ({mikrotik['host']}): {str(e)}"[:200]
+                print(f"[{self.job_type}] {mikrotik['name']}: {status}")
+                update_device_status(self.conn_str, mikrotik.get('id'), status, "OK" if ok else "Error")
+                # Підсумкова подія: metrics.py рахує оброблені пристрої через підписку на шину
+                self.digest(tracker.finish(OK if ok else FAILED, status))
+                if not ok:
+                    self.notify(status)
+        except Exception as e:
+            print(f"Помилка завершення задачі для {mikrotik['name']}: {str(e)}")
+        finally:
+            # Слот сайту і лічильник звільняються за будь-якої помилки, інакше finish() ніколи не виконається
+            if metrics.ENABLED:
+                metrics.IN_FLIGHT_VALUE.dec()
+            if self.site_limits:
+                self.site_limits.release(mikrotik.get('site_id'))
+            with self._lock:
+                (self.succeeded if ok else self.failed).append(mikrotik)
+                self._remaining -= 1
+                finished = self._remaining == 0
+            if finished:
+                self.finish()
+
+    def finish(self):
+        if self.job_type == "backup" and self.succeeded:
+            try:
+                results = evaluate_fleet(BACKUP_DIR, devices=[m['name'] for m in self.succeeded])
+                digest = format_digest(results)
+                if digest:
+                    self.notify(digest)
+            except Exception as e:
+                results = None
+                print(f"Помилка перевірки відповідності: {str(e)}")
+            if results and self.conn_str:
+                try:
+                    with span("db"):
+                        save_findings(self.conn_str, {m['name']: m.get('id') for m in self.succeeded}, results)
+                except Exception as e:
+                    print(f"Помилка збереження результатів перевірки: {str(e)}")
+        try:
+            report = self.profiler.finish(BACKUP_DIR)
+            if report:
+                print(report)
+        except Exception as e:
+            print(f"Помилка збереження профілю запуску: {str(e)}")
+        throttle_summary = throttle.THROTTLE.summary(self.throttle_mark)
+        if throttle_summary:
+            print(throttle_summary)
+        elapsed = datetime.now() - self.started
+        failed_stages = self.digest.format()
+        self.notify(f"✅ Завдання '{self.job_type}' виконано! Успішно: {len(self.succeeded)}, "
+                    f"з помилками: {len(self.failed)}, тривалість: {str(elapsed).split('.')[0]} "
+                    f"({datetime.now().strftime('%Y-%m-%d %H:%M')})" + (f"\n{failed_stages}" if failed_stages else ""))
+        self.done.set()
+
+
+class SchedulerDaemon:
+    """
+    Фоновий планувальник замість окремих скриптів під зовнішнім cron.
+    Кожна задача має cron-вираз і вікно window_minutes: пристрої отримують стабільний
+    зсув у межах вікна (хеш від типу задачі та хоста), тож навантаження розподіляється
+    рівномірно, а не стартує одночасно на початку години. Задачі з "enabled": false пропускаються.
+    """
+
+    def __init__(self, config, config_path=CONFIG_FILE):
+        self.config = config
+        self.config_path = config_path
+        schedule = config.get('schedule') or DEFAULT_SCHEDULE
+        self.jobs = []
+        for job in schedule.get('jobs', []):
+            if not job.get('enabled', True):
+                continue  # Приклад задачі в config.json, вмикається явно ("enabled": true)
+            if job['type'] not in JOBS:
+                raise ValueError(f"Невідомий тип задачі: {job['type']}")
+            self.jobs.append({
+                "type": job['type'],
+                "target": job.get('target'),
+                "cron": CronExpression(job['cron']),
+                "window": int(job.get('window_minutes', 0)) * 60,
+                "next": None
+            })
+        self.pool = SessionPool(idle_timeout=schedule.get('idle_timeout', 300))
+        self.executor = ThreadPoolExecutor(max_workers=schedule.get('max_workers', 8))
+        self.stop_event = threading.Event()
+        self._queue = []  # (час запуску, порядковий номер, JobRun, пристрій)
+        self._sequence = 0
+        self.health = None  # HealthPoller, якщо в config.json увімкнено "health"
+
+    @staticmethod
+    def jitter(job_type, mikrotik, window_seconds):
+        if window_seconds <= 0:
+            return 0
+        digest = hashlib.sha1(f"{job_type}:{mikrotik['host']}".encode('utf-8')).hexdigest()
+        return int(digest[:8], 16) % window_seconds
+
+    def start_run(self, job_type, window_seconds, start_ts=None, target=None):
+        # Інвентар перечитується на кожне спрацювання, щоб підхопити нові пристрої без перезапуску
+        try:
+            self.config = load_config(self.config_path)
+        except Exception as e:
+            print(f"Не вдалося перечитати {self.config_path}, використовуємо попередню конфігурацію: {str(e)}")
+        devices, telegram_token, ftp_config, chat_ids, conn_str = load_inventory(self.config, target)
+        mikrotik_ops.CHAT_IDS[:] = chat_ids
+        # Ліміти швидкості перечитуються разом з інвентарем; вікна розкладу перевіряються під час передачі
+        throttle.configure(self.config.get('throttle'), conn_str)
+        if self.health is not None and not target:
+            self.health.set_devices(devices)
+
+        run = JobRun(job_type, devices, self.pool, telegram_token, ftp_config, conn_str, load_site_limits(conn_str))
+        run.notify(f"🔹 Розпочато {JOB_TITLES[job_type]}{f' ({target})' if target else ''}! Пристроїв: {len(devices)} "
+                   f"({datetime.now().strftime('%Y-%m-%d %H:%M')})")
+        start_ts = start_ts if start_ts is not None else time.time()
+        for mikrotik in devices:
+            self._sequence += 1
+            due = start_ts + self.jitter(job_type, mikrotik, window_seconds)
+            heapq.heappush(self._queue, (due, self._sequence, run, mikrotik))
+        if metrics.ENABLED:
+            metrics.QUEUE_DEPTH_VALUE.set(len(self._queue))
+        return run
+
+    def _dispatch_due(self):
+        now = time.time()
+        deferred = []
+        while self._queue and self._queue[0][0] <= now:
+            _, sequence, run, mikrotik = heapq.heappop(self._queue)
+            # Сайт (або батьківський сайт) вичерпав ліміт - пристрій чекає, не займаючи потік
+            if run.site_limits and not run.site_limits.try_acquire(mikrotik.get('site_id')):
+                deferred.append((now + SITE_RETRY_SECONDS, sequence, run, mikrotik))
+                continue
+            self.executor.submit(run.execute, mikrotik)
+        for item in deferred:
+            heapq.heappush(self._queue, item)
+        if metrics.ENABLED:
+            metrics.QUEUE_DEPTH_VALUE.set(len(self._queue))
+
+    def start_health_poller(self):
+        """Опитування стану всього парку у фоні; з'єднання API беруться з того самого SessionPool, що й у задач."""
+        settings = self.config.get('health') or {}
+        if not settings.get('enabled'):
+            return
+        devices = load_inventory(self.config)[0]
+        self.health = HealthPoller(devices, interval=settings.get('interval', HEALTH_INTERVAL),
+                                   workers=settings.get('workers', HEALTH_WORKERS), pool=self.pool).start()
+        print(f"Моніторинг стану: {len(devices)} пристроїв кожні {self.health.interval} с")
+
+    def run_forever(self):
+        try:
+            self.start_health_poller()
+        except Exception as e:
+            print(f"Не вдалося запустити моніторинг стану: {str(e)}")
+        now = datetime.now()
+        for job in self.jobs:
+            job["next"] = job["cron"].next_after(now)
+            print(f"Задача '{job['type']}' ({job['cron'].expression}): наступний запуск {job['next']:%Y-%m-%d %H:%M}")
+
+        last_cleanup = time.monotonic()
+        while not self.stop_event.is_set():
+            now = datetime.now()
+            for job in self.jobs:
+                if job["next"] <= now:
+                    try:
+                        self.start_run(job["type"], job["window"], job["next"].timestamp(), job["target"])
+                    except Exception as e:
+                        print(f"Помилка запуску задачі '{job['type']}': {str(e)}")
+                    job["next"] = job["cron"].next_after(now)
+                    print(f"Задача '{job['type']}': наступний запуск {job['next']:%Y-%m-%d %H:%M}")
+            self._dispatch_due()
+
+            if time.monotonic() - last_cleanup > 60:
+                self.pool.close_idle()
+                last_cleanup = time.monotonic()
+
+            wake_at = min([job["next"].timestamp() for job in self.jobs] +
+                          ([self._queue[0][0]] if self._queue else []) + [time.time() + 30])
+            self.stop_event.wait(max(0.0, wake_at - time.time()))
+
+        self.shutdown()
+
+    def run_once(self, job_type, window_seconds=0, target=None):
+        run = self.start_run(job_type, window_seconds, target=target)
+        while not run.done.is_set() and not self.stop_event.is_set():
+            self._dispatch_due()
+            wake_at = self._queue[0][0] if self._queue else time.time() + 1
+            run.done.wait(max(0.1, min(wake_at - time.time(), 1)))
+        self.shutdown()
+        return run
+
+    def stop(self, *_):
+        print("Отримано сигнал завершення, зупиняємо планувальник...")
+        self.stop_event.set()
+
+    def shutdown(self):
+        if self.health is not None:
+            self.health.stop()
+        self.executor.shutdown(wait=True)
+        self.pool.close_all()
+        print(f"Статистика з'єднань: {self.pool.stats}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Фоновий планувальник бекапів/перевірок/оновлень MikroTik")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--once", choices=sorted(JOBS), help="Виконати задачу одразу і завершитись")
+    parser.add_argument("--window", type=int, default=0, help="Вікно розподілу для --once, хвилин")
+    parser.add_argument("--target", help="Ціль для --once: site:<назва>, group:<назва>, tag:<назва>, query:<назва>")
+    parser.add_argument("--metrics-port", type=int, help="Порт для /metrics (перекриває config.json)")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    metrics.start_from_config(config, args.metrics_port)
+    daemon = SchedulerDaemon(config, args.config)
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+
+    if args.once:
+        run = daemon.run_once(args.once, args.window * 60, args.target)
+        sys.exit(0 if not run.failed else 1)
+    daemon.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import json
+import base64
+import hashlib
+from datetime import datetime
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+    InvalidToken = ValueError
+
+from export_diff import BACKUP_DIR
+from inventory import DEVICE_COLUMNS, DEVICES_TABLE, TARGETS_SQL, InventoryQuery, device_from_row, read_targets
+
+# Налаштування (Telegram, FTP, chat_id) та інвентар пристроїв читаються одним пакетом запитів
+# з кількома наборами результатів (cursor.nextset) на одному з'єднанні - один round trip до SQL Server.
+# Знімок зберігається локально зашифрованим (ключ - з рядка підключення, тобто з пароля до БД),
+# тож GUI показує таблицю одразу після входу, а актуальність перевіряється у фоні за відбитком таблиць.
+
+CACHE_DIR = os.path.join(BACKUP_DIR, "cache")
+CACHE_MAGIC = b"MMS1"
+KDF_ITERATIONS = 100_000
+
+# Відбиток вмісту таблиць: COUNT(*) і MAX([row_version]) кожної таблиці. ROWVERSION зростає при кожному
+# INSERT/UPDATE у базі, тож зміна рядка змінює максимум, а видалення - кількість (не потребує Change Tracking).
+FINGERPRINT_SQL = """
+SELECT
+    (SELECT COUNT(*) FROM [ManagerMikrotik].[dbo].[MikroTikDevices]) AS device_count,
+    (SELECT CONCAT(COUNT(*), ':', CAST(MAX([row_version]) AS BIGINT))
+     FROM [ManagerMikrotik].[dbo].[TelegramSettings]) AS telegram,
+    (SELECT CONCAT(COUNT(*), ':', CAST(MAX([row_version]) AS BIGINT))
+     FROM [ManagerMikrotik].[dbo].[FTPSettings]) AS ftp,
+    (SELECT CONCAT(COUNT(*), ':', CAST(MAX([row_version]) AS BIGINT))
+     FROM [ManagerMikrotik].[dbo].[TelegramChatIds]) AS chat_ids,
+    (SELECT CONCAT(COUNT(*), ':', CAST(MAX([row_version]) AS BIGINT))
+     FROM [ManagerMikrotik].[dbo].[MikroTikDevices]) AS devices,
+    (SELECT CONCAT(COUNT(*), ':', CAST(MAX([row_version]) AS BIGINT))
+     FROM [ManagerMikrotik].[dbo].[Sites]) AS sites,
+    (SELECT CONCAT(COUNT(*), ':', CAST(MAX([row_version]) AS BIGINT))
+     FROM [ManagerMikrotik].[dbo].[DeviceGroups]) AS device_groups,
+    (SELECT CONCAT(COUNT(*), ':', CAST(MAX([row_version]) AS BIGINT))
+     FROM [ManagerMikrotik].[dbo].[DeviceGroupMembers]) AS group_members,
+    (SELECT CONCAT(COUNT(*), ':', CAST(MAX([row_version]) AS BIGINT))
+     FROM [ManagerMikrotik].[dbo].[SavedQueries]) AS saved_queries;
+"""
+
+SNAPSHOT_SQL = "SET NOCOUNT ON;" + FINGERPRINT_SQL + """
+SELECT TOP 1 [token] FROM [ManagerMikrotik].[dbo].[TelegramSettings];
+SELECT TOP 1 [host], [username], [password], [dir] FROM [ManagerMikrotik].[dbo].[FTPSettings];
+SELECT [chat_id] FROM [ManagerMikrotik].[dbo].[TelegramChatIds];
+SELECT TOP (?) """ + DEVICE_COLUMNS + " FROM " + DEVICES_TABLE + InventoryQuery().order_by() + ";" + TARGETS_SQL
+
+
+def _fingerprint(row):
+    return "|".join("" if value is None else str(value) for value in row)
+
+
+def _next_set(cursor):
+    if not cursor.nextset():
+        raise RuntimeError("Пакет запитів налаштувань повернув менше наборів результатів, ніж очікувалося")
+
+
+def fetch_fingerprint(cursor):
+    cursor.execute(FINGERPRINT_SQL)
+    return _fingerprint(cursor.fetchone())
+
+
+def fetch_snapshot(cursor, device_limit=None):
+    """
+    Знімок налаштувань та інвентарю одним execute(): відбиток, токен, FTP, chat_id, пристрої,
+    цілі задач (сайти, групи, теги, збережені запити).
+    device_limit - лише перша сторінка інвентарю в порядку InventoryQuery() за замовчуванням (GUI),
+    None - усі пристрої (scheduler_daemon). Повертає словник, придатний для JSON (кеш).
+    """
+    cursor.execute(SNAPSHOT_SQL, 2147483647 if device_limit is None else device_limit)
+    row = cursor.fetchone()
+    fingerprint, device_total = _fingerprint(row), row.device_count
+
+    _next_set(cursor)
+    row = cursor.fetchone()
+    telegram_token = row.token if row else None
+
+    _next_set(cursor)
+    row = cursor.fetchone()
+    ftp_config = {"host": row.host, "username": row.username, "password": row.password,
+                  "dir": row.dir} if row else None
+
+    _next_set(cursor)
+    chat_ids = [str(row.chat_id) for row in cursor.fetchall()]
+
+    _next_set(cursor)
+    devices = [device_from_row(row) for row in cursor.fetchall()]
+
+    _next_set(cursor)
+    targets = read_targets(cursor)
+
+    return {"fingerprint": fingerprint, "telegram_token": telegram_token, "ftp_config": ftp_config,
+            "chat_ids": chat_ids, "devices": devices, "device_total": device_total, "targets": targets,
+            "loaded_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def load_snapshot(conn_str, device_limit=None, timeout=30):
+    """Одне з'єднання, один пакет запитів. Помилки pyodbc піднімаються (зокрема помилка авторизації)."""
+    if pyodbc is None:
+        raise ImportError("pyodbc не встановлено")
+    with pyodbc.connect(conn_str, timeout=timeout) as conn:
+        return fetch_snapshot(conn.cursor(), device_limit)
+
+
+def load_fingerprint(conn_str, timeout=30):
+    """Лише відбиток таблиць; заразом перевіряє логін і пароль на сервері перед показом кешованого знімка."""
+    if pyodbc is None:
+        raise ImportError("pyodbc не встановлено")
+    with pyodbc.connect(conn_str, timeout=timeout) as conn:
+        return fetch_fingerprint(conn.cursor())
+
+
+def load_if_changed(conn_str, fingerprint, device_limit=None, timeout=30):
+    """Фонова перевірка: новий знімок, якщо відбиток таблиць змінився, інакше None."""
+    if pyodbc is None:
+        raise ImportError("pyodbc не встановлено")
+    with pyodbc.connect(conn_str, timeout=timeout) as conn:
+        cursor = conn.cursor()
+        if fingerprint and fetch_fingerprint(cursor) == fingerprint:
+            return None
+        return fetch_snapshot(cursor, device_limit)
+
+
+def _conn_params(conn_str):
+    params = {}
+    for part in conn_str.split(';'):
+        key, sep, value = part.partition('=')
+        if sep:
+            params[key.strip().upper()] = value.strip()
+    return params
+
+
+class SnapshotCache:
+    """
+    Зашифрований знімок у BackUp/cache: файл на пару сервер/база/користувач.
+    Ключ Fernet виводиться з повного рядка підключення (PBKDF2), тож прочитати кеш може лише той,
+    хто знає пароль до БД; після зміни пароля read() поверне None і знімок буде завантажено з сервера.
+    Без пакета cryptography кеш вимкнено.
+    """
+
+    def __init__(self, conn_str, cache_dir=CACHE_DIR):
+        self.conn_str = conn_str
+        params = _conn_params(conn_str)
+        identity = "|".join(params.get(key, "").lower() for key in ("SERVER", "DATABASE", "UID"))
+        self.path = os.path.join(cache_dir, f"settings-{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]}.bin")
+
+    @property
+    def enabled(self):
+        return Fernet is not None
+
+    def _fernet(self, salt):
+        key = hashlib.pbkdf2_hmac("sha256", self.conn_str.encode('utf-8'), salt, KDF_ITERATIONS)
+        return Fernet(base64.urlsafe_b64encode(key))
+
+    def read(self):
+        """Знімок з кешу або None (немає файлу, інший пароль, пошкоджений файл, немає cryptography)."""
+        if not self.enabled:
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if not data.startswith(CACHE_MAGIC):
+            return None
+        salt, token = data[len(CACHE_MAGIC):len(CACHE_MAGIC) + 16], data[len(CACHE_MAGIC) + 16:]
+        try:
+            return json.loads(self._fernet(salt).decrypt(token).decode('utf-8'))
+        except (InvalidToken, ValueError):
+            return None
+
+    def write(self, snapshot):
+        if not self.enabled:
+            return False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        salt = os.urandom(16)
+        token = self._fernet(salt).encrypt(json.dumps(snapshot, ensure_ascii=False).encode('utf-8'))
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(CACHE_MAGIC + salt + token)
+        os.replace(tmp_path, self.path)
+        return True
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,255 @@
+import os
+import sys
+import math
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+BACKUP_DIR = "./BackUp/"
+PROFILE_FILE = "run_profiles.sqlite"
+
+# Мережеві етапи, затримки яких передаються контролеру паралельності (Telegram і БД не залежать від мережі до роутерів)
+NETWORK_STAGES = ("ssh_connect", "backup_save", "export", "sftp", "ftp", "check")
+ALL_STAGES = NETWORK_STAGES + ("telegram", "db", "cleanup", "diff", "index")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id INTEGER PRIMARY KEY,
+    job_type TEXT NOT NULL,
+    run_ref TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT NOT NULL,
+    devices INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_profiles_job ON profiles (job_type, id);
+CREATE TABLE IF NOT EXISTS spans (
+    profile_id INTEGER NOT NULL,
+    device TEXT,
+    stage TEXT NOT NULL,
+    start_offset REAL NOT NULL,
+    seconds REAL NOT NULL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_spans_profile ON spans (profile_id);
+CREATE TABLE IF NOT EXISTS stage_summary (
+    profile_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    p50 REAL NOT NULL,
+    p95 REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (profile_id, stage)
+);
+"""
+
+_local = threading.local()
+
+# Глобальні спостерігачі етапів: listener(етап, секунди, виняток або None). Наприклад, metrics.py
+span_listeners = []
+
+
+def percentile(sorted_values, q):
+    """Перцентиль за найближчим рангом для вже відсортованого списку."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class RunProfiler:
+    """
+    Збирає тривалості етапів (span) одного запуску: хто, який етап, скільки секунд, чи успішно.
+    Прив'язується до потоку через bind(), тож функції з mikrotik_ops вимірюються без передачі
+    профайлера параметром. on_span отримує затримки мережевих етапів (для AimdController).
+    """
+
+    def __init__(self, job_type, run_ref=None, on_span=None):
+        self.job_type = job_type
+        self.run_ref = run_ref
+        self.on_span = on_span
+        self.started_at = datetime.now()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []  # (пристрій, етап, зсув від старту, секунди, успіх)
+
+    def record(self, device, stage, started, seconds, ok=True):
+        with self._lock:
+            self.spans.append((device, stage, started - self._origin, seconds, ok))
+        if self.on_span and stage in NETWORK_STAGES:
+            self.on_span(stage, seconds)
+
+    def stage_stats(self):
+        by_stage = {}
+        for _, stage, _, seconds, _ in self.spans:
+            by_stage.setdefault(stage, []).append(seconds)
+        stats = {}
+        for stage, values in by_stage.items():
+            values.sort()
+            stats[stage] = {"count": len(values), "total": sum(values), "p50": percentile(values, 50),
+                            "p95": percentile(values, 95), "max": values[-1]}
+        return stats
+
+    def slowest_devices(self, top=5):
+        totals = {}
+        for device, _, _, seconds, _ in self.spans:
+            if device:
+                totals[device] = totals.get(device, 0.0) + seconds
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    def format_report(self, previous=None, top=5):
+        stats = self.stage_stats()
+        if not stats:
+            return None
+        devices = len({span[0] for span in self.spans if span[0]})
+        lines = [f"⏱ Профіль запуску '{self.job_type}': пристроїв {devices}, етапів {len(self.spans)}"]
+        for stage, item in sorted(stats.items(), key=lambda pair: pair[1]["total"], reverse=True):
+            line = (f"{stage}: n={item['count']}, p50 {item['p50']:.2f} с, p95 {item['p95']:.2f} с, "
+                    f"max {item['max']:.2f} с, всього {item['total']:.1f} с")
+            if previous and stage in previous and previous[stage]["p95"] > 0:
+                change = (item["p95"] / previous[stage]["p95"] - 1) * 100
+                line += f" (p95 {change:+.0f}% до попереднього)"
+            lines.append(line)
+        slowest = self.slowest_devices(top)
+        if slowest:
+            lines.append("Найповільніші: " + ", ".join(f"{device} ({seconds:.1f} с)" for device, seconds in slowest))
+        return "\n".join(lines)
+
+    def finish(self, backup_dir=BACKUP_DIR):
+        """Зберігає профіль і повертає звіт із порівнянням з попереднім запуском того ж типу."""
+        store = ProfileStore(backup_dir)
+        try:
+            previous = store.last_summary(self.job_type)
+            store.save(self)
+        finally:
+            store.close()
+        return self.format_report(previous)
+
+
+@contextmanager
+def bind(profiler, device=None):
+    """Прив'язує профайлер і пристрій до поточного потоку на час обробки."""
+    previous = getattr(_local, "binding", None)
+    _local.binding = (profiler, device)
+    try:
+        yield
+    finally:
+        _local.binding = previous
+
+
+def exclude(seconds):
+    """
+    Очікування, яке не входить у тривалість етапів поточного потоку (паузи обмеження швидкості, throttle.py):
+    інакше контролер паралельності сприйняв би навмисне сповільнення передачі як перевантаження мережі.
+    """
+    _local.excluded = getattr(_local, "excluded", 0.0) + seconds
+
+
+@contextmanager
+def span(stage):
+    """Вимірює етап у профайлері поточного потоку; без bind() і спостерігачів нічого не робить."""
+    binding = getattr(_local, "binding", None)
+    if binding is not None and binding[0] is None:
+        binding = None
+    if binding is None and not span_listeners:
+        yield
+        return
+    started = time.perf_counter()
+    excluded = getattr(_local, "excluded", 0.0)
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        seconds = time.perf_counter() - started - (getattr(_local, "excluded", 0.0) - excluded)
+        if binding is not None:
+            binding[0].record(binding[1], stage, started, seconds, error is None)
+        for listener in span_listeners:
+            listener(stage, seconds, error)
+
+
+class ProfileStore:
+    """Профілі запусків у BackUp/run_profiles.sqlite для порівняння трендів між запусками."""
+
+    def __init__(self, backup_dir=BACKUP_DIR):
+        os.makedirs(backup_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(backup_dir, PROFILE_FILE), timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def save(self, profiler):
+        stats = profiler.stage_stats()
+        with self._conn:
+            profile_id = self._conn.execute("""
+                INSERT INTO profiles (job_type, run_ref, started_at, finished_at, devices) VALUES (?, ?, ?, ?, ?)
+            """, (profiler.job_type, None if profiler.run_ref is None else str(profiler.run_ref),
+                  profiler.started_at.strftime('%Y-%m-%d %H:%M:%S'), datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                  len({span[0] for span in profiler.spans if span[0]}))).lastrowid
+            self._conn.executemany("INSERT INTO spans VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(profile_id, device, stage, offset, seconds, int(ok))
+                                    for device, stage, offset, seconds, ok in profiler.spans])
+            self._conn.executemany("INSERT INTO stage_summary VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   [(profile_id, stage, item["count"], item["total"], item["p50"], item["p95"],
+                                     item["max"]) for stage, item in stats.items()])
+        return profile_id
+
+    def last_summary(self, job_type):
+        row = self._conn.execute("SELECT MAX(id) FROM profiles WHERE job_type = ?", (job_type,)).fetchone()
+        if not row or row[0] is None:
+            return None
+        return self.summary(row[0])
+
+    def summary(self, profile_id):
+        rows = self._conn.execute("""
+            SELECT stage, count, total, p50, p95, max FROM stage_summary WHERE profile_id = ?
+        """, (profile_id,)).fetchall()
+        return {row[0]: {"count": row[1], "total": row[2], "p50": row[3], "p95": row[4], "max": row[5]}
+                for row in rows}
+
+    def trend(self, job_type, stage, last=10):
+        """[(profile_id, started_at, count, p50, p95, max)] для останніх запусків, від старих до нових."""
+        rows = self._conn.execute("""
+            SELECT p.id, p.started_at, s.count, s.p50, s.p95, s.max
+            FROM profiles p JOIN stage_summary s ON s.profile_id = p.id
+            WHERE p.job_type = ? AND s.stage = ?
+            ORDER BY p.id DESC LIMIT ?
+        """, (job_type, stage, last)).fetchall()
+        return rows[::-1]
+
+    def stages(self, job_type):
+        return [row[0] for row in self._conn.execute("""
+            SELECT DISTINCT s.stage FROM stage_summary s JOIN profiles p ON p.id = s.profile_id
+            WHERE p.job_type = ? ORDER BY s.stage
+        """, (job_type,))]
+
+    def close(self):
+        self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Тренди тривалості етапів між запусками")
+    parser.add_argument("--backup-dir", default=BACKUP_DIR)
+    parser.add_argument("--job", default="backup", help="Тип запуску: backup, check, upgrade")
+    parser.add_argument("--stage", help="Лише один етап (за замовчуванням усі)")
+    parser.add_argument("--last", type=int, default=10, help="Кількість останніх запусків")
+    args = parser.parse_args(argv)
+
+    store = ProfileStore(args.backup_dir)
+    try:
+        for stage in [args.stage] if args.stage else store.stages(args.job):
+            print(f"{stage}:")
+            for profile_id, started_at, count, p50, p95, max_seconds in store.trend(args.job, stage, args.last):
+                print(f"  #{profile_id} {started_at}  n={count:<5} p50 {p50:7.2f} с  p95 {p95:7.2f} с  "
+                      f"max {max_seconds:7.2f} с")
+    finally:
+        store.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
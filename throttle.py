@@ -0,0 +1,281 @@
+import json
+import time
+import threading
+from datetime import datetime
+
+from inventory import load_site_bandwidth
+from job_journal import device_key
+from stage_timing import exclude
+
+# Обмеження швидкості передачі бекапів (SFTP з роутера, FTP на сервер бекапів) кошиками токенів:
+# на пристрій, на сайт (Sites.bandwidth_kbps разом з батьківськими сайтами - спільний канал області)
+# і загальне. Ліміти з config.json ("throttle") можуть відрізнятися за розкладом: у робочі години
+# вікно "windows" обмежує передачу, вночі - базові значення. Передача чекає найповільніший з кошиків.
+#
+# "throttle": {"global_kbps": 0, "device_kbps": 0, "site_kbps": 0,
+#              "windows": [{"days": "mon-fri", "start": "08:00", "end": "19:00",
+#                           "global_kbps": 50000, "device_kbps": 2000, "site_kbps": 4000, "site_scale": 0.5}]}
+# 0 або відсутнє значення - без обмеження; site_kbps - для сайтів без власного bandwidth_kbps,
+# site_scale множить ліміти сайтів з БД на час вікна.
+
+CONFIG_FILE = './config.json'
+KBPS = 1000 / 8  # Байт/с в 1 кбіт/с
+CHUNK_SIZE = 32768  # Розмір одного запиту читання SFTP (MAX_REQUEST_SIZE paramiko)
+# Пакет запитів SFTP при обмеженні: ~BATCH_SECONDS трафіку за найменшим лімітом, запити пакета йдуть конвеєром
+BATCH_SECONDS = 0.25
+MAX_BATCH = 4 * 1024 * 1024
+WINDOW_CHECK_SECONDS = 30  # Як часто перевіряти, чи змінилось активне вікно розкладу
+LIMIT_KEYS = ("global_kbps", "device_kbps", "site_kbps", "site_scale")
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+class TokenBucket:
+    """
+    rate - байт/с (0 - без обмеження), місткість - burst байт (за замовчуванням секунда трафіку).
+    Баланс може йти в мінус: великий блок відправляється одразу, а наступні чекають, поки борг погаситься.
+    """
+
+    def __init__(self, rate=0, burst=None):
+        self._lock = threading.Lock()
+        self.rate = None  # Перший set_rate завжди встановлює швидкість і місткість
+        self.burst = 0
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.set_rate(rate, burst)
+        self._tokens = float(self.burst)
+
+    def _refill(self, now):
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate, burst=None):
+        if (rate or 0) == self.rate and burst is None:
+            return  # Швидкість не змінилась - баланс кошика не чіпаємо
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate or 0
+            self.burst = burst or max(self.rate, CHUNK_SIZE)
+            self._tokens = min(self._tokens, self.burst)
+
+    def reserve(self, amount):
+        """Списує amount байт і повертає, скільки секунд чекати перед їх передачею."""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+
+def parse_days(text):
+    """'mon-fri', 'sat,sun', '' (щодня) -> множина номерів днів (0 - понеділок)."""
+    if not text:
+        return set(range(7))
+    days = set()
+    for part in str(text).lower().replace(" ", "").split(","):
+        first, _, last = part.partition("-")
+        start, end = DAY_NAMES.index(first[:3]), DAY_NAMES.index((last or first)[:3])
+        days.update(range(start, end + 1) if start <= end else list(range(start, 7)) + list(range(end + 1)))
+    return days
+
+
+def parse_minutes(text):
+    hours, _, minutes = str(text).partition(":")
+    return int(hours) * 60 + int(minutes or 0)
+
+
+def parse_window(window):
+    """Вікно розкладу з config.json -> (дні, початок, кінець у хвилинах доби, ліміти вікна)."""
+    limits = {key: window[key] for key in LIMIT_KEYS if key in window}
+    return parse_days(window.get("days")), parse_minutes(window.get("start", "00:00")), \
+        parse_minutes(window.get("end", "24:00")), limits
+
+
+def window_active(window, now):
+    days, start, end, _ = window
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return now.weekday() in days and start <= minute < end
+    # Вікно через північ (22:00-06:00): після півночі день вікна - попередній
+    if minute >= start:
+        return now.weekday() in days
+    return minute < end and (now.weekday() - 1) % 7 in days
+
+
+class Limiter:
+    """Набір кошиків однієї передачі; consume() блокує потік, поки всі кошики не дозволять передати байти."""
+
+    def __init__(self, throttle, buckets):
+        self.throttle = throttle
+        self.buckets = buckets
+
+    def consume(self, amount):
+        self.throttle.refresh()
+        wait = max(bucket.reserve(amount) for bucket in self.buckets)
+        if wait > 0:
+            time.sleep(wait)
+            exclude(wait)
+        self.throttle.account(amount, wait)
+
+    def on_block(self, block):
+        """Зворотний виклик ftplib.storbinary: викликається після відправки кожного блоку."""
+        self.consume(len(block))
+
+    def batch_size(self):
+        """Байт на один пакет читання: BATCH_SECONDS за найменшою ненульовою швидкістю, кратно CHUNK_SIZE."""
+        rates = [bucket.rate for bucket in self.buckets if bucket.rate]
+        if not rates:
+            return MAX_BATCH
+        return max(CHUNK_SIZE, min(MAX_BATCH, int(min(rates) * BATCH_SECONDS) // CHUNK_SIZE * CHUNK_SIZE))
+
+
+class Throttle:
+    def __init__(self, settings=None, site_bandwidth=None, site_parents=None):
+        self._lock = threading.Lock()
+        self._buckets = {}  # ("global", None) / ("site", id) / ("device", ключ) -> TokenBucket
+        self._limits = None
+        self._checked = None
+        self.transferred = 0  # Від старту процесу; запуск задачі рахує різницю від mark()
+        self.waited = 0.0
+        self.update(settings, site_bandwidth, site_parents)
+
+    def update(self, settings=None, site_bandwidth=None, site_parents=None):
+        """
+        Нові налаштування; кошики спільні для всіх запусків процесу, тож не перестворюються: швидкість
+        змінюється лише тим, чий ліміт змінився, з поточним балансом. Лічильники не скидаються (див. mark()).
+        """
+        settings = settings or {}
+        with self._lock:
+            self.base = {key: settings.get(key, 1.0 if key == "site_scale" else 0) for key in LIMIT_KEYS}
+            self.windows = [parse_window(window) for window in settings.get("windows", [])]
+            self.site_bandwidth = dict(site_bandwidth or {})
+            self.site_parents = dict(site_parents or {})
+            self._checked = None
+            self._limits = None  # Ліміти сайтів могли змінитись - швидкості кошиків перераховуються
+        self.refresh()
+        return self
+
+    @property
+    def enabled(self):
+        return bool(self.site_bandwidth) or any(self.base[key] for key in LIMIT_KEYS[:3]) or \
+            any(window[3].get(key) for window in self.windows for key in LIMIT_KEYS[:3])
+
+    def current_limits(self, now=None):
+        """Базові ліміти, перекриті першим активним вікном розкладу."""
+        now = now or datetime.now()
+        limits = dict(self.base)
+        for window in self.windows:
+            if window_active(window, now):
+                limits.update(window[3])
+                break
+        return limits
+
+    def _rate(self, key, limits):
+        kind, ident = key
+        if kind == "site":
+            kbps = (self.site_bandwidth.get(ident) or limits["site_kbps"]) * limits["site_scale"]
+        else:
+            kbps = limits[f"{kind}_kbps"]
+        return kbps * KBPS
+
+    def refresh(self):
+        """Перераховує швидкості кошиків, якщо змінилось активне вікно (не частіше WINDOW_CHECK_SECONDS)."""
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < WINDOW_CHECK_SECONDS:
+            return
+        limits = self.current_limits()
+        with self._lock:
+            self._checked = now
+            if limits == self._limits:
+                return
+            self._limits = limits
+            buckets = list(self._buckets.items())
+        for key, bucket in buckets:
+            bucket.set_rate(self._rate(key, limits))
+
+    def _bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self._rate(key, self._limits))
+        return bucket
+
+    def site_chain(self, site_id):
+        """Сайт пристрою і всі батьківські сайти (захист від циклу в parent_id)."""
+        chain, current = [], site_id
+        while current is not None and current not in chain:
+            chain.append(current)
+            current = self.site_parents.get(current)
+        return chain
+
+    def limiter(self, mikrotik=None):
+        """Limiter для передачі файлів пристрою (без пристрою - лише загальний) або None, якщо обмежень немає."""
+        if not self.enabled:
+            return None
+        self.refresh()
+        keys = [("global", None)]
+        if mikrotik:
+            # Власний сайт - з bandwidth_kbps або типовим site_kbps, батьківські - лише з власним лімітом у БД
+            chain = self.site_chain(mikrotik.get('site_id'))
+            keys += [("device", device_key(mikrotik))] + [("site", site) for index, site in enumerate(chain)
+                                                          if index == 0 or site in self.site_bandwidth]
+        return Limiter(self, [self._bucket(key) for key in keys])
+
+    def account(self, amount, wait):
+        with self._lock:
+            self.transferred += amount
+            self.waited += wait
+
+    def mark(self):
+        """Поточні лічильники; summary(mark) - передача від цієї точки (початку запуску задачі)."""
+        with self._lock:
+            return self.transferred, self.waited
+
+    def summary(self, since=(0, 0.0)):
+        with self._lock:
+            transferred, waited = self.transferred - since[0], self.waited - since[1]
+        if not transferred:
+            return None
+        return (f"🚦 Обмеження швидкості: передано {transferred / 1024 / 1024:.1f} МБ, "
+                f"очікування {waited:.0f} с")
+
+
+# Спільний для процесу екземпляр: mikrotik_ops бере з нього обмежувач кожної передачі
+THROTTLE = Throttle()
+
+
+def load_settings(path=CONFIG_FILE):
+    """Секція "throttle" з config.json; без файлу - без обмежень (GUI може працювати без config.json)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('throttle') or {}
+    except FileNotFoundError:
+        return {}
+
+
+def configure(settings, conn_str=None):
+    """Застосовує налаштування до THROTTLE; ліміти сайтів - з Sites.bandwidth_kbps, якщо задано conn_str."""
+    site_bandwidth, site_parents = load_site_bandwidth(conn_str)
+    return THROTTLE.update(settings, site_bandwidth, site_parents)
+
+
+def sftp_get(sftp, remote_path, local_path, limiter=None):
+    """sftp.get з обмеженням: без limiter - звичайне завантаження з попередньою вибіркою (найшвидше)."""
+    if limiter is None:
+        sftp.get(remote_path, local_path)
+        return
+    # Повний prefetch paramiko запитує весь файл наперед, і роутер віддає його на повній швидкості, а послідовні
+    # читання впираються в CHUNK_SIZE/RTT. Тому файл читається пакетами readv (запити пакета - конвеєром),
+    # а токени резервуються перед кожним пакетом
+    with sftp.open(remote_path, 'rb') as remote, open(local_path, 'wb') as local:
+        size = remote.stat().st_size
+        offset = 0
+        while offset < size:
+            batch = min(size - offset, limiter.batch_size())
+            limiter.consume(batch)
+            chunks = [(position, min(CHUNK_SIZE, offset + batch - position))
+                      for position in range(offset, offset + batch, CHUNK_SIZE)]
+            for data in remote.readv(chunks):
+                local.write(data)
+            offset += batch